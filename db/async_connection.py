@@ -0,0 +1,68 @@
+# db/async_connection.py
+"""
+Async engine/session stack (asyncpg + AsyncSession) next to the sync one in
+db/connection.py, for async routes that would otherwise run blocking ORM
+queries on the event loop.
+
+- Same database, same models; ORM flush hooks in db/models.py fire here too
+  (AsyncSession wraps a regular Session).
+- Existing sync helpers that take a Session can be reused without blocking
+  the loop through `await db.run_sync(fn, *args)`.
+"""
+
+import logging
+import os
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.connection import DB_HOST, DB_NAME, DB_PORT, DB_USERNAME, REQUEST_KEY, pw_quoted
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USERNAME}:{pw_quoted}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False,
+    pool_size=int(os.getenv("ASYNC_DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20")),
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    connect_args={
+        "timeout": 10,
+        "server_settings": {"application_name": "CRM_Backend_async", "timezone": "UTC"},
+    },
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+async def get_async_db(request: Request = None):
+    """
+    Async database dependency (counterpart of db.connection.get_db)
+    """
+    async with AsyncSessionLocal() as db:
+        if request is not None:
+            db.info[REQUEST_KEY] = request
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"Async database session error: {e}")
+            await db.rollback()
+            raise
+
+
+async def check_async_database_connection() -> bool:
+    try:
+        async with async_engine.connect() as conn:
+            return (await conn.execute(text("SELECT 1"))).scalar() == 1
+    except Exception as e:
+        logger.error(f"Async database health check failed: {e}")
+        return False
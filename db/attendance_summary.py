@@ -0,0 +1,171 @@
+# db/attendance_summary.py
+"""
+crm_attendance_monthly: attendance rolled up per employee and month.
+
+Each row holds the counters the analytics API needs (present / absent /
+late / half day / leave / worked minutes) and two 31-bit day masks:
+present_mask and recorded_mask. Streaks and per-day heatmaps are computed
+from the masks, so no report reads crm_attendance.
+
+Status mapping (case-insensitive):
+
+    present   present, late, half_day / half-day, wfh
+    late      status late, or a present day checked in after
+              ATTENDANCE_LATE_AFTER (local time in ATTENDANCE_TZ)
+    absent    absent
+    leave     leave, on_leave, holiday
+
+Maintenance is per touched month: refresh_months() re-aggregates the given
+(employee, month) pairs from crm_attendance (at most 31 rows each, found
+through uq_attendance_employee_date) and upserts them. Pairs left without
+rows are deleted. The ORM hook in db.models calls it after each flush that
+wrote attendance, and bulk ingest calls it once per batch.
+
+    python -m db.attendance_summary rebuild
+"""
+
+import logging
+import os
+import sys
+from datetime import date
+from typing import Iterable, Set, Tuple
+
+from sqlalchemy import text
+
+from db.connection import engine
+
+logger = logging.getLogger(__name__)
+
+ATTENDANCE_TZ = os.getenv("ATTENDANCE_TZ", "Asia/Kolkata")
+LATE_AFTER = os.getenv("ATTENDANCE_LATE_AFTER", "09:45")
+
+PRESENT_STATUSES = ("present", "late", "half_day", "half-day", "wfh")
+HALF_DAY_STATUSES = ("half_day", "half-day")
+LEAVE_STATUSES = ("leave", "on_leave", "holiday")
+
+
+def _in(values: Tuple[str, ...]) -> str:
+    return "(" + ", ".join(f"'{v}'" for v in values) + ")"
+
+
+_STATUS = "lower(btrim(a.status))"
+_PRESENT = f"{_STATUS} IN {_in(PRESENT_STATUSES)}"
+_LATE = (
+    f"({_STATUS} = 'late' OR ({_PRESENT} AND a.check_in IS NOT NULL "
+    f"AND (a.check_in AT TIME ZONE :tz)::time > CAST(:late_after AS time)))"
+)
+_DAY_BIT = "(1 << (extract(day FROM a.date)::int - 1))"
+_MONTH = "date_trunc('month', a.date)::date"
+
+_COLUMNS = (
+    "employee_code, month, branch_id, days_recorded, present, absent, late, half_day, leave, "
+    "work_minutes, present_mask, recorded_mask"
+)
+
+
+def _aggregate(join: str = "", where: str = "") -> str:
+    return f"""
+        SELECT a.employee_code, {_MONTH}, u.branch_id,
+               count(*),
+               count(*) FILTER (WHERE {_PRESENT}),
+               count(*) FILTER (WHERE {_STATUS} = 'absent'),
+               count(*) FILTER (WHERE {_LATE}),
+               count(*) FILTER (WHERE {_STATUS} IN {_in(HALF_DAY_STATUSES)}),
+               count(*) FILTER (WHERE {_STATUS} IN {_in(LEAVE_STATUSES)}),
+               coalesce(sum(extract(epoch FROM a.check_out - a.check_in) / 60)
+                        FILTER (WHERE a.check_out > a.check_in), 0)::int,
+               bit_or(CASE WHEN {_PRESENT} THEN {_DAY_BIT} ELSE 0 END),
+               bit_or({_DAY_BIT})
+          FROM crm_attendance a
+          {join}
+          LEFT JOIN crm_user_details u ON u.employee_code = a.employee_code
+         {where}
+         GROUP BY a.employee_code, {_MONTH}, u.branch_id
+    """
+
+
+def _upsert(select_sql: str) -> str:
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in _COLUMNS.split(", ")[2:])
+    return (
+        f"INSERT INTO crm_attendance_monthly ({_COLUMNS}) {select_sql} "
+        f"ON CONFLICT (employee_code, month) DO UPDATE SET {updates}, updated_at = now()"
+    )
+
+
+_KEYS = "unnest(CAST(:codes AS varchar[]), CAST(:months AS date[])) AS k(employee_code, month)"
+_IN_MONTH = "a.employee_code = k.employee_code AND a.date >= k.month AND a.date < k.month + interval '1 month'"
+
+_REFRESH_SQL = text(_upsert(_aggregate(join=f"JOIN {_KEYS} ON {_IN_MONTH}")))
+_DROP_EMPTY_SQL = text(
+    f"""
+    DELETE FROM crm_attendance_monthly m
+     USING {_KEYS}
+     WHERE m.employee_code = k.employee_code AND m.month = k.month
+       AND NOT EXISTS (SELECT 1 FROM crm_attendance a WHERE {_IN_MONTH})
+    """
+)
+_REBUILD_SQL = text(_upsert(_aggregate()))
+
+
+def month_of(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _params(**extra):
+    return {"tz": ATTENDANCE_TZ, "late_after": LATE_AFTER, **extra}
+
+
+def refresh_months(conn, keys: Iterable[Tuple[str, date]]) -> int:
+    """Re-aggregate the (employee_code, any day of the month) pairs; conn: Session or Connection."""
+    months: Set[Tuple[str, date]] = {(code, month_of(day)) for code, day in keys if code and day}
+    if not months:
+        return 0
+    codes, firsts = zip(*sorted(months))
+    params = _params(codes=list(codes), months=list(firsts))
+    conn.execute(_REFRESH_SQL, params)
+    conn.execute(_DROP_EMPTY_SQL, params)
+    return len(months)
+
+
+def rebuild() -> int:
+    """Re-derive every summary row from crm_attendance."""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM crm_attendance_monthly"))
+        return conn.execute(_REBUILD_SQL, _params()).rowcount
+
+
+def ensure_attendance_summary() -> None:
+    """
+    One row per employee/day before the unique index goes on (older
+    databases: keep the latest row), then fill the summary once when it is new.
+    """
+    with engine.begin() as conn:
+        if not conn.execute(text("SELECT to_regclass('uq_attendance_employee_date')")).scalar():
+            conn.execute(
+                text(
+                    """
+                    DELETE FROM crm_attendance a
+                     USING crm_attendance newer
+                     WHERE newer.employee_code = a.employee_code AND newer.date = a.date
+                       AND (newer.updated_at, newer.id) > (a.updated_at, a.id)
+                    """
+                )
+            )
+            conn.execute(
+                text("CREATE UNIQUE INDEX uq_attendance_employee_date ON crm_attendance (employee_code, date)")
+            )
+        if conn.execute(text("SELECT 1 FROM crm_attendance_monthly LIMIT 1")).first():
+            return
+        n = conn.execute(_REBUILD_SQL, _params()).rowcount
+        if n:
+            logger.info("crm_attendance_monthly backfilled with %d employee-months", n)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        print(f"summarized {rebuild()} employee-months")
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -1,12 +1,18 @@
 # db/connection.py - FIXED for SQLAlchemy 2.0
 
 from sqlalchemy import create_engine, event, text
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from sqlalchemy.engine import Engine
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlsplit
 from dotenv import load_dotenv
+from fastapi import Request
+from typing import Dict, List, Optional
+import hashlib
+import itertools
 import os
 import logging
+import threading
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -82,13 +88,15 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 # Improved dependency for FastAPI routes
-def get_db():
+def get_db(request: Request = None):
     """
     Database dependency with proper error handling
     """
     db = None
     try:
         db = SessionLocal()
+        if request is not None:
+            db.info[REQUEST_KEY] = request
         yield db
     except Exception as e:
         logger.error(f"Database session error: {e}")
@@ -99,6 +107,258 @@ def get_db():
         if db:
             db.close()
 
+
+# Sessions remember whether a commit actually wrote rows, so that only real
+# writers are pinned to the primary (see mark_write). Flushes that emitted
+# SQL and ORM-executed INSERT/UPDATE/DELETE count; a rollback discards them.
+# The mark happens in after_commit, i.e. while the endpoint is still running,
+# so it lands before the response is sent (dependency teardown runs after).
+# Registered on Session so AsyncSession (db.async_connection) is covered too.
+WROTE_KEY = "committed_write"
+REQUEST_KEY = "request"
+_PENDING_KEY = "pending_write"
+
+
+@event.listens_for(Session, "after_flush")
+def _flush_wrote(session, flush_context):
+    session.info[_PENDING_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _dml_executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_PENDING_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_wrote(session):
+    if session.info.pop(_PENDING_KEY, False):
+        session.info[WROTE_KEY] = True
+        request = session.info.get(REQUEST_KEY)
+        if request is not None:
+            mark_write(request)
+
+
+@event.listens_for(Session, "after_rollback")
+def _rollback_discards(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ---------------------------------------------------------------------------
+# Read replicas
+#
+# DB_REPLICA_URLS="postgresql://user:pw@replica1:5432/crm_db,postgresql://..."
+# Routes that only read (dashboards, analytics, search, exports, reports)
+# depend on get_read_db instead of get_db. A replica is used only while its
+# replay lag is under DB_REPLICA_MAX_LAG_SECONDS; otherwise, with no
+# replicas configured, or for a caller who wrote within
+# DB_REPLICA_STICKY_SECONDS (read-your-writes), the session goes to the
+# primary.
+#
+# A write is remembered twice: in this worker's _recent_writers, and in a
+# short-lived STICKY_COOKIE that StickyPrimaryMiddleware adds to the
+# response, so the caller's next read sticks to the primary whichever
+# worker or host serves it. Clients that drop cookies only get the
+# in-process marker.
+# ---------------------------------------------------------------------------
+REPLICA_URLS = [u.strip() for u in os.getenv("DB_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "5"))
+REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "30"))
+REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", "10"))
+STICKY_COOKIE = "db_primary_until"
+_STICKY_STATE = "db_primary_until"
+
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class _Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine = create_engine(
+            url,
+            pool_size=REPLICA_POOL_SIZE,
+            max_overflow=REPLICA_POOL_SIZE,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            connect_args={"application_name": "CRM_Backend_ro", "connect_timeout": 5},
+        )
+        self.sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _check(self) -> None:
+        try:
+            with self.engine.connect() as conn:
+                self.lag = float(conn.execute(_LAG_SQL).scalar() or 0)
+            self.error = None
+        except Exception as e:
+            self.lag, self.error = None, str(e)
+            logger.warning(f"Replica {self.name} lag check failed: {e}")
+
+    def usable(self) -> bool:
+        # one thread refreshes the lag; the rest use the last value
+        if time.monotonic() - self._checked_at >= REPLICA_LAG_CHECK_SECONDS and self._lock.acquire(blocking=False):
+            try:
+                self._check()
+                self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self.lag is not None and self.lag <= REPLICA_MAX_LAG_SECONDS
+
+
+def _replica_name(url: str, i: int) -> str:
+    parts = urlsplit(url)
+    return f"replica{i}:{parts.hostname}:{parts.port or 5432}"
+
+
+replicas: List[_Replica] = [_Replica(_replica_name(u, i), u) for i, u in enumerate(REPLICA_URLS, 1)]
+_replica_cycle = itertools.cycle(replicas) if replicas else None
+_route_counts: Dict[str, int] = {}
+_recent_writers: Dict[str, float] = {}
+_routing_lock = threading.Lock()
+
+
+def _caller_key(request: Request) -> str:
+    auth = request.headers.get("authorization") or ""
+    if auth:
+        return hashlib.sha1(auth.encode()).hexdigest()[:16]
+    return request.client.host if request.client else "anonymous"
+
+
+def mark_write(request: Request) -> None:
+    """
+    Remember that this caller just wrote; their reads stay on the primary
+    for a while. Called from the session's after_commit when rows were
+    written; StickyPrimaryMiddleware turns the request state into a cookie.
+    """
+    if not replicas or request.method in _SAFE_METHODS:
+        return
+    setattr(request.state, _STICKY_STATE, time.time() + REPLICA_STICKY_SECONDS)
+    now = time.monotonic()
+    with _routing_lock:
+        _recent_writers[_caller_key(request)] = now
+        if len(_recent_writers) > 10000:
+            cutoff = now - REPLICA_STICKY_SECONDS
+            for k in [k for k, t in _recent_writers.items() if t < cutoff]:
+                del _recent_writers[k]
+
+
+def _count(route: str) -> None:
+    with _routing_lock:
+        _route_counts[route] = _route_counts.get(route, 0) + 1
+
+
+def _sticky_cookie_until(request: Request) -> float:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE) or 0)
+    except ValueError:
+        return 0.0
+
+
+class StickyPrimaryMiddleware:
+    """Pure ASGI middleware: sets STICKY_COOKIE on responses to requests that wrote."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not replicas or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                until = (scope.get("state") or {}).get(_STICKY_STATE)
+                if until is not None:
+                    cookie = (
+                        f"{STICKY_COOKIE}={until:.3f}; Max-Age={int(REPLICA_STICKY_SECONDS)}; "
+                        "Path=/; HttpOnly; SameSite=Lax"
+                    )
+                    headers = list(message.get("headers", []))
+                    headers.append((b"set-cookie", cookie.encode()))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+def choose_read_sessionmaker(request: Optional[Request] = None):
+    """Returns (sessionmaker, route) for a read-only unit of work."""
+    if not replicas:
+        return SessionLocal, "primary"
+    if request is not None:
+        wrote_at = _recent_writers.get(_caller_key(request))
+        if (
+            wrote_at is not None and time.monotonic() - wrote_at < REPLICA_STICKY_SECONDS
+        ) or _sticky_cookie_until(request) > time.time():
+            _count("primary:sticky")
+            return SessionLocal, "primary"
+    for _ in range(len(replicas)):
+        with _routing_lock:
+            replica = next(_replica_cycle)
+        if replica.usable():
+            _count(replica.name)
+            return replica.sessionmaker, replica.name
+    _count("primary:lag_fallback")
+    return SessionLocal, "primary"
+
+
+def get_read_db(request: Request = None):
+    """
+    Read-only database dependency: a replica session when one is fresh
+    enough, else the primary. Don't write through it.
+    """
+    factory, route = choose_read_sessionmaker(request)
+    db = factory()
+    db.info["db_route"] = route
+    try:
+        yield db
+    except Exception as e:
+        logger.error(f"Read database session error ({route}): {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _pool_stats(eng: Engine) -> Dict[str, object]:
+    pool = eng.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "status": pool.status(),
+    }
+
+
+def pool_metrics() -> Dict[str, object]:
+    """Per-engine pool usage, replica lag and how reads were routed."""
+    engines = {"primary": {**_pool_stats(engine), "lag_seconds": 0.0}}
+    for r in replicas:
+        engines[r.name] = {**_pool_stats(r.engine), "lag_seconds": r.lag, "error": r.error, "usable": r.usable()}
+    with _routing_lock:
+        routed = dict(_route_counts)
+        sticky_callers = sum(1 for t in _recent_writers.values() if time.monotonic() - t < REPLICA_STICKY_SECONDS)
+    return {
+        "engines": engines,
+        "routed_reads": routed,
+        "sticky_callers": sticky_callers,
+        "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+    }
+
 # Health check function - FIXED for SQLAlchemy 2.0
 def check_database_connection():
     """
@@ -0,0 +1,154 @@
+# db/contact_keys.py
+"""
+crm_contact_keys: batched duplicate lookup and backfill.
+
+    python -m db.contact_keys backfill
+"""
+
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, insert, or_, select, text
+from sqlalchemy.orm import Session
+
+from db.connection import engine
+from db.models import ContactKey, Lead, UserDetails
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CHUNK = 10000  # keys per statement (bind parameter limit)
+
+
+@dataclass
+class ContactConflict:
+    kind: str
+    value: str
+    field: str
+    lead_id: Optional[int]
+    employee_code: Optional[str]
+    name: Optional[str]
+
+    @property
+    def is_user(self) -> bool:
+        return self.employee_code is not None
+
+
+def find_conflicts(
+    db: Session,
+    keys: Iterable[Tuple[str, Optional[str]]],
+    *,
+    exclude_user_id: Optional[str] = None,
+    exclude_lead_id: Optional[int] = None,
+) -> List[ContactConflict]:
+    """
+    Every lead/user holding any of the given (kind, normalized value) keys,
+    users first. One query (per LOOKUP_CHUNK keys).
+    """
+    by_kind: Dict[str, Set[str]] = {}
+    for kind, value in keys:
+        if value:
+            by_kind.setdefault(kind, set()).add(value)
+    if not by_kind:
+        return []
+
+    flat = [(k, v) for k, vs in by_kind.items() for v in sorted(vs)]
+    out: List[ContactConflict] = []
+    for i in range(0, len(flat), LOOKUP_CHUNK):
+        chunk: Dict[str, List[str]] = {}
+        for k, v in flat[i:i + LOOKUP_CHUNK]:
+            chunk.setdefault(k, []).append(v)
+
+        q = (
+            select(
+                ContactKey.kind,
+                ContactKey.value,
+                ContactKey.field,
+                ContactKey.lead_id,
+                ContactKey.employee_code,
+                func.coalesce(UserDetails.name, Lead.full_name),
+            )
+            .outerjoin(UserDetails, UserDetails.employee_code == ContactKey.employee_code)
+            .outerjoin(Lead, Lead.id == ContactKey.lead_id)
+            .where(or_(*[and_(ContactKey.kind == k, ContactKey.value.in_(vs)) for k, vs in chunk.items()]))
+        )
+        if exclude_user_id:
+            q = q.where(or_(ContactKey.employee_code.is_(None), ContactKey.employee_code != exclude_user_id))
+        if exclude_lead_id:
+            q = q.where(or_(ContactKey.lead_id.is_(None), ContactKey.lead_id != exclude_lead_id))
+        out.extend(ContactConflict(*row) for row in db.execute(q).all())
+
+    out.sort(key=lambda c: (not c.is_user, c.lead_id or 0))
+    return out
+
+
+def index_leads(db: Session, rows: Iterable[dict]) -> None:
+    """Keys for leads written with Core inserts (bulk upload), which skip the ORM hook."""
+    from utils.contact_keys import LEAD_KEY_FIELDS, key_rows
+
+    key_data = [k for r in rows for k in key_rows(r, LEAD_KEY_FIELDS, lead_id=r["id"])]
+    for i in range(0, len(key_data), LOOKUP_CHUNK):
+        db.execute(insert(ContactKey), key_data[i:i + LOOKUP_CHUNK])
+
+
+# -----------------------------
+# Backfill
+# -----------------------------
+def _mobile_sql(col: str) -> str:
+    # same rules as utils.contact_keys.normalize_mobile
+    d = f"regexp_replace(COALESCE({col}, ''), '\\D', '', 'g')"
+    return (
+        f"CASE WHEN length({d}) = 12 AND left({d}, 2) = '91' THEN substr({d}, 3) "
+        f"WHEN length({d}) = 11 AND left({d}, 1) = '0' THEN substr({d}, 2) "
+        f"ELSE {d} END"
+    )
+
+
+BACKFILL_SQL = text(
+    f"""
+    INSERT INTO crm_contact_keys (kind, value, field, lead_id, employee_code)
+    SELECT kind, value, field, lead_id, employee_code FROM (
+        SELECT 'email' AS kind, lower(btrim(email)) AS value, 'email' AS field,
+               id AS lead_id, CAST(NULL AS VARCHAR) AS employee_code FROM crm_lead
+        UNION ALL
+        SELECT 'mobile', {_mobile_sql('mobile')}, 'mobile', id, NULL FROM crm_lead
+        UNION ALL
+        SELECT 'mobile', {_mobile_sql('alternate_mobile')}, 'alternate_mobile', id, NULL FROM crm_lead
+        UNION ALL
+        SELECT 'pan', upper(btrim(pan)), 'pan', id, NULL FROM crm_lead
+        UNION ALL
+        SELECT 'email', lower(btrim(email)), 'email', NULL, employee_code FROM crm_user_details
+        UNION ALL
+        SELECT 'mobile', {_mobile_sql('phone_number')}, 'phone_number', NULL, employee_code FROM crm_user_details
+        UNION ALL
+        SELECT 'pan', upper(btrim(pan)), 'pan', NULL, employee_code FROM crm_user_details
+    ) k
+    WHERE value IS NOT NULL AND value <> ''
+    ON CONFLICT DO NOTHING
+    """
+)
+
+
+def backfill() -> int:
+    with engine.begin() as conn:
+        return conn.execute(BACKFILL_SQL).rowcount
+
+
+def ensure_contact_keys() -> None:
+    """Fill crm_contact_keys once, when the table is new (create_all made it empty)."""
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM crm_contact_keys LIMIT 1")).first():
+            return
+        n = conn.execute(BACKFILL_SQL).rowcount
+        if n:
+            logger.info("crm_contact_keys backfilled with %d keys", n)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        print(f"inserted {backfill()} keys")
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,173 @@
+# db/lead_owner.py
+"""
+Lead.effective_owner / Lead.assignment_user: schema patch, backfill, the
+shared visibility predicate and an EXPLAIN benchmark against the old
+OR/EXISTS predicate.
+
+    python -m db.lead_owner backfill
+    python -m db.lead_owner bench <manager_employee_code>
+"""
+
+import json
+import logging
+import sys
+import time
+from typing import List, Sequence
+
+from sqlalchemy import and_, literal, or_, select, text
+
+from db.connection import SessionLocal, engine
+from db.models import Lead, LeadAssignment
+
+logger = logging.getLogger(__name__)
+
+
+def owned_by(codes: Sequence[str]):
+    """
+    Visibility predicate for scoped lead queries: the lead's assigned_to_user
+    or its LeadAssignment user is in `codes`, same rows as the old predicate.
+    Both are columns on crm_lead, so this is a BitmapOr of two index scans.
+    """
+    codes = [c for c in codes if c]
+    if not codes:
+        return literal(False)
+    return or_(Lead.assigned_to_user.in_(codes), Lead.assignment_user.in_(codes))
+
+
+def _legacy_predicate(codes: Sequence[str]):
+    """The pre-effective_owner predicate, kept for the benchmark only."""
+    return or_(
+        Lead.assigned_to_user.in_(codes),
+        select(literal(1))
+        .select_from(LeadAssignment)
+        .where(and_(LeadAssignment.lead_id == Lead.id, LeadAssignment.user_id.in_(codes)))
+        .correlate(Lead)
+        .exists(),
+    )
+
+
+# -----------------------------
+# Schema / backfill
+# -----------------------------
+BACKFILL_SQL = text(
+    """
+    WITH src AS (
+        SELECT l.id, COALESCE(a.user_id, l.assigned_to_user) AS owner, a.user_id AS assignment_user
+          FROM crm_lead l
+          LEFT JOIN crm_lead_assignments a ON a.lead_id = l.id
+    )
+    UPDATE crm_lead l
+       SET effective_owner = src.owner,
+           assignment_user = src.assignment_user
+      FROM src
+     WHERE src.id = l.id
+       AND (l.effective_owner IS DISTINCT FROM src.owner
+            OR l.assignment_user IS DISTINCT FROM src.assignment_user)
+    """
+)
+
+_COLUMN_DDL = (
+    ("effective_owner", "ix_lead_owner_delete_created", "effective_owner"),
+    ("assignment_user", "ix_lead_assignment_user_delete_created", "assignment_user"),
+    (None, "ix_lead_assignee_delete_created", "assigned_to_user"),
+)
+
+
+def backfill() -> int:
+    with engine.begin() as conn:
+        return conn.execute(BACKFILL_SQL).rowcount
+
+
+def ensure_lead_owner_column() -> None:
+    """
+    create_all() doesn't add columns to an existing table; add the owner
+    columns and their indexes once, and backfill when a column is new.
+    """
+    with engine.begin() as conn:
+        existing = set(
+            conn.execute(
+                text(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_name = 'crm_lead' "
+                    "AND column_name IN ('effective_owner', 'assignment_user')"
+                )
+            ).scalars()
+        )
+        added = []
+        for column, index, indexed in _COLUMN_DDL:
+            if column is not None and column not in existing:
+                conn.execute(text(f"ALTER TABLE crm_lead ADD COLUMN IF NOT EXISTS {column} VARCHAR(100)"))
+                added.append(column)
+            if column is None or column in added:
+                conn.execute(
+                    text(f"CREATE INDEX IF NOT EXISTS {index} ON crm_lead ({indexed}, is_delete, created_at)")
+                )
+        if added:
+            n = conn.execute(BACKFILL_SQL).rowcount
+            logger.info("crm_lead %s added, %d rows backfilled", ", ".join(added), n)
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def _explain(db, query) -> dict:
+    sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    started = time.perf_counter()
+    plan = db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar()
+    wall_ms = (time.perf_counter() - started) * 1000
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    top = plan[0]
+    root = top["Plan"]
+    return {
+        "execution_ms": top.get("Execution Time"),
+        "planning_ms": top.get("Planning Time"),
+        "wall_ms": round(wall_ms, 2),
+        "root_node": root.get("Node Type"),
+        "shared_hit": root.get("Shared Hit Blocks"),
+        "shared_read": root.get("Shared Read Blocks"),
+        "rows": root.get("Actual Rows"),
+    }
+
+
+def bench(manager_code: str, runs: int = 5) -> dict:
+    """
+    EXPLAIN ANALYZE the paged lead list and the count for a manager's
+    self + subtree, old predicate vs the owner columns.
+    """
+    from utils.user_tree import get_subordinate_ids
+
+    db = SessionLocal()
+    try:
+        codes: List[str] = [manager_code] + list(get_subordinate_ids(db, manager_code))
+        out = {"manager": manager_code, "subtree_size": len(codes), "runs": runs}
+        for name, pred in (("legacy_or_exists", _legacy_predicate(codes)), ("owner_columns_in", owned_by(codes))):
+            base = db.query(Lead).filter(Lead.is_delete.is_(False), pred)
+            page = base.order_by(Lead.created_at.desc()).limit(50)
+            count = base.with_entities(Lead.id)
+            results = {"page": [], "count": []}
+            for _ in range(runs):
+                results["page"].append(_explain(db, page))
+                results["count"].append(_explain(db, count))
+            out[name] = {
+                k: {
+                    "median_execution_ms": sorted(r["execution_ms"] for r in v)[len(v) // 2],
+                    "last": v[-1],
+                }
+                for k, v in results.items()
+            }
+        return out
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "backfill":
+        print(f"updated {backfill()} rows")
+    elif cmd == "bench" and len(sys.argv) > 2:
+        print(json.dumps(bench(sys.argv[2]), indent=2, default=str))
+    else:
+        print(__doc__)
+        sys.exit(2)
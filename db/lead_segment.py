@@ -0,0 +1,58 @@
+# db/lead_segment.py
+"""
+crm_lead.segment moved from TEXT (a JSON-encoded list) to JSONB so list
+endpoints can hand the value straight to the serializer.
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from db.connection import engine
+
+logger = logging.getLogger(__name__)
+
+# legacy values: '["A","B"]' -> ["A","B"], '"A"' / 'A' -> ["A"], '' -> NULL
+_TO_JSONB_FN = text(
+    """
+    CREATE OR REPLACE FUNCTION pg_temp.crm_segment_to_jsonb(v TEXT) RETURNS JSONB AS $$
+    DECLARE
+        j JSONB;
+    BEGIN
+        IF v IS NULL OR btrim(v) = '' THEN
+            RETURN NULL;
+        END IF;
+        BEGIN
+            j := v::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN jsonb_build_array(v);
+        END;
+        IF jsonb_typeof(j) = 'array' THEN
+            RETURN j;
+        END IF;
+        RETURN jsonb_build_array(j);
+    END;
+    $$ LANGUAGE plpgsql IMMUTABLE
+    """
+)
+
+
+def ensure_lead_segment_jsonb() -> None:
+    """create_all() doesn't alter existing columns; convert segment once."""
+    with engine.begin() as conn:
+        data_type = conn.execute(
+            text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'crm_lead' AND column_name = 'segment'"
+            )
+        ).scalar()
+        if data_type is None or data_type == "jsonb":
+            return
+        conn.execute(_TO_JSONB_FN)
+        conn.execute(
+            text(
+                "ALTER TABLE crm_lead ALTER COLUMN segment TYPE JSONB "
+                "USING pg_temp.crm_segment_to_jsonb(segment)"
+            )
+        )
+        logger.info("crm_lead.segment converted from %s to jsonb", data_type)
@@ -0,0 +1,483 @@
+# db/log_partitions.py
+"""
+Monthly range partitions and cold storage for the high-volume log tables.
+
+crm_lead_story, crm_sms_logs, crm_whatsapp_logs, crm_email_logs,
+crm_audit_logs, crm_service_dispatch_history and
+crm_service_dispatch_platform_status are declared in db.models with
+postgresql_partition_by = RANGE (<time column>). Each table has:
+
+    <table>_pYYYYMM         one month, [YYYY-MM-01, next month)
+    <table>_upto_YYYYMM     rows from before the conversion, (MINVALUE, YYYY-MM-01)
+    <table>_default         anything outside the premade months
+
+maintain() premakes LOG_PARTITION_PREMAKE_MONTHS months ahead (moving any
+rows that landed in the default partition) and archives old partitions.
+
+Archiving: a partition whose range ended more than LOG_ARCHIVE_AFTER_MONTHS
+ago is exported to LOG_ARCHIVE_DIR/<partition>.csv.gz (if set) and moved,
+with its indexes, to LOG_ARCHIVE_TABLESPACE (if set; put that tablespace on
+cheap, compressed storage). The partition stays attached, so every query
+still sees it; queries filtered on the time column skip it by pruning.
+Postgres won't attach a foreign (file_fdw) partition under a parent with a
+primary key, hence the tablespace move instead of swapping in the CSV.
+
+ensure_log_partitions() (a db.migrate step) converts plain tables from
+before partitioning: the old table is renamed to <table>_upto_<next month>,
+patched to the new columns and attached as the historic partition. Attaching
+builds the parent's indexes on it under an exclusive lock: on a large table
+run `python -m db.migrate` in a maintenance window.
+
+    python -m db.log_partitions maintain
+    python -m db.log_partitions archive
+    python -m db.log_partitions dedup-email-bodies   # legacy rows -> crm_email_bodies
+    python -m db.log_partitions status
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Table, text
+from sqlalchemy.engine import Connection
+
+from db.connection import engine
+
+logger = logging.getLogger(__name__)
+
+PREMAKE_MONTHS = int(os.getenv("LOG_PARTITION_PREMAKE_MONTHS", "3"))
+ARCHIVE_AFTER_MONTHS = int(os.getenv("LOG_ARCHIVE_AFTER_MONTHS", "12"))
+ARCHIVE_TABLESPACE = os.getenv("LOG_ARCHIVE_TABLESPACE") or None
+ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR") or None
+MAINTAIN_INTERVAL_SECONDS = int(os.getenv("LOG_PARTITION_INTERVAL_SECONDS", str(6 * 3600)))
+DEDUP_BATCH = 5000
+
+ADVISORY_LOCK_KEY = 0x43524D4C50  # "CRMLP"
+SKIP_INITIAL = "log_partitions.skip_initial"  # Connection.info flag used while converting
+
+_PARTITION_BY = re.compile(r"RANGE\s*\(\s*(\w+)\s*\)", re.I)
+
+# Columns the new schema adds to a converted table that need more than a NULL
+# default. Runs against the old table before it is attached.
+_LEGACY_BACKFILL: Dict[str, List[str]] = {
+    "crm_service_dispatch_platform_status": [
+        """
+        UPDATE {legacy} s SET history_created_at = h.created_at
+          FROM crm_service_dispatch_history h
+         WHERE h.id = s.history_id AND s.history_created_at IS NULL
+        """,
+        "DELETE FROM {legacy} WHERE history_created_at IS NULL",
+    ],
+}
+
+
+# -----------------------------
+# Naming / bounds
+# -----------------------------
+def partitioned_tables() -> List[Tuple[Table, str]]:
+    """(table, time column) for every range-partitioned model, in definition order (parents first)."""
+    from db.models import Base
+
+    return [
+        (table, _time_column(table))
+        for table in Base.metadata.tables.values()
+        if table.dialect_options["postgresql"]["partition_by"]
+    ]
+
+
+def _time_column(table: Table) -> str:
+    return _PARTITION_BY.search(table.dialect_options["postgresql"]["partition_by"]).group(1)
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def _this_month() -> date:
+    return _month_start(datetime.now(timezone.utc).date())
+
+
+def _bound(table: Table, month: date) -> str:
+    tz = "+00" if getattr(table.c[_time_column(table)].type, "timezone", False) else ""
+    return f"'{month:%Y-%m-%d} 00:00:00{tz}'"
+
+
+def _month_name(table: Table, month: date) -> str:
+    return f"{table.name}_p{month:%Y%m}"
+
+
+def _legacy_name(table: Table, upto: date) -> str:
+    return f"{table.name}_upto_{upto:%Y%m}"
+
+
+def _default_name(table: Table) -> str:
+    return f"{table.name}_default"
+
+
+def _children(conn: Connection, table: Table) -> Dict[str, Tuple[Optional[date], Optional[date]]]:
+    """partition name -> (lower month, upper month exclusive); None = open / default."""
+    names = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:t)"
+        ),
+        {"t": table.name},
+    ).scalars()
+    pattern = re.compile(rf"^{re.escape(table.name)}_(p|upto_)(\d{{4}})(\d{{2}})$")
+    out: Dict[str, Tuple[Optional[date], Optional[date]]] = {}
+    for name in names:
+        m = pattern.match(name)
+        if m is None:
+            out[name] = (None, None)
+            continue
+        month = date(int(m.group(2)), int(m.group(3)), 1)
+        out[name] = (month, _add_months(month, 1)) if m.group(1) == "p" else (None, month)
+    return out
+
+
+def _relkind(conn: Connection, name: str) -> Optional[str]:
+    return conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": name}
+    ).scalar()
+
+
+# -----------------------------
+# Partition creation
+# -----------------------------
+def create_month_partition(conn: Connection, table: Table, month: date) -> bool:
+    """Create one month's partition; rows already in the default partition move into it."""
+    name = _month_name(table, month)
+    if _relkind(conn, name) is not None:
+        return False
+    col = _time_column(table)
+    lo, hi = _bound(table, month), _bound(table, _add_months(month, 1))
+    default = _default_name(table)
+    stranded = _relkind(conn, default) is not None and conn.execute(
+        text(f'SELECT 1 FROM "{default}" WHERE "{col}" >= {lo} AND "{col}" < {hi} LIMIT 1')
+    ).first()
+    if not stranded:
+        conn.execute(text(f'CREATE TABLE "{name}" PARTITION OF "{table.name}" FOR VALUES FROM ({lo}) TO ({hi})'))
+        return True
+
+    conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{table.name}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    moved = conn.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE "{col}" >= {lo} AND "{col}" < {hi} RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved'
+        )
+    ).rowcount
+    conn.execute(text(f'ALTER TABLE "{table.name}" ATTACH PARTITION "{name}" FOR VALUES FROM ({lo}) TO ({hi})'))
+    logger.info("%s: %d rows moved from the default partition", name, moved)
+    return True
+
+
+def _ensure_default(conn: Connection, table: Table) -> None:
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{_default_name(table)}" PARTITION OF "{table.name}" DEFAULT'))
+
+
+def ensure_months(conn: Connection, table: Table, months_ahead: int = PREMAKE_MONTHS) -> List[str]:
+    """Current month plus months_ahead, skipping whatever the historic partition covers."""
+    covered = max((hi for lo, hi in _children(conn, table).values() if lo is None and hi is not None), default=None)
+    start = _this_month()
+    if covered is not None and covered > start:
+        start = covered
+    created = []
+    for i in range(months_ahead + 1):
+        month = _add_months(_this_month(), i)
+        if month >= start and create_month_partition(conn, table, month):
+            created.append(_month_name(table, month))
+    return created
+
+
+def create_initial_partitions(conn: Connection, table: Table) -> None:
+    """after_create hook (db.models): default partition + the premade months."""
+    if conn.dialect.name != "postgresql" or conn.info.get(SKIP_INITIAL):
+        return
+    _ensure_default(conn, table)
+    ensure_months(conn, table)
+
+
+# -----------------------------
+# Converting pre-partitioning tables
+# -----------------------------
+def _convert_table(conn: Connection, table: Table) -> None:
+    upto = _add_months(_this_month(), 1)
+    legacy = _legacy_name(table, upto)
+    col = _time_column(table)
+
+    old_seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table.name}).scalar()
+    pkey = conn.execute(
+        text("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:t) AND contype = 'p'"),
+        {"t": table.name},
+    ).scalar()
+    if pkey:
+        # CASCADE drops foreign keys pointing at the old id-only key (status -> history)
+        conn.execute(text(f'ALTER TABLE "{table.name}" DROP CONSTRAINT "{pkey}" CASCADE'))
+    for (idx,) in conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :t"),
+        {"t": table.name},
+    ).all():
+        conn.execute(text(f'DROP INDEX "{idx}"'))
+    conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{legacy}"'))
+    if old_seq:
+        conn.execute(text(f"ALTER SEQUENCE {old_seq} RENAME TO \"{legacy}_id_seq\""))
+
+    conn.info[SKIP_INITIAL] = True
+    try:
+        table.create(conn)
+    finally:
+        conn.info.pop(SKIP_INITIAL, None)
+
+    existing = {
+        r.column_name: r.is_nullable == "YES"
+        for r in conn.execute(
+            text(
+                "SELECT column_name, is_nullable FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :t"
+            ),
+            {"t": legacy},
+        )
+    }
+    for c in table.columns:
+        if c.name not in existing:
+            conn.execute(text(f'ALTER TABLE "{legacy}" ADD COLUMN "{c.name}" {c.type.compile(dialect=conn.dialect)}'))
+        elif c.nullable and not existing[c.name]:
+            conn.execute(text(f'ALTER TABLE "{legacy}" ALTER COLUMN "{c.name}" DROP NOT NULL'))
+    for sql in _LEGACY_BACKFILL.get(table.name, []):
+        conn.execute(text(sql.format(legacy=f'"{legacy}"')))
+    for c in table.columns:
+        if not c.nullable:
+            conn.execute(text(f'ALTER TABLE "{legacy}" ALTER COLUMN "{c.name}" SET NOT NULL'))
+
+    conn.execute(
+        text(
+            f'ALTER TABLE "{table.name}" ATTACH PARTITION "{legacy}" '
+            f"FOR VALUES FROM (MINVALUE) TO ({_bound(table, upto)})"
+        )
+    )
+    conn.execute(
+        text(
+            "SELECT setval(pg_get_serial_sequence(:t, 'id'), "
+            f'COALESCE((SELECT MAX(id) FROM "{legacy}"), 0) + 1, false)'
+        ),
+        {"t": table.name},
+    )
+    _ensure_default(conn, table)
+    ensure_months(conn, table)
+    logger.info("%s partitioned by %s; existing rows kept in %s", table.name, col, legacy)
+
+
+def ensure_log_partitions() -> None:
+    """db.migrate step: convert plain log tables, then premake partitions."""
+    for table, _ in partitioned_tables():
+        with engine.begin() as conn:
+            kind = _relkind(conn, table.name)
+            if kind == "r":
+                _convert_table(conn, table)
+            elif kind == "p":
+                _ensure_default(conn, table)
+                ensure_months(conn, table)
+
+
+# -----------------------------
+# Archival
+# -----------------------------
+def _export(partition: str, directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{partition}.csv.gz")
+    tmp = path + ".part"
+    raw = engine.raw_connection()
+    try:
+        with gzip.open(tmp, "wb") as f:
+            raw.cursor().copy_expert(f'COPY "{partition}" TO STDOUT WITH (FORMAT csv, HEADER)', f)
+        raw.commit()
+    finally:
+        raw.close()
+    os.replace(tmp, path)
+    return path
+
+
+def _archive_partition(table: Table, partition: str) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(text(f'SELECT COUNT(*) FROM "{partition}"')).scalar()
+        before = conn.execute(text("SELECT pg_total_relation_size(to_regclass(:p))"), {"p": partition}).scalar()
+    export_path = _export(partition, ARCHIVE_DIR) if ARCHIVE_DIR else None
+    with engine.begin() as conn:
+        if ARCHIVE_TABLESPACE:
+            conn.execute(text(f'ALTER TABLE "{partition}" SET TABLESPACE "{ARCHIVE_TABLESPACE}"'))
+            for (idx,) in conn.execute(
+                text("SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(:p)"),
+                {"p": partition},
+            ).all():
+                conn.execute(text(f"ALTER INDEX {idx} SET TABLESPACE \"{ARCHIVE_TABLESPACE}\""))
+        after = conn.execute(text("SELECT pg_total_relation_size(to_regclass(:p))"), {"p": partition}).scalar()
+        conn.execute(
+            text(
+                """
+                INSERT INTO crm_log_partition_archive
+                    (partition_name, parent_table, row_count, bytes_before, bytes_after, export_path, tablespace)
+                VALUES (:p, :t, :rows, :before, :after, :path, :ts)
+                ON CONFLICT (partition_name) DO NOTHING
+                """
+            ),
+            {"p": partition, "t": table.name, "rows": rows, "before": before, "after": after,
+             "path": export_path, "ts": ARCHIVE_TABLESPACE},
+        )
+    return {"partition": partition, "rows": rows, "bytes_before": before, "export_path": export_path}
+
+
+def archive(older_than_months: int = ARCHIVE_AFTER_MONTHS) -> List[dict]:
+    """Move partitions whose range ended older_than_months ago to cold storage."""
+    if not (ARCHIVE_DIR or ARCHIVE_TABLESPACE):
+        logger.info("log archive: neither LOG_ARCHIVE_DIR nor LOG_ARCHIVE_TABLESPACE set, skipping")
+        return []
+    cutoff = _add_months(_this_month(), -older_than_months)
+    done = []
+    for table, _ in partitioned_tables():
+        with engine.connect() as conn:
+            if _relkind(conn, table.name) != "p":
+                continue
+            archived = set(conn.execute(text("SELECT partition_name FROM crm_log_partition_archive")).scalars())
+            due = sorted(
+                name for name, (_, hi) in _children(conn, table).items()
+                if hi is not None and hi <= cutoff and name not in archived
+            )
+        for name in due:
+            result = _archive_partition(table, name)
+            logger.info("log archive: %s", result)
+            done.append(result)
+    return done
+
+
+# -----------------------------
+# Email body dedup for rows logged before crm_email_bodies
+# -----------------------------
+_DEDUP_SQL = text(
+    """
+    WITH batch AS (
+        SELECT id, sent_at, body, encode(sha256(convert_to(body, 'UTF8')), 'hex') AS h
+          FROM crm_email_logs
+         WHERE body_hash IS NULL AND body IS NOT NULL
+         LIMIT :n
+           FOR UPDATE SKIP LOCKED
+    ), stored AS (
+        INSERT INTO crm_email_bodies (hash, body)
+        SELECT DISTINCT ON (h) h, body FROM batch
+        ON CONFLICT (hash) DO NOTHING
+    )
+    UPDATE crm_email_logs l SET body_hash = b.h, body = NULL
+      FROM batch b
+     WHERE l.id = b.id AND l.sent_at = b.sent_at
+    """
+)
+
+
+def dedup_email_bodies(batch: int = DEDUP_BATCH) -> int:
+    """Move inline crm_email_logs.body text into crm_email_bodies; returns rows rewritten."""
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            n = conn.execute(_DEDUP_SQL, {"n": batch}).rowcount
+        total += n
+        if n < batch:
+            return total
+
+
+# -----------------------------
+# Periodic maintenance
+# -----------------------------
+def maintain() -> Optional[dict]:
+    """Premake partitions and archive old ones; None if another process holds the lock."""
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY}).scalar():
+            return None
+        try:
+            created = []
+            for table, _ in partitioned_tables():
+                with engine.begin() as conn:
+                    if _relkind(conn, table.name) == "p":
+                        created += ensure_months(conn, table)
+            return {"created": created, "archived": archive()}
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+            lock_conn.commit()
+
+
+def status() -> List[dict]:
+    out = []
+    with engine.connect() as conn:
+        archived = {}
+        if conn.execute(text("SELECT to_regclass('crm_log_partition_archive')")).scalar():
+            archived = dict(conn.execute(text("SELECT partition_name, archived_at FROM crm_log_partition_archive")).all())
+        for table, col in partitioned_tables():
+            kind = _relkind(conn, table.name)
+            entry = {"table": table.name, "column": col, "partitioned": kind == "p", "partitions": []}
+            if kind == "p":
+                for name, (lo, hi) in sorted(_children(conn, table).items()):
+                    size = conn.execute(text("SELECT pg_total_relation_size(to_regclass(:p))"), {"p": name}).scalar()
+                    entry["partitions"].append(
+                        {"name": name, "from": lo, "to": hi, "bytes": size, "archived_at": archived.get(name)}
+                    )
+            out.append(entry)
+    return out
+
+
+class LogPartitionLoop:
+    def __init__(self, interval: int = MAINTAIN_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                result = await asyncio.to_thread(maintain)
+                if result is not None:
+                    logger.info("[log-partitions] %s", result)
+            except Exception as e:
+                logger.error("[log-partitions] maintenance failed: %s", e)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+log_partition_loop = LogPartitionLoop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "maintain":
+        print(json.dumps(maintain(), indent=2, default=str))
+    elif cmd == "archive":
+        print(json.dumps(archive(), indent=2, default=str))
+    elif cmd == "dedup-email-bodies":
+        print(f"rewrote {dedup_email_bodies()} email log rows")
+    elif cmd == "status":
+        print(json.dumps(status(), indent=2, default=str))
+    else:
+        print(__doc__)
+        sys.exit(2)
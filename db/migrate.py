@@ -0,0 +1,187 @@
+# db/migrate.py
+"""
+One-shot schema/bootstrap step.
+
+    python -m db.migrate            # apply (deploy step, before workers start)
+    python -m db.migrate status
+
+create_all, the ensure_* column patches and setup_complete_system() run here
+once per schema revision instead of on every worker boot. The revision is a
+hash of the model metadata plus BOOTSTRAP_REVISION and is stored in
+crm_schema_state, so a booting worker needs one SELECT to see the database is
+already initialized. Bump BOOTSTRAP_REVISION when seed data or an ensure_*
+patch changes without a model change.
+"""
+
+import hashlib
+import logging
+import os
+import sys
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError
+
+from db import models
+from db.connection import engine
+
+logger = logging.getLogger(__name__)
+
+BOOTSTRAP_REVISION = "1"
+MIGRATE_ON_BOOT = os.getenv("DB_MIGRATE_ON_BOOT", "1") == "1"
+_LOCK_KEY = 0x43524D5343  # pg_advisory_lock key shared by all workers ("CRMSC")
+
+_STATE_DDL = text(
+    """
+    CREATE TABLE IF NOT EXISTS crm_schema_state (
+        id SMALLINT PRIMARY KEY,
+        revision VARCHAR(64) NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """
+)
+
+
+def schema_revision() -> str:
+    """Stable hash of tables/columns/indexes/constraints + BOOTSTRAP_REVISION."""
+    dialect = postgresql.dialect()
+    parts: List[str] = [f"bootstrap:{BOOTSTRAP_REVISION}"]
+    for table in sorted(models.Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(f"table:{table.name}")
+        for col in table.columns:
+            parts.append(f"  {col.name} {col.type.compile(dialect=dialect)} null={col.nullable}")
+        for idx in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(f"  index:{idx.name} unique={idx.unique} {[c.name for c in idx.columns]}")
+        for cons in sorted(table.constraints, key=lambda c: (type(c).__name__, c.name or "")):
+            cols = [c.name for c in getattr(cons, "columns", ())]
+            parts.append(f"  {type(cons).__name__}:{cons.name} {cols}")
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+
+def applied_revision() -> Optional[str]:
+    """The revision recorded by the last migration (None on a fresh database)."""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass('crm_schema_state')")).scalar() is None:
+            return None
+        return conn.execute(text("SELECT revision FROM crm_schema_state WHERE id = 1")).scalar()
+
+
+def is_initialized() -> bool:
+    """Fast boot check: one catalog lookup + one primary-key read."""
+    try:
+        return applied_revision() == schema_revision()
+    except DBAPIError as e:
+        logger.warning(f"Schema state check failed: {e}")
+        return False
+
+
+def _create_tables() -> None:
+    models.Base.metadata.create_all(engine)
+
+
+def _bootstrap() -> None:
+    from db.complete_initialization import setup_complete_system
+
+    if not setup_complete_system():
+        raise RuntimeError("System setup failed")
+
+
+def _steps() -> List[Tuple[str, Callable[[], None]]]:
+    from db.attendance_summary import ensure_attendance_summary
+    from db.contact_keys import ensure_contact_keys
+    from db.lead_owner import ensure_lead_owner_column
+    from db.lead_segment import ensure_lead_segment_jsonb
+    from db.log_partitions import ensure_log_partitions
+    from db.old_lead_queue import ensure_old_lead_queue
+    from services.auth_login import ensure_login_indexes
+    from services.branch_directory import ensure_branch_directory_indexes
+    from services.client_list import ensure_client_list_indexes
+    from services.employee_directory import ensure_directory_indexes
+    from services.lead_fetch import ensure_fetch_history_unique
+    from services.lead_navigation import ensure_navigation_index
+    from services.permissions import ensure_permission_columns
+    from services.token_store import ensure_token_store
+
+    return [
+        ("create_all", _create_tables),
+        ("lead_owner_column", ensure_lead_owner_column),
+        ("lead_segment_jsonb", ensure_lead_segment_jsonb),
+        ("contact_keys", ensure_contact_keys),
+        ("fetch_history_unique", ensure_fetch_history_unique),
+        ("old_lead_queue", ensure_old_lead_queue),
+        ("log_partitions", ensure_log_partitions),
+        ("client_list_indexes", ensure_client_list_indexes),
+        ("login_indexes", ensure_login_indexes),
+        ("token_store", ensure_token_store),
+        ("branch_directory_indexes", ensure_branch_directory_indexes),
+        ("lead_navigation_index", ensure_navigation_index),
+        ("attendance_summary", ensure_attendance_summary),
+        ("permission_columns", ensure_permission_columns),
+        ("employee_directory_indexes", ensure_directory_indexes),
+        ("bootstrap", _bootstrap),
+    ]
+
+
+def run_migrations(step_timer=None) -> bool:
+    """
+    Apply pending schema/bootstrap work. Serialized with an advisory lock so
+    workers booting together run it once; the others wait, re-check and skip.
+    Returns True if anything ran.
+    """
+    revision = schema_revision()
+    with engine.connect() as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _LOCK_KEY})
+        try:
+            if applied_revision() == revision:
+                return False
+            for name, step in _steps():
+                if step_timer is not None:
+                    with step_timer(f"migrate.{name}"):
+                        step()
+                else:
+                    step()
+                logger.info(f"Migration step done: {name}")
+            with engine.begin() as conn:
+                conn.execute(_STATE_DDL)
+                conn.execute(
+                    text(
+                        "INSERT INTO crm_schema_state (id, revision) VALUES (1, :rev) "
+                        "ON CONFLICT (id) DO UPDATE SET revision = EXCLUDED.revision, applied_at = now()"
+                    ),
+                    {"rev": revision},
+                )
+            logger.info(f"Schema revision {revision[:12]} applied")
+            return True
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+            lock_conn.commit()
+
+
+def ensure_migrated(step_timer=None) -> None:
+    """Boot hook: skip when initialized, else migrate (or warn if disabled)."""
+    if is_initialized():
+        logger.info("✅ Database already initialized")
+        return
+    if not MIGRATE_ON_BOOT:
+        logger.warning(
+            "Schema revision %s not applied and DB_MIGRATE_ON_BOOT=0; run `python -m db.migrate`",
+            schema_revision()[:12],
+        )
+        return
+    run_migrations(step_timer)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "apply"
+    if cmd == "apply":
+        print("applied" if run_migrations() else "already up to date")
+    elif cmd == "status":
+        current, applied = schema_revision(), applied_revision()
+        print(f"model revision:   {current}")
+        print(f"applied revision: {applied}")
+        sys.exit(0 if current == applied else 1)
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -1,13 +1,16 @@
 from sqlalchemy import (
     Column, Integer, String, Text, Date, DateTime, Float, Boolean,
-    JSON, ARRAY, ForeignKey, func, Enum, Enum as SAEnum, text, select, BigInteger
+    JSON, ARRAY, ForeignKey, func, Enum, Enum as SAEnum, text, select, BigInteger, Index,
+    UniqueConstraint, delete, insert, ForeignKeyConstraint, DDL, literal_column
 )
-from sqlalchemy.orm import relationship, column_property
+from sqlalchemy import event
+from sqlalchemy.orm import relationship, column_property, Session
 from db.connection import Base
 import uuid
 import enum
 from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime   
+import hashlib
 
 # class RecommendationType(str, enum.Enum):
 #     equity_cash= "Equity Cash"
@@ -221,6 +224,9 @@ class UserDetails(Base):
     branch_id         = Column(Integer, ForeignKey("crm_branch_details.id"), nullable=True)
     senior_profile_id  = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=True)
     permissions = Column(ARRAY(String), nullable=True, default=[])
+    # permissions, or the role's defaults when empty; maintained below (services/permissions.py)
+    effective_permissions = Column(ARRAY(String), nullable=False, default=list, server_default="{}")
+    permission_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     vbc_extension_id = Column(String(10), nullable=True)
     vbc_user_username = Column(String(100), nullable=True)
@@ -288,6 +294,21 @@ class UserDetails(Base):
                     cascade="all, delete-orphan"
                 )
 
+    __table_args__ = (
+        Index("ix_user_email_lower", func.lower(email)),  # login lookup (services/auth_login.py)
+        Index("ix_user_branch_role", "branch_id", "role_id"),  # branch members / headcounts (services/branch_directory.py)
+        Index("ix_user_effective_permissions", "effective_permissions", postgresql_using="gin"),  # permission holders
+        # employee directory search / pages (services/employee_directory.py)
+        Index(
+            "ix_user_search_trgm",
+            func.lower(name + literal_column("' '") + email + literal_column("' '") + phone_number
+                       + literal_column("' '") + employee_code).label("search_text"),
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        ),
+        Index("ix_user_name_code", "name", "employee_code"),
+    )
+
 
 
 class TokenDetails(Base):
@@ -307,7 +328,16 @@ class TokenDetails(Base):
         nullable=False
     )
 
-    refresh_token = Column(String(255), unique=True, nullable=False)
+    # legacy plaintext column; new sessions only store the digest below
+    refresh_token = Column(String(255), unique=True, nullable=True)
+
+    # services/token_store.py: sha256 of the token, one family per login
+    token_hash = Column(String(64), nullable=False)
+    family_id = Column(String(36), nullable=False)
+    device = Column(String(255), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    rotated_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
 
     created_at = Column(
         DateTime(timezone=True),
@@ -317,6 +347,16 @@ class TokenDetails(Base):
 
     user = relationship("UserDetails", back_populates="tokens")
 
+    __table_args__ = (
+        Index("uq_token_details_hash", "token_hash", unique=True),
+        Index("ix_token_details_user", "user_id"),
+        Index("ix_token_details_family", "family_id"),
+        # services/token_store.purge(), one pass per index
+        Index("ix_token_details_expires", "expires_at"),
+        Index("ix_token_details_revoked", "revoked_at", postgresql_where=revoked_at.isnot(None)),
+        Index("ix_token_details_rotated", "rotated_at", postgresql_where=rotated_at.isnot(None)),
+    )
+
 
 class BranchDetails(Base):
     __tablename__ = "crm_branch_details"
@@ -371,6 +411,12 @@ class LeadAssignment(Base):
     lead         = relationship("Lead", back_populates="assignment")
     user         = relationship("UserDetails")
 
+    __table_args__ = (
+        # a user's assignment sequence, index-only (services/lead_navigation.py)
+        Index("ix_lead_assignment_user_fetched", "user_id", "fetched_at", "id",
+              postgresql_include=["lead_id", "is_call"]),
+    )
+
 
 class LeadFetchConfig(Base):
     __tablename__ = "crm_lead_fetch_config"
@@ -389,6 +435,10 @@ class LeadFetchConfig(Base):
 
 class LeadFetchHistory(Base):
     __tablename__ = "crm_lead_fetch_history"
+    __table_args__ = (
+        # one counter row per user/day: services.lead_fetch.consume_daily_fetch upserts on it
+        Index("uq_lead_fetch_history_user_date", "user_id", "date", unique=True),
+    )
     id          = Column(Integer, primary_key=True, autoincrement=True)
     user_id     = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=False)
     date        = Column(Date, nullable=False, index=True)
@@ -417,12 +467,17 @@ class LeadResponse(Base):
 
 class LeadStory(Base):
     __tablename__ = "crm_lead_story"
+    __table_args__ = (
+        Index("ix_lead_story_lead_time", "lead_id", "timestamp"),
+        Index("ix_lead_story_user_time", "user_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id               = Column(Integer, primary_key=True, autoincrement=True)
     lead_id          = Column(Integer, ForeignKey("crm_lead.id"), nullable=False)
     user_id          = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=False)
     msg              = Column(Text, nullable=False)
-    timestamp        = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    timestamp        = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), nullable=False)
 
     lead             = relationship("Lead", back_populates="stories")
     user             = relationship("UserDetails")
@@ -465,7 +520,7 @@ class Lead(Base):
 
     dob               = Column(Date, nullable=True)
     occupation        = Column(String(100), nullable=True)
-    segment           = Column(Text, nullable=True)  # Store as JSON string
+    segment           = Column(JSONB, nullable=True)  # list of segment names
     ft_service_type   = Column(String(50), nullable=True) #call or sms
     experience        = Column(String(50), nullable=True)
     investment        = Column(String(50), nullable=True)
@@ -491,6 +546,14 @@ class Lead(Base):
     ft_from_date      = Column(String(50), nullable=True)
     is_client         = Column(Boolean, default=False, nullable=True)
     assigned_to_user = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=True)
+    # whoever currently "has" the lead: the latest of LeadAssignment.user_id /
+    # assigned_to_user (transfer source, old-lead queue, load counts).
+    effective_owner = Column(String(100), nullable=True)
+    # copy of LeadAssignment.user_id. Scoped lead queries match
+    # assigned_to_user OR assignment_user (db.lead_owner.owned_by), two index
+    # scans instead of an EXISTS per row. Both maintained by
+    # _sync_lead_effective_owner below.
+    assignment_user = Column(String(100), nullable=True)
     response_changed_at = Column(DateTime(timezone=True), nullable=True)
     assigned_for_conversion = Column(Boolean, default=False, nullable=True) 
     conversion_deadline = Column(DateTime(timezone=True), nullable=True)
@@ -510,6 +573,27 @@ class Lead(Base):
     recordings = relationship("LeadRecording", back_populates="lead", cascade="all, delete-orphan")
     assigned_user = relationship("UserDetails", foreign_keys=[assigned_to_user])
 
+    __table_args__ = (
+        Index("ix_lead_owner_delete_created", "effective_owner", "is_delete", "created_at"),
+        Index("ix_lead_assignee_delete_created", "assigned_to_user", "is_delete", "created_at"),
+        Index("ix_lead_assignment_user_delete_created", "assignment_user", "is_delete", "created_at"),
+        # client list (services/client_list.py): live clients only
+        Index(
+            "ix_lead_clients_created", created_at.desc(), id.desc(),
+            postgresql_where=(is_client == True) & (is_delete == False),
+        ),
+        Index(
+            "ix_lead_clients_assignee_created", "assigned_to_user", created_at.desc(),
+            postgresql_where=(is_client == True) & (is_delete == False),
+        ),
+        Index(
+            "ix_lead_clients_branch_created", "branch_id", created_at.desc(),
+            postgresql_where=(is_client == True) & (is_delete == False),
+        ),
+        # per-branch lead / client totals, index-only (services/branch_directory.py)
+        Index("ix_lead_branch_live", "branch_id", "is_client", postgresql_where=(is_delete == False)),
+    )
+
 class Payment(Base):
     __tablename__ = "crm_payment"
 
@@ -537,6 +621,7 @@ class Payment(Base):
     transaction_id   = Column(String(100), nullable=True)
     user_id          = Column(String(50), nullable=True)
     branch_id        = Column(String(50), nullable=True)
+    status_event_at  = Column(DateTime(timezone=True), nullable=True)  # event_time of the last applied gateway status
 
     created_at       = Column(
                          DateTime(timezone=True),
@@ -554,20 +639,29 @@ class Payment(Base):
     lead_id          = Column(Integer, ForeignKey("crm_lead.id"), nullable=True)
     lead             = relationship("Lead", back_populates="payments")
 
+    __table_args__ = (
+        Index("ix_payment_lead_created", "lead_id", created_at.desc()),
+        Index("ix_payment_branch", "branch_id", postgresql_include=["status", "paid_amount"]),
+    )
+
 
 class ServiceDispatchHistory(Base):
     __tablename__ = "crm_service_dispatch_history"
+    __table_args__ = (
+        Index("ix_dispatch_history_lead_time", "lead_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    lead_id = Column(Integer, ForeignKey("crm_lead.id"), nullable=False, index=True)
+    lead_id = Column(Integer, ForeignKey("crm_lead.id"), nullable=False)
     recommendation_id = Column(Integer, ForeignKey("crm_narration.id"), nullable=True, index=True)
     payment_id = Column(Integer, ForeignKey("crm_payment.id"), nullable=True, index=True)
 
     service_name = Column(String(150), nullable=False, index=True)
     scheduled_for = Column(DateTime(timezone=True), nullable=False)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), nullable=False)
 
     # Relationships
     lead = relationship("Lead", backref="dispatch_histories")
@@ -578,9 +672,19 @@ class ServiceDispatchHistory(Base):
 
 class ServiceDispatchPlatformStatus(Base):
     __tablename__ = "crm_service_dispatch_platform_status"
+    # partitioned by the parent's month, so a history row and its statuses age out together
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["history_id", "history_created_at"],
+            ["crm_service_dispatch_history.id", "crm_service_dispatch_history.created_at"],
+        ),
+        Index("ix_dispatch_status_history", "history_id", "history_created_at"),
+        {"postgresql_partition_by": "RANGE (history_created_at)"},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    history_id = Column(Integer, ForeignKey("crm_service_dispatch_history.id"), nullable=False)
+    history_id = Column(Integer, nullable=False)
+    history_created_at = Column(DateTime(timezone=True), primary_key=True, nullable=False)
 
     platform = Column(String(30), nullable=False)  # SMS, WHATSAPP, CALL, EMAIL, APPLICATION
     platform_identifier = Column(String(100), nullable=True)  # Twilio ID, WhatsApp Msg ID, etc.
@@ -660,13 +764,18 @@ class Service(Base):
     
 class AuditLog(Base):
     __tablename__ = "crm_audit_logs"
+    __table_args__ = (
+        Index("ix_audit_logs_entity_time", "entity", "entity_id", "timestamp"),
+        Index("ix_audit_logs_user_time", "user_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id        = Column(Integer, primary_key=True, autoincrement=True)
     user_id   = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=False)
     action    = Column(String(20), nullable=False)
     entity    = Column(String(50), nullable=False)
     entity_id = Column(String(100), nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), nullable=False)
     details   = Column(JSON, nullable=True)
 
     user      = relationship("UserDetails", back_populates="audit_logs")
@@ -686,6 +795,37 @@ class Attendance(Base):
 
     employee      = relationship("UserDetails", back_populates="attendance_records")
 
+    __table_args__ = (
+        # one row per employee/day: bulk ingest upserts on it (services/attendance.py)
+        Index("uq_attendance_employee_date", "employee_code", "date", unique=True),
+    )
+
+
+class AttendanceMonthly(Base):
+    """Per employee/month attendance counters, maintained by db/attendance_summary.py."""
+    __tablename__ = "crm_attendance_monthly"
+
+    employee_code = Column(String(100), ForeignKey("crm_user_details.employee_code", ondelete="CASCADE"), primary_key=True)
+    month         = Column(Date, primary_key=True)  # first day of the month
+    branch_id     = Column(Integer, nullable=True)  # employee's branch when last recomputed
+
+    days_recorded = Column(Integer, nullable=False, default=0)
+    present       = Column(Integer, nullable=False, default=0)  # incl. late / half day
+    absent        = Column(Integer, nullable=False, default=0)
+    late          = Column(Integer, nullable=False, default=0)
+    half_day      = Column(Integer, nullable=False, default=0)
+    leave         = Column(Integer, nullable=False, default=0)
+    work_minutes  = Column(Integer, nullable=False, default=0)
+    # bit (day - 1): present on / any record for that day of the month
+    present_mask  = Column(Integer, nullable=False, default=0)
+    recorded_mask = Column(Integer, nullable=False, default=0)
+
+    updated_at    = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_attendance_monthly_branch_month", "branch_id", "month"),
+    )
+
 
 class SalarySlip(Base):
     __tablename__ = "crm_salary_slips"
@@ -710,6 +850,8 @@ class PanVerification(Base):
     PANnumber = Column(String(10), primary_key=True, index=True)
     response  = Column(Text, nullable=True)
     APICount = Column(Integer, default=0, nullable=False)
+    result_kind = Column(String(10), nullable=True)                 # full / partial / negative
+    expires_at  = Column(DateTime(timezone=True), nullable=True)    # NULL = never (full results)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(
                     DateTime(timezone=True),
@@ -779,6 +921,11 @@ class SMSTemplate(Base):
 
 class SMSLog(Base):
     __tablename__ = "crm_sms_logs"
+    __table_args__ = (
+        Index("ix_sms_logs_lead_time", "lead_id", "sent_at"),
+        Index("ix_sms_logs_user_time", "user_id", "sent_at"),
+        {"postgresql_partition_by": "RANGE (sent_at)"},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     template_id = Column(Integer, ForeignKey("crm_sms_templates.id"), nullable=False)
@@ -788,14 +935,19 @@ class SMSLog(Base):
     sms_type = Column(String(50), nullable=True)
     status = Column(String(50), nullable=True)
     sent_id = Column(String(100), nullable=True)
-    sent_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    user_id = Column(String(50), nullable=False, index=True)
+    sent_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
+    user_id = Column(String(50), nullable=False)
 
     template = relationship("SMSTemplate", back_populates="logs")
 
 
 class WhatsappLog(Base):
     __tablename__ = "crm_whatsapp_logs"
+    __table_args__ = (
+        Index("ix_whatsapp_logs_lead_time", "lead_id", "sent_at"),
+        Index("ix_whatsapp_logs_user_time", "user_id", "sent_at"),
+        {"postgresql_partition_by": "RANGE (sent_at)"},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     template_id = Column(Integer, ForeignKey("crm_sms_templates.id"), nullable=True)
@@ -805,24 +957,75 @@ class WhatsappLog(Base):
     template = Column(Text, nullable=False)
     sms_type = Column(String(50), nullable=True)
     status = Column(String(50), nullable=True)
-    sent_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    user_id = Column(String(50), nullable=False, index=True)
+    sent_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
+    user_id = Column(String(50), nullable=False)
+
+
+def email_body_hash(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class EmailBody(Base):
+    """One copy of each distinct email body (rational mails repeat the same HTML)."""
+    __tablename__ = "crm_email_bodies"
+
+    hash       = Column(String(64), primary_key=True)  # sha256 hex of the body
+    body       = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
 
 class EmailLog(Base):
     __tablename__ = "crm_email_logs"
+    __table_args__ = (
+        Index("ix_email_logs_recipient_time", "recipient_email", "sent_at"),
+        Index("ix_email_logs_user_time", "user_id", "sent_at"),
+        {"postgresql_partition_by": "RANGE (sent_at)"},
+    )
 
     id              = Column(Integer, primary_key=True, autoincrement=True)
     template_id     = Column(Integer, ForeignKey("crm_email_templates.id"), nullable=True)
-    recipient_email = Column(String(320), nullable=False, index=True)
+    recipient_email = Column(String(320), nullable=False)
     sender_email = Column(String(320), nullable=True)
     mail_type = Column(String(50), nullable=True)
     subject         = Column(String(200), nullable=False)
-    body            = Column(Text, nullable=False)
-    user_id         = Column(String(50), nullable=False, index=True)
+    body_text       = Column("body", Text, nullable=True)  # rows logged before crm_email_bodies
+    body_hash       = Column(String(64), ForeignKey("crm_email_bodies.hash"), nullable=True)
+    user_id         = Column(String(50), nullable=False)
     sent_id = Column(String(100), nullable=True)
-    sent_at         = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at         = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
 
     template = relationship("EmailTemplate", back_populates="logs")
+    stored_body = relationship("EmailBody", lazy="selectin", viewonly=True)
+
+    _pending_body = None
+
+    @property
+    def body(self):
+        if self._pending_body is not None:
+            return self._pending_body
+        if self.stored_body is not None:
+            return self.stored_body.body
+        return self.body_text
+
+    @body.setter
+    def body(self, value):
+        # the text goes to crm_email_bodies (once per hash) in the before_flush hook below
+        self._pending_body = value
+        self.body_hash = email_body_hash(value) if value is not None else None
+        self.body_text = None
+
+class LogPartitionArchive(Base):
+    """Partitions of the log tables moved to cold storage by db/log_partitions.py."""
+    __tablename__ = "crm_log_partition_archive"
+
+    partition_name = Column(String(100), primary_key=True)
+    parent_table   = Column(String(100), nullable=False, index=True)
+    row_count      = Column(BigInteger, nullable=True)
+    bytes_before   = Column(BigInteger, nullable=True)
+    bytes_after    = Column(BigInteger, nullable=True)
+    export_path    = Column(String(500), nullable=True)
+    tablespace     = Column(String(100), nullable=True)
+    archived_at    = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 # also add back‑ref on EmailTemplate:
 EmailTemplate.logs = relationship(
@@ -849,3 +1052,512 @@ class ClientConsent(Base):
     ref_id = Column(String(40), unique=True, nullable=False)
     mail_sent = Column(Boolean, nullable=True, default=False)
 
+
+
+class OutboxEvent(Base):
+    """
+    Transactional outbox for side-effects (notifications, emails, invoices).
+    Rows are inserted in the same transaction as the business write and
+    drained by services/outbox.py workers.
+    """
+    __tablename__ = "crm_outbox_events"
+
+    id              = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind            = Column(String(50), nullable=False)
+    lane            = Column(String(20), nullable=False, default="default")
+    priority        = Column(Integer, nullable=False, default=100)  # lower runs first
+    payload         = Column(JSONB, nullable=False, server_default="{}")
+    idempotency_key = Column(String(200), nullable=True, unique=True)
+
+    status          = Column(String(20), nullable=False, default="PENDING")  # PENDING / PROCESSING / DONE / DEAD
+    attempts        = Column(Integer, nullable=False, default=0)
+    max_attempts    = Column(Integer, nullable=False, default=8)
+    last_error      = Column(Text, nullable=True)
+
+    available_at    = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_at       = Column(DateTime(timezone=True), nullable=True)
+    locked_by       = Column(String(100), nullable=True)
+    created_at      = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    processed_at    = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_claim", "lane", "status", "priority", "available_at"),
+    )
+
+
+class PaymentWebhookEvent(Base):
+    """
+    One row per distinct gateway event (dedup key = event_id). Webhooks only
+    insert here; services/payment_events.py applies queued rows in batches.
+    """
+    __tablename__ = "crm_payment_webhook_events"
+
+    id             = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_id       = Column(String(200), nullable=False, unique=True)
+    order_id       = Column(String(100), nullable=True, index=True)
+    payment_status = Column(String(50), nullable=True)
+    event_time     = Column(DateTime(timezone=True), nullable=True)
+    payload        = Column(JSONB, nullable=False, server_default="{}")
+
+    status         = Column(String(20), nullable=False, default="QUEUED")  # QUEUED / APPLIED / STALE / ORPHAN / ERROR
+    error          = Column(Text, nullable=True)
+    received_at    = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    applied_at     = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_payment_webhook_events_status_id", "status", "id"),
+    )
+
+
+class VBCCallLog(Base):
+    """Local index of VBC call-log reports (synced by services/vbc_sync.py)."""
+    __tablename__ = "crm_vbc_call_logs"
+
+    id            = Column(BigInteger, primary_key=True, autoincrement=True)
+    vbc_id        = Column(String(100), nullable=False, unique=True)
+    direction     = Column(String(20), nullable=True)
+    from_number   = Column(String(50), nullable=True)
+    to_number     = Column(String(50), nullable=True)
+    norm_phone    = Column(String(32), nullable=True, index=True)  # customer side, 10 digits
+    extension     = Column(String(20), nullable=True, index=True)
+    employee_code = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=True, index=True)
+    lead_id       = Column(Integer, ForeignKey("crm_lead.id"), nullable=True, index=True)
+    start_time    = Column(DateTime(timezone=True), nullable=True, index=True)
+    duration      = Column(Integer, nullable=True)
+    result        = Column(String(50), nullable=True)
+    raw           = Column(JSONB, nullable=True)
+    synced_at     = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_vbc_call_logs_emp_start", "employee_code", "start_time"),
+    )
+
+
+class VBCCallRecording(Base):
+    """Local index of VBC company call recordings."""
+    __tablename__ = "crm_vbc_call_recordings"
+
+    id                = Column(BigInteger, primary_key=True, autoincrement=True)
+    recording_id      = Column(String(100), nullable=False, unique=True)
+    call_id           = Column(String(100), nullable=True, index=True)
+    direction         = Column(String(20), nullable=True)
+    caller_id         = Column(String(50), nullable=True)
+    dnis              = Column(String(50), nullable=True)
+    cnam              = Column(String(100), nullable=True)
+    norm_phone        = Column(String(32), nullable=True, index=True)
+    extension         = Column(String(20), nullable=True, index=True)
+    employee_code     = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=True, index=True)
+    lead_id           = Column(Integer, ForeignKey("crm_lead.id"), nullable=True, index=True)
+    lead_recording_id = Column(Integer, ForeignKey("crm_lead_recordings.id"), nullable=True)
+    start_time        = Column(DateTime(timezone=True), nullable=True, index=True)
+    duration          = Column(Integer, nullable=True)
+    raw               = Column(JSONB, nullable=True)
+    synced_at         = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_vbc_recordings_emp_start", "employee_code", "start_time"),
+    )
+
+
+class VBCSyncCursor(Base):
+    __tablename__ = "crm_vbc_sync_cursors"
+
+    name         = Column(String(50), primary_key=True)  # call_logs / company_recordings
+    synced_until = Column(DateTime(timezone=True), nullable=True)
+    last_run_at  = Column(DateTime(timezone=True), nullable=True)
+    last_error   = Column(Text, nullable=True)
+    rows_synced  = Column(BigInteger, nullable=False, default=0)
+
+
+class ReferenceVersion(Base):
+    """One row per cached lookup table; bumped by every write (services/reference_data.py)."""
+    __tablename__ = "crm_reference_versions"
+
+    name       = Column(String(50), primary_key=True)
+    version    = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class ContactKey(Base):
+    """
+    Normalized email / mobile / PAN of every lead and user, one row per
+    source field (see utils.contact_keys). Duplicate checks look keys up
+    here instead of ILIKE-ing crm_lead and crm_user_details separately.
+    """
+    __tablename__ = "crm_contact_keys"
+
+    id            = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind          = Column(String(10), nullable=False)    # email / mobile / pan
+    value         = Column(String(100), nullable=False)
+    field         = Column(String(30), nullable=False)    # source attribute, e.g. alternate_mobile
+    lead_id       = Column(Integer, ForeignKey("crm_lead.id", ondelete="CASCADE"), nullable=True)
+    employee_code = Column(
+        String(100),
+        ForeignKey("crm_user_details.employee_code", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=True,
+    )
+
+    __table_args__ = (
+        UniqueConstraint("lead_id", "field", name="uq_contact_key_lead_field"),
+        UniqueConstraint("employee_code", "field", name="uq_contact_key_user_field"),
+        Index("ix_contact_key_kind_value", "kind", "value"),
+    )
+
+
+class OldLeadQueue(Base):
+    """
+    Ready-queue of the old-lead pool (see db.old_lead_queue). One row per
+    old, live, non-client lead; is_ready rows can be fetched now, the others
+    become ready at ready_at (assignment TTL). Fetching pops the top
+    priority rows of a branch from a partial index.
+    """
+    __tablename__ = "crm_old_lead_queue"
+
+    lead_id   = Column(Integer, ForeignKey("crm_lead.id", ondelete="CASCADE"), primary_key=True)
+    branch_id = Column(Integer, nullable=True)
+    priority  = Column(Float, nullable=False)
+    attempts  = Column(Integer, nullable=False, default=0)
+    is_ready  = Column(Boolean, nullable=False, default=True)
+    ready_at  = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_old_lead_queue_branch_ready", "branch_id", priority.desc(), postgresql_where=is_ready),
+        Index("ix_old_lead_queue_ready", priority.desc(), postgresql_where=is_ready),
+        Index("ix_old_lead_queue_pending", "branch_id", "ready_at", postgresql_where=~is_ready),
+    )
+
+
+class LeadTransferJob(Base):
+    """
+    Bulk lead transfer / rebalance (services/lead_transfer.py). Leads matching
+    `filters` with id <= max_lead_id are moved a chunk at a time in id order;
+    last_lead_id, the counters and the strategy state (loads) are written in
+    the same transaction as each chunk, so a retried job resumes where it
+    stopped.
+    """
+    __tablename__ = "crm_lead_transfer_jobs"
+
+    id             = Column(Integer, primary_key=True, autoincrement=True)
+    status         = Column(String(20), nullable=False, default="PENDING")  # PENDING / RUNNING / DONE / FAILED / CANCELLED
+    created_by     = Column(String(100), ForeignKey("crm_user_details.employee_code"), nullable=False)
+    filters        = Column(JSONB, nullable=False, server_default="{}")
+    strategy       = Column(String(20), nullable=False)  # single / round_robin / least_loaded
+    targets        = Column(ARRAY(String), nullable=False)
+    target_branches = Column(JSONB, nullable=False, server_default="{}")  # employee_code -> branch_id
+    loads          = Column(JSONB, nullable=False, server_default="{}")   # least_loaded: employee_code -> open leads
+    recipients     = Column(JSONB, nullable=False, server_default="{}")   # employee_code -> leads moved to them
+    chunk_size     = Column(Integer, nullable=False, default=1000)
+    max_lead_id    = Column(Integer, nullable=False, default=0)
+    last_lead_id   = Column(Integer, nullable=False, default=0)
+    total          = Column(Integer, nullable=False, default=0)
+    moved          = Column(Integer, nullable=False, default=0)
+    skipped        = Column(Integer, nullable=False, default=0)
+    chunks         = Column(Integer, nullable=False, default=0)
+    error          = Column(Text, nullable=True)
+
+    created_at     = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at     = Column(DateTime(timezone=True), nullable=True)
+    finished_at    = Column(DateTime(timezone=True), nullable=True)
+    updated_at     = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_lead_transfer_jobs_creator", "created_by", "created_at"),
+    )
+
+
+# -----------------------------------------------------------------------------
+# Lead.effective_owner / Lead.assignment_user maintenance
+#
+# Every write path (fetch, old-lead fetch, transfer, response change, payment
+# webhook, scheduler cleanups) goes through the ORM, so one before_flush hook
+# keeps the columns right (bulk transfer, services/lead_transfer.py, updates in
+# Core and sets effective_owner itself; it leaves assignments alone):
+#   - new / reassigned LeadAssignment      -> owner = assignment_user = assignment.user_id
+#   - assigned_to_user set                 -> owner = that user
+#   - assigned_to_user cleared             -> owner = remaining assignment user, else NULL
+#   - LeadAssignment deleted               -> owner = assigned_to_user, assignment_user = NULL
+# Assignment changes are applied last, so they win within one flush.
+# -----------------------------------------------------------------------------
+def _owner_lead(session, lead_id):
+    if lead_id is None:
+        return None
+    lead = session.get(Lead, lead_id)
+    if lead is None or lead in session.deleted:
+        return None
+    return lead
+
+
+@event.listens_for(Session, "before_flush")
+def _sync_lead_effective_owner(session, flush_context, instances):
+    from sqlalchemy import inspect as sa_inspect
+
+    with session.no_autoflush:
+        deleted_assignment_leads = set()
+        for obj in list(session.deleted):
+            if isinstance(obj, LeadAssignment):
+                lead = _owner_lead(session, obj.lead_id)
+                if lead is not None:
+                    deleted_assignment_leads.add(lead.id)
+                    lead.effective_owner = lead.assigned_to_user
+                    lead.assignment_user = None
+
+        for obj in list(session.new) + list(session.dirty):
+            if not isinstance(obj, Lead):
+                continue
+            hist = sa_inspect(obj).attrs.assigned_to_user.history
+            if not hist.has_changes() and obj not in session.new:
+                continue
+            if obj.assigned_to_user:
+                obj.effective_owner = obj.assigned_to_user
+            elif obj.id is not None and obj.id not in deleted_assignment_leads:
+                a = obj.assignment
+                obj.effective_owner = a.user_id if a is not None and a not in session.deleted else None
+            else:
+                obj.effective_owner = None
+
+        for obj in list(session.new) + list(session.dirty):
+            if not isinstance(obj, LeadAssignment):
+                continue
+            if obj not in session.new and not sa_inspect(obj).attrs.user_id.history.has_changes():
+                continue
+            lead = obj.lead if obj.lead is not None else _owner_lead(session, obj.lead_id)
+            if lead is not None:
+                lead.effective_owner = obj.user_id
+                lead.assignment_user = obj.user_id
+
+
+# -----------------------------------------------------------------------------
+# crm_contact_keys maintenance
+#
+# Leads and users are created/updated through the ORM (bulk lead upload is the
+# exception and writes its keys itself), so an after_flush hook rewrites the
+# keys of changed fields. Deletes cascade in the database.
+# -----------------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _sync_contact_keys(session, flush_context):
+    from sqlalchemy import inspect as sa_inspect
+    from utils.contact_keys import LEAD_KEY_FIELDS, USER_KEY_FIELDS, key_rows
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Lead):
+            fields, owner_col, owner = LEAD_KEY_FIELDS, ContactKey.lead_id, {"lead_id": obj.id}
+        elif isinstance(obj, UserDetails):
+            fields, owner_col, owner = USER_KEY_FIELDS, ContactKey.employee_code, {"employee_code": obj.employee_code}
+        else:
+            continue
+        if obj in session.new:
+            changed = fields
+        else:
+            attrs = sa_inspect(obj).attrs
+            changed = {f: k for f, k in fields.items() if attrs[f].history.has_changes()}
+            if not changed:
+                continue
+            session.execute(
+                delete(ContactKey).where(owner_col == list(owner.values())[0], ContactKey.field.in_(list(changed)))
+            )
+        rows = key_rows({f: getattr(obj, f) for f in changed}, changed, **owner)
+        if rows:
+            session.execute(insert(ContactKey), rows)
+
+
+# -----------------------------------------------------------------------------
+# crm_old_lead_queue maintenance
+#
+# Same write paths as above; after each flush:
+#   - Lead became/stopped being an old, live, non-client lead -> enqueue/dequeue
+#   - response / response_changed_at / branch changed          -> re-prioritize
+#   - LeadAssignment created or re-stamped                     -> pending until TTL
+#   - LeadAssignment deleted                                   -> ready now
+# Rows whose ready_at passed are promoted lazily by the fetch itself.
+# -----------------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _sync_old_lead_queue(session, flush_context):
+    from db import old_lead_queue as q
+
+    leads = [o for o in list(session.new) + list(session.dirty) if isinstance(o, Lead)]
+    new_assignments = [o for o in list(session.new) + list(session.dirty) if isinstance(o, LeadAssignment)]
+    dropped = [o.lead_id for o in session.deleted if isinstance(o, LeadAssignment)]
+    if leads:
+        q.sync_leads(session, leads)
+    if dropped:
+        q.mark_ready(session, dropped)
+    if new_assignments:
+        q.mark_assigned(session, new_assignments)
+
+
+# -----------------------------------------------------------------------------
+# crm_attendance_monthly: recompute every (employee, month) an ORM attendance
+# write touched, old and new values of a moved row included. Bulk ingest
+# (services/attendance.py) upserts in Core and refreshes its own months.
+# -----------------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _sync_attendance_summary(session, flush_context):
+    from sqlalchemy import inspect as sa_inspect
+
+    keys = set()
+    for o in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(o, Attendance):
+            continue
+        keys.add((o.employee_code, o.date))
+        if o in session.dirty:
+            attrs = sa_inspect(o).attrs
+            for code in attrs.employee_code.history.deleted or [o.employee_code]:
+                for day in attrs.date.history.deleted or [o.date]:
+                    keys.add((code, day))
+    if keys:
+        from db.attendance_summary import refresh_months
+
+        refresh_months(session, keys)
+
+
+# -----------------------------------------------------------------------------
+# Lead navigation cursors (services/lead_navigation.py), applied on commit:
+#   - only is_call changed  -> flip the flag in the user's cached sequence
+#   - anything else         -> drop the (old and new) user's sequence
+# -----------------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _note_assignment_changes(session, flush_context):
+    from sqlalchemy import inspect as sa_inspect
+
+    changes = []
+    for o in list(session.new) + list(session.deleted):
+        if isinstance(o, LeadAssignment):
+            changes.append(("reset", o.user_id, None, None))
+    for o in session.dirty:
+        if not isinstance(o, LeadAssignment):
+            continue
+        attrs = sa_inspect(o).attrs
+        if attrs.user_id.history.has_changes() or attrs.fetched_at.history.has_changes():
+            for user_id in {o.user_id, *attrs.user_id.history.deleted}:
+                changes.append(("reset", user_id, None, None))
+        elif attrs.is_call.history.has_changes():
+            changes.append(("called", o.user_id, o.id, bool(o.is_call)))
+    if changes:
+        session.info.setdefault("assignment_changes", []).extend(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_assignment_changes(session):
+    changes = session.info.pop("assignment_changes", None)
+    if changes:
+        from services.lead_navigation import apply_changes
+
+        apply_changes(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_assignment_changes(session):
+    session.info.pop("assignment_changes", None)
+
+
+# -----------------------------------------------------------------------------
+# crm_user_details.effective_permissions (services/permissions.py):
+#   - user created / permissions or role_id changed -> recompute from the row
+#   - role default_permissions changed              -> recompute its users without own permissions
+# Each recompute bumps permission_version, which retires cached guard masks.
+# -----------------------------------------------------------------------------
+@event.listens_for(Session, "before_flush")
+def _sync_effective_permissions(session, flush_context, instances):
+    from sqlalchemy import inspect as sa_inspect
+
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty):
+            if not isinstance(obj, UserDetails):
+                continue
+            if obj not in session.new:
+                attrs = sa_inspect(obj).attrs
+                if not (attrs.permissions.history.has_changes() or attrs.role_id.history.has_changes()):
+                    continue
+                obj.permission_version = UserDetails.permission_version + 1
+            role = session.get(ProfileRole, obj.role_id) if obj.role_id is not None else None
+            obj.effective_permissions = list(obj.permissions or (role.default_permissions if role else None) or [])
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_role_permissions(session, flush_context):
+    from sqlalchemy import inspect as sa_inspect
+
+    users = UserDetails.__table__
+    for obj in session.dirty:
+        if not isinstance(obj, ProfileRole) or not sa_inspect(obj).attrs.default_permissions.history.has_changes():
+            continue
+        session.execute(
+            users.update()
+            .where(users.c.role_id == obj.id, func.coalesce(func.cardinality(users.c.permissions), 0) == 0)
+            .values(
+                effective_permissions=list(obj.default_permissions or []),
+                permission_version=users.c.permission_version + 1,
+            )
+        )
+
+
+# -----------------------------------------------------------------------------
+# Reference-data versions (services/reference_data.py): any ORM write to a
+# cached lookup table bumps its version row + NOTIFY in the same transaction;
+# this worker's snapshot goes stale on commit.
+# -----------------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _bump_reference_versions(session, flush_context):
+    from services.reference_data import NAME_BY_MODEL, bump_statements
+
+    names = {
+        NAME_BY_MODEL[type(o)]
+        for o in list(session.new) + list(session.dirty) + list(session.deleted)
+        if type(o) in NAME_BY_MODEL
+    }
+    if names:
+        for stmt, params in bump_statements(list(names)):
+            session.execute(stmt, params)
+        session.info.setdefault("reference_changes", set()).update(names)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_reference_changes(session):
+    names = session.info.pop("reference_changes", None)
+    if names:
+        from services.reference_data import reference
+
+        reference.mark_stale(names)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_reference_changes(session):
+    session.info.pop("reference_changes", None)
+
+
+# -----------------------------------------------------------------------------
+# crm_email_bodies: store each new body once, before the log rows referencing it.
+# -----------------------------------------------------------------------------
+@event.listens_for(Session, "before_flush")
+def _store_email_bodies(session, flush_context, instances):
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+    bodies = {
+        o.body_hash: o._pending_body
+        for o in list(session.new) + list(session.dirty)
+        if isinstance(o, EmailLog) and o._pending_body is not None
+    }
+    if bodies:
+        session.execute(
+            pg_insert(EmailBody)
+            .values([{"hash": h, "body": b} for h, b in bodies.items()])
+            .on_conflict_do_nothing(index_elements=["hash"])
+        )
+
+
+# -----------------------------------------------------------------------------
+# Monthly partitions for the range-partitioned log tables, created together
+# with the parent (later months: db/log_partitions.maintain()).
+# -----------------------------------------------------------------------------
+def _create_log_partitions(target, connection, **kw):
+    from db.log_partitions import create_initial_partitions
+
+    create_initial_partitions(connection, target)
+
+
+for _table in list(Base.metadata.tables.values()):
+    if _table.dialect_options["postgresql"]["partition_by"]:
+        event.listen(_table, "after_create", _create_log_partitions)
+
+# ix_user_search_trgm needs pg_trgm before crm_user_details is created
+event.listen(UserDetails.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
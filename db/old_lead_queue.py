@@ -0,0 +1,426 @@
+# db/old_lead_queue.py
+"""
+crm_old_lead_queue: the old-lead pool as a maintained ready-queue.
+
+Old-lead fetch used to scan crm_lead with a three-way OR (never assigned /
+TTL expired / own expired conversion) over an outer join and sort by
+response_changed_at on every call. Now each old, live, non-client lead has
+one queue row with a precomputed priority:
+
+    priority = days since epoch of response_changed_at (or created_at)
+             + response weight (RESPONSE_WEIGHT_DAYS, by response name)
+             - ATTEMPT_PENALTY_DAYS * times fetched from the pool
+
+The ORM hook in db.models keeps rows in step with lead/assignment writes.
+A fetch promotes its branch's rows whose assignment TTL ran out and pops the
+top-N ready rows (FOR UPDATE SKIP LOCKED, so concurrent fetchers get
+disjoint leads) from a partial (branch_id, priority DESC) index.
+
+    python -m db.old_lead_queue rebuild
+    python -m db.old_lead_queue bench [leads]     # default 2,000,000, scratch schema
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import and_, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db.connection import SessionLocal, engine
+from db.models import Lead, LeadAssignment, LeadResponse, OldLeadQueue, UserDetails
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_PENALTY_DAYS = float(os.getenv("OLD_LEAD_ATTEMPT_PENALTY_DAYS", "3"))
+PROMOTE_BATCH = 5000
+
+# Response weight in "days of recency": a CALL BACK lead ranks like one whose
+# response changed a week later; NOT INTERESTED sinks by a fortnight.
+RESPONSE_WEIGHT_DAYS: Dict[str, float] = {
+    "INTERESTED": 10,
+    "CALL BACK": 7,
+    "FT": 5,
+    "BUSY": 2,
+    "CALL DISCONNECTED": 2,
+    "NOT REACHABLE": 0,
+    "SWITCH OFF": 0,
+    "NPC": 0,
+    "FUND ISSUE": -3,
+    "LANGUAGE ISSUE": -10,
+    "NOT INTERESTED": -15,
+    "DND": -30,
+    "DO NOT TRADE": -30,
+}
+RESPONSE_WEIGHT_DAYS.update(json.loads(os.getenv("OLD_LEAD_RESPONSE_WEIGHTS", "{}")))
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def in_pool(lead: Lead) -> bool:
+    return bool(lead.is_old_lead) and not lead.is_delete and not lead.is_client
+
+
+def base_priority(changed_at: Optional[datetime], response_name: Optional[str]) -> float:
+    days = changed_at.timestamp() / 86400 if changed_at else 0.0
+    return days + RESPONSE_WEIGHT_DAYS.get((response_name or "").upper(), 0.0)
+
+
+def _assignment_ttl(session: Session, user_id: str) -> timedelta:
+    from services.lead_fetch import fetch_configs
+
+    user = session.get(UserDetails, user_id)
+    if user is None:
+        cfg, _ = fetch_configs.resolve(session, None, None)
+    else:
+        cfg, _ = fetch_configs.for_user(session, user)
+    return timedelta(hours=cfg.assignment_ttl_hours)
+
+
+# -----------------------------
+# Maintenance (called from the after_flush hook in db.models)
+# -----------------------------
+_QUEUE_FIELDS = ("is_old_lead", "is_delete", "is_client", "lead_response_id", "response_changed_at", "branch_id")
+
+
+def sync_leads(session: Session, leads: Iterable[Lead]) -> None:
+    from sqlalchemy import inspect as sa_inspect
+
+    upserts: List[dict] = []
+    removed: List[int] = []
+    for lead in leads:
+        if lead not in session.new:
+            attrs = sa_inspect(lead).attrs
+            if not any(attrs[f].history.has_changes() for f in _QUEUE_FIELDS):
+                continue
+        if not in_pool(lead):
+            removed.append(lead.id)
+            continue
+        response = session.get(LeadResponse, lead.lead_response_id) if lead.lead_response_id else None
+        assignment = lead.assignment
+        ready_at = utcnow()
+        if assignment is not None and assignment not in session.deleted and assignment.fetched_at:
+            ready_at = assignment.fetched_at + _assignment_ttl(session, assignment.user_id)
+        upserts.append({
+            "lead_id": lead.id,
+            "branch_id": lead.branch_id,
+            "priority": base_priority(lead.response_changed_at or lead.created_at, getattr(response, "name", None)),
+            "attempts": 0,
+            "is_ready": ready_at <= utcnow(),
+            "ready_at": ready_at,
+        })
+
+    if removed:
+        session.execute(OldLeadQueue.__table__.delete().where(OldLeadQueue.lead_id.in_(removed)))
+    if upserts:
+        stmt = pg_insert(OldLeadQueue)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[OldLeadQueue.lead_id],
+                set_={
+                    "branch_id": stmt.excluded.branch_id,
+                    # keep the attempt penalty already earned
+                    "priority": stmt.excluded.priority - ATTEMPT_PENALTY_DAYS * OldLeadQueue.attempts,
+                },
+            ),
+            upserts,
+        )
+
+
+def mark_ready(session: Session, lead_ids: Sequence[int]) -> None:
+    session.execute(
+        update(OldLeadQueue)
+        .where(OldLeadQueue.lead_id.in_(list(lead_ids)))
+        .values(is_ready=True, ready_at=utcnow())
+    )
+
+
+def mark_assigned(session: Session, assignments: Iterable[LeadAssignment]) -> None:
+    from sqlalchemy import inspect as sa_inspect
+
+    by_ready_at: Dict[datetime, List[int]] = {}
+    ttls: Dict[str, timedelta] = {}
+    for a in assignments:
+        if a not in session.new:
+            attrs = sa_inspect(a).attrs
+            if not (attrs.fetched_at.history.has_changes() or attrs.user_id.history.has_changes()):
+                continue
+        # server-default fetched_at isn't loaded after the INSERT; don't refresh it here
+        fetched_at = a.__dict__.get("fetched_at") or utcnow()
+        if a.user_id not in ttls:
+            ttls[a.user_id] = _assignment_ttl(session, a.user_id)
+        by_ready_at.setdefault(fetched_at + ttls[a.user_id], []).append(a.lead_id)
+
+    for ready_at, lead_ids in by_ready_at.items():
+        session.execute(
+            update(OldLeadQueue)
+            .where(OldLeadQueue.lead_id.in_(lead_ids))
+            .values(is_ready=False, ready_at=ready_at)
+        )
+
+
+# -----------------------------
+# Fetch
+# -----------------------------
+def promote_due(db: Session, branch_id: Optional[int]) -> int:
+    """Flip rows whose assignment TTL ran out to ready (skips rows another fetch holds)."""
+    due = select(OldLeadQueue.lead_id).where(
+        ~OldLeadQueue.is_ready, OldLeadQueue.ready_at <= utcnow()
+    )
+    if branch_id:
+        due = due.where(OldLeadQueue.branch_id == branch_id)
+    due = due.limit(PROMOTE_BATCH).with_for_update(skip_locked=True)
+    return db.execute(
+        update(OldLeadQueue).where(OldLeadQueue.lead_id.in_(due)).values(is_ready=True)
+    ).rowcount
+
+
+def pop_ready(
+    db: Session, branch_id: Optional[int], limit: int, ttl: timedelta, exclude: Sequence[int] = ()
+) -> List[int]:
+    """
+    Take the top `limit` ready leads of a branch (all branches when None), in
+    priority order. Rows are locked until the caller's transaction ends and
+    marked pending for `ttl`; a rollback puts them back.
+    """
+    if limit <= 0:
+        return []
+    promote_due(db, branch_id)
+    q = select(OldLeadQueue.lead_id).where(OldLeadQueue.is_ready)  # matches the partial indexes
+    if branch_id:
+        q = q.where(OldLeadQueue.branch_id == branch_id)
+    if exclude:
+        q = q.where(OldLeadQueue.lead_id.notin_(list(exclude)))
+    ids = db.execute(
+        q.order_by(OldLeadQueue.priority.desc()).limit(limit).with_for_update(skip_locked=True)
+    ).scalars().all()
+    if ids:
+        db.execute(
+            update(OldLeadQueue)
+            .where(OldLeadQueue.lead_id.in_(ids))
+            .values(
+                is_ready=False,
+                ready_at=utcnow() + ttl,
+                attempts=OldLeadQueue.attempts + 1,
+                priority=OldLeadQueue.priority - ATTEMPT_PENALTY_DAYS,
+            )
+        )
+    return list(ids)
+
+
+def own_expired_conversions(db: Session, employee_code: str, branch_id: Optional[int], limit: int):
+    """The fetcher's own old leads whose conversion window ran out (small, owner-indexed)."""
+    now = utcnow()
+    q = db.query(Lead).filter(
+        Lead.effective_owner == employee_code,
+        Lead.is_delete.is_(False),
+        Lead.assigned_to_user == employee_code,
+        Lead.is_old_lead.is_(True),
+        Lead.is_client.is_(False),
+        Lead.assigned_for_conversion.is_(True),
+        Lead.conversion_deadline.isnot(None),
+        Lead.conversion_deadline < now,
+    )
+    if branch_id:
+        q = q.filter(Lead.branch_id == branch_id)
+    return (
+        q.order_by(Lead.response_changed_at.desc().nullslast(), Lead.id.desc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+# -----------------------------
+# Rebuild / backfill
+# -----------------------------
+def _rebuild_sql(ttl_hours: int):
+    weights = list(RESPONSE_WEIGHT_DAYS.items())
+    cases = " ".join(f"WHEN :wn{i} THEN :wv{i}" for i in range(len(weights)))
+    params = {"ttl_hours": ttl_hours}
+    for i, (name, days) in enumerate(weights):
+        params[f"wn{i}"], params[f"wv{i}"] = name, days
+    sql = text(
+        f"""
+        INSERT INTO crm_old_lead_queue (lead_id, branch_id, priority, attempts, is_ready, ready_at)
+        SELECT l.id,
+               l.branch_id,
+               COALESCE(EXTRACT(EPOCH FROM COALESCE(l.response_changed_at, l.created_at)) / 86400, 0)
+                 + COALESCE(CASE upper(r.name) {cases} END, 0),
+               0,
+               a.id IS NULL OR a.fetched_at + make_interval(hours => :ttl_hours) <= now(),
+               COALESCE(a.fetched_at + make_interval(hours => :ttl_hours), now())
+          FROM crm_lead l
+          LEFT JOIN crm_lead_assignments a ON a.lead_id = l.id
+          LEFT JOIN crm_lead_response r ON r.id = l.lead_response_id
+         WHERE l.is_old_lead IS TRUE
+           AND l.is_delete IS NOT TRUE
+           AND l.is_client IS NOT TRUE
+        ON CONFLICT (lead_id) DO NOTHING
+        """
+    )
+    return sql, params
+
+
+def rebuild() -> int:
+    """Re-derive the queue from crm_lead (assignment TTL: default fetch config)."""
+    from services.lead_fetch import DEFAULT_FETCH_CONFIG
+
+    sql, params = _rebuild_sql(DEFAULT_FETCH_CONFIG.assignment_ttl_hours)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM crm_old_lead_queue"))
+        return conn.execute(sql, params).rowcount
+
+
+def ensure_old_lead_queue() -> None:
+    """Fill crm_old_lead_queue once, when the table is new (create_all made it empty)."""
+    from services.lead_fetch import DEFAULT_FETCH_CONFIG
+
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM crm_old_lead_queue LIMIT 1")).first():
+            return
+        sql, params = _rebuild_sql(DEFAULT_FETCH_CONFIG.assignment_ttl_hours)
+        n = conn.execute(sql, params).rowcount
+        if n:
+            logger.info("crm_old_lead_queue backfilled with %d leads", n)
+
+
+# -----------------------------
+# Benchmark (scratch schema in a rolled-back transaction)
+# -----------------------------
+_BENCH_SCHEMA = "bench_old_lead_queue"
+
+
+def _legacy_query(db: Session, employee_code: str, branch_id: int, limit: int):
+    """The pre-queue candidate query of fetch_old_leads, kept for the benchmark only."""
+    now = utcnow()
+    expiry_cutoff = now - timedelta(hours=24)
+    return (
+        db.query(Lead.id)
+        .outerjoin(LeadAssignment, LeadAssignment.lead_id == Lead.id)
+        .filter(
+            and_(
+                Lead.is_old_lead.is_(True),
+                Lead.is_delete.is_(False),
+                Lead.is_client.is_(False),
+                or_(
+                    LeadAssignment.id.is_(None),
+                    LeadAssignment.fetched_at < expiry_cutoff,
+                    and_(
+                        Lead.assigned_for_conversion.is_(True),
+                        Lead.conversion_deadline.isnot(None),
+                        Lead.conversion_deadline < now,
+                        Lead.assigned_to_user == employee_code,
+                    ),
+                ),
+                Lead.branch_id == branch_id,
+            )
+        )
+        .order_by(Lead.response_changed_at.desc().nullslast(), Lead.id.desc())
+        .limit(limit)
+    )
+
+
+def _explain_ms(db: Session, sql: str, params: Optional[dict] = None) -> dict:
+    started = time.perf_counter()
+    plan = db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params or {}).scalar()
+    wall_ms = (time.perf_counter() - started) * 1000
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    top = plan[0]
+    return {
+        "execution_ms": top.get("Execution Time"),
+        "wall_ms": round(wall_ms, 2),
+        "root_node": top["Plan"].get("Node Type"),
+        "shared_hit": top["Plan"].get("Shared Hit Blocks"),
+        "shared_read": top["Plan"].get("Shared Read Blocks"),
+    }
+
+
+def bench(n_leads: int = 2_000_000, branches: int = 20, limit: int = 50, runs: int = 5) -> dict:
+    """
+    Seed n_leads old leads (30% assigned, half of those past TTL) into a
+    scratch schema cloned from the live tables, then EXPLAIN ANALYZE the
+    legacy candidate query against the queue promote + pop for one branch.
+    Everything runs in one transaction that is rolled back at the end.
+    """
+    db = SessionLocal()
+    s = _BENCH_SCHEMA
+    try:
+        db.execute(text(f"CREATE SCHEMA {s}"))
+        for table in ("crm_lead", "crm_lead_assignments", "crm_lead_response", "crm_old_lead_queue"):
+            db.execute(text(f"CREATE TABLE {s}.{table} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING INDEXES)"))
+
+        started = time.perf_counter()
+        db.execute(text(
+            f"""
+            INSERT INTO {s}.crm_lead (id, full_name, mobile, is_old_lead, is_delete, is_client,
+                                      branch_id, response_changed_at, created_at, updated_at)
+            SELECT g, 'Lead ' || g, lpad(g::text, 10, '9'), TRUE, FALSE, FALSE,
+                   1 + g % :branches,
+                   now() - (random() * interval '365 days'),
+                   now() - interval '400 days', now()
+              FROM generate_series(1, :n) g
+            """
+        ), {"n": n_leads, "branches": branches})
+        db.execute(text(
+            f"""
+            INSERT INTO {s}.crm_lead_assignments (id, lead_id, user_id, is_call, fetched_at)
+            SELECT g, g, 'EMP' || (g % 500), FALSE,
+                   CASE WHEN g % 2 = 0 THEN now() - interval '2 days' ELSE now() - interval '1 hour' END
+              FROM generate_series(1, :n) g
+             WHERE g % 10 < 3
+            """
+        ), {"n": n_leads})
+        db.execute(text(f"SET LOCAL search_path TO {s}, public"))
+        sql, params = _rebuild_sql(24)
+        db.execute(sql, params)
+        db.execute(text(f"ANALYZE {s}.crm_lead; ANALYZE {s}.crm_lead_assignments; ANALYZE {s}.crm_old_lead_queue"))
+        seed_s = time.perf_counter() - started
+
+        branch = 1
+        legacy_sql = str(
+            _legacy_query(db, "EMP1", branch, limit).statement.compile(engine, compile_kwargs={"literal_binds": True})
+        )
+        promote_sql = (
+            "UPDATE crm_old_lead_queue SET is_ready = TRUE WHERE lead_id IN ("
+            "SELECT lead_id FROM crm_old_lead_queue WHERE NOT is_ready AND ready_at <= now() "
+            f"AND branch_id = {branch} LIMIT {PROMOTE_BATCH} FOR UPDATE SKIP LOCKED)"
+        )
+        pop_sql = (
+            "SELECT lead_id FROM crm_old_lead_queue WHERE is_ready "
+            f"AND branch_id = {branch} ORDER BY priority DESC LIMIT {limit} FOR UPDATE SKIP LOCKED"
+        )
+
+        out = {"leads": n_leads, "branches": branches, "limit": limit, "runs": runs, "seed_seconds": round(seed_s, 1)}
+        out["promote_first"] = _explain_ms(db, promote_sql)
+        for name, sql_ in (("legacy_or_scan", legacy_sql), ("queue_promote", promote_sql), ("queue_pop", pop_sql)):
+            results = [_explain_ms(db, sql_) for _ in range(runs)]
+            out[name] = {
+                "median_execution_ms": sorted(r["execution_ms"] for r in results)[len(results) // 2],
+                "last": results[-1],
+            }
+        return out
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        print(f"queued {rebuild()} leads")
+    elif cmd == "bench":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000_000
+        print(json.dumps(bench(n), indent=2, default=str))
+    else:
+        print(__doc__)
+        sys.exit(2)
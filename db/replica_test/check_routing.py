@@ -0,0 +1,83 @@
+# db/replica_test/check_routing.py
+"""
+Smoke test for replica routing against the docker-compose stand-ins
+(see docker-compose.yml next to this file).
+
+  1. a write on the primary becomes visible on each replica (observed lag)
+  2. anonymous/GET reads go to a replica
+  3. a caller's POST makes their next reads stick to the primary
+  4. pool metrics per engine
+"""
+
+import json
+import sys
+import time
+
+from sqlalchemy import text
+from starlette.requests import Request
+
+from db import connection as dbc
+
+
+def _request(method: str, token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": "/",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 0),
+    })
+
+
+def check_replication(timeout: float = 30.0) -> dict:
+    marker = time.time()
+    with dbc.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS crm_replica_probe (id INT PRIMARY KEY, marker DOUBLE PRECISION)"))
+        conn.execute(
+            text(
+                "INSERT INTO crm_replica_probe (id, marker) VALUES (1, :m) "
+                "ON CONFLICT (id) DO UPDATE SET marker = EXCLUDED.marker"
+            ),
+            {"m": marker},
+        )
+    seen = {}
+    for r in dbc.replicas:
+        started = time.monotonic()
+        while time.monotonic() - started < timeout:
+            try:
+                with r.engine.connect() as conn:
+                    got = conn.execute(text("SELECT marker FROM crm_replica_probe WHERE id = 1")).scalar()
+            except Exception:
+                got = None
+            if got == marker:
+                seen[r.name] = round(time.monotonic() - started, 3)
+                break
+            time.sleep(0.05)
+        else:
+            seen[r.name] = None
+    return seen
+
+
+def main() -> int:
+    if not dbc.replicas:
+        print("DB_REPLICA_URLS is not set")
+        return 2
+
+    out = {"replication_visible_after_s": check_replication()}
+
+    _, route = dbc.choose_read_sessionmaker(_request("GET", "reader"))
+    out["anonymous_read_route"] = route
+
+    dbc.mark_write(_request("POST", "writer"))
+    _, route = dbc.choose_read_sessionmaker(_request("GET", "writer"))
+    out["read_after_write_route"] = route
+
+    out["pool_metrics"] = dbc.pool_metrics()
+    print(json.dumps(out, indent=2, default=str))
+
+    ok = out["anonymous_read_route"] != "primary" and out["read_after_write_route"] == "primary"
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
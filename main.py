@@ -1,46 +1,58 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
-from contextlib import asynccontextmanager
-import uvicorn
-import logging
-import os
-from datetime import datetime, timedelta
-# Import database
-from db.connection import engine, check_database_connection
-from db import models
-
-# Import routes
-from routes.auth import login, register
-from routes.branch import branch
-
-# from scheduler import lead_scheduler
-
-# Import for manual cleanup endpoint
-from routes.auth.auth_dependency import get_current_user
-from routes.Permission import permissions
-from routes.leads import leads, lead_sources, bulk_leads, leads_fetch, fetch_config, lead_responses, assignments, lead_navigation, lead_recordings, clients, lead_analytics, old_leads_fetch, lead_transfer
-# from routes.auth.create_admin import create_admin
-from routes.services import services
-from routes.payments import Cashfree, Cashfree_webhook
-from routes.Pan_verification import PanVerification
-from routes.KYC import kyc_verification, redirect, View_Agreement
-from routes.profile_role import ProfileRole
-from routes.attendance import attendance
-from routes.Rational import Rational
-from routes.notification import notifiaction_websocket, send_notification
-from routes.Send_client_message import Client_mail_service, sms_templates
-from routes.notification.notification_scheduler import start_scheduler, shutdown_scheduler, is_scheduler_running
-from routes.payments import Get_Invoice, payment
-from db.complete_initialization import setup_complete_system
-from routes.VBC_Calling import Create_Call
-from routes.ClientConsent import ClientConsent
-from routes.Dashboard import dashboard
-from routes.state import state
-from pathlib import Path
-from routes.leads import globel_search
+from utils.startup_profile import startup_profile
+
+with startup_profile.imports():
+    from fastapi import FastAPI, Depends, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.staticfiles import StaticFiles
+    from fastapi_cache import FastAPICache
+    from fastapi_cache.backends.inmemory import InMemoryBackend
+    from contextlib import asynccontextmanager
+    import uvicorn
+    import logging
+    import os
+    from datetime import datetime, timedelta
+    # Import database
+    from db.connection import StickyPrimaryMiddleware, check_database_connection, get_db, pool_metrics
+    from db.async_connection import async_engine, get_async_db
+    from db import models
+    from db.migrate import ensure_migrated
+    from services.auth_login import password_pool
+    from services.token_store import recent as recent_token_digests
+
+    # Import routes
+    from routes.auth import login, register
+    from routes.branch import branch
+
+    # from scheduler import lead_scheduler
+
+    # Import for manual cleanup endpoint
+    from routes.auth.auth_dependency import get_current_user
+    from routes.Permission import permissions
+    from routes.leads import leads, lead_sources, bulk_leads, leads_fetch, fetch_config, lead_responses, assignments, lead_navigation, lead_recordings, clients, lead_analytics, old_leads_fetch, lead_transfer
+    # from routes.auth.create_admin import create_admin
+    from routes.services import services
+    from routes.payments import Cashfree, Cashfree_webhook
+    from routes.Pan_verification import PanVerification
+    from routes.KYC import kyc_verification, redirect, View_Agreement
+    from routes.profile_role import ProfileRole
+    from routes.attendance import attendance
+    from routes.Rational import Rational
+    from routes.notification import notifiaction_websocket, send_notification
+    from routes.Send_client_message import Client_mail_service, sms_templates
+    from routes.notification.notification_scheduler import start_scheduler, shutdown_scheduler, is_scheduler_running
+    from services.outbox import OutboxWorker, lanes_from_env
+    from services.payment_events import webhook_applier
+    from services.pan_cache import pan_counter_flusher
+    from services import reference_data
+    from utils.query_stats import QueryStatsMiddleware, route_report
+    from routes.VBC_Calling.vbc_client import vbc_manager
+    from routes.payments import Get_Invoice, payment
+    from routes.VBC_Calling import Create_Call
+    from routes.ClientConsent import ClientConsent
+    from routes.Dashboard import dashboard
+    from routes.state import state
+    from pathlib import Path
+    from routes.leads import globel_search
 
 BASE_DIR = Path(__file__).resolve().parent
 STATIC_ROOT = Path(os.getenv("STATIC_ROOT", BASE_DIR / "static")).resolve()
@@ -48,38 +60,50 @@ STATIC_ROOT.mkdir(parents=True, exist_ok=True)
 
 logger = logging.getLogger(__name__)
 
+# Realtime outbox lane (websocket notifications) is drained in-process because
+# the sockets live here; heavy lanes run in outbox_worker.py.
+outbox_worker = OutboxWorker(lanes_from_env("OUTBOX_INPROCESS_LANES", "realtime"), concurrency=8)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 Starting CRM Backend...")
 
     try:
+        step = startup_profile.step
+
         # 1) Start all schedulers ONCE here
         # lead_scheduler.start()          # your existing lead scheduler
-        start_scheduler()               # notification (APS) scheduler
+        with step("scheduler"):
+            start_scheduler()               # notification (APS) scheduler
 
         # 2) Init cache
         FastAPICache.init(InMemoryBackend(), prefix="fastapi-cache")
         logger.info("✅ Cache initialized")
 
-        # 3) DB check + tables
-        if not check_database_connection():
-            raise Exception("Database connection failed")
+        # 3) DB check; schema/bootstrap only when the revision changed
+        #    (deploys run `python -m db.migrate` before starting workers)
+        with step("db_check"):
+            if not check_database_connection():
+                raise Exception("Database connection failed")
         logger.info("✅ Database connection verified")
-        models.Base.metadata.create_all(engine)
-        logger.info("✅ Database tables created/verified")
+        with step("schema_check"):
+            ensure_migrated(step)
 
-        # 4) Bootstrap system
-        if setup_complete_system():
-            logger.info("✅ Complete system setup successful!")
-        else:
-            logger.error("❌ System setup failed!")
-
-        # 5) Static dirs
+        # 4) Static dirs
         os.makedirs("static/agreements", exist_ok=True)
         os.makedirs("static/lead_documents", exist_ok=True)
         logger.info("✅ Static directories created")
 
+        # 5) Outbox drain (in-process lanes) + payment webhook applier
+        with step("background_workers"):
+            outbox_worker.start()
+            webhook_applier.start()
+            pan_counter_flusher.start()
+            if reference_data.LISTEN:
+                reference_data.reference_listener.start()
+
         logger.info("🎉 Application startup completed successfully!")
+        startup_profile.log()
 
     except Exception as e:
         logger.error(f"❌ Application startup failed: {e}")
@@ -99,6 +123,34 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Notification scheduler stop error: {e}")
 
+    try:
+        await webhook_applier.stop()
+        await outbox_worker.stop()
+    except Exception as e:
+        logger.warning(f"Outbox worker stop error: {e}")
+
+    try:
+        await pan_counter_flusher.stop()
+    except Exception as e:
+        logger.warning(f"PAN counter flush error: {e}")
+
+    try:
+        await reference_data.reference_listener.stop()
+    except Exception as e:
+        logger.warning(f"Reference listener stop error: {e}")
+
+    password_pool.shutdown()
+
+    try:
+        await vbc_manager.aclose()
+    except Exception as e:
+        logger.warning(f"VBC client close error: {e}")
+
+    try:
+        await async_engine.dispose()
+    except Exception as e:
+        logger.warning(f"Async engine dispose error: {e}")
+
     logger.info("🛑 Shutting down CRM Backend...")
 
 # Initialize FastAPI app with lifespan
@@ -118,6 +170,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request SQL statement count / DB time (X-DB-* headers, /debug/query-stats)
+app.add_middleware(QueryStatsMiddleware)
+
+# Read-your-writes cookie for callers that just wrote (see db/connection.py)
+app.add_middleware(StickyPrimaryMiddleware)
+
 # Mount static files
 app.mount("/api/v1/static", StaticFiles(directory="static"), name="static")
 
@@ -147,6 +205,74 @@ def health_check():
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
+# Per-route SQL statement report (see utils/query_stats.py)
+@app.get("/api/v1/debug/query-stats")
+def query_stats_report(sort: str = "queries", current_user=Depends(get_current_user)):
+    if getattr(current_user, "role_name", None) != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Only SUPERADMIN can view query stats")
+    return {"routes": route_report.snapshot(sort)}
+
+@app.delete("/api/v1/debug/query-stats")
+def query_stats_reset(current_user=Depends(get_current_user)):
+    if getattr(current_user, "role_name", None) != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Only SUPERADMIN can reset query stats")
+    route_report.reset()
+    return {"reset": True}
+
+# Connection pools per engine, replica lag and read routing (db/connection.py)
+@app.get("/api/v1/debug/db-pools")
+def db_pool_report(current_user=Depends(get_current_user)):
+    if getattr(current_user, "role_name", None) != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Only SUPERADMIN can view pool metrics")
+    return pool_metrics()
+
+# Login bcrypt pool: pending/queued checks, rejections, wait vs hash time (services/auth_login.py)
+@app.get("/api/v1/debug/password-pool")
+def password_pool_report(current_user=Depends(get_current_user)):
+    if getattr(current_user, "role_name", None) != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Only SUPERADMIN can view password pool metrics")
+    return password_pool.stats()
+
+# Refresh-token LRU: recently rotated / known-dead digests in this worker (services/token_store.py)
+@app.get("/api/v1/debug/token-store")
+def token_store_report(current_user=Depends(get_current_user)):
+    if getattr(current_user, "role_name", None) != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Only SUPERADMIN can view token store metrics")
+    return recent_token_digests.stats()
+
+# Lookup-table snapshots: versions, hits/misses, 304s, push vs poll (services/reference_data.py)
+@app.get("/api/v1/debug/reference-cache")
+def reference_cache_report(current_user=Depends(get_current_user)):
+    if getattr(current_user, "role_name", None) != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Only SUPERADMIN can view reference cache metrics")
+    return reference_data.reference.stats()
+
+# Same query through each DB stack, for utils/loadtest.py (off unless LOADTEST_PROBES=1)
+if os.getenv("LOADTEST_PROBES", "0") == "1":
+    from sqlalchemy import select as _select
+    from sqlalchemy.orm import Session as _Session
+    from sqlalchemy.ext.asyncio import AsyncSession as _AsyncSession
+
+    _PROBE_STMT = (
+        _select(models.Lead.id, models.Lead.full_name, models.Lead.created_at)
+        .where(models.Lead.is_delete.is_(False), models.Lead.is_client.is_(True))
+        .order_by(models.Lead.created_at.desc())
+        .limit(20)
+    )
+
+    @app.get("/api/v1/debug/db-probe/blocking")
+    async def db_probe_blocking(db: _Session = Depends(get_db)):
+        # async route + sync session: the query blocks the event loop
+        return {"rows": len(db.execute(_PROBE_STMT).all())}
+
+    @app.get("/api/v1/debug/db-probe/threadpool")
+    def db_probe_threadpool(db: _Session = Depends(get_db)):
+        return {"rows": len(db.execute(_PROBE_STMT).all())}
+
+    @app.get("/api/v1/debug/db-probe/async")
+    async def db_probe_async(db: _AsyncSession = Depends(get_async_db)):
+        return {"rows": len((await db.execute(_PROBE_STMT)).all())}
+
 # Register all your existing routes
 try:
     app.include_router(lead_transfer.router, prefix="/api/v1")
@@ -203,12 +329,6 @@ except Exception as e:
     logger.error(f"Failed to register routes: {e}")
     raise
 
-try:
-    models.Base.metadata.create_all(engine)
-    logger.info("Tables created successfully!")
-except Exception as e:
-    logger.error(f"Error creating tables: {e}", exc_info=True)
-
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
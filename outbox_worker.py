@@ -0,0 +1,69 @@
+# outbox_worker.py - standalone drain process for services/outbox.py
+#
+#   python outbox_worker.py                       # default + bulk lanes
+#   OUTBOX_WORKER_LANES=bulk python outbox_worker.py
+#
+# The realtime lane (websocket notifications) is drained inside the web
+# process, see OUTBOX_INPROCESS_LANES in main.py.
+#
+# VBC_SYNC_ENABLED=1 also runs the VBC call-log / recording index sync
+# (services/vbc_sync.py) in this process.
+#
+# LOG_PARTITION_MAINTENANCE=1 (default) premakes monthly partitions of the log
+# tables and archives old ones (db/log_partitions.py).
+#
+# TOKEN_PURGE=1 (default) deletes expired / revoked / long-rotated refresh
+# tokens (services/token_store.py).
+
+import asyncio
+import logging
+import os
+import signal
+
+from db.log_partitions import log_partition_loop
+from services.outbox import OutboxWorker, lanes_from_env
+from services.token_store import token_purge_loop
+from services.vbc_sync import vbc_sync_loop
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def _main():
+    worker = OutboxWorker(
+        lanes_from_env("OUTBOX_WORKER_LANES", "default,bulk"),
+        concurrency=int(os.getenv("OUTBOX_WORKER_CONCURRENCY", "4")),
+        batch_size=int(os.getenv("OUTBOX_WORKER_BATCH", "20")),
+    )
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    sync_enabled = os.getenv("VBC_SYNC_ENABLED", "0") == "1"
+    partitions_enabled = os.getenv("LOG_PARTITION_MAINTENANCE", "1") == "1"
+    purge_enabled = os.getenv("TOKEN_PURGE", "1") == "1"
+
+    worker.start()
+    if sync_enabled:
+        vbc_sync_loop.start()
+    if partitions_enabled:
+        log_partition_loop.start()
+    if purge_enabled:
+        token_purge_loop.start()
+    await stop.wait()
+    if purge_enabled:
+        await token_purge_loop.stop()
+    if partitions_enabled:
+        await log_partition_loop.stop()
+    if sync_enabled:
+        await vbc_sync_loop.stop()
+    await worker.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
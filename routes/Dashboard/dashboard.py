@@ -1,11 +1,12 @@
 # routes/analytics/dashboard.py
 from fastapi import APIRouter, Depends, Query, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, select, literal, case
+from sqlalchemy import or_, func, literal, case
 from typing import Optional, List, Dict, Any, Tuple, Literal
 from datetime import datetime, date, timedelta, time
 
-from db.connection import get_db
+from db.connection import get_read_db
+from db.lead_owner import owned_by
 from db.models import (
     Lead, Payment, UserDetails, LeadAssignment,
     BranchDetails, LeadSource, LeadResponse
@@ -89,22 +90,6 @@ def _allowed_codes_for_employee_scope(
     else:  # "all"
         return [current_user.employee_code] + subs
 
-def _exists_assignment_for_allowed(allowed_codes: List[str]):
-    if not allowed_codes:
-        return literal(False)
-    return (
-        select(literal(1))
-        .select_from(LeadAssignment)
-        .where(
-            and_(
-                LeadAssignment.lead_id == Lead.id,
-                LeadAssignment.user_id.in_(allowed_codes),
-            )
-        )
-        .correlate(Lead)
-        .exists()
-    )
-
 def _scope_leads(
     db: Session,
     current_user: UserDetails,
@@ -125,12 +110,7 @@ def _scope_leads(
         q = q.filter(Lead.branch_id == b_id)
     else:
         allowed = _allowed_codes_for_employee_scope(db, current_user, view) or []
-        q = q.filter(
-            or_(
-                Lead.assigned_to_user.in_(allowed),
-                _exists_assignment_for_allowed(allowed),
-            )
-        )
+        q = q.filter(owned_by(allowed))
 
     if branch_id is not None:
         q = q.filter(Lead.branch_id == branch_id)
@@ -190,12 +170,7 @@ def _apply_common_lead_filters(
 
     if employee_id:
         # match by LeadAssignment or assigned_to_user
-        q = q.filter(
-            or_(
-                Lead.assigned_to_user == employee_id,
-                _exists_assignment_for_allowed([employee_id]),
-            )
-        )
+        q = q.filter(owned_by([employee_id]))
 
     if profile_id or department_id:
         # join to assignee's profile if needed
@@ -448,12 +423,7 @@ def source_and_response_wise_lead_analytics(
     if employee_id or profile_id or department_id:
         leads_q = leads_q.outerjoin(UserDetails, Lead.assigned_to_user == UserDetails.employee_code)
         if employee_id:
-            leads_q = leads_q.filter(
-                or_(
-                    Lead.assigned_to_user == employee_id,
-                    _exists_assignment_for_allowed([employee_id]),
-                )
-            )
+            leads_q = leads_q.filter(owned_by([employee_id]))
         if profile_id:
             leads_q = leads_q.filter(UserDetails.role_id == profile_id)
         if department_id and hasattr(UserDetails, "department_id"):
@@ -919,7 +889,7 @@ def dashboard(
     view: Literal["self","team","all","other"] = Query("all"),
 
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     from_dt, to_dt = _bounds_from_to(from_date, to_date, days)
     v_req = _resolved_view(view)
@@ -1002,7 +972,7 @@ def payment_card(
     employee_id: Optional[str] = Query(None),
     view: Literal["self","team","all","other"] = Query("all"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     from_dt, to_dt = _bounds_from_to(from_date, to_date, days)
     return payment_analytics(
@@ -1028,7 +998,7 @@ def leads_card(
     employee_id: Optional[str] = Query(None),
     view: Literal["self","team","all","other"] = Query("all"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     from_dt, to_dt = _bounds_from_to(from_date, to_date, days)
     return lead_analytics(
@@ -1052,7 +1022,7 @@ def source_response_breakdown(
     employee_id: Optional[str] = Query(None),
     view: Literal["self","team","all","other"] = Query("all"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     from_dt, to_dt = _bounds_from_to(from_date, to_date, days)
     return source_and_response_wise_lead_analytics(
@@ -1072,7 +1042,7 @@ def top_branches(
     view: Literal["self","team","all","other"] = Query("all"),
     limit: int = Query(10, ge=1, le=50),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     if _role(current_user) != "SUPERADMIN":
         return _blank_list()
@@ -1091,7 +1061,7 @@ def top_employees(
     view: Literal["self","team","all","other"] = Query("all"),
     limit: int = Query(10, ge=1, le=100),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     if _is_employee(current_user):
         limit = min(limit, 5)
@@ -1109,7 +1079,7 @@ def users_table(
     days: int = Query(30, ge=1, le=365),
     view: Literal["self","team","all","other"] = Query("all"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     forced_view = "team" if _is_employee(current_user) else _resolved_view(view)
     from_dt, to_dt = _bounds_from_to(from_date, to_date, days)
@@ -1126,7 +1096,7 @@ def profiles_table(
     days: int = Query(30, ge=1, le=365),
     view: Literal["self","team","all","other"] = Query("all"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     if _is_employee(current_user):
         return _blank_list()
@@ -1144,7 +1114,7 @@ def departments_table(
     days: int = Query(30, ge=1, le=365),
     view: Literal["self","team","all","other"] = Query("all"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     if _is_employee(current_user):
         return _blank_list()
@@ -5,7 +5,6 @@ from fastapi import APIRouter, HTTPException, Depends, Form, status
 from sqlalchemy.orm import Session
 from db.models import Lead
 from db.connection import get_db
-from routes.KYC.agreement_kyc_pdf import generate_kyc_pdf
 import pytz
 from routes.mail_service.send_mail import send_mail
 from routes.auth.auth_dependency import get_current_user
@@ -74,6 +73,8 @@ async def update_kyc_details(
         
         # Generate KYC PDF and get signer details
         employee_code = current_user.employee_code
+        # PDF stack (weasyprint/pyhanko/reportlab) loads on first use, not at boot
+        from routes.KYC.agreement_kyc_pdf import generate_kyc_pdf
         try:
             signer_details = await generate_kyc_pdf(data, mobile,employee_code, db)
         except Exception as e:
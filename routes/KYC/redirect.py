@@ -1,21 +1,14 @@
 from fastapi.responses import RedirectResponse
-from fastapi import APIRouter, Request, HTTPException, Depends, Response, BackgroundTasks
-import json
-from sqlalchemy.orm import Session
-from db.connection import get_db
-import httpx
-from db.models import Lead, Payment
-from routes.mail_service.kyc_agreement_mail import send_agreement
-import base64
-from routes.notification.notification_service import notification_service
+from fastapi import APIRouter, Request, HTTPException, Depends, Response
+import hashlib
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.async_connection import get_async_db
+from db.models import Lead, Payment, LeadStory
 from datetime import datetime, timezone, timedelta
-from utils.AddLeadStory import AddLeadStory
-from sqlalchemy import and_, or_, func
-from routes.payments.Invoice import generate_invoices_from_payments
+from sqlalchemy import and_, or_, func, select
+from services.outbox import enqueue
 import logging
-import asyncio
 from typing import Any, Dict, List, Optional
-import anyio  # pip install anyio
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["Agreement KYC Redirect"])
@@ -41,29 +34,6 @@ async def redirect_route(response: Response, platform: str, mobile: str):
     return RedirectResponse(url=redirect_url, status_code=302)
 
 
-# ---------- SAFE WRAPPER ----------
-
-async def _safe_generate_invoices(payloads: List[Dict[str, Any]]):
-    """
-    Runs generate_invoices_from_payments whether it's sync or async.
-    Adds resilient logging so you can see if it actually ran.
-    """
-    try:
-        logger.info("[invoice] starting background generation for %d payload(s)", len(payloads))
-
-        if asyncio.iscoroutinefunction(generate_invoices_from_payments):
-            await generate_invoices_from_payments(payloads)
-        else:
-            # run sync fn in a worker thread
-            await anyio.to_thread.run_sync(generate_invoices_from_payments, payloads)
-
-        logger.info("[invoice] done background generation")
-    except HTTPException as he:
-        logger.error("[invoice] HTTPException during generation: %s", he.detail)
-    except Exception as e:
-        logger.exception("[invoice] Background invoice gen failed: %s", e)
-
-
 # ---------- ENDPOINT ----------
 
 @router.post("/response_url/{mobile}/{employee_code}")
@@ -72,8 +42,7 @@ async def response_url_endpoint(
     response: Response,
     mobile: str,
     employee_code: str,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     set_cors_allow_all(response)
 
@@ -85,54 +54,49 @@ async def response_url_endpoint(
     if not signed_url:
         raise HTTPException(status_code=400, detail="signed_url missing in callback payload")
 
-    # Fetch the PDF
-    try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            pdf_response = await client.get(signed_url)
-        pdf_response.raise_for_status()
-    except httpx.HTTPError as exc:
-        raise HTTPException(status_code=500, detail=f"HTTP error fetching PDF: {exc}")
-
     # Lookup lead
-    kyc_user: Optional[Lead] = db.query(Lead).filter(Lead.mobile == mobile).first()
+    kyc_user: Optional[Lead] = (
+        await db.execute(select(Lead).where(Lead.mobile == mobile).limit(1))
+    ).scalars().first()
     if not kyc_user:
         raise HTTPException(status_code=404, detail="Lead not found for given mobile")
 
-    # Email agreement (already working)
-    await send_agreement(
-        kyc_user.email,
-        getattr(kyc_user, "full_name", kyc_user.full_name),
-        pdf_response.content,
-    )
+    lead_name = getattr(kyc_user, "full_name", kyc_user.full_name)
+    callback_key = hashlib.sha256(signed_url.encode("utf-8")).hexdigest()[:32]
 
     # Mark KYC true
     kyc_user.kyc = True
-    db.commit()
+
+    # Email agreement (PDF download + SMTP happen in the outbox worker)
+    await db.run_sync(
+        enqueue, "agreement_email",
+        {"signed_url": signed_url, "email": kyc_user.email, "name": lead_name},
+        idempotency_key=f"agreement:{kyc_user.id}:{callback_key}",
+    )
 
     # Notify employee
     ist = datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=5, minutes=30)))
     msg_html = (
         "<div style='font-family:Arial,sans-serif; line-height:1.4;'>"
         "  <h3>📝 Agreement Completed</h3>"
-        f"  <p><strong>Lead</strong>: {getattr(kyc_user,'full_name',kyc_user.full_name)} ({mobile})</p>"
+        f"  <p><strong>Lead</strong>: {lead_name} ({mobile})</p>"
         f"  <p><strong>Time</strong>: {ist.strftime('%Y-%m-%d %H:%M:%S')} IST</p>"
         f"  <p><strong>Employee</strong>: {employee_code}</p>"
         "</div>"
     )
-    await notification_service.notify(
-        user_id=employee_code,
-        title="Agreement Done",
-        message=msg_html,
-        lead_id=kyc_user.id
+    await db.run_sync(
+        enqueue, "notify",
+        {"user_id": employee_code, "title": "Agreement Done", "message": msg_html, "lead_id": kyc_user.id},
+        idempotency_key=f"agreement:{kyc_user.id}:{callback_key}:notify",
     )
 
     # ---------- collect *all* eligible paid payments (not just one) ----------
     paid_statuses = {"PAID", "SUCCESS", "SUCCESSFUL", "COMPLETED"}
 
     # Use UPPER() comparison so mixed-case statuses also match
-    eligible_payments: List[Payment] = (
-        db.query(Payment)
-        .filter(
+    eligible_payments: List[Payment] = (await db.execute(
+        select(Payment)
+        .where(
             and_(
                 Payment.lead_id == kyc_user.id,
                 or_(
@@ -144,37 +108,37 @@ async def response_url_endpoint(
             )
         )
         .order_by(Payment.created_at.desc())
-        .all()
-    )
+    )).scalars().all()
 
     if eligible_payments:
         logger.info(
-            "[invoice] scheduling background invoices for %d payment(s) (lead_id=%s)",
+            "[invoice] queueing invoices for %d payment(s) (lead_id=%s)",
             len(eligible_payments),
             kyc_user.id,
         )
 
-        invoice_payloads: List[Dict[str, Any]] = []
+        # One event per order; the key is shared with the payment webhook so
+        # an order is never invoiced twice.
         for p in eligible_payments:
-            invoice_payloads.append(
-                {
-                    "order_id": p.order_id,
-                    "paid_amount": float(p.paid_amount or 0.0),
-                    "plan": p.plan,
-                    "call": p.call or 0,
-                    "created_at": p.created_at.isoformat()
-                    if isinstance(p.created_at, datetime)
-                    else None,
-                    "phone_number": p.phone_number,
-                    "email": kyc_user.email or p.email,
-                    "name": getattr(kyc_user, "full_name", kyc_user.full_name),
-                    "mode": p.mode,
-                    "employee_code": p.user_id,
-                }
+            invoice_payload: Dict[str, Any] = {
+                "order_id": p.order_id,
+                "paid_amount": float(p.paid_amount or 0.0),
+                "plan": p.plan,
+                "call": p.call or 0,
+                "created_at": p.created_at.isoformat()
+                if isinstance(p.created_at, datetime)
+                else None,
+                "phone_number": p.phone_number,
+                "email": kyc_user.email or p.email,
+                "name": lead_name,
+                "mode": p.mode,
+                "employee_code": p.user_id,
+            }
+            await db.run_sync(
+                enqueue, "invoice", {"payments": [invoice_payload]},
+                idempotency_key=f"invoice:{p.order_id or p.id}",
             )
 
-        background_tasks.add_task(_safe_generate_invoices, invoice_payloads)
-
     else:
         logger.info(
             "[invoice] no eligible payments found for lead_id=%s (status or is_send_invoice filter failed)",
@@ -183,12 +147,14 @@ async def response_url_endpoint(
 
     # Story log
     msg = (
-        f"📝 Agreement completed for lead “{getattr(kyc_user,'full_name',kyc_user.full_name)}” "
+        f"📝 Agreement completed for lead “{lead_name}” "
         f"(mobile: {kyc_user.mobile}) by employee {employee_code} "
         f"at {ist.strftime('%Y-%m-%d %H:%M:%S')} IST"
     )
-    AddLeadStory(kyc_user.id, employee_code, msg)
+    db.add(LeadStory(lead_id=kyc_user.id, user_id=employee_code, msg=msg))
+
+    # KYC flag + story + outbox rows in one transaction
+    await db.commit()
 
-    print("✅ Zoop callback received:")
-    print(payload)
+    logger.info("Zoop callback received for lead %s", kyc_user.id)
     return {"status": "received"}
@@ -1,17 +1,22 @@
 # routes/pan_verification.py
 
-import json
 import asyncio
-from fastapi import APIRouter, HTTPException, Form, Depends, BackgroundTasks
-from sqlalchemy.orm import Session
+import csv
+import io
+import os
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Form, File, UploadFile
 import httpx
 
-from db.connection import get_db, SessionLocal
-from db.models import PanVerification
 from config import PAN_API_ID, PAN_API_KEY, PAN_TASK_ID_1
+from services.pan_cache import pan_cache
 
 router = APIRouter(tags=["Pan Verification"])
 
+BULK_MAX_PANS = int(os.getenv("PAN_BULK_MAX", "500"))
+BULK_CONCURRENCY = int(os.getenv("PAN_BULK_CONCURRENCY", "5"))
+
 
 async def post_with_retries(
     url: str,
@@ -39,6 +44,9 @@ async def post_with_retries(
         except httpx.HTTPStatusError as exc:
             status = exc.response.status_code
             detail = f"Error calling {url}: {exc.response.text}"
+            if 400 <= status < 500 and status != 429:
+                # the answer won't change on retry (bad / unknown PAN)
+                raise HTTPException(status_code=status, detail=detail)
         except httpx.HTTPError as exc:
             status = 500
             detail = f"Error calling {url}: {str(exc)}"
@@ -51,76 +59,7 @@ async def post_with_retries(
         delay = min(delay * backoff_factor, max_delay)
 
 
-def save_pan_verification_to_db(pannumber: str, data: dict):
-    """
-    Sync function for BackgroundTasks: upsert PanVerification entry.
-    """
-    db = SessionLocal()
-    try:
-        entry = (
-            db.query(PanVerification)
-              .filter(PanVerification.PANnumber == pannumber)
-              .first()
-        )
-        text = json.dumps(data)
-        if entry:
-            entry.response = text
-            entry.APICount += 1
-        else:
-            entry = PanVerification(
-                PANnumber=pannumber,
-                response=text,
-                APICount=1
-            )
-            db.add(entry)
-        db.commit()
-    except Exception:
-        db.rollback()
-    finally:
-        db.close()
-
-
-def increment_pan_count(pannumber: str):
-    """
-    Sync function for BackgroundTasks: increment APICount on cached hits.
-    """
-    db = SessionLocal()
-    try:
-        entry = (
-            db.query(PanVerification)
-              .filter(PanVerification.PANnumber == pannumber)
-              .first()
-        )
-        if entry:
-            entry.APICount += 1
-            db.commit()
-    except Exception:
-        db.rollback()
-    finally:
-        db.close()
-
-
-@router.post("/micro-pan-verification")
-async def micro_pan_verification(
-    background_tasks: BackgroundTasks,
-    pannumber: str = Form(...),
-    panType: str = Form(None),
-    db: Session = Depends(get_db),
-):
-    """
-    Micro PAN verification with:
-      - cache lookup
-      - API fetch + conditional DB save in background
-    """
-    # 1) Validate PAN format
-    if not pannumber or len(pannumber.strip()) != 10:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PAN format. Must be 10 characters."
-        )
-    pannumber = pannumber.upper().strip()
-
-    # 2) Determine endpoint URL
+def _zoop_request(pannumber: str, panType: Optional[str]) -> Tuple[str, dict, dict]:
     if panType == "company":
         url = "https://live.zoop.one/api/v1/in/identity/pan/pro"
     else:
@@ -141,55 +80,108 @@ async def micro_pan_verification(
         },
         "task_id": PAN_TASK_ID_1
     }
+    return url, headers, payload
 
-    # 3) Check cache
-    entry = (
-        db.query(PanVerification)
-          .filter(PanVerification.PANnumber == pannumber)
-          .first()
-    )
-    if entry and entry.response:
+
+def _clean_pan(pannumber: Optional[str]) -> str:
+    if not pannumber or len(pannumber.strip()) != 10:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid PAN format. Must be 10 characters."
+        )
+    return pannumber.upper().strip()
+
+
+async def verify_pan(pannumber: str, panType: Optional[str]) -> dict:
+    """
+    Cached PAN lookup (see services/pan_cache.py). Returns the endpoint's
+    "data" object; raises HTTPException for upstream / negative results.
+    """
+    url, headers, payload = _zoop_request(pannumber, panType)
+
+    async def _fetch() -> dict:
         try:
-            cached = json.loads(entry.response)
-        except json.JSONDecodeError:
-            cached = None
-
-        if cached:
-            result = {"cached": True, "api_call_count": entry.APICount, **cached}
-            # increment count asynchronously
-            background_tasks.add_task(increment_pan_count, pannumber)
-            return {
-                "success": True,
-                "pan_number": pannumber,
-                "verification_type": "micro",
-                "data": result
-            }
-
-    # 4) Fetch from external API
-    try:
-        api_data = await post_with_retries(url, headers, payload)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    # 5) Conditional save: if not company AND no user_father_name, skip DB
-    if panType != "company":
-        result_obj = api_data.get("result") or {}
-        if not result_obj.get("user_father_name"):
-            return {
-                "success": True,
-                "pan_number": pannumber,
-                "verification_type": "micro",
-                "data": {"cached": False, **api_data}
-            }
-
-    # 6) Schedule background save
-    background_tasks.add_task(save_pan_verification_to_db, pannumber, api_data)
+            return await post_with_retries(url, headers, payload)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    result, cached = await pan_cache.get_or_fetch(pannumber, panType, _fetch)
+    if cached:
+        pending = pan_cache.count_hit(pannumber)
+    result.raise_if_negative()
 
+    if cached:
+        return {"cached": True, "api_call_count": result.api_count + pending, **result.data}
+    return {"cached": False, **result.data}
+
+
+@router.post("/micro-pan-verification")
+async def micro_pan_verification(
+    pannumber: str = Form(...),
+    panType: str = Form(None),
+):
+    """
+    Micro PAN verification with:
+      - memory + DB cache lookup
+      - API fetch (coalesced per PAN) + write-through save
+    """
+    pannumber = _clean_pan(pannumber)
+    data = await verify_pan(pannumber, panType)
     return {
         "success": True,
         "pan_number": pannumber,
         "verification_type": "micro",
-        "data": {"cached": False, **api_data}
+        "data": data
+    }
+
+
+@router.post("/micro-pan-verification/bulk")
+async def micro_pan_verification_bulk(
+    file: UploadFile = File(..., description="CSV / text file, PAN in the first column"),
+    panType: str = Form(None),
+):
+    """
+    Verify an uploaded list of PANs. Duplicates are checked once; cached
+    PANs cost no API call and upstream calls run with bounded concurrency.
+    """
+    raw = (await file.read()).decode("utf-8-sig", errors="ignore")
+    pans: List[str] = []
+    seen = set()
+    for row in csv.reader(io.StringIO(raw)):
+        if not row:
+            continue
+        cell = row[0].strip().upper()
+        if cell in ("", "PAN", "PANNUMBER", "PAN_NUMBER") or cell in seen:
+            continue
+        seen.add(cell)
+        pans.append(cell)
+
+    if not pans:
+        raise HTTPException(status_code=400, detail="No PAN numbers found in file")
+    if len(pans) > BULK_MAX_PANS:
+        raise HTTPException(status_code=400, detail=f"Too many PAN numbers (max {BULK_MAX_PANS})")
+
+    sem = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def _one(pan: str) -> dict:
+        try:
+            pan = _clean_pan(pan)
+            async with sem:
+                data = await verify_pan(pan, panType)
+            return {"pan_number": pan, "success": True, "data": data}
+        except HTTPException as e:
+            return {"pan_number": pan, "success": False, "status_code": e.status_code, "error": e.detail}
+
+    results = await asyncio.gather(*(_one(p) for p in pans))
+    ok = sum(1 for r in results if r["success"])
+    return {
+        "success": True,
+        "verification_type": "micro",
+        "total": len(results),
+        "verified": ok,
+        "failed": len(results) - ok,
+        "cached": sum(1 for r in results if r["success"] and r["data"].get("cached")),
+        "results": results,
     }
@@ -7,7 +7,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError, DisconnectionError
 
 from db.connection import get_db
-from db.models import PermissionDetails, UserDetails, ProfileRole, Department
+from db.models import UserDetails, ProfileRole, Department
 
 # NOTE: Your schema can define a model like:
 # class PermissionUpdate(BaseModel):
@@ -15,6 +15,8 @@ from db.models import PermissionDetails, UserDetails, ProfileRole, Department
 #     add: Optional[List[str]] = None          # additive update
 #     remove: Optional[List[str]] = None       # subtractive update
 from db.Schema.permissions import PermissionUpdate
+from routes.auth.auth_dependency import get_current_user
+from services import permissions as permission_engine
 
 from pydantic import BaseModel, Field
 
@@ -29,12 +31,11 @@ class PermissionReplace(BaseModel):
 # ---------- helpers -----------------------------------------------------------
 
 def _all_permission_values() -> List[str]:
-    """All valid permission strings from the Enum."""
-    return [p.value for p in PermissionDetails]
+    """All valid permission strings from the Enum (compiled once at import)."""
+    return list(permission_engine.PERMISSIONS)
 
 def _validate_permissions_or_400(perms: List[str]) -> None:
-    valid = set(_all_permission_values())
-    invalid = [p for p in perms if p not in valid]
+    invalid = permission_engine.invalid(perms)
     if invalid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -42,6 +43,25 @@ def _validate_permissions_or_400(perms: List[str]) -> None:
         )
 
 
+def _holders_branch_scope(current_user: UserDetails, branch_id: Optional[int]) -> Optional[int]:
+    """
+    Branch filter the caller may use for holder lookups (same gating as the
+    branch directory): SUPERADMIN any, BRANCH_MANAGER their own branch only.
+    """
+    role = (getattr(current_user, "role_name", "") or "").upper()
+    if role == "SUPERADMIN":
+        return branch_id
+    if role == "BRANCH_MANAGER":
+        managed = getattr(current_user, "manages_branch", None)
+        own = managed.id if managed is not None else current_user.branch_id
+        if own is not None and branch_id in (None, own):
+            return own
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not allowed to list permission holders for this branch"
+    )
+
+
 # ---------- API Endpoints -----------------------------------------------------
 
 @router.get("/", response_model=List[str])
@@ -61,6 +81,35 @@ def get_all_permissions(
         )
 
 
+@router.get("/holders/{permission_name}")
+def get_permission_holders(
+    permission_name: str,
+    branch_id: Optional[int] = None,
+    active_only: bool = True,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """
+    Users whose effective permissions (own list, else role defaults) include
+    `permission_name`. Served from the GIN index on effective_permissions.
+    SUPERADMIN only, or a branch manager for their own branch.
+    """
+    branch_id = _holders_branch_scope(current_user, branch_id)
+    if permission_name not in permission_engine.VALID:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid permission name: {permission_name}"
+        )
+    try:
+        users = permission_engine.holders(db, permission_name, branch_id=branch_id, active_only=active_only)
+        return {"permission": permission_name, "total": len(users), "users": users}
+    except (OperationalError, DisconnectionError):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database connection lost. Please try again."
+        )
+
+
 @router.get("/user/{employee_code}")
 def get_user_permissions(
     employee_code: str,
@@ -78,7 +127,8 @@ def get_user_permissions(
             )
         return {
             "employee_code": employee_code,
-            "permissions": user.permissions or []
+            "permissions": user.permissions or [],
+            "effective_permissions": user.effective_permissions or [],
         }
     except HTTPException:
         raise
@@ -161,7 +211,7 @@ def toggle_single_permission(
     """
     try:
         # Validate permission name
-        if permission_name not in _all_permission_values():
+        if permission_name not in permission_engine.VALID:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Invalid permission name: {permission_name}"
@@ -235,8 +285,7 @@ def reset_to_default_permissions(
             )
 
         # Sanitize against current valid Enum values (in case defaults drifted)
-        valid = set(_all_permission_values())
-        defaults = [p for p in (role.default_permissions or []) if p in valid]
+        defaults = [p for p in (role.default_permissions or []) if p in permission_engine.VALID]
 
         user.permissions = defaults
         db.commit()
@@ -14,11 +14,9 @@ from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date
 from db.models import NARRATION
-from db.connection import get_db
+from db.connection import get_db, get_read_db
 from routes.auth.auth_dependency import get_current_user
-from routes.Rational.rational_pdf_gen import generate_signed_pdf
 import io
-import pandas as pd
 from fastapi.responses import StreamingResponse, FileResponse
 import zipfile
 from fastapi import BackgroundTasks
@@ -44,6 +42,8 @@ def _pdf_background_task(recommendation_id: int):
     Fetch the freshly‐created recommendation, run generate_signed_pdf,
     write back the URL and commit, all outside the request.
     """
+    from routes.Rational.rational_pdf_gen import generate_signed_pdf  # weasyprint/pyhanko load on first use
+
     db = SessionLocal()
     try:
         rec = db.query(NARRATION).filter(NARRATION.id == recommendation_id).first()
@@ -557,7 +557,7 @@ def delete_recommendation(
 def get_analytics_summary(
     date_from: Optional[date] = Query(None),
     date_to: Optional[date]   = Query(None),
-    db: Session               = Depends(get_db),
+    db: Session               = Depends(get_read_db),
 ):
     """Get overall system analytics summary."""
     try:
@@ -683,7 +683,7 @@ def export_recommendations_xlsx(
         "desc",
         description="Sort by creation date: `asc` or `desc`"
     ),
-    db: Session                          = Depends(get_db),
+    db: Session                          = Depends(get_read_db),
 ):
     """
     Apply filters, then stream back an XLSX file containing only the requested columns.
@@ -735,6 +735,8 @@ def export_recommendations_xlsx(
         })
 
     # 4) Build DataFrame and filter columns if requested
+    import pandas as pd  # loaded on first export, not at boot
+
     df = pd.DataFrame(data)
     if columns:
         invalid = set(columns) - set(df.columns)
@@ -819,7 +821,7 @@ def export_pdfs_zip(
     recommendation_type: Optional[str]   = Query(None, description="Filter by recommendation_type"),
     date_from: Optional[date]            = Query(None, description="Created at >= date_from"),
     date_to: Optional[date]              = Query(None, description="Created at <= date_to"),
-    db: Session                          = Depends(get_db),
+    db: Session                          = Depends(get_read_db),
 ):
     """
     Apply filters on recommendations, collect their signed PDFs,
@@ -287,7 +287,8 @@ def list_email_logs(
     summary="Get a specific email log entry"
 )
 def get_email_log(log_id: int, db: Session = Depends(get_db)):
-    log = db.get(EmailLog, log_id)
+    # primary key is (id, sent_at) since crm_email_logs is partitioned; id stays unique
+    log = db.query(EmailLog).filter(EmailLog.id == log_id).first()
     if not log:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
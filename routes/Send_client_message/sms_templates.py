@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_
 from sqlalchemy.exc import SQLAlchemyError
 from pydantic import BaseModel, Field, ConfigDict, root_validator
 from typing import Optional, List, Union
@@ -10,9 +10,10 @@ import httpx
 import os
 import logging
 
-from db.connection import get_db
+from db.connection import get_db, get_read_db
 from db.models import SMSTemplate, SMSLog
 from routes.auth.auth_dependency import get_current_user
+from services import reference_data
 from config import AIRTEL_IQ_SMS_URL, BASIC_AUTH_PASS, BASIC_AUTH_USER, BASIC_IQ_CUSTOMER_ID, BASIC_IQ_ENTITY_ID
 
 logger = logging.getLogger(__name__)
@@ -123,22 +124,30 @@ def create_sms_template(payload: SMSTemplateCreate, db: Session = Depends(get_db
 
 @router.get("/", response_model=List[SMSTemplateOut])
 def list_sms_templates(
+    request: Request,
+    response: Response,
     search: Optional[str] = Query(None, description="Search in title or template"),
     allowed_role: Optional[str] = Query(None, description="Filter templates allowed for this role"),
-    db: Session = Depends(get_db),
 ):
     try:
-        q = db.query(SMSTemplate)
+        snap = reference_data.get("sms_templates")
+        unchanged = reference_data.not_modified(
+            request, response, reference_data.query_etag(request, snap.name, snap.version)
+        )
+        if unchanged:
+            return unchanged
+
+        rows = snap.rows
         if search:
-            pattern = f"%{search}%"
-            q = q.filter(
-                or_(SMSTemplate.title.ilike(pattern), SMSTemplate.template.ilike(pattern))
-            )
+            needle = search.lower()
+            rows = [
+                r for r in rows
+                if reference_data.contains(r["title"], needle) or reference_data.contains(r["template"], needle)
+            ]
         if allowed_role:
-            # PostgreSQL ARRAY contains check: template.allowed_roles contains the single role
-            q = q.filter(SMSTemplate.allowed_roles.contains([allowed_role]))
-        templates = q.order_by(SMSTemplate.id.desc()).all()
-        return [SMSTemplateOut.model_validate(t) for t in templates]
+            # same as ARRAY contains: template.allowed_roles contains the single role
+            rows = [r for r in rows if allowed_role in (r["allowed_roles"] or [])]
+        return [SMSTemplateOut.model_validate(r) for r in reversed(rows)]
     except SQLAlchemyError as e:
         logger.error("Failed to list SMS templates: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to list SMS templates")
@@ -318,7 +327,7 @@ def get_sms_logs(
     end_date: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     try:
         query = db.query(SMSLog).join(SMSTemplate, SMSLog.template_id == SMSTemplate.id)
@@ -1,20 +1,28 @@
 # routes/VBC_Calling/Create_call.py
 from __future__ import annotations
 
-import os
 from typing import Optional, Literal, Dict, Any
 import re
 import httpx
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Path
 from pydantic import BaseModel, constr, Field, validator
-from db.models import UserDetails
-from routes.auth.auth_dependency import get_current_user
-
-from routes.VBC_Calling.vbc_client import VBCClient, VBCEnv
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.connection import get_db
+from db.async_connection import get_async_db
+from db.models import PermissionDetails, UserDetails, VBCCallLog, VBCCallRecording
+from routes.auth.auth_dependency import get_current_user, require_permission
+
+from routes.VBC_Calling.vbc_client import AsyncVBCClient, VBCEnv, vbc_manager
 from config import VBC_ACCOUNT_ID, API_CLIENT_ID, API_CLIENT_SECRET
+from services.outbox import enqueue
+from services.vbc_sync import audio_cache, sync_status
+from utils.contact_keys import normalize_mobile
+from utils.user_tree import get_subordinate_ids
 
 from datetime import datetime, timedelta, timezone
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 
 router = APIRouter(prefix="/vbc", tags=["vbc-calls"])
 
@@ -33,25 +41,20 @@ def _normalize_dst(num: str) -> str:
         )
     return num
 
-def _token_cache_file_for(user: UserDetails) -> str:
-    """
-    Per-user token cache file (persists access/refresh tokens & expiry).
-    """
-    cache_dir = os.path.join(os.getcwd(), "vbc_token_cache")
-    os.makedirs(cache_dir, exist_ok=True)
-    return os.path.join(cache_dir, f"{user.employee_code}.json")
-
-def _build_vbc_client_for_user(user: UserDetails) -> VBCClient:
-    """
-    Build a fresh VBC client using the current user's Vonage username/password.
-    Account/client id/secret come from env (config).
-    Uses on-disk token cache so tokens survive process restarts.
-    """
+def _require_vbc_credentials(user: UserDetails) -> None:
     if not user.vbc_user_username or not user.vbc_user_password:
         raise HTTPException(
             status_code=400,
             detail="VBC credentials are not configured for this user (username/password missing).",
         )
+
+async def _vbc_for_user(user: UserDetails) -> AsyncVBCClient:
+    """
+    Per-request facade over the process-wide VBC manager: the HTTP pool and
+    the user's tokens are shared, so a warm user costs no token round trip.
+    Account/client id/secret come from env (config).
+    """
+    _require_vbc_credentials(user)
     env = VBCEnv(
         account_id=VBC_ACCOUNT_ID,
         vbc_user_username=user.vbc_user_username,
@@ -59,7 +62,11 @@ def _build_vbc_client_for_user(user: UserDetails) -> VBCClient:
         client_id=API_CLIENT_ID,
         client_secret=API_CLIENT_SECRET,
     )
-    return VBCClient(env, token_cache_path=_token_cache_file_for(user))
+    return await vbc_manager.for_user(
+        user.employee_code,
+        env,
+        extension=str(user.vbc_extension_id) if user.vbc_extension_id else None,
+    )
 
 def _raise_for_httpx(e: httpx.HTTPStatusError, msg: str):
     try:
@@ -115,7 +122,7 @@ class LegStatePayload(BaseModel):
     status_code=status.HTTP_201_CREATED,
     summary="Place a VBC click2dial call (from the current user's extension)",
 )
-def create_call_api(
+async def create_call_api(
     payload: Click2DialRequest,
     current_user: UserDetails = Depends(get_current_user),
 ):
@@ -127,16 +134,17 @@ def create_call_api(
       - vbc_extension_id as the 'from' extension
       - vbc_user_username / vbc_user_password to authenticate against VBC
 
-    Tokens are fetched/refreshed automatically and cached on disk per user.
+    Tokens are cached in memory per user (refreshed single-flight) and
+    written behind to disk.
     """
     if not current_user.vbc_extension_id:
         raise HTTPException(status_code=400, detail="VBC extension is not configured for this user.")
 
     dst = _normalize_dst(payload.to_number)
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
 
     try:
-        resp = client.telephony_click2dial(
+        resp = await client.telephony_click2dial(
             from_type="extension",
             from_destination=str(current_user.vbc_extension_id),
             to_type="pstn",
@@ -161,7 +169,7 @@ def create_call_api(
     "/calls",
     summary="List active/recent calls (scoped to your account)",
 )
-def list_calls_api(
+async def list_calls_api(
     page_size: Optional[int] = Query(None, ge=1, le=200),
     page: Optional[int] = Query(None, ge=1),
     extension: Optional[str] = Query(None, description="Filter by extension"),
@@ -170,7 +178,7 @@ def list_calls_api(
     end_time: Optional[int] = Query(None, description="Epoch seconds <= end"),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
         filters: Dict[str, Any] = {}
         if page_size is not None:
@@ -186,7 +194,7 @@ def list_calls_api(
         if end_time is not None:
             filters["end_time"] = end_time
 
-        resp = client.telephony_calls(**filters)
+        resp = await client.telephony_calls(**filters)
         return {"filters": filters, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to list calls")
@@ -198,13 +206,13 @@ def list_calls_api(
     "/calls/{call_id}",
     summary="Get a specific call by ID",
 )
-def get_call_api(
+async def get_call_api(
     call_id: str = Path(..., min_length=1),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        resp = client.telephony_call(call_id)
+        resp = await client.telephony_call(call_id)
         return {"call_id": call_id, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to fetch call")
@@ -216,12 +224,12 @@ def get_call_api(
     "/calls/{call_id}",
     summary="Update a call (e.g., transfer legs)",
 )
-def update_call_api(
+async def update_call_api(
     payload: CallUpdatePayload,
     call_id: str = Path(..., min_length=1),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
         # build payload exactly as VBC expects ("from" key, not "from_")
         body: Dict[str, Any] = {}
@@ -233,7 +241,7 @@ def update_call_api(
         if not body:
             raise HTTPException(status_code=400, detail="Nothing to update; provide at least 'from' or 'to'.")
 
-        resp = client.telephony_call_update(call_id, body)
+        resp = await client.telephony_call_update(call_id, body)
         return {"call_id": call_id, "request": body, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to update call")
@@ -246,16 +254,16 @@ def update_call_api(
     status_code=status.HTTP_200_OK,
     summary="End a call",
 )
-def delete_call_api(
+async def delete_call_api(
     call_id: str = Path(..., min_length=1),
     current_user: UserDetails = Depends(get_current_user),
 ):
     """
     Ends the call. Backend typically does not require a body for delete.
     """
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        resp = client.telephony_call_delete(call_id, payload={})
+        resp = await client.telephony_call_delete(call_id, payload={})
         return {"message": "Call ended", "call_id": call_id, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to end call")
@@ -270,13 +278,13 @@ def delete_call_api(
     "/calls/{call_id}/legs",
     summary="List legs for a call",
 )
-def list_call_legs_api(
+async def list_call_legs_api(
     call_id: str = Path(..., min_length=1),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        resp = client.telephony_call_legs(call_id)
+        resp = await client.telephony_call_legs(call_id)
         return {"call_id": call_id, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to list call legs")
@@ -288,14 +296,14 @@ def list_call_legs_api(
     "/calls/{call_id}/legs/{leg_id}",
     summary="Get leg details",
 )
-def get_call_leg_api(
+async def get_call_leg_api(
     call_id: str = Path(..., min_length=1),
     leg_id: str = Path(..., min_length=1),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        resp = client.telephony_call_leg(call_id, leg_id)
+        resp = await client.telephony_call_leg(call_id, leg_id)
         return {"call_id": call_id, "leg_id": leg_id, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to fetch leg")
@@ -307,16 +315,16 @@ def get_call_leg_api(
     "/calls/{call_id}/legs/{leg_id}",
     summary="Send DTMF to a leg",
 )
-def put_call_leg_api(
+async def put_call_leg_api(
     payload: LegDtmfPayload,
     call_id: str = Path(..., min_length=1),
     leg_id: str = Path(..., min_length=1),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
         body = payload.model_dump()
-        resp = client.telephony_call_leg_put(call_id, leg_id, payload=body)
+        resp = await client.telephony_call_leg_put(call_id, leg_id, payload=body)
         return {"call_id": call_id, "leg_id": leg_id, "request": body, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to update leg (DTMF)")
@@ -328,7 +336,7 @@ def put_call_leg_api(
     "/calls/{call_id}/legs/{leg_id}",
     summary="Modify/terminate a leg (provider-dependent)",
 )
-def delete_call_leg_api(
+async def delete_call_leg_api(
     call_id: str = Path(..., min_length=1),
     leg_id: str = Path(..., min_length=1),
     payload: Optional[LegStatePayload] = None,
@@ -338,10 +346,10 @@ def delete_call_leg_api(
     Some backends accept a body like {"state":"held"} when deleting a leg.
     If your backend does not require a body, this will still send an empty JSON.
     """
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
         body = payload.model_dump() if payload else {}
-        resp = client.telephony_call_leg_delete(call_id, leg_id, payload=body)
+        resp = await client.telephony_call_leg_delete(call_id, leg_id, payload=body)
         return {
             "message": "Leg modified/terminated",
             "call_id": call_id,
@@ -362,7 +370,7 @@ def delete_call_leg_api(
     "/devices",
     summary="List registered devices (SIP/softphone) for the account",
 )
-def list_devices_api(
+async def list_devices_api(
     page_size: Optional[int] = Query(None, ge=1, le=200),
     page: Optional[int] = Query(None, ge=1),
     order: Optional[Literal["asc", "desc"]] = Query(None),
@@ -370,7 +378,7 @@ def list_devices_api(
     end_time: Optional[int] = Query(None, description="Epoch seconds <= end"),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
         filters: Dict[str, Any] = {}
         if page_size is not None:
@@ -384,7 +392,7 @@ def list_devices_api(
         if end_time is not None:
             filters["end_time"] = end_time
 
-        resp = client.telephony_devices(**filters)
+        resp = await client.telephony_devices(**filters)
         return {"filters": filters, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to list devices")
@@ -396,13 +404,13 @@ def list_devices_api(
     "/devices/{device_id}",
     summary="Get a device by ID",
 )
-def get_device_api(
+async def get_device_api(
     device_id: str = Path(..., min_length=1),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        resp = client.telephony_device(device_id)
+        resp = await client.telephony_device(device_id)
         return {"device_id": device_id, "vbc_response": resp}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to fetch device")
@@ -424,7 +432,7 @@ def _cr_bounds_or_default(start_gte: str | None, start_lte: str | None, days: in
 
 # ========== COMPANY CALL RECORDINGS ==========
 @router.get("/cr/company", summary="List company call recordings")
-def cr_company_list_api(
+async def cr_company_list_api(
     start_gte: str | None = None,
     start_lte: str | None = None,
     page_size: int = Query(20, ge=1, le=200),
@@ -440,7 +448,7 @@ def cr_company_list_api(
     order: str | None = Query(None, description="start:DESC"),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     s_gte, s_lte = _cr_bounds_or_default(start_gte, start_lte)
 
     filters = {
@@ -457,7 +465,7 @@ def cr_company_list_api(
     filters = {k: v for k, v in filters.items() if v is not None}
 
     try:
-        data = client.cr_company_list(
+        data = await client.cr_company_list(
             start_gte=s_gte, start_lte=s_lte, page_size=page_size, page=page, **filters
         )
         return {"window": {"start_gte": s_gte, "start_lte": s_lte}, "filters": filters, "vbc_response": data}
@@ -465,61 +473,91 @@ def cr_company_list_api(
         _raise_for_httpx(e, "Failed to list company recordings")
 
 @router.get("/cr/company/{recording_id}", summary="Get company recording by id")
-def cr_company_get_api(
+async def cr_company_get_api(
     recording_id: str,
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        data = client.cr_company_get(recording_id)
+        data = await client.cr_company_get(recording_id)
         return {"recording_id": recording_id, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to fetch company recording")
 
 @router.delete("/cr/company/{recording_id}", summary="Delete company recording")
-def cr_company_delete_api(
+async def cr_company_delete_api(
     recording_id: str,
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        data = client.cr_company_delete(recording_id)
+        data = await client.cr_company_delete(recording_id)
         return {"message": "Recording deleted", "recording_id": recording_id, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to delete company recording")
 
 @router.post("/cr/company/export", summary="Export company recordings (creates job)")
-def cr_company_export_api(
+async def cr_company_export_api(
     start_gte: str | None = None,
     start_lte: str | None = None,
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     s_gte, s_lte = _cr_bounds_or_default(start_gte, start_lte)
     try:
-        data = client.cr_company_export(start_gte=s_gte, start_lte=s_lte)
+        data = await client.cr_company_export(start_gte=s_gte, start_lte=s_lte)
         return {"window": {"start_gte": s_gte, "start_lte": s_lte}, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to request export for company recordings")
 
 @router.get("/cr/audio/{recording_id}", summary="Download company recording audio")
-def cr_company_audio_api(
+async def cr_company_audio_api(
     recording_id: str,
     filename: str | None = Query(None, description="Optional download filename (e.g., rec.mp3)"),
-    current_user: UserDetails = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserDetails = Depends(require_permission(PermissionDetails.lead_recording_view)),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    fname = filename or f"recording_{recording_id}.bin"
+    headers = {"Content-Disposition": f'attachment; filename="{fname}"'}
+
+    # same checks as an uncached download, before the cache is consulted
+    _require_vbc_credentials(current_user)
+    owner = (await db.execute(
+        select(VBCCallRecording.employee_code).where(VBCCallRecording.recording_id == recording_id)
+    )).first()
+    if owner is not None:
+        visible = await db.run_sync(lambda s: _visible_codes(s, current_user))
+        if visible is not None and owner[0] not in visible:
+            raise HTTPException(status_code=403, detail="You can't access this recording")
+
+    cached = audio_cache.hit(recording_id)
+    if cached:
+        return FileResponse(cached, media_type="application/octet-stream", headers=headers)
+
+    client = await _vbc_for_user(current_user)
+    upstream = client.cr_company_audio_stream(recording_id)
     try:
-        audio_bytes = client.cr_company_audio(recording_id)
-        fname = filename or f"recording_{recording_id}.bin"
-        headers = {"Content-Disposition": f'attachment; filename="{fname}"'}
-        return StreamingResponse(iter([audio_bytes]), media_type="application/octet-stream", headers=headers)
+        # pull the first chunk here so upstream errors still map to an HTTP status
+        first = await upstream.__anext__()
+    except StopAsyncIteration:
+        first = b""
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to download recording audio")
 
+    async def _chained():
+        yield first
+        async for chunk in upstream:
+            yield chunk
+
+    return StreamingResponse(
+        audio_cache.stream_and_cache(recording_id, _chained()),
+        media_type="application/octet-stream",
+        headers=headers,
+    )
+
 # ========== ON-DEMAND (USER) RECORDINGS ==========
 @router.get("/cr/user", summary="List on-demand recordings for a user (defaults to self)")
-def cr_user_list_api(
+async def cr_user_list_api(
     start_gte: str | None = None,
     start_lte: str | None = None,
     page_size: int = Query(20, ge=1, le=200),
@@ -536,7 +574,7 @@ def cr_user_list_api(
     order: str | None = None,
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     s_gte, s_lte = _cr_bounds_or_default(start_gte, start_lte)
 
     filters = {
@@ -553,76 +591,231 @@ def cr_user_list_api(
     filters = {k: v for k, v in filters.items() if v is not None}
 
     try:
-        data = client.cr_user_list(user_id=user_id, start_gte=s_gte, start_lte=s_lte, page_size=page_size, page=page, **filters)
+        data = await client.cr_user_list(user_id=user_id, start_gte=s_gte, start_lte=s_lte, page_size=page_size, page=page, **filters)
         return {"window": {"start_gte": s_gte, "start_lte": s_lte}, "user_id": user_id, "filters": filters, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to list user recordings")
 
 @router.get("/cr/user/{recording_id}", summary="Get one on-demand recording (self by default)")
-def cr_user_get_api(
+async def cr_user_get_api(
     recording_id: str,
     user_id: str = Query("self"),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        data = client.cr_user_get(user_id=user_id, recording_id=recording_id)
+        data = await client.cr_user_get(user_id=user_id, recording_id=recording_id)
         return {"user_id": user_id, "recording_id": recording_id, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to fetch user recording")
 
 @router.delete("/cr/user/{recording_id}", summary="Delete on-demand recording (self by default)")
-def cr_user_delete_api(
+async def cr_user_delete_api(
     recording_id: str,
     user_id: str = Query("self"),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        data = client.cr_user_delete(user_id=user_id, recording_id=recording_id)
+        data = await client.cr_user_delete(user_id=user_id, recording_id=recording_id)
         return {"message": "Recording deleted", "user_id": user_id, "recording_id": recording_id, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to delete user recording")
 
 @router.post("/cr/user/export", summary="Export on-demand recordings (self by default)")
-def cr_user_export_api(
+async def cr_user_export_api(
     user_id: str = Query("self"),
     start_gte: str | None = None,
     start_lte: str | None = None,
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     s_gte, s_lte = _cr_bounds_or_default(start_gte, start_lte)
     try:
-        data = client.cr_user_export(user_id=user_id, start_gte=s_gte, start_lte=s_lte)
+        data = await client.cr_user_export(user_id=user_id, start_gte=s_gte, start_lte=s_lte)
         return {"user_id": user_id, "window": {"start_gte": s_gte, "start_lte": s_lte}, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to request export for user recordings")
 
 @router.get("/cr/user/jobs", summary="List export jobs (self by default)")
-def cr_user_jobs_api(
+async def cr_user_jobs_api(
     user_id: str = Query("self"),
     status_filter: str | None = Query(None, alias="status"),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
         filters = {"status": status_filter} if status_filter else {}
-        data = client.cr_user_jobs(user_id=user_id, **filters)
+        data = await client.cr_user_jobs(user_id=user_id, **filters)
         return {"user_id": user_id, "filters": filters, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to list export jobs")
 
 @router.get("/cr/user/jobs/{job_id}", summary="Get a specific export job (self by default)")
-def cr_user_job_api(
+async def cr_user_job_api(
     job_id: str,
     user_id: str = Query("self"),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    client = _build_vbc_client_for_user(current_user)
+    client = await _vbc_for_user(current_user)
     try:
-        data = client.cr_user_job(job_id=job_id, user_id=user_id)
+        data = await client.cr_user_job(job_id=job_id, user_id=user_id)
         return {"user_id": user_id, "job_id": job_id, "vbc_response": data}
     except httpx.HTTPStatusError as e:
         _raise_for_httpx(e, "Failed to fetch export job")
 
+
+
+# ========== LOCAL INDEX (synced by services/vbc_sync.py) ==========
+def _visible_codes(db: Session, user: UserDetails) -> Optional[list[str]]:
+    """Employee codes whose calls `user` may see: self + subordinates; None = everyone (SUPERADMIN)."""
+    if (getattr(user, "role_name", "") or "").upper() == "SUPERADMIN":
+        return None
+    return [user.employee_code, *get_subordinate_ids(db, user.employee_code)]
+
+
+def _scoped(q, model, db: Session, user: UserDetails):
+    visible = _visible_codes(db, user)
+    return q if visible is None else q.filter(model.employee_code.in_(visible))
+
+
+def _index_filters(q, model, *, start_gte, start_lte, employee_code, lead_id, phone, direction, extension,
+                   duration_gte, duration_lte):
+    if start_gte:
+        q = q.filter(model.start_time >= start_gte)
+    if start_lte:
+        q = q.filter(model.start_time <= start_lte)
+    if employee_code:
+        q = q.filter(model.employee_code == employee_code)
+    if lead_id:
+        q = q.filter(model.lead_id == lead_id)
+    if phone:
+        norm = normalize_mobile(phone)
+        if not norm:
+            raise HTTPException(status_code=400, detail="Invalid phone")
+        q = q.filter(model.norm_phone == norm)
+    if direction:
+        q = q.filter(model.direction == direction.upper())
+    if extension:
+        q = q.filter(model.extension == extension)
+    if duration_gte is not None:
+        q = q.filter(model.duration >= duration_gte)
+    if duration_lte is not None:
+        q = q.filter(model.duration <= duration_lte)
+    return q
+
+
+@router.get("/index/recordings", summary="List company recordings from the local index")
+def index_recordings_api(
+    start_gte: datetime | None = None,
+    start_lte: datetime | None = None,
+    employee_code: str | None = None,
+    lead_id: int | None = None,
+    phone: str | None = Query(None, description="Customer number, any format"),
+    direction: str | None = Query(None, description="INBOUND | OUTBOUND | INTRA_PBX"),
+    extension: str | None = None,
+    duration_gte: int | None = None,
+    duration_lte: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(require_permission(PermissionDetails.lead_recording_view)),
+):
+    q = _index_filters(
+        _scoped(db.query(VBCCallRecording), VBCCallRecording, db, current_user), VBCCallRecording,
+        start_gte=start_gte, start_lte=start_lte, employee_code=employee_code, lead_id=lead_id,
+        phone=phone, direction=direction, extension=extension,
+        duration_gte=duration_gte, duration_lte=duration_lte,
+    )
+    total = q.count()
+    rows = q.order_by(VBCCallRecording.start_time.desc()).offset(offset).limit(limit).all()
+    return {
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "items": [
+            {
+                "recording_id": r.recording_id,
+                "call_id": r.call_id,
+                "direction": r.direction,
+                "caller_id": r.caller_id,
+                "dnis": r.dnis,
+                "cnam": r.cnam,
+                "extension": r.extension,
+                "employee_code": r.employee_code,
+                "lead_id": r.lead_id,
+                "start_time": r.start_time,
+                "duration": r.duration,
+                "audio_url": f"/api/v1/vbc/cr/audio/{r.recording_id}",
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.get("/index/call-logs", summary="List call logs from the local index")
+def index_call_logs_api(
+    start_gte: datetime | None = None,
+    start_lte: datetime | None = None,
+    employee_code: str | None = None,
+    lead_id: int | None = None,
+    phone: str | None = Query(None, description="Customer number, any format"),
+    direction: str | None = None,
+    extension: str | None = None,
+    result: str | None = None,
+    duration_gte: int | None = None,
+    duration_lte: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(require_permission(PermissionDetails.lead_recording_view)),
+):
+    q = _index_filters(
+        _scoped(db.query(VBCCallLog), VBCCallLog, db, current_user), VBCCallLog,
+        start_gte=start_gte, start_lte=start_lte, employee_code=employee_code, lead_id=lead_id,
+        phone=phone, direction=direction, extension=extension,
+        duration_gte=duration_gte, duration_lte=duration_lte,
+    )
+    if result:
+        q = q.filter(VBCCallLog.result == result)
+    total = q.count()
+    rows = q.order_by(VBCCallLog.start_time.desc()).offset(offset).limit(limit).all()
+    return {
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "items": [
+            {
+                "vbc_id": r.vbc_id,
+                "direction": r.direction,
+                "from_number": r.from_number,
+                "to_number": r.to_number,
+                "extension": r.extension,
+                "employee_code": r.employee_code,
+                "lead_id": r.lead_id,
+                "start_time": r.start_time,
+                "duration": r.duration,
+                "result": r.result,
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.get("/index/sync", summary="Local index sync cursors")
+def index_sync_status_api(current_user: UserDetails = Depends(get_current_user)):
+    return {"cursors": sync_status()}
+
+
+@router.post("/index/sync", summary="Queue one incremental sync pass", status_code=status.HTTP_202_ACCEPTED)
+def index_sync_run_api(
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    if getattr(current_user, "role_name", None) != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Only SUPERADMIN can trigger a VBC sync")
+    # the worker runs it; repeated clicks within a minute collapse into one pass
+    bucket = int(datetime.now(timezone.utc).timestamp() // 60)
+    enqueue(db, "vbc_sync", {"requested_by": current_user.employee_code}, idempotency_key=f"vbc_sync:{bucket}")
+    db.commit()
+    return {"queued": True, "cursors": sync_status()}
@@ -3,13 +3,19 @@ from __future__ import annotations
 
 import os
 import json
+import asyncio
+import logging
 import threading
-from dataclasses import dataclass, asdict
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional, Callable
+from typing import Any, AsyncIterator, Dict, Optional, Callable
 
 import httpx
 
+logger = logging.getLogger(__name__)
+
 
 # =========================================================
 # Environment / Config
@@ -503,6 +509,395 @@ class VBCClient:
         return self.post("/vis/v1/self/calls", json={"phoneNumber": phone_number}).json()
 
 
+# =========================================================
+# Shared async client + in-memory token cache
+# =========================================================
+def _read_token_file(filepath: str) -> Dict[str, Any]:
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_token_file(filepath: str, data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp = f"{filepath}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, filepath)
+
+
+@dataclass
+class _TokenState:
+    cred_key: str
+    token: Optional[str] = None
+    refresh_token: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+
+    def valid(self, skew_seconds: int) -> bool:
+        if not self.token or not self.expires_at:
+            return False
+        return (self.expires_at - datetime.now(timezone.utc)).total_seconds() >= skew_seconds
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "token": self.token,
+            "refresh_token": self.refresh_token,
+            "token_expires_at": self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+
+class VBCClientManager:
+    """
+    Process-wide VBC access:
+      - one pooled httpx.AsyncClient (keep-alive TCP/TLS reuse)
+      - per-user token state in an LRU (idle users evicted)
+      - single-flight refresh per user (asyncio.Lock)
+      - on-disk token cache read once per user, written behind asynchronously
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        *,
+        max_users: int = 500,
+        idle_seconds: int = 6 * 3600,
+        timeout: float = 30.0,
+        max_connections: int = 50,
+        skew_seconds: int = 120,
+    ):
+        self.cache_dir = cache_dir or os.path.join(os.getcwd(), "vbc_token_cache")
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.skew_seconds = skew_seconds
+        self._http: Optional[httpx.AsyncClient] = None
+        self._states: "OrderedDict[str, _TokenState]" = OrderedDict()
+        self._states_lock = asyncio.Lock()
+        self._pending_writes: set = set()
+
+    # ---------- shared HTTP client ----------
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=False,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=120,
+                ),
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._pending_writes:
+            await asyncio.gather(*list(self._pending_writes), return_exceptions=True)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    # ---------- token state LRU ----------
+    def _cache_path(self, employee_code: str) -> str:
+        return os.path.join(self.cache_dir, f"{employee_code}.json")
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        while self._states:
+            st = next(iter(self._states.values()))
+            if len(self._states) > self.max_users or now - st.last_used > self.idle_seconds:
+                self._states.popitem(last=False)
+                continue
+            break
+
+    def _cached_state(self, employee_code: str, cred_key: str) -> Optional[_TokenState]:
+        st = self._states.get(employee_code)
+        if st is None or st.cred_key != cred_key:
+            return None
+        st.last_used = time.monotonic()
+        self._states.move_to_end(employee_code)
+        return st
+
+    async def _state_for(self, employee_code: str, cred_key: str) -> _TokenState:
+        st = self._cached_state(employee_code, cred_key)
+        if st is not None:
+            return st
+
+        # miss (or credentials changed): create under the lock so concurrent
+        # first requests share one state (and one refresh lock); seed from disk once
+        async with self._states_lock:
+            st = self._cached_state(employee_code, cred_key)
+            if st is not None:
+                return st
+            st = _TokenState(cred_key=cred_key)
+            if employee_code not in self._states:
+                d = await asyncio.to_thread(_read_token_file, self._cache_path(employee_code))
+                st.token = d.get("token")
+                st.refresh_token = d.get("refresh_token")
+                iso = d.get("token_expires_at")
+                st.expires_at = datetime.fromisoformat(iso) if iso else None
+            self._states[employee_code] = st
+            self._states.move_to_end(employee_code)
+            self._evict_idle()
+            return st
+
+    def persist_later(self, employee_code: str, st: _TokenState) -> None:
+        task = asyncio.create_task(
+            asyncio.to_thread(_write_token_file, self._cache_path(employee_code), st.to_json_dict())
+        )
+        self._pending_writes.add(task)
+
+        def _done(t: asyncio.Task) -> None:
+            self._pending_writes.discard(t)
+            if not t.cancelled() and t.exception():
+                logger.warning("VBC token cache write failed for %s: %s", employee_code, t.exception())
+
+        task.add_done_callback(_done)
+
+    async def for_user(
+        self,
+        employee_code: str,
+        env: VBCEnv,
+        *,
+        extension: Optional[str] = None,
+    ) -> "AsyncVBCClient":
+        cred_key = f"{env.vbc_user_username}:{hash(env.vbc_user_password)}"
+        st = await self._state_for(employee_code, cred_key)
+        return AsyncVBCClient(self, employee_code, env, st, extension=extension)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cached_users": len(self._states), "max_users": self.max_users}
+
+
+class AsyncVBCClient:
+    """
+    Lightweight per-request facade over VBCClientManager. Mirrors the
+    VBCClient convenience methods used by the routes.
+    """
+
+    def __init__(
+        self,
+        manager: VBCClientManager,
+        employee_code: str,
+        env: VBCEnv,
+        state: _TokenState,
+        *,
+        extension: Optional[str] = None,
+    ):
+        self.manager = manager
+        self.employee_code = employee_code
+        self.env = env
+        self.state = state
+        self.extension = extension
+
+    # ---------- Token management ----------
+    async def _post_token(self, payload: Dict[str, Any]) -> None:
+        r = await self.manager.http.post(
+            self.env.get_token_url,
+            data=payload,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        r.raise_for_status()
+        data = r.json()
+        st = self.state
+        st.token = data.get("access_token")
+        st.refresh_token = data.get("refresh_token", st.refresh_token)
+        st.expires_at = datetime.now(timezone.utc) + timedelta(seconds=data.get("expires_in", 3600))
+        self.manager.persist_later(self.employee_code, st)
+
+    async def _authenticate(self) -> None:
+        if not self.env.vbc_user_username or not self.env.vbc_user_password:
+            raise RuntimeError("Missing VBC user credentials. Provide via DB getter or set on VBCEnv.")
+        await self._post_token({
+            "grant_type": self.env.grant_type,
+            "scope": self.env.scope,
+            "username": f"{self.env.vbc_user_username}@{self.env.api_env}",
+            "password": self.env.vbc_user_password,
+            "client_id": self.env.client_id,
+            "client_secret": self.env.client_secret,
+        })
+
+    async def _refresh(self) -> None:
+        if self.state.refresh_token:
+            try:
+                await self._post_token({
+                    "grant_type": "refresh_token",
+                    "client_id": self.env.client_id,
+                    "client_secret": self.env.client_secret,
+                    "refresh_token": self.state.refresh_token,
+                })
+                return
+            except httpx.HTTPError:
+                pass
+        await self._authenticate()
+
+    async def ensure_token(self, stale_token: Optional[str] = None) -> None:
+        """
+        Single-flight: concurrent callers for the same user wait on one
+        refresh. `stale_token` forces a refresh unless someone already
+        replaced that token (401 path).
+        """
+        st = self.state
+        if stale_token is None and st.valid(self.manager.skew_seconds):
+            return
+        async with st.lock:
+            if stale_token is None and st.valid(self.manager.skew_seconds):
+                return
+            if stale_token is not None and st.token != stale_token:
+                return
+            await self._refresh()
+
+    def _base(self) -> str:
+        return f"{self.env.api_url}/{self.env.api_env}"
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        await self.ensure_token()
+        url = f"{self._base()}{path}"
+        token = self.state.token
+        resp = await self.manager.http.request(
+            method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs
+        )
+        if resp.status_code != 401:
+            resp.raise_for_status()
+            return resp
+
+        # If 401, refresh once (single-flight) and retry
+        try:
+            await self.ensure_token(stale_token=token)
+        except httpx.HTTPError:
+            resp.raise_for_status()
+        resp2 = await self.manager.http.request(
+            method, url, headers={"Authorization": f"Bearer {self.state.token}"}, **kwargs
+        )
+        resp2.raise_for_status()
+        return resp2
+
+    async def _json(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        return (await self._request(method, path, **kwargs)).json()
+
+    # ---------- Telephony ----------
+    async def telephony_click2dial(
+        self,
+        to_destination: str,
+        *,
+        from_destination: Optional[str] = None,
+        from_type: str = "extension",
+        to_type: str = "pstn",
+    ) -> Dict[str, Any]:
+        from_destination = from_destination or self.extension
+        if not from_destination:
+            raise ValueError("from_destination is missing and no extension is configured.")
+        payload = {
+            "from": {"destination": str(from_destination), "type": from_type},
+            "to": {"destination": str(to_destination), "type": to_type},
+            "type": "click2dial",
+        }
+        return await self._json("POST", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls", json=payload)
+
+    async def telephony_calls(self, **filters) -> Dict[str, Any]:
+        return await self._json("GET", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls", params=filters or None)
+
+    async def telephony_call(self, call_id: str, **filters) -> Dict[str, Any]:
+        return await self._json("GET", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls/{call_id}", params=filters or None)
+
+    async def telephony_call_update(self, call_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._json("PUT", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls/{call_id}", json=payload)
+
+    async def telephony_call_delete(self, call_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._json("DELETE", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls/{call_id}", json=payload)
+
+    async def telephony_call_legs(self, call_id: str) -> Dict[str, Any]:
+        return await self._json("GET", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls/{call_id}/legs")
+
+    async def telephony_call_leg(self, call_id: str, leg_id: str) -> Dict[str, Any]:
+        return await self._json("GET", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls/{call_id}/legs/{leg_id}")
+
+    async def telephony_call_leg_put(self, call_id: str, leg_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._json("PUT", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls/{call_id}/legs/{leg_id}", json=payload)
+
+    async def telephony_call_leg_delete(self, call_id: str, leg_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._json("DELETE", f"/telephony/v3/cc/accounts/{self.env.account_id}/calls/{call_id}/legs/{leg_id}", json=payload)
+
+    async def telephony_devices(self, **filters) -> Dict[str, Any]:
+        return await self._json("GET", f"/telephony/v3/registration/accounts/{self.env.account_id}/devices", params=filters or None)
+
+    async def telephony_device(self, device_id: str, **filters) -> Dict[str, Any]:
+        return await self._json("GET", f"/telephony/v3/registration/accounts/{self.env.account_id}/devices/{device_id}", params=filters or None)
+
+    # ---------- Reports ----------
+    async def reports_call_logs(self, start_gte: str, start_lte: str, **filters) -> Dict[str, Any]:
+        params = {"start:gte": start_gte, "start:lte": start_lte, **(filters or {})}
+        return await self._json("GET", f"/reports/accounts/{self.env.account_id}/call-logs", params=params)
+
+    # ---------- Call Recording - Company ----------
+    async def cr_company_list(self, start_gte: str, start_lte: str, page_size: int = 20, page: int = 1, **filters) -> Dict[str, Any]:
+        params = {"start:gte": start_gte, "start:lte": start_lte, "page_size": page_size, "page": page, **(filters or {})}
+        return await self._json("GET", f"/call_recording/api/accounts/{self.env.account_id}/company_call_recordings", params=params)
+
+    async def cr_company_get(self, recording_id: str) -> Dict[str, Any]:
+        return await self._json("GET", f"/call_recording/api/accounts/{self.env.account_id}/company_call_recordings/{recording_id}")
+
+    async def cr_company_delete(self, recording_id: str) -> Dict[str, Any]:
+        return await self._json("DELETE", f"/call_recording/api/accounts/{self.env.account_id}/company_call_recordings/{recording_id}")
+
+    async def cr_company_export(self, start_gte: str, start_lte: str) -> Dict[str, Any]:
+        payload = {"start:gte": start_gte, "start:lte": start_lte}
+        return await self._json("POST", f"/call_recording/api/accounts/{self.env.account_id}/company_call_recordings/export", json=payload)
+
+    async def cr_company_audio(self, recording_id: str) -> bytes:
+        r = await self._request("GET", f"/call_recording/api/audio/recording/{recording_id}")
+        return r.content
+
+    async def cr_company_audio_stream(self, recording_id: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Yield the recording audio in chunks without buffering it whole."""
+        await self.ensure_token()
+        url = f"{self._base()}/call_recording/api/audio/recording/{recording_id}"
+        for attempt in (1, 2):
+            token = self.state.token
+            async with self.manager.http.stream("GET", url, headers={"Authorization": f"Bearer {token}"}) as resp:
+                if resp.status_code == 401 and attempt == 1:
+                    await self.ensure_token(stale_token=token)
+                    continue
+                if resp.is_error:
+                    await resp.aread()
+                    resp.raise_for_status()
+                async for chunk in resp.aiter_bytes(chunk_size):
+                    yield chunk
+                return
+
+    # ---------- Call Recording - On-Demand (per user) ----------
+    async def cr_user_list(self, user_id: str, start_gte: str, start_lte: str, page_size: int = 20, page: int = 1, **filters) -> Dict[str, Any]:
+        params = {"start:gte": start_gte, "start:lte": start_lte, "page_size": page_size, "page": page, **(filters or {})}
+        return await self._json("GET", f"/call_recording/api/accounts/{self.env.account_id}/users/{user_id}/call_recordings", params=params)
+
+    async def cr_user_get(self, user_id: str, recording_id: str) -> Dict[str, Any]:
+        return await self._json("GET", f"/call_recording/api/accounts/{self.env.account_id}/users/{user_id}/call_recordings/{recording_id}")
+
+    async def cr_user_delete(self, user_id: str, recording_id: str) -> Dict[str, Any]:
+        return await self._json("DELETE", f"/call_recording/api/accounts/{self.env.account_id}/users/{user_id}/call_recordings/{recording_id}")
+
+    async def cr_user_export(self, user_id: str, start_gte: str, start_lte: str) -> Dict[str, Any]:
+        payload = {"start:gte": start_gte, "start:lte": start_lte}
+        return await self._json("POST", f"/call_recording/api/accounts/{self.env.account_id}/users/{user_id}/call_recordings/export", json=payload)
+
+    async def cr_user_jobs(self, user_id: str = "self", **filters) -> Dict[str, Any]:
+        return await self._json("GET", f"/call_recording/api/accounts/{self.env.account_id}/users/{user_id}/call_recordings/jobs", params=filters or None)
+
+    async def cr_user_job(self, job_id: str, user_id: str = "self") -> Dict[str, Any]:
+        return await self._json("GET", f"/call_recording/api/accounts/{self.env.account_id}/users/{user_id}/call_recordings/jobs/{job_id}")
+
+
+vbc_manager = VBCClientManager(
+    max_users=int(os.getenv("VBC_TOKEN_CACHE_MAX", "500")),
+    idle_seconds=int(os.getenv("VBC_TOKEN_IDLE_SECONDS", str(6 * 3600))),
+)
+
+
 # =========================================================
 # Glue helpers: SQLAlchemy getters (use your own Session)
 # =========================================================
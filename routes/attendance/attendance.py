@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date
@@ -10,6 +11,7 @@ from db.Schema.attendance import (
     AttendanceOut,
     AttendanceUpdate,
 )
+from services import attendance as attendance_service
 
 router = APIRouter(
     prefix="/attendance",
@@ -29,11 +31,102 @@ def create_attendance(
 ):
     att = AttendanceModel(**payload.dict())
     db.add(att)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Attendance already recorded for this employee and date",
+        )
     db.refresh(att)
     return att
 
 
+def _check_batch_size(n: int) -> None:
+    if n > attendance_service.MAX_INGEST_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {attendance_service.MAX_INGEST_ROWS} rows per request",
+        )
+
+
+@router.post(
+    "/bulk",
+    summary="Upsert many attendance records (last row wins per employee/date)",
+)
+def bulk_attendance(
+    payload: List[AttendanceCreate],
+    db: Session = Depends(get_db),
+):
+    _check_batch_size(len(payload))
+    result = attendance_service.ingest(db, payload)
+    db.commit()
+    return result
+
+
+@router.post(
+    "/bulk/csv",
+    summary="Upsert attendance from a CSV (employee_code,date,check_in,check_out,status)",
+)
+def bulk_attendance_csv(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+):
+    try:
+        rows, errors = attendance_service.parse_csv(file.file.read())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable CSV: {e}")
+    _check_batch_size(len(rows) + len(errors))
+    result = attendance_service.ingest(db, rows)
+    db.commit()
+    return {**result, "invalid_rows": errors}
+
+
+@router.get(
+    "/analytics/summary",
+    summary="Monthly attendance counters per employee (from the monthly summary)",
+)
+def attendance_summary(
+    month_from: date = Query(..., description="Any day of the first month"),
+    month_to: Optional[date] = Query(None, description="Any day of the last month (default: month_from)"),
+    employee_code: Optional[str] = Query(None),
+    branch_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+):
+    return attendance_service.monthly_summary(
+        db,
+        month_from=month_from,
+        month_to=month_to or month_from,
+        employee_code=employee_code,
+        branch_id=branch_id,
+    )
+
+
+@router.get(
+    "/analytics/streaks/{employee_code}",
+    summary="Current and longest run of present days",
+)
+def attendance_streaks(
+    employee_code: str,
+    month_from: Optional[date] = Query(None, description="Only count from this month on"),
+    db: Session = Depends(get_db),
+):
+    return attendance_service.streaks(db, employee_code, month_from=month_from)
+
+
+@router.get(
+    "/analytics/heatmap",
+    summary="Present / recorded employees per day of a month, per branch",
+)
+def attendance_heatmap(
+    month: date = Query(..., description="Any day of the month"),
+    branch_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+):
+    return attendance_service.heatmap(db, month, branch_id=branch_id)
+
+
 @router.get(
     "/",
     response_model=List[AttendanceOut],
@@ -89,7 +182,14 @@ def update_attendance(
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(att, field, value)
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Attendance already recorded for this employee and date",
+        )
     db.refresh(att)
     return att
 
@@ -1,12 +1,12 @@
 # routes/auth/JWTSecurity.py - Fixed token saving error
 
-from datetime import datetime, timedelta
 import uuid
+from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 
-from db.models import UserDetails, TokenDetails
 from config import JWT_SECRET_KEY, logger
+from services import token_store
 
 # JWT configuration
 ALGORITHM = "HS256"
@@ -26,11 +26,12 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 def create_refresh_token(user_id: str):
     """
-    Generates a refresh token with a longer expiration time.
+    Generates a refresh token with a longer expiration time (jti keeps two
+    tokens minted in the same second distinct in the token store).
     """
     expires = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     return jwt.encode(
-        {"sub": user_id, "exp": datetime.utcnow() + expires, "token_type": "refresh"},
+        {"sub": user_id, "exp": datetime.utcnow() + expires, "token_type": "refresh", "jti": uuid.uuid4().hex},
         JWT_SECRET_KEY,
         algorithm=ALGORITHM
     )
@@ -54,35 +55,16 @@ def verify_token(token: str, db: Session = None):
         return None
 
 
-def save_refresh_token(db: Session, user_id: str, refresh_token: str):
+def save_refresh_token(db: Session, user_id: str, refresh_token: str, device: str = None):
     """
-    Saves the refresh token in the database - FIXED VERSION
+    Saves the refresh token's digest as a new session family
+    (services/token_store.py; the user_id FK rejects unknown users).
     """
     try:
-        # Find user by employee_code (not phone_number)
-        user = db.query(UserDetails).filter(UserDetails.employee_code == user_id).first()
-        if not user:
-            logger.error(f"Cannot save refresh token: User with employee_code {user_id} does not exist.")
-            return
-
-        # Check if token already exists for this user
-        existing_token = db.query(TokenDetails).filter(TokenDetails.user_id == user_id).first()
-        if existing_token:
-            # Update existing token
-            existing_token.refresh_token = refresh_token
-            existing_token.created_at = datetime.utcnow()
-        else:
-            # Create new token
-            new_token = TokenDetails(
-                id=str(uuid.uuid4()), 
-                user_id=user_id, 
-                refresh_token=refresh_token
-            )
-            db.add(new_token)
-        
+        db.execute(token_store.issue_statement(user_id, refresh_token, device=device))
         db.commit()
         logger.info(f"Refresh token saved successfully for user: {user_id}")
-        
+
     except Exception as e:
         logger.error(f"Error saving refresh token: {str(e)}")
         db.rollback()
@@ -90,12 +72,13 @@ def save_refresh_token(db: Session, user_id: str, refresh_token: str):
 
 def revoke_refresh_token(db: Session, refresh_token: str):
     """
-    Revokes (invalidates) the refresh token by deleting it from the database.
+    Revokes the refresh token and the rest of its session family.
     """
     try:
-        deleted_count = db.query(TokenDetails).filter(TokenDetails.refresh_token == refresh_token).delete()
+        revoked_count = db.execute(token_store.revoke_token_statement(refresh_token)).rowcount
         db.commit()
-        logger.info(f"Revoked {deleted_count} refresh token(s)")
+        token_store.forget(refresh_token)
+        logger.info(f"Revoked {revoked_count} refresh token(s)")
     except Exception as e:
         logger.error(f"Error revoking refresh token: {str(e)}")
-        db.rollback()
\ No newline at end of file
+        db.rollback()
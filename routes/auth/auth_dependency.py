@@ -9,6 +9,7 @@ import logging
 from db.connection import get_db
 from db.models import UserDetails, PermissionDetails
 from routes.auth.JWTSecurity import verify_token
+from services import permissions
 from typing import Union
 
 
@@ -148,27 +149,21 @@ def require_permission(permission: Union[str, PermissionDetails]):
     Usage:
       @router.get(..., dependencies=[Depends(require_permission('lead_manage_page'))])
       @router.post(..., dependencies=[Depends(require_permission(PermissionDetails.lead_manage_page))])
-    """
-    def permission_checker(current_user: UserDetails = Depends(get_current_user)) -> UserDetails:
-        # Normalize to string on each request (lazy validation to avoid import-time crashes)
-        # perm_value = permission.value if isinstance(permission, PermissionDetails) else str(permission).strip()
 
-        # # Validate against enum
-        # valid = {p.value for p in PermissionDetails}
-        # if perm_value not in valid:
-        #     raise HTTPException(
-        #         status_code=status.HTTP_400_BAD_REQUEST,
-        #         detail=f"Unknown permission '{perm_value}'. Valid permissions are: {sorted(valid)}"
-        #     )
+    The permission is resolved to its bit once, here; each request is one AND
+    on the user's cached mask (services/permissions.py). Names outside the
+    enum can't be granted, so they are logged and left unenforced.
+    """
+    bit = permissions.bit_of(permission)
+    if bit is None:
+        logger.warning("require_permission(%r): not a PermissionDetails value, not enforced", permission)
 
-        # user_perms = set(current_user.permissions or [])
-        # if perm_value not in user_perms:
-        #     raise HTTPException(
-        #         status_code=status.HTTP_403_FORBIDDEN,
-        #         detail=f"Permission '{perm_value}' required"
-        #     )
+    def permission_checker(current_user: UserDetails = Depends(get_current_user)) -> UserDetails:
+        if bit is not None and not permissions.masks.mask(current_user) & bit:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Permission '{permissions.names_of(bit)[0]}' required"
+            )
         return current_user
 
     return permission_checker
-
-
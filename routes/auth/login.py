@@ -1,82 +1,67 @@
 # routes/auth/login.py - Fixed version for ProfileRole system
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import OperationalError, DisconnectionError
-import hashlib
-import bcrypt
 
-from db.connection import get_db
-from db.models import UserDetails, TokenDetails
+from db.async_connection import get_async_db
+from db.models import UserDetails
 from db.Schema.login import TokenResponse, RefreshTokenRequest, LoginRequest, UserInfoResponse
 from routes.auth.JWTSecurity import (
     create_access_token,
     create_refresh_token,
-    save_refresh_token,
-    revoke_refresh_token,
     verify_token,
 )
+from services import token_store
+from services.auth_login import (
+    PoolBusy,
+    credential_statement,
+    needs_rehash,
+    password_pool,
+    session_user_statement,
+)
 
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
 )
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password with bcrypt or fallback method"""
-    try:
-        # Try bcrypt first
-        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-    except Exception as e:
-        # Fallback to SHA-256
-        print(f"Bcrypt verify error, falling back to SHA-256: {e}")
-        return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
+_INVALID = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Invalid credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(
+async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Authenticate user and issue access + refresh tokens.
     Username can be phone_number or email.
+
+    One credential query, bcrypt on services.auth_login.password_pool (503
+    when it is saturated), one insert starting a new refresh-token family
+    (services/token_store.py) so each device keeps its own session.
     """
     try:
-        # Try to find user by phone number first, then by email
-        user = None
-        
-        # Check if username looks like email
-        if "@" in form_data.username:
-            user = db.query(UserDetails).filter(
-                UserDetails.email == form_data.username
-            ).first()
-        else:
-            # Try phone number
-            user = db.query(UserDetails).filter(
-                UserDetails.phone_number == form_data.username
-            ).first()
-        
-        # If not found by phone, try email as fallback
-        if not user:
-            user = db.query(UserDetails).filter(
-                UserDetails.email == form_data.username
-            ).first()
-
-        # Validate user and password
+        user = (await db.execute(credential_statement(form_data.username))).first()
         if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            raise _INVALID
 
-        if not verify_password(form_data.password, user.password):
+        try:
+            if not await password_pool.verify(form_data.password, user.password):
+                raise _INVALID
+        except PoolBusy:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials",
-                headers={"WWW-Authenticate": "Bearer"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many logins in progress. Please retry.",
+                headers={"Retry-After": "1"},
             )
 
         # Check if user is active
@@ -86,47 +71,50 @@ def login(
                 detail="Account is deactivated. Contact administrator.",
             )
 
-        # Create tokens - FIXED: use role_id directly (it's an integer)
+        # Upgrade legacy SHA-256 / low-cost hashes while we have the plain password
+        if needs_rehash(user.password):
+            try:
+                new_hash = await password_pool.hash(form_data.password)
+                await db.execute(
+                    update(UserDetails)
+                    .where(UserDetails.employee_code == user.employee_code, UserDetails.password == user.password)
+                    .values(password=new_hash)
+                )
+            except PoolBusy:
+                pass  # next login
+
+        role_name = user.role_name or "Unknown"
         access_token = create_access_token({
             "sub": user.employee_code,
-            "role_id": user.role_id,  # REMOVED .value - role_id is already an integer
-            "role_name": user.profile_role.name if user.profile_role else "Unknown",
+            "role_id": user.role_id,
+            "role_name": role_name,
             "branch_id": user.branch_id
         })
         refresh_token = create_refresh_token(user.employee_code)
 
-        # Persist refresh token
-        save_refresh_token(db, user.employee_code, refresh_token)
-
-        # def to_dict(obj):
-        #     return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
-
-        # print(user.permissions)
+        # Persist refresh token (digest only)
+        await db.execute(
+            token_store.issue_statement(
+                user.employee_code, refresh_token, device=request.headers.get("user-agent")
+            )
+        )
+        await db.commit()
 
-        # Prepare user info - FIXED: removed .value calls
         user_info = {
             "employee_code": user.employee_code,
             "name": user.name,
             "email": user.email,
             "phone_number": user.phone_number,
-            "role_id": user.role_id,  # This is already an integer
-            "role_name": user.profile_role.name if user.profile_role else "Unknown",
+            "role_id": user.role_id,
+            "role_name": role_name,
             "department_id": user.department_id,
-            "department_name": user.department.name if user.department else None,
+            "department_name": user.department_name,
             "branch_id": user.branch_id,
-            "branch_name": user.branch.name if user.branch else None,
+            "branch_name": user.branch_name,
             "is_active": user.is_active,
-            "permissions": user.permissions if user.permissions else user.profile_role.default_permissions if user.profile_role else []
+            "permissions": user.permissions or user.default_permissions or [],
         }
 
-        # Get legacy permissions if they exist (optional)
-        if hasattr(user, 'permission') and user.permission:
-            user_info["legacy_permissions"] = {
-                key: getattr(user.permission, key) 
-                for key in vars(user.permission) 
-                if not key.startswith("_") and key != "id" and key != "user_id"
-            }
-
         return TokenResponse(
             access_token=access_token,
             refresh_token=refresh_token,
@@ -150,37 +138,27 @@ def login(
 
 
 @router.post("/refresh", response_model=TokenResponse)
-def refresh_token(
+async def refresh_token(
     body: RefreshTokenRequest,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Given a valid refresh token, issue a new access + refresh pair."""
+    """
+    Given a valid refresh token, issue a new access + refresh pair.
+
+    The refresh token is rotated within its family (services/token_store.py):
+    presenting an already rotated token revokes the family.
+    """
     try:
-        payload = verify_token(body.refresh_token, db=db)
+        payload = verify_token(body.refresh_token)
         if not payload or payload.get("token_type") != "refresh":
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid or expired refresh token",
             )
 
-        # Check if refresh token exists in database
-        token_in_db = (
-            db.query(TokenDetails)
-            .filter(TokenDetails.refresh_token == body.refresh_token)
-            .first()
-        )
-        if not token_in_db:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Refresh token revoked or not found",
-            )
-
-        # Get user info
         user_id = payload.get("sub")
-        user = db.query(UserDetails).filter(
-            UserDetails.employee_code == user_id
-        ).first()
-        
+        user = (await db.execute(session_user_statement(user_id))).first()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -193,34 +171,44 @@ def refresh_token(
                 detail="Account is deactivated",
             )
 
-        # Create new tokens - FIXED: removed .value calls
+        try:
+            rotation = await token_store.rotate(
+                db,
+                body.refresh_token,
+                user_id=user_id,
+                mint=create_refresh_token,
+                device=request.headers.get("user-agent"),
+            )
+        except token_store.RefreshRejected:
+            await db.commit()  # keeps a reuse's family revocation
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Refresh token revoked or not found",
+            )
+        await db.commit()
+
+        role_name = user.role_name or "Unknown"
         access_token = create_access_token({
             "sub": user.employee_code,
-            "role_id": user.role_id,  # Already an integer
-            "role_name": user.profile_role.name if user.profile_role else "Unknown",
+            "role_id": user.role_id,
+            "role_name": role_name,
             "branch_id": user.branch_id
         })
-        new_refresh_token = create_refresh_token(user_id)
-        
-        # Save new refresh token and revoke old one
-        revoke_refresh_token(db, body.refresh_token)
-        save_refresh_token(db, user_id, new_refresh_token)
 
-        # Prepare user info - FIXED: removed .value calls
         user_info = {
             "employee_code": user.employee_code,
             "name": user.name,
             "email": user.email,
             "phone_number": user.phone_number,
-            "role_id": user.role_id,  # Already an integer
-            "role_name": user.profile_role.name if user.profile_role else "Unknown",
+            "role_id": user.role_id,
+            "role_name": role_name,
             "branch_id": user.branch_id,
             "is_active": user.is_active,
         }
 
         return TokenResponse(
             access_token=access_token,
-            refresh_token=new_refresh_token,
+            refresh_token=rotation.refresh_token,
             user_info=user_info
         )
 
@@ -231,4 +219,3 @@ def refresh_token(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Token refresh failed: {str(e)}"
         )
-    
\ No newline at end of file
@@ -1,11 +1,9 @@
 # routes/auth/register.py - Complete User CRUD API (role->department auto mapping)
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from datetime import datetime
-import hashlib
-import bcrypt
-from typing import Optional
+from typing import Optional, Tuple
 
 from db.connection import get_db
 from db.models import UserDetails, ProfileRole, PermissionDetails, BranchDetails
@@ -13,34 +11,14 @@ from db.Schema.register import UserCreate, UserUpdate, ChangePasswordRequest
 from utils.validation_utils import validate_user_data
 from sqlalchemy.exc import IntegrityError
 from routes.auth.auth_dependency import get_current_user
+from services import branch_directory, employee_directory
+from services.auth_login import hash_password, verify_password
 
 router = APIRouter(
     prefix="/users",
     tags=["users"],
 )
 
-# ---------------- Password Utils ----------------
-def hash_password(password: str) -> str:
-    """Hash password with bcrypt - fixed version"""
-    try:
-        salt = bcrypt.gensalts()
-    except AttributeError:
-        salt = bcrypt.gensalt()
-    try:
-        hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
-        return hashed.decode("utf-8")
-    except Exception as e:
-        print(f"Bcrypt error, falling back to SHA-256: {e}")
-        return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password with bcrypt - fixed version"""
-    try:
-        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
-    except Exception as e:
-        print(f"Bcrypt verify error, falling back to SHA-256: {e}")
-        return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
-
 # ---------------- Small helper ----------------
 def _department_id_for_role(db: Session, role_id: int) -> Optional[int]:
     """
@@ -104,12 +82,7 @@ def serialize_user(user: UserDetails) -> dict:
 @router.post("/", status_code=status.HTTP_201_CREATED)
 def create_user(user_in: UserCreate, db: Session = Depends(get_db)):
     """Create user with hierarchy validation. department_id is derived from role_id."""
-    # Uniques
-    if db.query(UserDetails).filter_by(phone_number=user_in.phone_number).first():
-        raise HTTPException(status_code=400, detail="Phone number already registered")
-    if db.query(UserDetails).filter_by(email=user_in.email).first():
-        raise HTTPException(status_code=400, detail="Email already registered")
-
+    # Formats + uniques (email / phone / PAN vs users and leads, one lookup)
     user_data = user_in.model_dump()
     validate_user_data(db, user_data)
 
@@ -162,6 +135,8 @@ def create_user(user_in: UserCreate, db: Session = Depends(get_db)):
     try:
         db.add(user)
         db.commit()
+        branch_directory.invalidate()
+        employee_directory.invalidate()
         db.refresh(user)
         return serialize_user(user)
     except Exception as e:
@@ -175,6 +150,23 @@ def _manager_branch_id(u: UserDetails) -> Optional[int]:
         return u.manages_branch.id
     return u.branch_id
 
+def _visible_branch(current_user: UserDetails) -> Tuple[bool, Optional[int]]:
+    """
+    (restricted, branch_id) for the caller:
+      - SUPERADMIN: unrestricted.
+      - BRANCH_MANAGER: their branch (managed branch preferred).
+      - HR: their own branch.
+      - Others: unrestricted (beyond the provided filters).
+    restricted with branch_id None means the caller sees nobody.
+    """
+    role_name = (getattr(current_user, "role_name", None) or "").upper()
+    if role_name == "BRANCH_MANAGER":
+        return True, _manager_branch_id(current_user)
+    if role_name == "HR":
+        return True, current_user.branch_id
+    return False, None
+
+
 # ---------------- LIST (scoped by role) ----------------
 @router.get("/")
 def get_all_users(
@@ -182,9 +174,11 @@ def get_all_users(
     limit: int = 100,
     active_only: bool = False,
     branch_id: Optional[int] = None,
-    role_id: Optional[str] = None,
+    role_id: Optional[int] = None,
     senior_profile_id: Optional[str] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page (keyset paging; skip is ignored)"),
+    count: str = Query("exact", description="exact | estimate | none"),
     db: Session = Depends(get_db),
     current_user: UserDetails = Depends(get_current_user),
 ):
@@ -196,67 +190,69 @@ def get_all_users(
       - BRANCH_MANAGER: sees ONLY users in their branch (managed branch preferred).
       - HR: sees ONLY users in their own branch.
       - Others: unchanged (no extra restriction beyond provided filters).
+
+    `search` matches every word against name / email / phone / employee code
+    (trigram index). Pages are ordered by name; follow `next_cursor` for
+    constant-cost deep pages.
     """
+    if count not in employee_directory.COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count must be one of {list(employee_directory.COUNT_MODES)}")
     try:
-        query = db.query(UserDetails)
-
-        # ---------- Role-based visibility ----------
-        role_name = (getattr(current_user, "role_name", None) or "").upper()
-
-        if role_name == "SUPERADMIN":
-            pass
-        elif role_name == "BRANCH_MANAGER":
-            b_id = _manager_branch_id(current_user)
-            if b_id is None:
-                query = query.filter(UserDetails.employee_code == "__none__")
-            else:
-                query = query.filter(UserDetails.branch_id == b_id)
-        elif role_name == "HR":
-            if current_user.branch_id is None:
-                query = query.filter(UserDetails.employee_code == "__none__")
-            else:
-                query = query.filter(UserDetails.branch_id == current_user.branch_id)
-
-        # ---------- Existing filters ----------
-        if active_only:
-            query = query.filter(UserDetails.is_active.is_(True))
-
-        if branch_id is not None:
-            query = query.filter(UserDetails.branch_id == branch_id)
-
-        if role_id:
-            query = query.filter(UserDetails.role_id == role_id)
-
-        if senior_profile_id is not None:
-            query = query.filter(UserDetails.senior_profile_id == senior_profile_id)
-
-        if search:
-            ilike = f"%{search}%"
-            query = query.filter(
-                (UserDetails.name.ilike(ilike))
-                | (UserDetails.email.ilike(ilike))
-                | (UserDetails.phone_number.ilike(ilike))
-                | (UserDetails.employee_code.ilike(ilike))
+        restricted, visible_branch = _visible_branch(current_user)
+        if restricted and visible_branch is None:
+            page = {"data": [], "total": 0, "next_cursor": None}
+        elif restricted and branch_id is not None and branch_id != visible_branch:
+            page = {"data": [], "total": 0, "next_cursor": None}
+        else:
+            page = employee_directory.list_users(
+                db,
+                offset=skip,
+                limit=limit,
+                cursor=cursor,
+                count=count,
+                search=search,
+                active_only=active_only,
+                branch_id=visible_branch if restricted else branch_id,
+                role_id=role_id,
+                senior_profile_id=senior_profile_id,
             )
 
-        total_count = query.count()
-        users = query.offset(skip).limit(limit).all()
-        serialized_users = [serialize_user(u) for u in users]
-
+        total_count = page["total"]
         return {
-            "data": serialized_users,
+            "data": page["data"],
             "pagination": {
                 "total": total_count,
-                "skip": skip,
+                "skip": 0 if cursor else skip,
                 "limit": limit,
-                "pages": (total_count + limit - 1) // limit,
+                "pages": (total_count + limit - 1) // limit if total_count is not None else None,
+                "count": count,
+                "next_cursor": page["next_cursor"],
             },
         }
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
 
+
+@router.get("/typeahead")
+def user_typeahead(
+    q: str = Query(..., min_length=1, description="Name, email, phone or employee code (prefix first)"),
+    limit: int = Query(employee_directory.TYPEAHEAD_LIMIT, ge=1, le=50),
+    branch_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Active employees for pickers, served from the in-process directory."""
+    restricted, visible_branch = _visible_branch(current_user)
+    if restricted:
+        if visible_branch is None or (branch_id is not None and branch_id != visible_branch):
+            return {"data": []}
+        branch_id = visible_branch
+    return {"data": employee_directory.typeahead(db, q, limit=limit, branch_id=branch_id)}
+
 # ---------------- GET BY ID ----------------
 @router.get("/{employee_code}")
 def get_user_by_id(employee_code: str, db: Session = Depends(get_db)):
@@ -374,6 +370,8 @@ def update_user(employee_code: str, user_update: UserUpdate, db: Session = Depen
             user.password = hash_password(user_update.password)
 
         db.commit()
+        branch_directory.invalidate()
+        employee_directory.invalidate()
         db.refresh(user)
         return serialize_user(user)
 
@@ -407,6 +405,8 @@ def delete_user(
             user.is_active = False
             user.updated_at = datetime.utcnow()
             db.commit()
+            branch_directory.invalidate()
+            employee_directory.invalidate()
             return {
                 "message": f"User {employee_code} has been deactivated successfully",
                 "employee_code": employee_code,
@@ -434,6 +434,8 @@ def delete_user(
 
         db.delete(user)
         db.commit()
+        branch_directory.invalidate()
+        employee_directory.invalidate()
         return {
             "message": f"User {employee_code} has been hard-deleted successfully",
             "employee_code": employee_code,
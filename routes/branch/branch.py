@@ -15,6 +15,8 @@ from sqlalchemy.exc import OperationalError, DisconnectionError
 
 from db.connection import get_db
 from db.models import BranchDetails, UserDetails, ProfileRole
+from routes.auth.auth_dependency import get_current_user
+from services import branch_directory
 from passlib.context import CryptContext
 import re
 
@@ -83,11 +85,34 @@ class UserInfo(BaseModel):
     email: str
     is_active: bool
 
-class BranchDetailsOut(BaseModel):
+class RoleHeadcount(BaseModel):
+    role_id: Optional[int] = None
+    role_name: Optional[str] = None
+    users: int
+    active: int
+
+class BranchHeadcount(BaseModel):
+    total: int
+    active: int
+    by_role: List[RoleHeadcount]
+
+class BranchTotals(BaseModel):
+    leads: int
+    clients: int
+    payments: int
+    paid_amount: float
+
+class BranchDirectoryEntry(BaseModel):
     branch: BranchOut
     manager: Optional[ManagerInfo] = None
+    headcount: BranchHeadcount
+    totals: Optional[BranchTotals] = None  # SUPERADMIN / the branch's own manager only
+
+class BranchDetailsOut(BranchDirectoryEntry):
     users: List[UserInfo]
     total_users: int
+    skip: int
+    limit: int
 
 class BranchWithManagerResponse(BaseModel):
     message: str
@@ -100,6 +125,15 @@ router = APIRouter(
     tags=["branches"],
 )
 
+def _with_visible_totals(entry: dict, current_user: UserDetails) -> dict:
+    """Lead/client/payment totals are shown to SUPERADMIN and the branch's own manager only."""
+    role = (getattr(current_user, "role_name", "") or "").upper()
+    if role == "SUPERADMIN":
+        return entry
+    if role == "BRANCH_MANAGER" and entry["branch"].get("manager_id") == current_user.employee_code:
+        return entry
+    return {**entry, "totals": None}
+
 SAVE_DIR = "static/agreements"
 
 @router.get("/", response_model=List[BranchOut])
@@ -109,13 +143,9 @@ def get_all_branches(
     active_only: bool = False,
     db: Session = Depends(get_db),
 ):
-    """Get all branches with pagination and filtering"""
+    """Get all branches with pagination and filtering (served from the branch cache)"""
     try:
-        query = db.query(BranchDetails)
-        if active_only:
-            query = query.filter(BranchDetails.active == True)
-        branches = query.offset(skip).limit(limit).all()
-        return branches
+        return branch_directory.list_branches(db, active_only=active_only, offset=skip, limit=limit)
     except HTTPException:
         raise
     except (OperationalError, DisconnectionError) as e:
@@ -133,33 +163,7 @@ def get_all_branches(
 def get_available_managers(db: Session = Depends(get_db)):
     """Get list of users who can be branch managers"""
     try:
-        branch_manager_profile = db.query(ProfileRole).filter_by(name="BRANCH_MANAGER").first()
-
-        query = db.query(UserDetails).filter(
-            UserDetails.is_active == True,
-            ~UserDetails.employee_code.in_(
-                db.query(BranchDetails.manager_id).filter(BranchDetails.manager_id.isnot(None))
-            )
-        )
-
-        if branch_manager_profile:
-            query = query.filter(UserDetails.role_id == branch_manager_profile.id)
-        else:
-            # Fallback if legacy attribute exists
-            query = query.filter(getattr(UserDetails, "role", None) == "BRANCH_MANAGER")
-
-        available_managers = query.all()
-
-        return [
-            {
-                "employee_code": m.employee_code,
-                "name": m.name,
-                "email": m.email,
-                "phone_number": m.phone_number,
-                "role_name": getattr(m, 'role_name', None) or str(getattr(m, 'role', 'Unknown'))
-            }
-            for m in available_managers
-        ]
+        return branch_directory.available_managers(db)
     except (OperationalError, DisconnectionError):
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -171,11 +175,31 @@ def get_available_managers(db: Session = Depends(get_db)):
             detail=f"Error fetching available managers: {str(e)}"
         )
 
+@router.get("/directory", response_model=List[BranchDirectoryEntry])
+def get_branch_directory(
+    active_only: bool = False,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Every branch with its manager, role-grouped headcounts and lead/client/payment totals"""
+    try:
+        return [
+            _with_visible_totals(entry, current_user)
+            for entry in branch_directory.directory(db, active_only=active_only)
+        ]
+    except (OperationalError, DisconnectionError):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database connection lost. Please try again."
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching branch directory: {str(e)}")
+
 @router.get("/{branch_id}", response_model=BranchOut)
 def get_branch(branch_id: int, db: Session = Depends(get_db)):
     """Get a specific branch by ID"""
     try:
-        branch = db.query(BranchDetails).filter_by(id=branch_id).first()
+        branch = branch_directory.get_branch(db, branch_id)
         if not branch:
             raise HTTPException(status_code=404, detail="Branch not found")
         return branch
@@ -190,56 +214,19 @@ def get_branch(branch_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error fetching branch: {str(e)}")
 
 @router.get("/{branch_id}/details", response_model=BranchDetailsOut)
-def get_branch_details(branch_id: int, db: Session = Depends(get_db)):
-    """Get detailed branch information including manager and users"""
+def get_branch_details(
+    branch_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Get branch information with manager, headcounts, totals and a page of users"""
     try:
-        branch = db.query(BranchDetails).filter_by(id=branch_id).first()
-        if not branch:
+        details = branch_directory.branch_details(db, branch_id, offset=skip, limit=limit)
+        if details is None:
             raise HTTPException(status_code=404, detail="Branch not found")
-
-        branch_data = {
-            "id": branch.id,
-            "name": branch.name,
-            "address": branch.address,
-            "authorized_person": branch.authorized_person,
-            "agreement_url": branch.agreement_url,
-            "active": branch.active,
-            "manager_id": branch.manager_id,
-            "created_at": branch.created_at,
-            "updated_at": branch.updated_at,
-        }
-
-        manager_info = None
-        if branch.manager_id:
-            manager = db.query(UserDetails).filter_by(employee_code=branch.manager_id).first()
-            if manager:
-                manager_info = {
-                    "employee_code": manager.employee_code,
-                    "name": manager.name,
-                    "email": manager.email,
-                    "phone_number": manager.phone_number,
-                }
-
-        branch_users = db.query(UserDetails).filter_by(branch_id=branch_id).all()
-        users_info = [
-            {
-                "employee_code": u.employee_code,
-                "name": u.name,
-                "role": str(getattr(u, 'role', 'Unknown')),
-                "role_id": getattr(u, 'role_id', None),
-                "role_name": getattr(u, 'role_name', None),
-                "email": u.email,
-                "is_active": u.is_active
-            }
-            for u in branch_users
-        ]
-
-        return {
-            "branch": branch_data,
-            "manager": manager_info,
-            "users": users_info,
-            "total_users": len(users_info)
-        }
+        return _with_visible_totals(details, current_user)
     except HTTPException:
         raise
     except (OperationalError, DisconnectionError):
@@ -324,6 +311,7 @@ async def create_branch(
                 manager.branch_id = branch.id
                 db.commit()
 
+        branch_directory.invalidate()
         return branch
 
     except HTTPException:
@@ -448,6 +436,7 @@ async def create_branch_with_manager(
         branch.manager_id = emp_code
 
         db.commit()
+        branch_directory.invalidate()
         db.refresh(branch)
         db.refresh(manager)
 
@@ -607,6 +596,7 @@ async def update_branch(
                     new_manager.branch_id = branch_id
 
         db.commit()
+        branch_directory.invalidate()
         db.refresh(branch)
         return branch
 
@@ -640,6 +630,7 @@ def delete_branch(branch_id: int, db: Session = Depends(get_db)):
             branch.manager_id = None
 
         db.commit()
+        branch_directory.invalidate()
         return {"message": f"Branch '{branch.name}' has been deactivated successfully"}
 
     except HTTPException:
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import csv
+import importlib.util
 import io
-import json
 import os
 from typing import Optional, List, Dict, Any, Tuple, Set
 from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
@@ -11,13 +11,12 @@ from pydantic import BaseModel
 from routes.auth.auth_dependency import get_current_user
 from db.connection import get_db
 from db.models import Lead, LeadSource, UserDetails
+from db.contact_keys import find_conflicts, index_leads
+from utils.contact_keys import KIND_EMAIL, KIND_MOBILE, KIND_PAN, contact_key
 from utils.validation_utils import FormatValidator
 
-# NEW: Excel support
-try:
-    import openpyxl  # type: ignore
-except Exception:  # pragma: no cover
-    openpyxl = None  # we'll error clearly if user uploads xlsx without this installed
+# NEW: Excel support (openpyxl is imported on the first Excel upload, not at boot)
+HAS_OPENPYXL = importlib.util.find_spec("openpyxl") is not None
 
 router = APIRouter(
     prefix="/bulk-leads",
@@ -49,7 +48,7 @@ def validate_tabular_file(file: Optional[UploadFile]) -> str:
     ext = _ext(file.filename)
     if ext not in ALLOWED_EXTS:
         raise HTTPException(status_code=400, detail="Only CSV/XLSX/XLSM files are allowed.")
-    if ext in (".xlsx", ".xlsm") and openpyxl is None:
+    if ext in (".xlsx", ".xlsm") and not HAS_OPENPYXL:
         raise HTTPException(
             status_code=500,
             detail="openpyxl is not installed on the server; cannot parse Excel files."
@@ -81,6 +80,8 @@ def parse_excel_stream(file: UploadFile, sheet_name: Optional[str] = None) -> Li
     Parse Excel (xlsx/xlsm) using openpyxl in read-only mode, return list of list[str].
     Uses the first worksheet unless sheet_name provided.
     """
+    import openpyxl
+
     file.file.seek(0)
     wb = openpyxl.load_workbook(file.file, read_only=True, data_only=True)
     if sheet_name:
@@ -110,38 +111,16 @@ def get_column_value(row: List[str], idx: Optional[int]) -> Optional[str]:
     val = (row[idx] or "").strip()
     return val or None
 
-def process_segment(text: Optional[str]) -> Optional[str]:
+def process_segment(text: Optional[str]) -> Optional[List[str]]:
     if not text:
         return None
     parts = [p.strip() for p in text.split(",")]
     parts = [p for p in parts if p]
-    return json.dumps(parts) if parts else None
-
-def _bulk_fetch_existing(
-    db: Session,
-    emails: Set[str],
-    mobiles: Set[str],
-    pans: Set[str],
-) -> Tuple[Set[str], Set[str], Set[str]]:
-    """One-shot DB lookups for duplicates."""
-    existing_emails: Set[str] = set()
-    existing_mobiles: Set[str] = set()
-    existing_pans: Set[str] = set()
-
-    if emails:
-        for (e,) in db.execute(select(Lead.email).where(Lead.email.in_(emails))).all():
-            if e:
-                existing_emails.add(e)
-    if mobiles:
-        for (m,) in db.execute(select(Lead.mobile).where(Lead.mobile.in_(mobiles))).all():
-            if m:
-                existing_mobiles.add(m)
-    if pans:
-        for (p,) in db.execute(select(Lead.pan).where(Lead.pan.in_(pans))).all():
-            if p:
-                existing_pans.add(p.upper())
-
-    return existing_emails, existing_mobiles, existing_pans
+    return parts or None
+
+def _bulk_fetch_existing(db: Session, keys: Set[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+    """One-shot contact-key lookup (leads and users) for duplicates."""
+    return {(c.kind, c.value) for c in find_conflicts(db, keys)}
 
 # -------------------- Endpoint (FAST + CSV/XLSX) --------------------
 @router.post("/upload", response_model=BulkUploadResponse)
@@ -203,25 +182,15 @@ async def upload_bulk_leads_fast(
     header, data_rows = rows[0], rows[1:]
     total_rows = len(data_rows)
 
-    # 2) Pre-collect candidate keys to do one-shot duplicate DB queries
-    file_emails: Set[str] = set()
-    file_mobiles: Set[str] = set()
-    file_pans: Set[str] = set()
-
+    # 2) Pre-collect normalized keys to do one-shot duplicate DB queries
+    file_keys: Set[Tuple[str, str]] = set()
     for r in data_rows:
-        e = get_column_value(r, email_column)
-        m = get_column_value(r, mobile_column)
-        p = get_column_value(r, pan_column)
-        if e:
-            file_emails.add(e)
-        if m:
-            file_mobiles.add(m)
-        if p:
-            file_pans.add(p.upper())
-
-    existing_emails, existing_mobiles, existing_pans = _bulk_fetch_existing(
-        db, file_emails, file_mobiles, file_pans
-    )
+        for kind, col in ((KIND_EMAIL, email_column), (KIND_MOBILE, mobile_column), (KIND_PAN, pan_column)):
+            key = contact_key(kind, get_column_value(r, col))
+            if key:
+                file_keys.add((kind, key))
+
+    existing_keys = _bulk_fetch_existing(db, file_keys)
 
     # 3) validators & counters
     fmt = FormatValidator()   # your utils (regex compiled once internally)
@@ -238,9 +207,7 @@ async def upload_bulk_leads_fast(
     }
 
     # Track duplicates *within* file itself
-    seen_in_file_email: Set[str] = set()
-    seen_in_file_mobile: Set[str] = set()
-    seen_in_file_pan: Set[str] = set()
+    seen_in_file: Set[Tuple[str, str]] = set()
 
     # 4) Build rows for bulk insert (dicts)
     rows_to_insert: List[Dict[str, Any]] = []
@@ -282,21 +249,14 @@ async def upload_bulk_leads_fast(
 
             # 4b) Duplicate checks (DB + in-file)
             dup_errs = []
-            if email:
-                if email in existing_emails or email in seen_in_file_email:
-                    dup_errs.append("Email duplicate")
-                else:
-                    seen_in_file_email.add(email)
-            if mobile:
-                if mobile in existing_mobiles or mobile in seen_in_file_mobile:
-                    dup_errs.append("Mobile duplicate")
-                else:
-                    seen_in_file_mobile.add(mobile)
-            if pan:
-                if pan in existing_pans or pan in seen_in_file_pan:
-                    dup_errs.append("PAN duplicate")
+            for kind, raw, label in ((KIND_EMAIL, email, "Email"), (KIND_MOBILE, mobile, "Mobile"), (KIND_PAN, pan, "PAN")):
+                key = contact_key(kind, raw)
+                if not key:
+                    continue
+                if (kind, key) in existing_keys or (kind, key) in seen_in_file:
+                    dup_errs.append(f"{label} duplicate")
                 else:
-                    seen_in_file_pan.add(pan)
+                    seen_in_file.add((kind, key))
 
             if dup_errs:
                 duplicates_skipped += 1
@@ -347,10 +307,12 @@ async def upload_bulk_leads_fast(
         BATCH = 5000
         for i in range(0, len(rows_to_insert), BATCH):
             chunk = rows_to_insert[i:i+BATCH]
-            stmt = insert(Lead).returning(Lead.id)
+            stmt = insert(Lead).returning(Lead.id, sort_by_parameter_order=True)
             result = db.execute(stmt, chunk)
             new_ids = [row[0] for row in result.fetchall()]
             uploaded_ids.extend(new_ids)
+            # Core insert skips the ORM hook that maintains crm_contact_keys
+            index_leads(db, [dict(r, id=lead_id) for r, lead_id in zip(chunk, new_ids)])
         db.commit()
         successful_uploads = len(uploaded_ids)
     except Exception as e:
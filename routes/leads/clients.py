@@ -1,17 +1,19 @@
 # routes/clients/clients.py
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, desc, func, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, func, exists, select
 from typing import List, Optional, Literal
 from datetime import datetime
 
-from db.connection import get_db
-from db.models import Lead, Payment, UserDetails
+from db.async_connection import get_async_db
+from db.models import BranchDetails, Lead, Payment, UserDetails
 from routes.auth.auth_dependency import get_current_user
 from pydantic import BaseModel
 # ⬇️ use the recursive CTE helpers (put them in services/user_tree.py as in my previous message)
 from utils.user_tree import get_subordinate_ids, get_subordinate_users
+from services.client_list import client_page
+from utils.serializers import ORJSONResponse
 
 router = APIRouter(prefix="/clients", tags=["Clients"])
 
@@ -88,93 +90,22 @@ class ClientListResponse(BaseModel):
 # Helper Functions
 # ---------------------------
 
-def get_client_query_base(db: Session):
+def get_client_query_base():
     """
-    Base query: active clients only, no deletions.
+    Base statement: active clients only, no deletions.
     """
-    return (
-        db.query(Lead)
-        .filter(
-            and_(
-                Lead.is_delete == False,
-                Lead.is_client == True
-            )
+    return select(Lead.id).where(
+        and_(
+            Lead.is_delete == False,
+            Lead.is_client == True
         )
-        .distinct()
-    )
-
-def _paid_statuses():
-    return {"PAID", "SUCCESS", "SUCCESSFUL", "COMPLETED"}
-
-def _is_paid_status(status: Optional[str]) -> bool:
-    return (status or "").upper() in _paid_statuses()
-
-def format_client_response(lead: Lead, db: Session) -> ClientResponse:
-    payments = (
-        db.query(Payment)
-        .filter(
-            Payment.lead_id == lead.id,
-            func.upper(Payment.status).in_(list(_paid_statuses()))
-        )
-        .order_by(desc(Payment.created_at))
-        .all()
-    )
-
-    payment_info = [
-        ClientPaymentInfo(
-            payment_id=p.id,
-            order_id=p.order_id,
-            service=p.Service if p.Service else [],
-            paid_amount=p.paid_amount,
-            status=p.status,
-            mode=p.mode,
-            plan=p.plan if p.plan else [],
-            created_at=p.created_at,
-            duration_day=p.duration_day,
-            call=p.call,
-        )
-        for p in payments
-    ]
-
-    assigned_employee = None
-    if lead.assigned_user:
-        u = lead.assigned_user
-        assigned_employee = AssignedEmployeeInfo(
-            employee_code=u.employee_code,
-            name=u.name,
-            role_id=str(u.role_id),
-            phone_number=u.phone_number,
-            email=u.email,
-        )
-
-    branch_name = lead.branch.name if lead.branch else None
-
-    return ClientResponse(
-        lead_id=lead.id,
-        full_name=lead.full_name,
-        email=lead.email,
-        mobile=lead.mobile,
-        city=lead.city,
-        state=lead.state,
-        occupation=lead.occupation,
-        segment=lead.segment,
-        lead_status=lead.lead_status,
-        created_at=lead.created_at,
-        total_payments=len(payments),
-        total_amount_paid=sum(p.paid_amount for p in payments),
-        latest_payment=payment_info[0] if payment_info else None,
-        all_payments=payment_info,
-        assigned_employee=assigned_employee,
-        branch_name=branch_name,
-        is_active_client=any(_is_paid_status(p.status) for p in payments) or bool(lead.is_client),
-        kyc_status=bool(lead.kyc),
     )
 
 # ---------------------------
 # API Endpoints
 # ---------------------------
 
-@router.get("/", response_model=ClientListResponse)
+@router.get("/", response_model=ClientListResponse, response_class=ORJSONResponse)
 async def get_clients(
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(10, ge=1, le=100, description="Items per page"),
@@ -186,7 +117,7 @@ async def get_clients(
     view: Literal["self", "other", "all"] = Query("all", description="Scope for non-managers: self | other | all"),
     team_member: Optional[str] = Query(None, description="When view='other', restrict to this subordinate employee_code"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Role visibility:
@@ -195,7 +126,7 @@ async def get_clients(
       - Others: self + subordinates (controlled by `view` and `team_member`).
     """
 
-    query = get_client_query_base(db)
+    query = get_client_query_base()
 
     # -------- Role-scoped visibility --------
     role = (current_user.role_name or "").upper()
@@ -209,48 +140,48 @@ async def get_clients(
         pass
 
     elif role == "BRANCH_MANAGER":
-        branch_id_for_filter = None
-        if current_user.manages_branch:
-            branch_id_for_filter = current_user.manages_branch.id
-        elif current_user.branch_id:
+        branch_id_for_filter = (
+            await db.execute(select(BranchDetails.id).where(BranchDetails.manager_id == current_user.employee_code))
+        ).scalar()
+        if not branch_id_for_filter and current_user.branch_id:
             branch_id_for_filter = current_user.branch_id
 
         if branch_id_for_filter:
-            query = query.filter(Lead.branch_id == branch_id_for_filter)
+            query = query.where(Lead.branch_id == branch_id_for_filter)
         else:
             # no branch → empty set
-            query = query.filter(Lead.id == -1)
+            query = query.where(Lead.id == -1)
 
     else:
         # Other employees → build team (recursive)
-        team_codes = get_subordinate_ids(db, current_user.employee_code, include_inactive=False)
-        team_users = get_subordinate_users(db, current_user.employee_code, include_inactive=False)
+        team_codes = await db.run_sync(get_subordinate_ids, current_user.employee_code, include_inactive=False)
+        team_users = await db.run_sync(get_subordinate_users, current_user.employee_code, include_inactive=False)
 
         # Apply view filter
         if view == "self":
-            query = query.filter(Lead.assigned_to_user == current_user.employee_code)
+            query = query.where(Lead.assigned_to_user == current_user.employee_code)
         elif view == "other":
             if not team_codes:
-                query = query.filter(Lead.id == -1)  # no subordinates
+                query = query.where(Lead.id == -1)  # no subordinates
             else:
                 if team_member:
                     # restrict to a selected subordinate (if it's actually under me)
                     if team_member in team_codes:
-                        query = query.filter(Lead.assigned_to_user == team_member)
+                        query = query.where(Lead.assigned_to_user == team_member)
                     else:
-                        query = query.filter(Lead.id == -1)
+                        query = query.where(Lead.id == -1)
                 else:
-                    query = query.filter(Lead.assigned_to_user.in_(team_codes))
+                    query = query.where(Lead.assigned_to_user.in_(team_codes))
         else:  # "all"
             if team_codes:
-                query = query.filter(
+                query = query.where(
                     or_(
                         Lead.assigned_to_user == current_user.employee_code,
                         Lead.assigned_to_user.in_(team_codes),
                     )
                 )
             else:
-                query = query.filter(Lead.assigned_to_user == current_user.employee_code)
+                query = query.where(Lead.assigned_to_user == current_user.employee_code)
 
         # Prepare filters metadata for UI (list of subordinate users)
         filters_meta = FiltersMeta(
@@ -270,7 +201,7 @@ async def get_clients(
     # -------- Additional filters --------
     if search:
         search_term = f"%{search}%"
-        query = query.filter(
+        query = query.where(
             or_(
                 Lead.full_name.ilike(search_term),
                 Lead.email.ilike(search_term),
@@ -279,13 +210,13 @@ async def get_clients(
         )
 
     if employee_code:
-        query = query.filter(Lead.assigned_to_user == employee_code)
+        query = query.where(Lead.assigned_to_user == employee_code)
 
     if branch_id:
-        query = query.filter(Lead.branch_id == branch_id)
+        query = query.where(Lead.branch_id == branch_id)
 
     if status:
-        query = query.filter(
+        query = query.where(
             exists().where(
                 and_(
                     Payment.lead_id == Lead.id,
@@ -294,82 +225,44 @@ async def get_clients(
             )
         )
 
-    # Count BEFORE pagination
-    total_count = query.count()
-
-    # Pagination + eager loads
     offset = (page - 1) * limit
-    clients = (
-        query.options(
-            joinedload(Lead.branch),
-            joinedload(Lead.payments),
-            joinedload(Lead.assigned_user),
-        )
-        .order_by(desc(Lead.created_at))
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
-
-    client_responses = [format_client_response(client, db) for client in clients]
-
-    return ClientListResponse(
-        clients=client_responses,
-        total_count=total_count,
-        page=page,
-        limit=limit,
-        total_pages=(total_count + limit - 1) // limit,
-        filters=filters_meta,
-    )
-
-@router.get("/my/clients", response_model=ClientListResponse)
+    client_rows, total_count = await client_page(db, query, offset=offset, limit=limit)
+
+    return ORJSONResponse({
+        "clients": client_rows,
+        "total_count": total_count,
+        "page": page,
+        "limit": limit,
+        "total_pages": (total_count + limit - 1) // limit,
+        "filters": filters_meta.model_dump() if filters_meta else None,
+    })
+
+@router.get("/my/clients", response_model=ClientListResponse, response_class=ORJSONResponse)
 async def get_my_clients(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Clients directly assigned to the current user (via Lead.assigned_to_user).
     """
-    query = (
-        db.query(Lead)
-        .filter(
-            and_(
-                Lead.is_delete == False,
-                Lead.is_client == True,
-                Lead.assigned_to_user == current_user.employee_code,
-            )
-        )
-    )
+    query = get_client_query_base().where(Lead.assigned_to_user == current_user.employee_code)
 
-    total_count = query.count()
     offset = (page - 1) * limit
-    clients = (
-        query.options(
-            joinedload(Lead.branch),
-            joinedload(Lead.payments),
-            joinedload(Lead.assigned_user),
-        )
-        .order_by(desc(Lead.created_at))
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
-
-    client_responses = [format_client_response(client, db) for client in clients]
-
-    return ClientListResponse(
-        clients=client_responses,
-        total_count=total_count,
-        page=page,
-        limit=limit,
-        total_pages=(total_count + limit - 1) // limit,
-        filters=FiltersMeta(
-            view="self",
-            available_views=["self"],
-            available_team_members=[],
-            selected_team_member=None,
-        ),
-    )
+    client_rows, total_count = await client_page(db, query, offset=offset, limit=limit)
+
+    return ORJSONResponse({
+        "clients": client_rows,
+        "total_count": total_count,
+        "page": page,
+        "limit": limit,
+        "total_pages": (total_count + limit - 1) // limit,
+        "filters": {
+            "view": "self",
+            "available_views": ["self"],
+            "available_team_members": [],
+            "selected_team_member": None,
+        },
+    })
 
@@ -8,6 +8,7 @@ from pydantic import BaseModel, validator
 
 from db.connection import get_db
 from db.models import LeadFetchConfig, BranchDetails
+from services.lead_fetch import fetch_configs
 
 router = APIRouter(
     prefix="/lead-fetch-config",
@@ -175,6 +176,7 @@ def create_fetch_config(config: LeadFetchConfigCreate, db: Session = Depends(get
         )
         db.add(new_config)
         db.commit()
+        fetch_configs.invalidate()
         db.refresh(new_config)
 
         return LeadFetchConfigResponse(
@@ -265,6 +267,7 @@ def update_fetch_config(config_id: int, updates: LeadFetchConfigUpdate, db: Sess
 
         db.commit()
         db.refresh(cfg)
+        fetch_configs.invalidate()
 
         return LeadFetchConfigResponse(
             id=cfg.id,
@@ -294,6 +297,7 @@ def delete_fetch_config(config_id: int, db: Session = Depends(get_db)):
 
         db.delete(cfg)
         db.commit()
+        fetch_configs.invalidate()
         return {"message": "Fetch configuration deleted successfully"}
 
     except HTTPException:
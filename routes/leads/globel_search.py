@@ -287,20 +287,17 @@
 #             detail=f"Error searching leads: {str(e)}",
 #         )
 
-import json
-from typing import Optional, List, Any, Dict, Union, Literal, Tuple
-from datetime import datetime, date, timedelta, timezone
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Query
-from pydantic import BaseModel, validator
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, select, literal, not_
+from sqlalchemy import or_, literal, not_
 
-from db.connection import get_db
-from db.models import (
-    Lead, LeadAssignment,
-)
+from db.connection import get_read_db
+from db.lead_owner import owned_by
+from db.models import Lead
 from routes.auth.auth_dependency import get_current_user
+from utils.serializers import LEAD_OUT, ORJSONResponse
 from utils.user_tree import get_subordinate_ids
 
 router = APIRouter(
@@ -319,26 +316,6 @@ def _branch_id_for_manager(u) -> Optional[int]:
         return u.manages_branch.id
     return getattr(u, "branch_id", None)
 
-def _exists_assignment_for_allowed(allowed_codes: List[str]):
-    """
-    SQL EXISTS(SELECT 1 FROM crm_lead_assignments ...)
-    correlated to Lead; TRUE if any assignment for this lead is in allowed_codes.
-    """
-    if not allowed_codes:
-        return literal(False)
-    return (
-        select(literal(1))
-        .select_from(LeadAssignment)
-        .where(
-            and_(
-                LeadAssignment.lead_id == Lead.id,
-                LeadAssignment.user_id.in_(allowed_codes),
-            )
-        )
-        .correlate(Lead)
-        .exists()
-    )
-
 # ---------- masking helpers ----------
 def mask_phone(phone: Optional[str]) -> Optional[str]:
     if not phone:
@@ -369,136 +346,12 @@ def mask_name(name: Optional[str]) -> Optional[str]:
         return n[0] + "*"
     return n[0] + ("*" * (len(n)-2)) + n[-1]
 
-# ----------------- output model & converters -----------------
-class LeadOut(BaseModel):
-    id: int
-    full_name: Optional[str] = None
-    director_name: Optional[str] = None
-    father_name: Optional[str] = None
-    gender: Optional[str] = None
-    marital_status: Optional[str] = None
-    email: Optional[str] = None
-    mobile: Optional[str] = None
-    alternate_mobile: Optional[str] = None
-    aadhaar: Optional[str] = None
-    pan: Optional[str] = None
-    gstin: Optional[str] = None
-    state: Optional[str] = None
-    city: Optional[str] = None
-    district: Optional[str] = None
-    address: Optional[str] = None
-    pincode: Optional[str] = None
-    country: Optional[str] = None
-    dob: Optional[date] = None
-    occupation: Optional[str] = None
-    segment: Optional[List[str]] = None
-    experience: Optional[str] = None
-    investment: Optional[str] = None
-    ft_service_type: Optional[str] = None
-    lead_response_id: Optional[int] = None
-    lead_source_id: Optional[int] = None
-    branch_id: Optional[int] = None
-    created_by: Optional[str] = None
-    created_by_name: Optional[str] = None
-    aadhar_front_pic: Optional[str] = None
-    aadhar_back_pic: Optional[str] = None
-    pan_pic: Optional[str] = None
-    kyc: Optional[bool] = False
-    kyc_id: Optional[str] = None
-    is_old_lead: Optional[bool] = False
-    call_back_date: Optional[datetime] = None
-    lead_status: Optional[str] = None
-    ft_to_date: Optional[str] = None
-    ft_from_date: Optional[str] = None
-    is_client: Optional[bool] = None
-    assigned_to_user: Optional[str] = None
-    response_changed_at: Optional[datetime] = None
-    assigned_for_conversion: Optional[bool] = False
-    conversion_deadline: Optional[datetime] = None
-    created_at: datetime
-
-    @validator("segment", pre=True, always=True)
-    def parse_segment(cls, v):
-        if v is None:
-            return None
-        if isinstance(v, str):
-            try:
-                parsed = json.loads(v)
-                return parsed if isinstance(parsed, list) else [parsed]
-            except json.JSONDecodeError:
-                return [v] if v.strip() else None
-        if isinstance(v, list):
-            return v
-        return [str(v)] if v is not None else None
-
-    class Config:
-        from_attributes = True
-
-def safe_convert_lead_to_dict(lead) -> dict:
-    try:
-        lead_dict = {}
-        for column in lead.__table__.columns:
-            value = getattr(lead, column.name, None)
-            if column.name == "segment":
-                if value is not None:
-                    try:
-                        parsed = json.loads(value)
-                        lead_dict[column.name] = parsed if isinstance(parsed, list) else [parsed]
-                    except (json.JSONDecodeError, TypeError):
-                        lead_dict[column.name] = [value] if value else []
-                else:
-                    lead_dict[column.name] = None
-            else:
-                lead_dict[column.name] = value
-        return lead_dict
-    except Exception:
-        return {
-            "id": getattr(lead, "id", None),
-            "full_name": getattr(lead, "full_name", None),
-            "director_name": getattr(lead, "director_name", None),
-            "father_name": getattr(lead, "father_name", None),
-            "gender": getattr(lead, "gender", None),
-            "marital_status": getattr(lead, "marital_status", None),
-            "email": getattr(lead, "email", None),
-            "mobile": getattr(lead, "mobile", None),
-            "alternate_mobile": getattr(lead, "alternate_mobile", None),
-            "aadhaar": getattr(lead, "aadhaar", None),
-            "pan": getattr(lead, "pan", None),
-            "gstin": getattr(lead, "gstin", None),
-            "state": getattr(lead, "state", None),
-            "city": getattr(lead, "city", None),
-            "district": getattr(lead, "district", None),
-            "address": getattr(lead, "address", None),
-            "pincode": getattr(lead, "pincode", None),
-            "country": getattr(lead, "country", None),
-            "dob": getattr(lead, "dob", None),
-            "occupation": getattr(lead, "occupation", None),
-            "experience": getattr(lead, "experience", None),
-            "investment": getattr(lead, "investment", None),
-            "ft_service_type": getattr(lead, "ft_service_type", None),
-            "created_at": getattr(lead, "created_at", datetime.now()),
-            "lead_status": getattr(lead, "lead_status", None),
-            "kyc": getattr(lead, "kyc", False),
-            "segment": None,
-            "lead_response_id": getattr(lead, "lead_response_id", None),
-            "lead_source_id": getattr(lead, "lead_source_id", None),
-            "branch_id": getattr(lead, "branch_id", None),
-            "created_by": getattr(lead, "created_by", None),
-            "created_by_name": getattr(lead, "created_by_name", None),
-            "aadhar_front_pic": getattr(lead, "aadhar_front_pic", None),
-            "aadhar_back_pic": getattr(lead, "aadhar_back_pic", None),
-            "pan_pic": getattr(lead, "pan_pic", None),
-            "kyc_id": getattr(lead, "kyc_id", None),
-            "is_old_lead": getattr(lead, "is_old_lead", False),
-            "call_back_date": getattr(lead, "call_back_date", None),
-        }
-
 # ----------------- SEARCH with visibility + masked “activate” -----------------
-@router.get("/search/")
+@router.get("/search/", response_class=ORJSONResponse)
 def search_leads(
     q: str,
     search_type: str = "all",  # all, name, mobile, email, pan, aadhaar
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user),
 ):
     """
@@ -568,21 +421,24 @@ def search_leads(
         else:
             subs = get_subordinate_ids(db, current_user.employee_code)
             allowed = [current_user.employee_code] + (subs or [])
-            query = query.filter(
-                or_(
-                    Lead.assigned_to_user.in_(allowed),
-                    _exists_assignment_for_allowed(allowed),
-                )
-            )
+            query = query.filter(owned_by(allowed))
 
-        visible_rows = query.order_by(Lead.created_at.desc()).limit(50).all()
+        visible_rows = (
+            query.with_entities(*LEAD_OUT.columns)
+            .order_by(Lead.created_at.desc())
+            .limit(50)
+            .all()
+        )
 
-        visible_ids = {ld.id for ld in visible_rows}
+        visible_ids = {row.id for row in visible_rows}
 
         # ---------- MASKED (ACTIVATE) QUERY (no visibility restriction) ----------
         # Find additional matches the user is NOT allowed to see.
         masked_query = (
-            db.query(Lead)
+            db.query(
+                Lead.full_name, Lead.mobile, Lead.alternate_mobile, Lead.email,
+                Lead.city, Lead.state, Lead.created_at,
+            )
             .filter(
                 Lead.is_delete.is_(False),
                 _text_filter(),
@@ -594,14 +450,8 @@ def search_leads(
         masked_rows = masked_query.all()
 
         # ---------- Build responses ----------
-        # Visible (full) details using your existing transformer
-        result: List[LeadOut] = []
-        for lead in visible_rows:
-            try:
-                lead_dict = safe_convert_lead_to_dict(lead)
-                result.append(LeadOut(**lead_dict))
-            except Exception:
-                continue
+        # Visible (full) details, same keys as leads.LeadOut
+        result = LEAD_OUT.many(visible_rows)
 
         # Masked list (minimal, non-sensitive — intended for “Activate” tab)
         activate_leads = []
@@ -621,14 +471,14 @@ def search_leads(
             except Exception:
                 continue
 
-        return {
+        return ORJSONResponse({
             "search_query": q,
             "search_type": search_type,
             "total_results": len(result),
             "leads": result,                 # visible
             "total_activate": len(activate_leads),
             "activate_leads": activate_leads # masked, for “Activate” tab
-        }
+        })
 
     except HTTPException:
         raise
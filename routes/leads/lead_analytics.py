@@ -3,12 +3,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import (
-    and_, or_, desc, func, text, case, extract, exists, select, literal
+    and_, desc, func, text, case, extract, exists, select, literal
 )
 from typing import List, Optional, Dict, Any, Tuple, Literal
 from datetime import datetime, date, timedelta
 from pydantic import BaseModel
-from db.connection import get_db
+from db.connection import get_read_db
+from db.lead_owner import owned_by
 from db.models import (
     Lead, Payment, UserDetails, LeadAssignment,
     BranchDetails, LeadSource, LeadResponse, LeadStory, LeadComment
@@ -187,22 +188,6 @@ def _exists_called_assignment_for_lead():
         .exists()
     )
 
-def _exists_assignment_for_allowed(allowed_codes: List[str]):
-    if not allowed_codes:
-        return select(literal(1)).where(literal(False)).exists()
-    return (
-        select(literal(1))
-        .select_from(LeadAssignment)
-        .where(
-            and_(
-                LeadAssignment.lead_id == Lead.id,
-                LeadAssignment.user_id.in_(allowed_codes),
-            )
-        )
-        .correlate(Lead)
-        .exists()
-    )
-
 def _exists_assignment_for_users(user_codes_selectable):
     """
     Accepts a selectable/subquery that yields one column `employee_code`.
@@ -377,7 +362,7 @@ async def get_admin_analytics(
     branch_id: Optional[int] = Query(None, description="Filter by branch ID"),
     view: Literal["self","other","all"] = Query("all", description="For employees: self/other/all"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Visibility:
@@ -643,12 +628,7 @@ async def get_admin_analytics(
     else:
         allowed = allowed_for_trends or []
         if allowed:
-            source_analytics_q = source_analytics_q.filter(
-                or_(
-                    Lead.assigned_to_user.in_(allowed),  # direct column if you keep it
-                    _exists_assignment_for_allowed(allowed),
-                )
-            )
+            source_analytics_q = source_analytics_q.filter(owned_by(allowed))
         else:
             source_analytics_q = source_analytics_q.filter(literal(False))
 
@@ -748,7 +728,7 @@ async def get_admin_analytics(
 async def get_employee_analytics(
     days: int = Query(30, ge=1, le=365, description="Number of days to analyze"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     start_date, end_date = get_date_range_filter(days)
 
@@ -1005,7 +985,7 @@ async def get_admin_dashboard_card(
     view: Literal["self","other","all"] = Query("all"),
     team_member: Optional[str] = Query(None),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     start_date, end_date = get_date_range_filter(days)
 
@@ -1080,7 +1060,7 @@ async def get_admin_dashboard_card(
 async def get_employee_response_analytics(
     days: int = Query(30, ge=1, le=365, description="Number of days to analyze"),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     start_date, end_date = get_date_range_filter(days)
 
@@ -1108,7 +1088,7 @@ async def get_admin_response_analytics(
     view: Literal["self","other","all"] = Query("all"),
     team_member: Optional[str] = Query(None),
     current_user: UserDetails = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     if from_date and to_date and from_date > to_date:
         from_date, to_date = to_date, from_date
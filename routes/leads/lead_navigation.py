@@ -1,16 +1,17 @@
 # routes/leads/lead_navigation.py
 
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, select
 
 from db.connection import get_db
 from db.models import Lead, LeadAssignment, UserDetails
 from routes.auth.auth_dependency import get_current_user
+from services.lead_navigation import navigation
 from utils.AddLeadStory import AddLeadStory
 
 router = APIRouter(
@@ -81,35 +82,83 @@ async def mark_lead_called(
 
 
 @router.get("/navigation/uncalled-count")
-async def get_uncalled_leads_count(
+def get_uncalled_leads_count(
     db: Session = Depends(get_db),
     current_user: UserDetails = Depends(get_current_user),
 ):
     """
     Returns how many assigned leads are still uncalled.
+    Counts come from the user's cached assignment sequence (services/lead_navigation.py).
     """
-    # Use timezone-aware datetime
-    now = datetime.now(timezone.utc)  # Fixed timezone issue
-    expiry_cutoff = now - timedelta(hours=24)
-    
-    uncalled_count = db.query(LeadAssignment).filter(
-        and_(
-            LeadAssignment.user_id == current_user.employee_code,
-            LeadAssignment.fetched_at >= expiry_cutoff,
-            LeadAssignment.is_call == False
-        )
-    ).count()
-    
-    total_count = db.query(LeadAssignment).filter(
-        and_(
-            LeadAssignment.user_id == current_user.employee_code,
-            LeadAssignment.fetched_at >= expiry_cutoff
-        )
-    ).count()
-    
-    return {
-        "uncalled_count": uncalled_count,
-        "total_count": total_count,
-        "called_count": total_count - uncalled_count
-    }
+    return navigation.sequence(db, current_user.employee_code).counts()
+
+
+_NAV_LEAD_COLUMNS = (
+    Lead.id, Lead.full_name, Lead.email, Lead.mobile, Lead.city, Lead.occupation,
+    Lead.investment, Lead.created_at, Lead.lead_source_id, Lead.lead_response_id,
+)
+
+
+def _index_or_404(seq, assignment_id: int) -> int:
+    index = seq.index_of(assignment_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Assignment not found in your active leads")
+    return index
+
+
+def _navigate(db: Session, user_id: str, current_assignment_id: Optional[int], step: int) -> LeadNavigationResponse:
+    """Lead at current +/- step in the user's sequence (the first one without a current assignment)."""
+    for attempt in range(2):
+        seq = navigation.sequence(db, user_id)
+        if current_assignment_id is None:
+            index = 0 if step > 0 else seq.total - 1
+        else:
+            index = _index_or_404(seq, current_assignment_id) + step
+        if not 0 <= index < seq.total:
+            raise HTTPException(status_code=404, detail="No more leads in this direction")
+
+        entry = seq.entry(index)
+        lead = db.execute(
+            select(*_NAV_LEAD_COLUMNS).where(Lead.id == entry["lead_id"], Lead.is_delete == False)
+        ).first()
+        if lead is not None:
+            return LeadNavigationResponse(
+                **lead._mapping,
+                is_call=entry["is_call"],
+                assignment_id=entry["assignment_id"],
+                **seq.cursor(index),
+            )
+        # stale slot (lead deleted / reassigned elsewhere): reload once
+        navigation.invalidate(user_id)
+    raise HTTPException(status_code=404, detail="Lead not found")
 
+
+@router.get("/navigation/next", response_model=LeadNavigationResponse)
+def get_next_lead(
+    current_assignment_id: Optional[int] = Query(None, description="Omit for the first lead"),
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Next assigned lead after the current one."""
+    return _navigate(db, current_user.employee_code, current_assignment_id, +1)
+
+
+@router.get("/navigation/previous", response_model=LeadNavigationResponse)
+def get_previous_lead(
+    current_assignment_id: Optional[int] = Query(None, description="Omit for the last lead"),
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Previous assigned lead before the current one."""
+    return _navigate(db, current_user.employee_code, current_assignment_id, -1)
+
+
+@router.get("/navigation/position/{assignment_id}", response_model=LeadPositionResponse)
+def get_lead_position(
+    assignment_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Position of an assignment in the user's sequence."""
+    seq = navigation.sequence(db, current_user.employee_code)
+    return seq.cursor(_index_or_404(seq, assignment_id))
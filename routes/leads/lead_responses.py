@@ -1,11 +1,12 @@
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError, DisconnectionError, IntegrityError
 from pydantic import BaseModel, constr
 
 from db.connection import get_db
 from db.models import LeadResponse, Lead
+from services import reference_data
 
 router = APIRouter(
     prefix="/lead-config",
@@ -125,20 +126,26 @@ def create_lead_response(
 
 @router.get("/responses/", response_model=List[LeadResponseOut])
 def get_all_lead_responses(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
 ):
-    """Get all lead responses with optional search"""
+    """Get all lead responses with optional search (cached snapshot, ETag)"""
     try:
-        query = db.query(LeadResponse)
-        
+        snap = reference_data.get("lead_responses")
+        unchanged = reference_data.not_modified(
+            request, response, reference_data.query_etag(request, snap.name, snap.version)
+        )
+        if unchanged:
+            return unchanged
+
+        rows = snap.rows
         if search:
-            query = query.filter(LeadResponse.name.ilike(f"%{search}%"))
-        
-        responses = query.offset(skip).limit(limit).all()
-        return responses
+            needle = search.lower()
+            rows = [r for r in rows if reference_data.contains(r["name"], needle)]
+        return reference_data.page(rows, skip, limit)
         
     except (OperationalError, DisconnectionError):
         raise HTTPException(
@@ -155,11 +162,10 @@ def get_all_lead_responses(
 @router.get("/responses/{response_id}", response_model=LeadResponseOut)
 def get_lead_response(
     response_id: int,
-    db: Session = Depends(get_db),
 ):
     """Get a specific lead response by ID"""
     try:
-        response = db.query(LeadResponse).filter_by(id=response_id).first()
+        response = reference_data.get("lead_responses").by_id.get(response_id)
         if not response:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
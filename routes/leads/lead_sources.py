@@ -1,5 +1,5 @@
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError, DisconnectionError, IntegrityError
 from pydantic import BaseModel, constr
@@ -7,6 +7,7 @@ from pydantic import BaseModel, constr
 from db.connection import get_db
 from db.models import LeadSource, UserDetails, Lead
 from routes.auth.auth_dependency import get_current_user
+from services import reference_data
 from sqlalchemy import or_, UniqueConstraint  # or_ used below
 # ...
 
@@ -91,24 +92,34 @@ def create_lead_source(
 
 @router.get("/sources/", response_model=List[LeadSourceOut])
 def get_all_lead_sources(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
     current_user: UserDetails = Depends(get_current_user),
 ):
-    """Get all lead sources with optional search"""
+    """Get all lead sources with optional search (cached snapshot, ETag)"""
     
     try:
-        query = db.query(LeadSource)
+        snap = reference_data.get("lead_sources")
+        scope = None if is_superadmin(current_user) else current_user.branch_id
+        unchanged = reference_data.not_modified(
+            request, response, reference_data.query_etag(request, snap.name, snap.version, scope)
+        )
+        if unchanged:
+            return unchanged
+
+        rows = snap.rows
         if search:
-            query = query.filter(
-                LeadSource.name.ilike(f"%{search}%")
-                | LeadSource.description.ilike(f"%{search}%")
-            )
+            needle = search.lower()
+            rows = [
+                r for r in rows
+                if reference_data.contains(r["name"], needle) or reference_data.contains(r["description"], needle)
+            ]
         if not is_superadmin(current_user):
-            query = query.filter(LeadSource.branch_id == current_user.branch_id)
-        return query.offset(skip).limit(limit).all()
+            rows = [r for r in rows if scope is not None and r["branch_id"] == scope]
+        return reference_data.page(rows, skip, limit)
     except (OperationalError, DisconnectionError):
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -123,11 +134,10 @@ def get_all_lead_sources(
 @router.get("/sources/{source_id}", response_model=LeadSourceOut)
 def get_lead_source(
     source_id: int,
-    db: Session = Depends(get_db),
 ):
     """Get a specific lead source by ID"""
     try:
-        source = db.query(LeadSource).filter_by(id=source_id).first()
+        source = reference_data.get("lead_sources").by_id.get(source_id)
         if not source:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Lead source not found"
@@ -1,5 +1,5 @@
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
@@ -10,6 +10,7 @@ from db.models import Lead, UserDetails
 from routes.auth.auth_dependency import get_current_user
 from utils.AddLeadStory import AddLeadStory
 from routes.notification.notification_service import notification_service
+from services import lead_transfer as bulk_transfer
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,6 +28,24 @@ class TransferPayload(BaseModel):
     lead_id: int = Field(..., description="Lead ID to transfer")
     employee_id: str = Field(..., description="Target employee_code")
 
+class BulkTransferFilters(BaseModel):
+    source_user: Optional[str] = Field(None, description="Current owner (employee_code)")
+    branch_id: Optional[int] = None
+    lead_response_id: Optional[int] = None
+    created_from: Optional[date] = None
+    created_to: Optional[date] = None
+    lead_ids: Optional[List[int]] = Field(None, description="Explicit lead ids (ANDed with the other filters)")
+
+class BulkTransferPayload(BaseModel):
+    filters: BulkTransferFilters = Field(default_factory=BulkTransferFilters)
+    targets: List[str] = Field(..., min_length=1, description="Target employee_codes")
+    strategy: str = Field("single", description="single / round_robin / least_loaded")
+    chunk_size: Optional[int] = Field(None, ge=1, le=10000)
+    dry_run: bool = Field(False, description="Only count matching leads (and target loads)")
+
+def _rejected(e: bulk_transfer.TransferRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail)
+
 # --------- endpoint ----------
 @router.post("/transfer/", status_code=status.HTTP_200_OK)
 async def transfer_leads(
@@ -131,3 +150,85 @@ async def transfer_leads(
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to transfer lead: {e}")
+
+
+# --------- bulk transfer / rebalance (services/lead_transfer.py) ----------
+@router.post("/transfer/bulk", status_code=status.HTTP_202_ACCEPTED)
+def create_bulk_transfer(
+    payload: BulkTransferPayload,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Queue a chunked background transfer; poll GET /leads/transfer/jobs/{id} for progress."""
+    try:
+        result = bulk_transfer.create_job(
+            db,
+            current_user,
+            filters=payload.filters.model_dump(),
+            targets=payload.targets,
+            strategy=payload.strategy,
+            chunk_size=payload.chunk_size,
+            dry_run=payload.dry_run,
+        )
+        if not payload.dry_run:
+            db.commit()
+        return result
+    except bulk_transfer.TransferRejected as e:
+        db.rollback()
+        raise _rejected(e)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to queue bulk transfer: {e}")
+
+
+@router.get("/transfer/jobs", status_code=status.HTTP_200_OK)
+def list_bulk_transfers(
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    return bulk_transfer.list_jobs(db, current_user, limit=max(1, min(limit, 100)))
+
+
+@router.get("/transfer/jobs/{job_id}", status_code=status.HTTP_200_OK)
+def get_bulk_transfer(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    try:
+        return bulk_transfer.get_job(db, job_id, current_user)
+    except bulk_transfer.TransferRejected as e:
+        raise _rejected(e)
+
+
+@router.post("/transfer/jobs/{job_id}/cancel", status_code=status.HTTP_200_OK)
+def cancel_bulk_transfer(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Stops at the next chunk boundary; chunks already moved stay moved."""
+    try:
+        result = bulk_transfer.cancel_job(db, job_id, current_user)
+        db.commit()
+        return result
+    except bulk_transfer.TransferRejected as e:
+        db.rollback()
+        raise _rejected(e)
+
+
+@router.post("/transfer/jobs/{job_id}/resume", status_code=status.HTTP_202_ACCEPTED)
+def resume_bulk_transfer(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserDetails = Depends(get_current_user),
+):
+    """Continue a FAILED or CANCELLED job from its cursor."""
+    try:
+        result = bulk_transfer.resume_job(db, job_id, current_user)
+        db.commit()
+        return result
+    except bulk_transfer.TransferRejected as e:
+        db.rollback()
+        raise _rejected(e)
@@ -5,11 +5,14 @@ from typing import Optional, List, Any, Dict, Union, Literal, Tuple
 from datetime import datetime, date, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import OperationalError, DisconnectionError
 from pydantic import BaseModel, constr, validator
-from sqlalchemy import and_, or_, select, literal  # <— add and_, select, literal
+from sqlalchemy import or_, select
 from sqlalchemy.sql import exists  # optional if you prefer sqlalchemy.exists()
 from db.connection import get_db
+from db.async_connection import get_async_db
+from db.lead_owner import owned_by
 from db.models import (
     Lead, LeadSource, LeadResponse, BranchDetails, 
     UserDetails, Payment, LeadComment, LeadStory, LeadAssignment, LeadFetchConfig, ClientConsent
@@ -20,6 +23,8 @@ from routes.notification.notification_scheduler import schedule_callback
 from routes.leads.leads_fetch import load_fetch_config
 from utils.validation_utils import validate_lead_data, UniquenessValidator, FormatValidator
 from utils.user_tree import get_subordinate_users, get_subordinate_ids  # <— add this import
+from utils.serializers import LEAD_OUT, ORJSONResponse, segment_list
+from services import reference_data
 from services.mail_with_file import send_mail_by_client_with_file
 from zoneinfo import ZoneInfo
 
@@ -256,8 +261,8 @@ def save_uploaded_file(file: UploadFile, lead_id: int, file_type: str) -> str:
     return f"/{UPLOAD_DIR}/{filename}"
 
 def prepare_lead_data_for_db(data: dict) -> dict:
-    if 'segment' in data and isinstance(data['segment'], list):
-        data['segment'] = json.dumps(data['segment'])
+    if 'segment' in data:
+        data['segment'] = segment_list(data['segment'])
     if 'pan' in data and data['pan']:
         data['pan'] = data['pan'].upper()
     return data
@@ -268,14 +273,7 @@ def safe_convert_lead_to_dict(lead) -> dict:
         for column in lead.__table__.columns:
             value = getattr(lead, column.name, None)
             if column.name == 'segment':
-                if value is not None:
-                    try:
-                        parsed = json.loads(value)
-                        lead_dict[column.name] = parsed if isinstance(parsed, list) else [parsed]
-                    except (json.JSONDecodeError, TypeError):
-                        lead_dict[column.name] = [value] if value else []
-                else:
-                    lead_dict[column.name] = None
+                lead_dict[column.name] = segment_list(value)
             else:
                 lead_dict[column.name] = value
         return lead_dict
@@ -326,26 +324,6 @@ def _branch_id_for_manager(u: UserDetails) -> Optional[int]:
         return u.manages_branch.id
     return u.branch_id
 
-def _exists_assignment_for_users(allowed_codes: List[str]):
-    """
-    Correlated EXISTS(LeadAssignment...) for allowed user codes.
-    """
-    if not allowed_codes:
-        # produce FALSE condition if empty
-        return literal(False)
-    return (
-        select(literal(1))
-        .select_from(LeadAssignment)
-        .where(
-            and_(
-                LeadAssignment.lead_id == Lead.id,
-                LeadAssignment.user_id.in_(allowed_codes),
-            )
-        )
-        .correlate(Lead)
-        .exists()
-    )
-
 def apply_visibility_to_leads_list(
     db: Session,
     current_user: UserDetails,
@@ -358,7 +336,7 @@ def apply_visibility_to_leads_list(
     Apply role-based visibility on Lead list:
     - SUPERADMIN: no restriction
     - BRANCH_MANAGER: branch filter
-    - Others: self/other/all by assignment (Lead.assigned_to_user OR LeadAssignment)
+    - Others: self/other/all by assigned_to_user or assignment user (owned_by)
     Returns (scoped_query, filters_meta|None)
     """
     role = (getattr(current_user, "role_name", "") or "").upper()
@@ -388,15 +366,8 @@ def apply_visibility_to_leads_list(
     else:  # "all"
         allowed = [current_user.employee_code] + subs
 
-    # Assigned via column OR via LeadAssignment mapping
-    assignment_exists = _exists_assignment_for_users(allowed)
-
-    scoped = base_q.filter(
-        or_(
-            Lead.assigned_to_user.in_(allowed),
-            assignment_exists
-        )
-    )
+    # Assigned via column or LeadAssignment (both denormalized on crm_lead)
+    scoped = base_q.filter(owned_by(allowed))
 
     # Build filters meta for UI (list of direct subordinates)
     subs_users = get_subordinate_users(db, current_user.employee_code)
@@ -514,7 +485,7 @@ def create_lead(
             detail=f"Error creating lead: {str(e)}"
         )
 
-@router.get("/", response_model=LeadsListResponse)  # <— changed response model
+@router.get("/", response_model=LeadsListResponse, response_class=ORJSONResponse)
 def get_all_leads(
     # Pagination
     skip: int = Query(0, ge=0, description="Number of records to skip"),
@@ -613,22 +584,20 @@ def get_all_leads(
                 UserDetails, Lead.assigned_to_user == UserDetails.employee_code
             ).filter(UserDetails.role_id.in_(assigned_roles))
 
-        # ----- Ordering + Pagination -----
-        leads = (
+        # ----- Ordering + Pagination (projected to LeadOut columns) -----
+        rows = (
             scoped_q
+            .with_entities(*LEAD_OUT.columns)
             .order_by(Lead.created_at.desc())
             .offset(skip)
             .limit(limit)
             .all()
         )
 
-        # Pydantic conversion
-        result_leads: List[LeadOut] = []
-        for lead in leads:
-            lead_dict = safe_convert_lead_to_dict(lead)
-            result_leads.append(LeadOut(**lead_dict))
-
-        return LeadsListResponse(leads=result_leads, filters=filters_meta)
+        return ORJSONResponse({
+            "leads": LEAD_OUT.many(rows),
+            "filters": filters_meta.model_dump() if filters_meta else None,
+        })
 
     except Exception as e:
         raise HTTPException(
@@ -1043,16 +1012,19 @@ from datetime import datetime, timedelta, timezone
 async def change_lead_response(
     lead_id: int,
     payload: ChangeResponse,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user),
 ):
     # 1) Fetch lead
-    lead = db.query(Lead).filter_by(id=lead_id, is_delete=False).first()
+    lead = (
+        await db.execute(select(Lead).where(Lead.id == lead_id, Lead.is_delete == False))
+    ).scalar_one_or_none()
     if not lead:
         raise HTTPException(status_code=404, detail="Lead not found")
 
     # 2) Validate new response
-    new_response = db.query(LeadResponse).filter_by(id=payload.lead_response_id).first()
+    responses = (await reference_data.aget("lead_responses")).by_id
+    new_response = responses.get(payload.lead_response_id)
     if not new_response:
         raise HTTPException(
             status_code=400,
@@ -1063,8 +1035,8 @@ async def change_lead_response(
     old_response_id = lead.lead_response_id
     old_response_name = "None"
     if old_response_id:
-        old_resp = db.query(LeadResponse).filter_by(id=old_response_id).first()
-        old_response_name = old_resp.name if old_resp else "Unknown"
+        old_resp = responses.get(old_response_id)
+        old_response_name = old_resp["name"] if old_resp else "Unknown"
         
 
     # 3) Response change + retention logic
@@ -1078,12 +1050,14 @@ async def change_lead_response(
         lead.assigned_to_user = current_user.employee_code
 
         # Get timeout from config
-        config, _ = load_fetch_config(db, current_user)
+        config, _ = await db.run_sync(load_fetch_config, current_user)
         timeout_days = getattr(config, "old_lead_remove_days", None) or 30
         lead.conversion_deadline = now + timedelta(days=timeout_days)
 
         # Ensure lead stays with current user
-        assignment = db.query(LeadAssignment).filter_by(lead_id=lead_id).first()
+        assignment = (
+            await db.execute(select(LeadAssignment).where(LeadAssignment.lead_id == lead_id))
+        ).scalar_one_or_none()
         if assignment:
             assignment.user_id = current_user.employee_code
             assignment.fetched_at = now
@@ -1144,18 +1118,14 @@ async def change_lead_response(
     if payload.ft_from_date:
         lead.ft_from_date = payload.ft_from_date
     if payload.segment:
-        lead.segment = payload.segment
+        lead.segment = segment_list(payload.segment)
     if payload.ft_service_type:
         lead.ft_service_type = payload.ft_service_type
 
-    # 6) Commit changes
-    db.commit()
-    db.refresh(lead)
-
-    # 7) Add detailed story
+    # 6) Detailed story (same transaction as the change)
     story_msg = (
         f"Response changed by {current_user.name} ({current_user.employee_code}): "
-        f"'{old_response_name}' ➔ '{new_response.name}'. "
+        f"'{old_response_name}' ➔ '{new_response['name']}'. "
     )
     if old_response_id != payload.lead_response_id:
         story_msg += (
@@ -1163,7 +1133,11 @@ async def change_lead_response(
             f"(expires: {lead.conversion_deadline.strftime('%Y-%m-%d %H:%M')}). "
             f"Marked as old lead."
         )
-    AddLeadStory(lead.id, current_user.employee_code, story_msg)
+    db.add(LeadStory(lead_id=lead.id, user_id=current_user.employee_code, msg=story_msg))
+
+    # 7) Commit changes
+    await db.commit()
+    await db.refresh(lead)
 
     return LeadOut(**safe_convert_lead_to_dict(lead))
 
@@ -1,4 +1,4 @@
-from datetime import datetime, date, timedelta
+from datetime import datetime, timedelta
 from typing import Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -10,11 +10,10 @@ from db.connection import get_db
 from db.models import (
     Lead,
     LeadAssignment,
-    LeadFetchConfig,
-    LeadFetchHistory,
     UserDetails,
 )
 from routes.auth.auth_dependency import require_permission
+from services.lead_fetch import FetchConfig, consume_daily_fetch, fetch_configs
 from utils.AddLeadStory import AddLeadStory
 
 router = APIRouter(
@@ -63,15 +62,6 @@ def get_user_open_assignments_count(
           .count()
     )
 
-# ---------- helpers ----------
-def _role_key(role_id) -> Optional[str]:
-    """Return a string key for role_id regardless of whether role_id is Enum/int/str/None."""
-    if role_id is None:
-        return None
-    # If Enum-like, use .value; else coerce to str
-    return getattr(role_id, "value", str(role_id))
-
-
 def get_user_active_assignments_count(
     db: Session, user_id: str, assignment_ttl_hours: int
 ) -> int:
@@ -89,7 +79,7 @@ def get_user_active_assignments_count(
     )
 
 
-def can_user_fetch_leads(db: Session, user_id: str, config: LeadFetchConfig) -> Tuple[bool, int]:
+def can_user_fetch_leads(db: Session, user_id: str, config: FetchConfig) -> Tuple[bool, int]:
     """
     Eligible if OPEN (unworked) assignment count <= last_fetch_limit.
     """
@@ -97,69 +87,9 @@ def can_user_fetch_leads(db: Session, user_id: str, config: LeadFetchConfig) ->
     return (current_open <= config.last_fetch_limit, current_open)
 
 
-def load_fetch_config(db: Session, user: UserDetails) -> Tuple[LeadFetchConfig, str]:
-    cfg = None
-    source = "default"
-
-    role_key = _role_key(user.role_id)
-
-    # 1️⃣ role_id+branch
-    if role_key and user.branch_id is not None:
-        cfg = (
-            db.query(LeadFetchConfig)
-            .filter(
-                LeadFetchConfig.role_id == role_key,
-                LeadFetchConfig.branch_id == user.branch_id,
-            )
-            .first()
-        )
-        if cfg:
-            source = "role_branch"
-
-    # 2️⃣ role_id global
-    if not cfg and role_key:
-        cfg = (
-            db.query(LeadFetchConfig)
-            .filter(
-                LeadFetchConfig.role_id == role_key,
-                LeadFetchConfig.branch_id.is_(None),
-            )
-            .first()
-        )
-        if cfg:
-            source = "role_global"
-
-    # 3️⃣ branch global
-    if not cfg and user.branch_id is not None:
-        cfg = (
-            db.query(LeadFetchConfig)
-            .filter(
-                LeadFetchConfig.role_id.is_(None),
-                LeadFetchConfig.branch_id == user.branch_id,
-            )
-            .first()
-        )
-        if cfg:
-            source = "branch_global"
-
-    # 4️⃣ defaults
-    if not cfg:
-        cfg_values = {
-            "per_request_limit": 100,
-            "daily_call_limit": 50,
-            "last_fetch_limit": 10,
-            "assignment_ttl_hours": 24,
-            "old_lead_remove_days": 30,
-        }
-
-        class TempConfig:
-            def __init__(self, **kw):
-                for k, v in kw.items():
-                    setattr(self, k, v)
-
-        cfg = TempConfig(**cfg_values)
-
-    return cfg, source
+def load_fetch_config(db: Session, user: UserDetails) -> Tuple[FetchConfig, str]:
+    """Resolved from the in-memory config map (no query once warm)."""
+    return fetch_configs.for_user(db, user)
 
 
 @router.post("/fetch", response_model=dict)
@@ -202,14 +132,9 @@ def fetch_leads(
                 },
             }
 
-        # Enforce daily limit (call-count based)
-        today = date.today()
-        hist = (
-            db.query(LeadFetchHistory)
-            .filter_by(user_id=current_user.employee_code, date=today)
-            .first()
-        )
-        if hist and hist.call_count >= config.daily_call_limit:
+        # Enforce daily limit (call-count based): take one unit up front; the
+        # early returns below don't commit, so an empty fetch gives it back
+        if consume_daily_fetch(db, current_user.employee_code, config.daily_call_limit) is None:
             return {
                 "leads": [],
                 "message": f"Daily fetch limit of {config.daily_call_limit} reached.",
@@ -283,18 +208,6 @@ def fetch_leads(
                 lead.assigned_to_user = current_user.employee_code
                 lead.conversion_deadline = now + timedelta(hours=config.assignment_ttl_hours)
 
-        # Update daily history and commit all changes
-        if not hist:
-            db.add(
-                LeadFetchHistory(
-                    user_id=current_user.employee_code,
-                    date=today,
-                    call_count=1,
-                )
-            )
-        else:
-            hist.call_count += 1
-
         db.commit()
 
         # Audit story entries
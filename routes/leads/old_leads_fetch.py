@@ -5,12 +5,14 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func
 from sqlalchemy.types import Date
 from typing import Optional
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, timezone, date
 import logging
 
 from db.connection import get_db
-from db.models import Lead, LeadAssignment, UserDetails, LeadFetchConfig, LeadFetchHistory
+from db.models import Lead, LeadAssignment, UserDetails
+from db.old_lead_queue import own_expired_conversions, pop_ready
 from routes.auth.auth_dependency import require_permission
+from services.lead_fetch import FetchConfig, consume_daily_fetch, fetch_configs
 from utils.AddLeadStory import AddLeadStory
 from pydantic import BaseModel
 
@@ -38,65 +40,19 @@ class OldLeadResponse(BaseModel):
 
 # ----------------------------- Helpers -----------------------------
 
-def load_fetch_config(db: Session, user: UserDetails):
-    """Load fetch config for user from LeadFetchConfig (role_id/branch), else defaults."""
-    cfg = None
-    source = "default"
-
-    try:
-        # 1) role_id + branch
-        if user.role_id and user.branch_id:
-            cfg = db.query(LeadFetchConfig).filter_by(role_id=user.role_id, branch_id=user.branch_id).first()
-            if cfg:
-                source = "role_branch"
-
-        # 2) role_id global
-        if not cfg and user.role_id:
-            cfg = db.query(LeadFetchConfig).filter_by(role_id=user.role_id, branch_id=None).first()
-            if cfg:
-                source = "role_global"
-
-        # 3) branch global
-        if not cfg and user.branch_id:
-            cfg = db.query(LeadFetchConfig).filter_by(role_id=None, branch_id=user.branch_id).first()
-            if cfg:
-                source = "branch_global"
-
-        # 4) defaults
-        if not cfg:
-            defaults = {
-                dict(per_request_limit=50, daily_call_limit=30, last_fetch_limit=15,
-                                   assignment_ttl_hours=24, old_lead_remove_days=15)
-            }
+# Old-lead pool defaults (used when no LeadFetchConfig row matches)
+OLD_LEAD_FETCH_DEFAULTS = FetchConfig(
+    per_request_limit=50,
+    daily_call_limit=30,
+    last_fetch_limit=15,
+    assignment_ttl_hours=24,
+    old_lead_remove_days=15,
+)
 
-            cfg_values =defaults
 
-            class TempConfig:
-                def __init__(self, **kw):
-                    for k, v in kw.items():
-                        setattr(self, k, v)
-
-            cfg = TempConfig(**cfg_values)
-            source = "default"
-
-    except Exception as e:
-        logger.error(f"Error loading fetch config: {e}")
-
-        class TempConfig:
-            def __init__(self, **kw):
-                for k, v in kw.items():
-                    setattr(self, k, v)
-
-        cfg = TempConfig(
-            per_request_limit=10,
-            daily_call_limit=5,
-            last_fetch_limit=3,
-            assignment_ttl_hours=168,
-            old_lead_remove_days=30
-        )
-        source = "emergency_fallback"
-
-    return cfg, source
+def load_fetch_config(db: Session, user: UserDetails):
+    """Load fetch config for user from the cached LeadFetchConfig map, else defaults."""
+    return fetch_configs.for_user(db, user, defaults=OLD_LEAD_FETCH_DEFAULTS)
 
 
 def get_user_active_assignments_count(db: Session, user_id: str, assignment_ttl_hours: int) -> int:
@@ -124,19 +80,6 @@ def can_user_fetch_leads(db: Session, user_id: str, config):
         return False, 0
 
 
-def check_daily_call_limit(db: Session, user_id: str, daily_limit: int):
-    """Checks/initializes today's fetch call counter."""
-    try:
-        today = datetime.utcnow().date()
-        hist = db.query(LeadFetchHistory).filter_by(user_id=user_id, date=today).first()
-        if not hist:
-            return True, 0
-        return hist.call_count < daily_limit, hist.call_count
-    except Exception as e:
-        logger.error(f"Error checking daily limit: {e}")
-        return False, 0
-
-
 # ----------------------------- Routes -----------------------------
 
 @router.post("/fetch", response_model=dict)
@@ -156,12 +99,13 @@ def fetch_old_leads(
         config, cfg_source = load_fetch_config(db, current_user)
         logger.info(f"Using config from: {cfg_source}")
 
-        # Daily call limit
-        can_call_today, today_calls = check_daily_call_limit(db, current_user.employee_code, config.daily_call_limit)
-        if not can_call_today:
+        # Daily call limit: one atomic upsert takes a unit of today's quota;
+        # the early returns below don't commit, so they give it back
+        today_calls = consume_daily_fetch(db, current_user.employee_code, config.daily_call_limit)
+        if today_calls is None:
             return {
                 "leads": [],
-                "message": f"Daily fetch limit reached ({today_calls}/{config.daily_call_limit}). Try again tomorrow.",
+                "message": f"Daily fetch limit reached ({config.daily_call_limit}/{config.daily_call_limit}). Try again tomorrow.",
                 "fetched_count": 0,
                 "config_used": {
                     "per_request_limit": config.per_request_limit,
@@ -188,40 +132,30 @@ def fetch_old_leads(
             }
 
         to_fetch = config.per_request_limit
-        now = datetime.utcnow()
-        expiry_cutoff = now - timedelta(hours=config.assignment_ttl_hours)
-
-        # Select eligible old leads (unassigned or expired assignment, or user's expired conversion)
-        query = (
-            db.query(Lead)
-            .outerjoin(LeadAssignment, LeadAssignment.lead_id == Lead.id)
-            .filter(
-                and_(
+        now = datetime.now(timezone.utc)
+        branch_id = current_user.branch_id or None
+
+        # Candidates: the user's own expired conversions (owner index), then the
+        # top of the branch's ready-queue (db.old_lead_queue: unassigned or past TTL)
+        own = own_expired_conversions(db, current_user.employee_code, branch_id, to_fetch)
+        queued_ids = pop_ready(
+            db, branch_id, to_fetch - len(own), timedelta(hours=config.assignment_ttl_hours),
+            exclude=[lead.id for lead in own],
+        )
+        queued = []
+        if queued_ids:
+            rank = {lead_id: i for i, lead_id in enumerate(queued_ids)}
+            queued = sorted(
+                db.query(Lead).filter(
+                    Lead.id.in_(queued_ids),
                     Lead.is_old_lead.is_(True),
                     Lead.is_delete.is_(False),
                     Lead.is_client.is_(False),
-                    or_(
-                        LeadAssignment.id.is_(None),                       # never assigned
-                        LeadAssignment.fetched_at < expiry_cutoff,         # expired assignment
-                        and_(                                              # or user's own expired conversion assignment
-                            Lead.assigned_for_conversion.is_(True),
-                            Lead.conversion_deadline.isnot(None),
-                            Lead.conversion_deadline < now,
-                            Lead.assigned_to_user == current_user.employee_code
-                        )
-                    )
-                )
+                ).all(),
+                key=lambda lead: rank[lead.id],
             )
-            .order_by(Lead.response_changed_at.desc().nullslast(), Lead.id.desc())
-        )
-
-        # Branch scoping
-        if current_user.branch_id:
-            query = query.filter(Lead.branch_id == current_user.branch_id)
-            logger.info(f"Filtering by branch: {current_user.branch_id}")
-
-        old_leads = query.limit(to_fetch).all()
-        logger.info(f"Found {len(old_leads)} old leads to assign")
+        old_leads = own + queued
+        logger.info(f"Found {len(old_leads)} old leads to assign ({len(own)} own expired conversions)")
 
         if not old_leads:
             return {
@@ -237,53 +171,28 @@ def fetch_old_leads(
                 }
             }
 
+        existing = {
+            a.lead_id: a
+            for a in db.query(LeadAssignment).filter(LeadAssignment.lead_id.in_([lead.id for lead in old_leads]))
+        }
         assigned_leads = []
         for lead in old_leads:
-            try:
-                # Remove expired assignment (check against TTL, or expired conversion on the Lead object)
-                assignment = db.query(LeadAssignment).filter(LeadAssignment.lead_id == lead.id).first()
-                expired_by_ttl = assignment and assignment.fetched_at < expiry_cutoff
-                expired_conversion = bool(
-                    lead.assigned_for_conversion and lead.conversion_deadline and lead.conversion_deadline < now
-                )
-
-                if assignment and (expired_by_ttl or expired_conversion):
-                    logger.info(f"Removing expired assignment for lead {lead.id}")
-                    db.delete(assignment)
-                    assignment = None  # allow re-assignment below
-
-                # Create new assignment if none present
-                if not assignment:
-                    new_assignment = LeadAssignment(
-                        lead_id=lead.id,
-                        user_id=current_user.employee_code,
-                        fetched_at=now
-                    )
-                    db.add(new_assignment)
-                    assigned_leads.append(lead)
-
-                    # Reset conversion fields if conversion has expired
-                    if expired_conversion:
-                        logger.info(f"Resetting expired conversion fields for lead {lead.id}")
-                        lead.assigned_for_conversion = False
-                        lead.assigned_to_user = None
-                        lead.conversion_deadline = None
-
-            except Exception as e:
-                logger.error(f"Error processing lead {lead.id}: {e}")
-                continue
-
-        # Update daily fetch history counter
-        today = datetime.utcnow().date()
-        hist = db.query(LeadFetchHistory).filter_by(
-            user_id=current_user.employee_code,
-            date=today
-        ).first()
-        if not hist:
-            hist = LeadFetchHistory(user_id=current_user.employee_code, date=today, call_count=1)
-            db.add(hist)
-        else:
-            hist.call_count += 1
+            # Every candidate's previous assignment is past its TTL or its
+            # conversion window: re-stamp it for this user (lead_id is unique)
+            assignment = existing.get(lead.id)
+            if assignment:
+                assignment.user_id = current_user.employee_code
+                assignment.fetched_at = now
+            else:
+                db.add(LeadAssignment(lead_id=lead.id, user_id=current_user.employee_code, fetched_at=now))
+            assigned_leads.append(lead)
+
+            # Reset conversion fields if conversion has expired
+            if lead.assigned_for_conversion and lead.conversion_deadline and lead.conversion_deadline < now:
+                logger.info(f"Resetting expired conversion fields for lead {lead.id}")
+                lead.assigned_for_conversion = False
+                lead.assigned_to_user = None
+                lead.conversion_deadline = None
 
         db.commit()
         logger.info(f"Successfully assigned {len(assigned_leads)} old leads to user {current_user.employee_code}")
@@ -329,7 +238,7 @@ def fetch_old_leads(
             "message": f"Successfully fetched {len(response_leads)} old leads",
             "fetched_count": len(response_leads),
             "current_assignments": active_count + len(response_leads),
-            "today_calls": hist.call_count,
+            "today_calls": today_calls,
             "config_used": {
                 "per_request_limit": config.per_request_limit,
                 "daily_call_limit": config.daily_call_limit,
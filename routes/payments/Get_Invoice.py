@@ -7,7 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy import and_
 from sqlalchemy.orm import Session
 
-from db.connection import get_db
+from db.connection import get_db, get_read_db
 from db.models import Payment, Lead
 from pydantic import BaseModel
 import io
@@ -153,7 +153,7 @@ def export_invoices_zip(
     max_amount:     Optional[float]= Query(None, description="paid_amount ≤ this value"),
     branch_id:      Optional[int]  = Query(None, description="Filter by branch_id of the lead"),
 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Fetches all payments matching the filters that have a non-null `invoice` path,
@@ -1,6 +1,6 @@
 import logging
 from datetime import datetime, date
-from typing import Any, Optional, List, Union, Dict, Literal, Set
+from typing import Optional, List, Union, Dict, Literal, Set
 from fastapi import (
     APIRouter,
     HTTPException,
@@ -19,6 +19,7 @@ from db.models import Payment, Lead, UserDetails
 from db.Schema.payment import PaymentOut  # keep using your existing request types
 from routes.auth.auth_dependency import get_current_user
 from sqlalchemy.exc import SQLAlchemyError
+from utils.serializers import PAYMENT_OUT, ORJSONResponse
 from utils.user_tree import get_subordinate_users, get_subordinate_ids
 
 logger = logging.getLogger(__name__)
@@ -57,15 +58,18 @@ async def _call_cashfree(method: str, path: str, json_data: Optional[dict] = Non
 
 # Common status refresh logic for ACTIVE orders
 async def refresh_active_status(payment: Payment) -> str:
-    current_status = (payment.status or "").upper()
-    if current_status == "ACTIVE" and payment.order_id:
+    return await _refresh_status(payment.status, payment.order_id)
+
+async def _refresh_status(status: Optional[str], order_id: Optional[str]) -> str:
+    current_status = (status or "").upper()
+    if current_status == "ACTIVE" and order_id:
         try:
-            cf = await _call_cashfree("GET", f"/orders/{payment.order_id}")
+            cf = await _call_cashfree("GET", f"/orders/{order_id}")
             cf_status = cf.get("order_status")
             if cf_status:
                 return cf_status.upper()
         except Exception:
-            logger.debug("Failed to refresh Cashfree status for order %s", payment.order_id)
+            logger.debug("Failed to refresh Cashfree status for order %s", order_id)
     return current_status
 
 # -------------------------------------------------------
@@ -172,6 +176,7 @@ async def get_employee_payment_history(
     status_code=status.HTTP_200_OK,
     summary="Get payment history with rich filters + role-based visibility",
     response_model=PaginatedPayments,
+    response_class=ORJSONResponse,
 )
 async def get_payment_history_rich(
     service: Optional[str] = Query(None, description="Service name (partial, case-insensitive)"),
@@ -308,15 +313,16 @@ async def get_payment_history_rich(
             q = q.filter(func.date(Payment.created_at) <= date_to)
 
         total = q.count()
-        records = (
-            q.order_by(Payment.created_at.desc())
+        records = PAYMENT_OUT.many(
+            q.with_entities(*PAYMENT_OUT.columns)
+             .order_by(Payment.created_at.desc())
              .limit(limit)
              .offset(offset)
              .all()
         )
 
         # Prefetch employee/user details to avoid N+1
-        user_ids = {r.user_id for r in records if r.user_id}
+        user_ids = {r["user_id"] for r in records if r["user_id"]}
         employee_map: Dict[str, UserDetails] = {}
         if user_ids:
             users = (
@@ -338,21 +344,13 @@ async def get_payment_history_rich(
         logger.error("Database query failed: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch payment history from database")
 
-    payments_out: list[PaymentOut] = []
-    for r in records:
-        current_status = await refresh_active_status(r)
-
-        data: dict[str, Any] = {k: v for k, v in r.__dict__.items() if not k.startswith("_sa_instance_state")}
-        data["status"] = current_status
-
-        # Normalize datetime fields
-        for dt_field in ("created_at", "updated_at"):
-            val = getattr(r, dt_field, None)
-            if isinstance(val, datetime):
-                data[dt_field] = val.isoformat()
+    # rows PaymentOut would reject were already dropped by PAYMENT_OUT
+    for data in records:
+        if data["status"] == "ACTIVE":
+            data["status"] = await _refresh_status(data["status"], data["order_id"])
 
         # Attach employee info
-        employee = employee_map.get(r.user_id) if r.user_id else None
+        employee = employee_map.get(data["user_id"]) if data["user_id"] else None
         if employee:
             data["raised_by"] = getattr(employee, "name", None) or getattr(employee, "full_name", None)
             data["raised_by_role"] = (
@@ -362,26 +360,18 @@ async def get_payment_history_rich(
             data["raised_by_phone"] = getattr(employee, "phone_number", None)
             data["raised_by_email"] = getattr(employee, "email", None)
         else:
-            data.setdefault("raised_by", None)
-            data.setdefault("raised_by_role", None)
-            data.setdefault("raised_by_phone", None)
-            data.setdefault("raised_by_email", None)
-
-        try:
-            payment_obj = PaymentOut(**data)
-        except Exception as e:
-            logger.error("Serialization failed (payment id=%s): %s", getattr(r, "id", "<unknown>"), e)
-            continue
-
-        payments_out.append(payment_obj)
-
-    return PaginatedPayments(
-        limit=limit,
-        offset=offset,
-        total=total,
-        payments=payments_out,
-        filters=filters_meta,
-    )
+            data["raised_by"] = None
+            data["raised_by_role"] = None
+            data["raised_by_phone"] = None
+            data["raised_by_email"] = None
+
+    return ORJSONResponse({
+        "limit": limit,
+        "offset": offset,
+        "total": total,
+        "payments": records,
+        "filters": filters_meta.model_dump() if filters_meta else None,
+    })
 
 
 @router.get(
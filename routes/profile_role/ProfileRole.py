@@ -7,16 +7,16 @@ from db.connection import get_db
 from db.models import RecommendationType
 
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from pydantic import BaseModel, Field, constr
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_, asc, desc
 
 # ---- import your app bits ----------------------------------------------------
 # Adjust these imports to your project layout
 from db.connection import get_db
 from db.models import Department, ProfileRole  # your models from the snippet
+from services import reference_data
 
 # -----------------------------------------------------------------------------
 # Pydantic Schemas
@@ -71,27 +71,6 @@ class ProfileRoleOut(ProfileRoleBase):
         from_attributes = True
 
 
-# -----------------------------------------------------------------------------
-# Helpers
-# -----------------------------------------------------------------------------
-def apply_ordering(query, model, order_by: Optional[str]):
-    """
-    order_by pattern: "field" (asc) or "-field" (desc).
-    Example: "name" or "-created_at"
-    """
-    if not order_by:
-        return query
-
-    field_name = order_by.lstrip("-")
-    is_desc = order_by.startswith("-")
-
-    if not hasattr(model, field_name):
-        return query  # ignore unknown fields
-
-    column = getattr(model, field_name)
-    return query.order_by(desc(column) if is_desc else asc(column))
-
-
 # -----------------------------------------------------------------------------
 # Routers
 # -----------------------------------------------------------------------------
@@ -109,29 +88,35 @@ def get_recommendation_types():
 # =============================================================================
 @departments_router.get("/", response_model=List[DepartmentOut])
 def list_departments(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
     search: Optional[str] = Query(default=None, description="Search in name/description"),
     is_active: Optional[bool] = Query(default=None),
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=50, ge=1, le=200),
     order_by: Optional[str] = Query(default="name", description='e.g., "name" or "-created_at"'),
 ):
-    q = db.query(Department)
+    snap = reference_data.get("departments")
+    unchanged = reference_data.not_modified(
+        request, response, reference_data.query_etag(request, snap.name, snap.version)
+    )
+    if unchanged:
+        return unchanged
 
+    rows = snap.rows
     if search:
-        s = f"%{search}%"
-        q = q.filter(or_(Department.name.ilike(s), Department.description.ilike(s)))
+        s = search.lower()
+        rows = [r for r in rows if reference_data.contains(r["name"], s) or reference_data.contains(r["description"], s)]
 
     if is_active is not None:
-        q = q.filter(Department.is_active == is_active)
+        rows = [r for r in rows if r["is_active"] == is_active]
 
-    q = apply_ordering(q, Department, order_by)
-    return q.offset(skip).limit(limit).all()
+    return reference_data.page(reference_data.ordered(rows, order_by), skip, limit)
 
 
 @departments_router.get("/{dept_id}", response_model=DepartmentOut)
-def get_department(dept_id: int, db: Session = Depends(get_db)):
-    dept = db.query(Department).get(dept_id)
+def get_department(dept_id: int):
+    dept = reference_data.get("departments").by_id.get(dept_id)
     if not dept:
         raise HTTPException(status_code=404, detail="Department not found")
     return dept
@@ -214,7 +199,8 @@ def delete_department(
 # =============================================================================
 @profiles_router.get("/", response_model=List[ProfileRoleOut])
 def list_profiles(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
     department_id: Optional[int] = Query(default=None),
     search: Optional[str] = Query(default=None, description="Search in name/description"),
     is_active: Optional[bool] = Query(default=None),
@@ -222,25 +208,30 @@ def list_profiles(
     limit: int = Query(default=50, ge=1, le=200),
     order_by: Optional[str] = Query(default="hierarchy_level", description='e.g., "hierarchy_level" or "-created_at"'),
 ):
-    q = db.query(ProfileRole)
+    snap = reference_data.get("profile_roles")
+    unchanged = reference_data.not_modified(
+        request, response, reference_data.query_etag(request, snap.name, snap.version)
+    )
+    if unchanged:
+        return unchanged
 
+    rows = snap.rows
     if department_id is not None:
-        q = q.filter(ProfileRole.department_id == department_id)
+        rows = [r for r in rows if r["department_id"] == department_id]
 
     if search:
-        s = f"%{search}%"
-        q = q.filter(or_(ProfileRole.name.ilike(s), ProfileRole.description.ilike(s)))
+        s = search.lower()
+        rows = [r for r in rows if reference_data.contains(r["name"], s) or reference_data.contains(r["description"], s)]
 
     if is_active is not None:
-        q = q.filter(ProfileRole.is_active == is_active)
+        rows = [r for r in rows if r["is_active"] == is_active]
 
-    q = apply_ordering(q, ProfileRole, order_by)
-    return q.offset(skip).limit(limit).all()
+    return reference_data.page(reference_data.ordered(rows, order_by), skip, limit)
 
 
 @profiles_router.get("/{profile_id}", response_model=ProfileRoleOut)
-def get_profile(profile_id: int, db: Session = Depends(get_db)):
-    pr = db.query(ProfileRole).get(profile_id)
+def get_profile(profile_id: int):
+    pr = reference_data.get("profile_roles").by_id.get(profile_id)
     if not pr:
         raise HTTPException(status_code=404, detail="ProfileRole not found")
     return pr
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from db.connection import get_db
 from db.models import Service
 from typing import List
+from services import reference_data
 from db.Schema.service import (
     ServiceCreate,
     ServiceOut,
@@ -13,14 +14,19 @@ from db.Schema.service import (
 
 router = APIRouter(prefix="/services", tags=["Services"])
 
+_BILLING_CYCLES = list(BillingCycleEnum)
+_PLAN_TYPES = list(PlanTypeEnum)
+_BILLING_CYCLES_ETAG = reference_data.etag("billing_cycles", [c.value for c in _BILLING_CYCLES])
+_PLAN_TYPES_ETAG = reference_data.etag("plan_types", [p.value for p in _PLAN_TYPES])
+
 
 @router.get(
     "/billing-cycles",
     response_model=List[BillingCycleEnum],
     summary="List available billing cycles for dropdown",
 )
-def list_billing_cycles() -> List[BillingCycleEnum]:
-    return list(BillingCycleEnum)
+def list_billing_cycles(request: Request, response: Response) -> List[BillingCycleEnum]:
+    return reference_data.not_modified(request, response, _BILLING_CYCLES_ETAG) or _BILLING_CYCLES
 
 
 @router.get(
@@ -28,8 +34,8 @@ def list_billing_cycles() -> List[BillingCycleEnum]:
     response_model=List[PlanTypeEnum],
     summary="List available plan types for dropdown",
 )
-def list_plan_types() -> List[PlanTypeEnum]:
-    return list(PlanTypeEnum)
+def list_plan_types(request: Request, response: Response) -> List[PlanTypeEnum]:
+    return reference_data.not_modified(request, response, _PLAN_TYPES_ETAG) or _PLAN_TYPES
 
 
 @router.post("/", response_model=ServiceOut, status_code=status.HTTP_201_CREATED)
@@ -47,8 +53,9 @@ def create_service(
 
 
 @router.get("/", response_model=list[ServiceOut])
-def list_services(db: Session = Depends(get_db)):
-    return db.query(Service).all()
+def list_services(request: Request, response: Response):
+    snap = reference_data.get("services")
+    return reference_data.not_modified(request, response, reference_data.etag(snap.name, snap.version)) or snap.rows
 
 
 @router.patch("/{service_id}", response_model=ServiceOut)
@@ -1,5 +1,7 @@
 import logging
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
+
+from services import reference_data
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/state", tags=["State"])
@@ -47,11 +49,10 @@ state_code = {
 }
 
 
+_STATES = {"states": [{"state_name": name, "code": code} for name, code in state_code.items()]}
+_STATES_ETAG = reference_data.etag("states", _STATES)
+
+
 @router.get("/")
-def get_states():
-    # Convert dictionary into a list of dicts
-    states = [
-        {"state_name": name, "code": code}
-        for name, code in state_code.items()
-    ]
-    return {"states": states}
+def get_states(request: Request, response: Response):
+    return reference_data.not_modified(request, response, _STATES_ETAG) or _STATES
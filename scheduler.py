@@ -13,9 +13,9 @@ from db.connection import engine
 from db.models import (
     Lead,
     LeadAssignment,
-    LeadFetchConfig,
     UserDetails,
 )
+from services.lead_fetch import fetch_configs
 from utils.AddLeadStory import AddLeadStory
 
 logger = logging.getLogger(__name__)
@@ -43,12 +43,6 @@ def to_aware_utc(dt: datetime | None) -> datetime | None:
 # -----------------------------
 # Config resolution helpers
 # -----------------------------
-def _role_key(role_id):
-    """Return a string key for role_id regardless of whether role_id is Enum/int/str/None."""
-    if role_id is None:
-        return None
-    return getattr(role_id, "value", str(role_id))
-
 def load_fetch_config_for_lead(db, lead: Lead):
     """
     Resolve LeadFetchConfig for a given lead using priority:
@@ -57,8 +51,6 @@ def load_fetch_config_for_lead(db, lead: Lead):
       3) Lead's branch (branch_global)
       4) In-memory defaults
     """
-    cfg = None
-
     # Try current assignee, if any
     assignee = None
     if lead.assigned_to_user:
@@ -68,57 +60,12 @@ def load_fetch_config_for_lead(db, lead: Lead):
             .first()
         )
 
-    # 1) role+branch (assignee)
-    if assignee and assignee.role_id and assignee.branch_id is not None:
-        rk = _role_key(assignee.role_id)
-        cfg = (
-            db.query(LeadFetchConfig)
-            .filter(
-                LeadFetchConfig.role_id == rk,
-                LeadFetchConfig.branch_id == assignee.branch_id,
-            )
-            .first()
-        )
-        if cfg:
-            return cfg, "role_branch"
-
-    # 2) role (assignee, global)
-    if assignee and assignee.role_id:
-        rk = _role_key(assignee.role_id)
-        cfg = (
-            db.query(LeadFetchConfig)
-            .filter(
-                LeadFetchConfig.role_id == rk,
-                LeadFetchConfig.branch_id.is_(None),
-            )
-            .first()
-        )
-        if cfg:
-            return cfg, "role_global"
-
-    # 3) branch (lead branch, global)
-    if lead.branch_id is not None:
-        cfg = (
-            db.query(LeadFetchConfig)
-            .filter(
-                LeadFetchConfig.role_id.is_(None),
-                LeadFetchConfig.branch_id == lead.branch_id,
-            )
-            .first()
-        )
-        if cfg:
-            return cfg, "branch_global"
-
-    # 4) defaults
-    class TempConfig:
-        def __init__(self):
-            self.per_request_limit = 100
-            self.daily_call_limit = 50
-            self.last_fetch_limit = 10
-            self.assignment_ttl_hours = 24
-            self.old_lead_remove_days = 30
-
-    return TempConfig(), "default"
+    return fetch_configs.resolve(
+        db,
+        role_id=assignee.role_id if assignee else None,
+        branch_id=assignee.branch_id if assignee else None,
+        fallback_branch_id=lead.branch_id,
+    )
 
 # -----------------------------
 # Scheduler
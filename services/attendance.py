@@ -0,0 +1,350 @@
+# services/attendance.py
+"""
+Attendance bulk ingest and analytics.
+
+ingest() takes thousands of rows (JSON or CSV) and validates them. The last
+row wins per (employee_code, date). Rows for unknown employees are
+rejected up front, and the rest are upserted in batches of
+ATTENDANCE_INGEST_BATCH on uq_attendance_employee_date. The touched
+employee-months are then refreshed in crm_attendance_monthly with one
+statement (db/attendance_summary.py). Everything happens in the caller's
+transaction.
+
+The analytics read only crm_attendance_monthly:
+
+    monthly_summary()  present / absent / late / ... per employee-month + totals
+    streaks()          current / longest run of present days from the day masks
+                       (days without a record, e.g. weekly offs, don't break a run)
+    heatmap()          present / recorded employees per day of a month, per branch
+
+    python -m services.attendance bench [employees] [years]   # default 500 x 3, scratch schema
+"""
+
+import calendar
+import csv
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db.attendance_summary import month_of, refresh_months
+from db.connection import SessionLocal
+from db.models import Attendance, AttendanceMonthly, UserDetails
+from db.Schema.attendance import AttendanceCreate
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH = int(os.getenv("ATTENDANCE_INGEST_BATCH", "1000"))
+MAX_INGEST_ROWS = int(os.getenv("ATTENDANCE_MAX_INGEST_ROWS", "50000"))
+
+_SUMMARY_COUNTERS = ("days_recorded", "present", "absent", "late", "half_day", "leave", "work_minutes")
+
+
+# -----------------------------
+# Ingest
+# -----------------------------
+def parse_csv(data: bytes) -> Tuple[List[AttendanceCreate], List[Dict[str, Any]]]:
+    """Header row: employee_code,date,check_in,check_out,status. (rows, errors by line)."""
+    rows: List[AttendanceCreate] = []
+    errors: List[Dict[str, Any]] = []
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    for line, raw in enumerate(reader, start=2):
+        clean = {k.strip(): (v.strip() or None) for k, v in raw.items() if k}
+        try:
+            rows.append(AttendanceCreate(**clean))
+        except ValidationError as e:
+            errors.append({"line": line, "error": e.errors()[0].get("msg", str(e))})
+    return rows, errors
+
+
+def ingest(db: Session, rows: Iterable[AttendanceCreate]) -> Dict[str, Any]:
+    """Batched upsert on (employee_code, date) + summary refresh. The caller commits."""
+    latest: Dict[Tuple[str, date], Dict[str, Any]] = {}
+    received = 0
+    for r in rows:
+        received += 1
+        latest[(r.employee_code, r.date)] = {
+            "employee_code": r.employee_code,
+            "date": r.date,
+            "check_in": r.check_in,
+            "check_out": r.check_out,
+            "status": r.status.strip().lower(),
+        }
+
+    codes = {code for code, _ in latest}
+    known = set(
+        db.execute(select(UserDetails.employee_code).where(UserDetails.employee_code.in_(codes))).scalars()
+    ) if codes else set()
+    unknown = sorted(codes - known)
+    values = [v for (code, _), v in latest.items() if code in known]
+
+    stmt = pg_insert(Attendance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Attendance.employee_code, Attendance.date],
+        set_={
+            "check_in": stmt.excluded.check_in,
+            "check_out": stmt.excluded.check_out,
+            "status": stmt.excluded.status,
+            "updated_at": func.now(),
+        },
+    )
+    for i in range(0, len(values), INGEST_BATCH):
+        db.execute(stmt, values[i:i + INGEST_BATCH])
+
+    months = refresh_months(db, ((v["employee_code"], v["date"]) for v in values))
+    return {
+        "received": received,
+        "upserted": len(values),
+        "duplicates_in_batch": received - len(latest),
+        "unknown_employees": unknown,
+        "rejected": len(latest) - len(values),
+        "months_refreshed": months,
+    }
+
+
+# -----------------------------
+# Analytics (crm_attendance_monthly only)
+# -----------------------------
+def monthly_summary(
+    db: Session,
+    *,
+    month_from: date,
+    month_to: date,
+    employee_code: Optional[str] = None,
+    branch_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    m = AttendanceMonthly
+    stmt = (
+        select(
+            m.employee_code, UserDetails.name, m.branch_id, m.month,
+            *[getattr(m, c) for c in _SUMMARY_COUNTERS],
+        )
+        .outerjoin(UserDetails, UserDetails.employee_code == m.employee_code)
+        .where(m.month >= month_of(month_from), m.month <= month_of(month_to))
+        .order_by(m.employee_code, m.month)
+    )
+    if employee_code:
+        stmt = stmt.where(m.employee_code == employee_code)
+    if branch_id is not None:
+        stmt = stmt.where(m.branch_id == branch_id)
+
+    rows = [dict(r._mapping) for r in db.execute(stmt)]
+    totals = {c: sum(r[c] for r in rows) for c in _SUMMARY_COUNTERS}
+    totals["employees"] = len({r["employee_code"] for r in rows})
+    return {"rows": rows, "totals": totals}
+
+
+def _runs(months: Iterable[Tuple[date, int, int]]) -> Dict[str, Any]:
+    current = longest = 0
+    longest_end: Optional[date] = None
+    last_recorded: Optional[date] = None
+    for month, present_mask, recorded_mask in months:
+        for day in range(calendar.monthrange(month.year, month.month)[1]):
+            bit = 1 << day
+            if not recorded_mask & bit:
+                continue
+            last_recorded = month.replace(day=day + 1)
+            if present_mask & bit:
+                current += 1
+                if current > longest:
+                    longest, longest_end = current, last_recorded
+            else:
+                current = 0
+    return {
+        "current_streak": current,
+        "longest_streak": longest,
+        "longest_streak_end": longest_end,
+        "last_recorded_day": last_recorded,
+    }
+
+
+def streaks(db: Session, employee_code: str, *, month_from: Optional[date] = None) -> Dict[str, Any]:
+    m = AttendanceMonthly
+    stmt = select(m.month, m.present_mask, m.recorded_mask).where(m.employee_code == employee_code).order_by(m.month)
+    if month_from is not None:
+        stmt = stmt.where(m.month >= month_of(month_from))
+    return {"employee_code": employee_code, **_runs(db.execute(stmt).all())}
+
+
+_HEATMAP_SQL = text(
+    """
+    SELECT m.branch_id, d.day,
+           count(*) FILTER (WHERE m.present_mask & (1 << (d.day - 1)) <> 0) AS present,
+           count(*) FILTER (WHERE m.recorded_mask & (1 << (d.day - 1)) <> 0) AS recorded
+      FROM crm_attendance_monthly m
+     CROSS JOIN generate_series(1, :days) AS d(day)
+     WHERE m.month = :month
+       AND (CAST(:branch_id AS integer) IS NULL OR m.branch_id = :branch_id)
+     GROUP BY m.branch_id, d.day
+     ORDER BY m.branch_id NULLS LAST, d.day
+    """
+)
+
+
+def heatmap(db: Session, month: date, *, branch_id: Optional[int] = None) -> Dict[str, Any]:
+    """Per branch: present and recorded employee counts for each day of the month."""
+    month = month_of(month)
+    days = calendar.monthrange(month.year, month.month)[1]
+    branches: Dict[Optional[int], Dict[str, Any]] = {}
+    for r in db.execute(_HEATMAP_SQL, {"days": days, "month": month, "branch_id": branch_id}):
+        b = branches.setdefault(r.branch_id, {"branch_id": r.branch_id, "present": [0] * days, "recorded": [0] * days})
+        b["present"][r.day - 1] = r.present
+        b["recorded"][r.day - 1] = r.recorded
+    return {"month": month, "days": days, "branches": list(branches.values())}
+
+
+# -----------------------------
+# Benchmark (scratch schema in a rolled-back transaction)
+# -----------------------------
+_BENCH_SCHEMA = "bench_attendance"
+
+# the same reports straight off crm_attendance, kept for the benchmark only
+_RAW_BRANCH_MONTH_SQL = text(
+    """
+    SELECT a.employee_code, count(*) FILTER (WHERE lower(a.status) IN ('present', 'late')),
+           count(*) FILTER (WHERE lower(a.status) = 'absent')
+      FROM crm_attendance a JOIN crm_user_details u ON u.employee_code = a.employee_code
+     WHERE u.branch_id = :branch_id AND a.date >= :month AND a.date < CAST(:month AS date) + interval '1 month'
+     GROUP BY a.employee_code
+    """
+)
+_RAW_HEATMAP_SQL = text(
+    """
+    SELECT u.branch_id, a.date, count(*) FILTER (WHERE lower(a.status) IN ('present', 'late')), count(*)
+      FROM crm_attendance a JOIN crm_user_details u ON u.employee_code = a.employee_code
+     WHERE a.date >= :month AND a.date < CAST(:month AS date) + interval '1 month'
+     GROUP BY u.branch_id, a.date
+    """
+)
+_RAW_STREAK_SQL = text("SELECT date, status FROM crm_attendance WHERE employee_code = :code ORDER BY date")
+
+
+def _median_ms(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(timings), 2)
+
+
+def bench(employees: int = 500, years: int = 3, branches: int = 10, runs: int = 5) -> Dict[str, Any]:
+    """
+    Seed `years` of daily attendance (Sundays off) for `employees` spread over
+    `branches` into a scratch schema, then time: one month ingested through
+    ingest(), the full summary rebuild, and branch-month / heatmap / streak
+    reports from the summary vs. the same reports over raw rows.
+    Everything runs in one transaction that is rolled back at the end.
+    """
+    from db.attendance_summary import _REBUILD_SQL, _params
+
+    db = SessionLocal()
+    s = _BENCH_SCHEMA
+    try:
+        db.execute(text(f"CREATE SCHEMA {s}"))
+        db.execute(text(f"CREATE TABLE {s}.crm_user_details (employee_code VARCHAR(100) PRIMARY KEY, branch_id INTEGER)"))
+        for table in ("crm_attendance", "crm_attendance_monthly"):
+            db.execute(text(f"CREATE TABLE {s}.{table} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING INDEXES)"))
+        db.execute(text(f"SET LOCAL search_path TO {s}, public"))
+
+        first_day = date.today().replace(day=1) - timedelta(days=365 * years)
+        started = time.perf_counter()
+        db.execute(text(
+            "INSERT INTO crm_user_details SELECT 'EMP' || e, 1 + e % :branches FROM generate_series(1, :n) e"
+        ), {"n": employees, "branches": branches})
+        db.execute(text(
+            """
+            INSERT INTO crm_attendance (employee_code, date, check_in, check_out, status, created_at, updated_at)
+            SELECT 'EMP' || e, d::date,
+                   (d + interval '9 hours' + random() * interval '75 minutes') AT TIME ZONE 'Asia/Kolkata',
+                   (d + interval '18 hours' + random() * interval '60 minutes') AT TIME ZONE 'Asia/Kolkata',
+                   CASE WHEN r < 0.05 THEN 'absent' WHEN r < 0.09 THEN 'leave'
+                        WHEN r < 0.12 THEN 'half_day' ELSE 'present' END,
+                   now(), now()
+              FROM generate_series(1, :n) e
+             CROSS JOIN generate_series(CAST(:first AS date), CAST(:last AS date), interval '1 day') d
+             CROSS JOIN LATERAL (SELECT random() + e * 0 AS r) x
+             WHERE extract(dow FROM d) <> 0
+            """
+        ), {"n": employees, "first": first_day, "last": date.today().replace(day=1) - timedelta(days=1)})
+        raw_rows = db.execute(text("SELECT count(*) FROM crm_attendance")).scalar()
+        seed_s = time.perf_counter() - started
+
+        t0 = time.perf_counter()
+        summarized = db.execute(_REBUILD_SQL, _params()).rowcount
+        rebuild_s = time.perf_counter() - t0
+        db.execute(text("ANALYZE crm_attendance; ANALYZE crm_attendance_monthly; ANALYZE crm_user_details"))
+
+        # one month (the current one) through the ingest path
+        today = date.today()
+        batch = [
+            AttendanceCreate(
+                employee_code=f"EMP{e}", date=day, status="present",
+                check_in=datetime.combine(day, datetime.min.time()) + timedelta(hours=4),
+                check_out=datetime.combine(day, datetime.min.time()) + timedelta(hours=13),
+            )
+            for e in range(1, employees + 1)
+            for day in (today.replace(day=d) for d in range(1, today.day + 1))
+            if day.weekday() != 6
+        ]
+        t0 = time.perf_counter()
+        result = ingest(db, batch)
+        ingest_s = time.perf_counter() - t0
+
+        last_month = month_of(today.replace(day=1) - timedelta(days=1))
+        out: Dict[str, Any] = {
+            "employees": employees,
+            "years": years,
+            "raw_rows": raw_rows,
+            "summary_rows": summarized,
+            "seed_seconds": round(seed_s, 1),
+            "summary_rebuild_seconds": round(rebuild_s, 2),
+            "ingest": {
+                "rows": result["upserted"],
+                "months_refreshed": result["months_refreshed"],
+                "seconds": round(ingest_s, 2),
+                "rows_per_sec": round(result["upserted"] / ingest_s) if ingest_s else None,
+            },
+        }
+        reports = {
+            "branch_month": (
+                lambda: monthly_summary(db, month_from=last_month, month_to=last_month, branch_id=1),
+                lambda: db.execute(_RAW_BRANCH_MONTH_SQL, {"branch_id": 1, "month": last_month}).all(),
+            ),
+            "heatmap": (
+                lambda: heatmap(db, last_month),
+                lambda: db.execute(_RAW_HEATMAP_SQL, {"month": last_month}).all(),
+            ),
+            "streaks": (
+                lambda: streaks(db, "EMP1"),
+                lambda: db.execute(_RAW_STREAK_SQL, {"code": "EMP1"}).all(),
+            ),
+        }
+        for name, (summary_fn, raw_fn) in reports.items():
+            out[name] = {"summary_ms": _median_ms(summary_fn, runs), "raw_ms": _median_ms(raw_fn, runs)}
+        return out
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "bench":
+        e = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        y = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+        print(json.dumps(bench(e, y), indent=2, default=str))
+    else:
+        print(__doc__)
+        sys.exit(2)
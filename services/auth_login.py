@@ -0,0 +1,310 @@
+# services/auth_login.py
+"""
+Login fast path: bcrypt off the request threadpool, one credential query
+(refresh tokens: services/token_store.py).
+
+bcrypt costs ~0.2 s of CPU per check by design. Done inline in a `def`
+route, a morning login burst holds AnyIO threadpool slots that every other
+sync route needs. HashPool runs it on its own bounded executor instead:
+threads by default (bcrypt releases the GIL), PASSWORD_HASH_POOL=process
+for a process pool. At most PASSWORD_HASH_MAX_PENDING checks are queued
+or running. Past that PoolBusy is raised and login answers 503 with
+Retry-After instead of queueing for minutes.
+
+Legacy SHA-256 hex hashes (register.py's old bcrypt-error fallback) still
+verify. needs_rehash() flags them, and bcrypt hashes below BCRYPT_ROUNDS,
+so login replaces them with a current bcrypt hash.
+
+    python -m services.auth_login bench [concurrency] [seconds]
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import bcrypt
+from sqlalchemy import false, func, or_, select
+from sqlalchemy.schema import CreateIndex
+
+from db.connection import engine
+from db.models import BranchDetails, Department, ProfileRole, UserDetails
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(HASH_WORKERS * 32)))
+HASH_POOL_KIND = os.getenv("PASSWORD_HASH_POOL", "thread")
+
+_SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+# -----------------------------
+# Hashes
+# -----------------------------
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def verify_password(plain_password: str, hashed_password: Optional[str]) -> bool:
+    """bcrypt, or a legacy unsalted SHA-256 hex digest."""
+    if not hashed_password:
+        return False
+    if hashed_password.startswith("$2"):
+        try:
+            return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+        except ValueError:
+            return False
+    if _SHA256_HEX.match(hashed_password):
+        return hmac.compare_digest(hashlib.sha256(plain_password.encode("utf-8")).hexdigest(), hashed_password)
+    return False
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    if not hashed_password.startswith("$2"):
+        return True
+    try:
+        return int(hashed_password.split("$")[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+# -----------------------------
+# Bounded hashing pool
+# -----------------------------
+class PoolBusy(Exception):
+    pass
+
+
+def _timed_call(fn: Callable, *args) -> Tuple[Any, float]:
+    started = time.perf_counter()
+    return fn(*args), (time.perf_counter() - started) * 1000
+
+
+class HashPool:
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING, kind: str = HASH_POOL_KIND):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        # counters are only touched on the event loop thread
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_ms = 0.0
+        self._run_ms = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    async def run(self, fn: Callable, *args) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolBusy(f"{self.pending} password checks pending")
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            result, run_ms = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), _timed_call, fn, *args
+            )
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self._run_ms += run_ms
+        self._wait_ms += max(0.0, (time.perf_counter() - started) * 1000 - run_ms)
+        return result
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.completed or 1
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(self._wait_ms / done, 2),
+            "avg_hash_ms": round(self._run_ms / done, 2),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_pool = HashPool()
+
+
+# -----------------------------
+# Credential lookup
+# -----------------------------
+def login_key(username: str) -> Tuple[str, Optional[str]]:
+    """(email key, phone key): emails compare lower-cased, phones on their last 10 digits."""
+    username = (username or "").strip()
+    if "@" in username:
+        return username.lower(), None
+    digits = re.sub(r"\D", "", username)
+    return username.lower(), (digits[-10:] or None)
+
+
+def _user_select():
+    return (
+        select(
+            UserDetails.employee_code,
+            UserDetails.name,
+            UserDetails.email,
+            UserDetails.phone_number,
+            UserDetails.password,
+            UserDetails.role_id,
+            UserDetails.department_id,
+            UserDetails.branch_id,
+            UserDetails.is_active,
+            UserDetails.permissions,
+            ProfileRole.name.label("role_name"),
+            ProfileRole.default_permissions,
+            Department.name.label("department_name"),
+            BranchDetails.name.label("branch_name"),
+        )
+        .outerjoin(ProfileRole, ProfileRole.id == UserDetails.role_id)
+        .outerjoin(Department, Department.id == UserDetails.department_id)
+        .outerjoin(BranchDetails, BranchDetails.id == UserDetails.branch_id)
+    )
+
+
+def credential_statement(username: str):
+    """User + role/department/branch names in one row (phone match preferred)."""
+    email, phone = login_key(username)
+    phone_match = UserDetails.phone_number == phone if phone else false()
+    return (
+        _user_select()
+        .where(or_(phone_match, func.lower(UserDetails.email) == email))
+        .order_by(phone_match.desc())
+        .limit(1)
+    )
+
+
+def session_user_statement(employee_code: str):
+    """The same row by employee code (token refresh)."""
+    return _user_select().where(UserDetails.employee_code == employee_code)
+
+
+def ensure_login_indexes() -> None:
+    """lower(email) lookup index (create_all doesn't add it to an existing table)."""
+    with engine.begin() as conn:
+        for idx in UserDetails.__table__.indexes:
+            if idx.name == "ix_user_email_lower":
+                conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+# -----------------------------
+# Benchmark (no database: the hashing layer only)
+# -----------------------------
+async def _bench_mode(call: Callable, concurrency: int, seconds: float) -> Dict[str, Any]:
+    from starlette.concurrency import run_in_threadpool
+
+    latencies: List[float] = []
+    probe: List[float] = []
+    lag = [0.0]
+    rejected = [0]
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                await call()
+                latencies.append(time.perf_counter() - t0)
+            except PoolBusy:
+                rejected[0] += 1
+                await asyncio.sleep(0.05)
+
+    async def loop_lag():
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag[0] = max(lag[0], time.perf_counter() - t0 - 0.01)
+
+    async def sync_route_probe():
+        # what any other `def` route sees while the burst runs
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            await run_in_threadpool(lambda: None)
+            probe.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)), loop_lag(), sync_route_probe())
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    probe.sort()
+    ms = lambda v: round(v * 1000, 1)
+    return {
+        "logins_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": ms(statistics.median(latencies)) if latencies else None,
+        "p99_ms": ms(latencies[int(len(latencies) * 0.99) - 1]) if latencies else None,
+        "rejected": rejected[0],
+        "loop_lag_max_ms": ms(lag[0]),
+        "sync_route_p99_ms": ms(probe[int(len(probe) * 0.99) - 1]) if probe else None,
+    }
+
+
+async def _bench(concurrency: int, seconds: float) -> Dict[str, Any]:
+    from starlette.concurrency import run_in_threadpool
+
+    password = "bench-password"
+    hashed = hash_password(password)
+    out: Dict[str, Any] = {"concurrency": concurrency, "seconds": seconds, "bcrypt_rounds": BCRYPT_ROUNDS}
+    out["threadpool_inline"] = await _bench_mode(
+        lambda: run_in_threadpool(verify_password, password, hashed), concurrency, seconds
+    )
+    out["hash_pool"] = await _bench_mode(lambda: password_pool.verify(password, hashed), concurrency, seconds)
+    out["hash_pool_stats"] = password_pool.stats()
+    password_pool.shutdown()
+    return out
+
+
+def bench(concurrency: int = 200, seconds: float = 10.0) -> Dict[str, Any]:
+    """
+    `concurrency` clients verifying one bcrypt hash back to back: in the AnyIO
+    threadpool (the old `def login`) vs. the hash pool, with event-loop lag and
+    the latency a trivial sync route sees meanwhile. End to end against a
+    running app: utils/loadtest.py --form username=... --form password=...
+    """
+    return asyncio.run(_bench(concurrency, seconds))
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "bench":
+        c = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+        s = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+        print(json.dumps(bench(c, s), indent=2))
+    else:
+        print(__doc__)
+        sys.exit(2)
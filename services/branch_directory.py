@@ -0,0 +1,326 @@
+# services/branch_directory.py
+"""
+Branch directory: cached branch + manager metadata, per-branch totals from
+one grouped statement, members a page at a time.
+
+BranchMetaCache keeps every crm_branch_details row together with its
+manager's contact columns (a few dozen rows), so listing or resolving a
+branch costs no query. The branch routes and the user write routes
+(routes/auth/register.py) invalidate it. Other workers pick up a change
+within BRANCH_CACHE_TTL_SECONDS.
+
+branch_totals_statement() computes, for every branch in one round trip:
+
+    staff  = users grouped by (branch, role): totals + a by-role json list
+    leads  = live leads / clients per branch   (ix_lead_branch_live, index-only)
+    paid   = paid payments per branch          (ix_payment_branch, covering)
+
+The result is cached for BRANCH_STATS_TTL_SECONDS. Headcounts are also
+dropped on invalidate(). Lead and payment totals only follow the TTL.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import String, and_, cast, exists, func, literal_column, select
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.schema import CreateIndex
+
+from db.connection import engine
+from db.models import BranchDetails, Lead, Payment, ProfileRole, UserDetails
+from services.client_list import PAID_STATUSES
+
+CACHE_TTL_SECONDS = float(os.getenv("BRANCH_CACHE_TTL_SECONDS", "300"))
+STATS_TTL_SECONDS = float(os.getenv("BRANCH_STATS_TTL_SECONDS", "30"))
+
+_BRANCH_FIELDS = (
+    "id", "name", "address", "authorized_person", "agreement_url",
+    "active", "manager_id", "created_at", "updated_at",
+)
+_Manager = aliased(UserDetails, name="manager")
+
+
+# -----------------------------
+# Statements
+# -----------------------------
+def branch_meta_statement():
+    return (
+        select(
+            *[getattr(BranchDetails, f) for f in _BRANCH_FIELDS],
+            _Manager.employee_code.label("m_employee_code"),
+            _Manager.name.label("m_name"),
+            _Manager.email.label("m_email"),
+            _Manager.phone_number.label("m_phone_number"),
+        )
+        .outerjoin(_Manager, _Manager.employee_code == BranchDetails.manager_id)
+        .order_by(BranchDetails.id)
+    )
+
+
+def branch_totals_statement():
+    """One row per branch: headcounts (by role) and lead/client/payment totals."""
+    per_role = (
+        select(
+            UserDetails.branch_id,
+            UserDetails.role_id,
+            func.count().label("users"),
+            func.count().filter(UserDetails.is_active == True).label("active"),
+        )
+        .where(UserDetails.branch_id.isnot(None))
+        .group_by(UserDetails.branch_id, UserDetails.role_id)
+        .subquery("per_role")
+    )
+    role_json = func.json_build_object(
+        literal_column("'role_id'"), per_role.c.role_id,
+        literal_column("'role_name'"), ProfileRole.name,
+        literal_column("'users'"), per_role.c.users,
+        literal_column("'active'"), per_role.c.active,
+    )
+    staff = (
+        select(
+            per_role.c.branch_id,
+            func.sum(per_role.c.users).label("users"),
+            func.sum(per_role.c.active).label("active_users"),
+            func.json_agg(aggregate_order_by(role_json, per_role.c.role_id), type_=JSON).label("by_role"),
+        )
+        .outerjoin(ProfileRole, ProfileRole.id == per_role.c.role_id)
+        .group_by(per_role.c.branch_id)
+        .subquery("staff")
+    )
+    leads = (
+        select(
+            Lead.branch_id,
+            func.count().label("leads"),
+            func.count().filter(Lead.is_client == True).label("clients"),
+        )
+        .where(Lead.is_delete == False, Lead.branch_id.isnot(None))
+        .group_by(Lead.branch_id)
+        .subquery("leads")
+    )
+    paid = (
+        select(
+            Payment.branch_id,
+            func.count().label("payments"),
+            func.sum(Payment.paid_amount).label("paid_amount"),
+        )
+        .where(Payment.branch_id.isnot(None), func.upper(Payment.status).in_(PAID_STATUSES))
+        .group_by(Payment.branch_id)
+        .subquery("paid")
+    )
+    return (
+        select(
+            BranchDetails.id.label("branch_id"),
+            func.coalesce(staff.c.users, 0).label("users"),
+            func.coalesce(staff.c.active_users, 0).label("active_users"),
+            staff.c.by_role,
+            func.coalesce(leads.c.leads, 0).label("leads"),
+            func.coalesce(leads.c.clients, 0).label("clients"),
+            func.coalesce(paid.c.payments, 0).label("payments"),
+            func.coalesce(paid.c.paid_amount, 0.0).label("paid_amount"),
+        )
+        .outerjoin(staff, staff.c.branch_id == BranchDetails.id)
+        .outerjoin(leads, leads.c.branch_id == BranchDetails.id)
+        .outerjoin(paid, paid.c.branch_id == cast(BranchDetails.id, String))
+    )
+
+
+def members_statement(branch_id: int, *, offset: int, limit: int):
+    """One page of a branch's users with role names (joined, not a per-row subquery)."""
+    return (
+        select(
+            UserDetails.employee_code,
+            UserDetails.name,
+            UserDetails.role_id,
+            ProfileRole.name.label("role_name"),
+            UserDetails.email,
+            UserDetails.is_active,
+            func.count().over().label("total_count"),
+        )
+        .outerjoin(ProfileRole, ProfileRole.id == UserDetails.role_id)
+        .where(UserDetails.branch_id == branch_id)
+        .order_by(UserDetails.name, UserDetails.employee_code)
+        .offset(offset)
+        .limit(limit)
+    )
+
+
+def available_managers_statement():
+    """Active BRANCH_MANAGER users not managing a branch (NOT EXISTS anti-join)."""
+    return (
+        select(
+            UserDetails.employee_code,
+            UserDetails.name,
+            UserDetails.email,
+            UserDetails.phone_number,
+            ProfileRole.name.label("role_name"),
+        )
+        .join(ProfileRole, and_(ProfileRole.id == UserDetails.role_id, ProfileRole.name == "BRANCH_MANAGER"))
+        .where(
+            UserDetails.is_active == True,
+            ~exists().where(BranchDetails.manager_id == UserDetails.employee_code),
+        )
+        .order_by(UserDetails.name)
+    )
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+def _branch_entry(r) -> Dict[str, Any]:
+    m = r._mapping
+    return {
+        "branch": {f: m[f] for f in _BRANCH_FIELDS},
+        "manager": {
+            "employee_code": m["m_employee_code"],
+            "name": m["m_name"],
+            "email": m["m_email"],
+            "phone_number": m["m_phone_number"],
+        } if m["m_employee_code"] is not None else None,
+    }
+
+
+def _totals_entry(r) -> Dict[str, Any]:
+    m = r._mapping
+    return {
+        "headcount": {
+            "total": int(m["users"]),
+            "active": int(m["active_users"]),
+            "by_role": m["by_role"] or [],
+        },
+        "totals": {
+            "leads": m["leads"],
+            "clients": m["clients"],
+            "payments": m["payments"],
+            "paid_amount": float(m["paid_amount"]),
+        },
+    }
+
+
+class BranchMetaCache:
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS, stats_ttl_seconds: float = STATS_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.stats_ttl_seconds = stats_ttl_seconds
+        self._branches: Optional[Dict[int, Dict[str, Any]]] = None
+        self._loaded_at = 0.0
+        self._totals: Optional[Dict[int, Dict[str, Any]]] = None
+        self._totals_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._branches = None
+            self._totals = None
+
+    def branches(self, db: Session) -> Dict[int, Dict[str, Any]]:
+        """branch id -> {"branch": BranchOut fields, "manager": ManagerInfo | None}, by id."""
+        branches = self._branches
+        if branches is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return branches
+        generation = self._generation
+        branches = {r.id: _branch_entry(r) for r in db.execute(branch_meta_statement())}
+        with self._lock:
+            # a write landed while we were reading: use the rows, don't cache them
+            if generation == self._generation:
+                self._branches = branches
+                self._loaded_at = time.monotonic()
+        return branches
+
+    def totals(self, db: Session) -> Dict[int, Dict[str, Any]]:
+        totals = self._totals
+        if totals is not None and time.monotonic() - self._totals_at < self.stats_ttl_seconds:
+            return totals
+        generation = self._generation
+        totals = {r.branch_id: _totals_entry(r) for r in db.execute(branch_totals_statement())}
+        with self._lock:
+            if generation == self._generation:
+                self._totals = totals
+                self._totals_at = time.monotonic()
+        return totals
+
+
+branch_meta = BranchMetaCache()
+
+
+def invalidate() -> None:
+    branch_meta.invalidate()
+
+
+# -----------------------------
+# Directory
+# -----------------------------
+_EMPTY_TOTALS = {
+    "headcount": {"total": 0, "active": 0, "by_role": []},
+    "totals": {"leads": 0, "clients": 0, "payments": 0, "paid_amount": 0.0},
+}
+
+
+def list_branches(db: Session, *, active_only: bool = False, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Cached BranchOut dicts in id order."""
+    rows = [e["branch"] for e in branch_meta.branches(db).values()]
+    if active_only:
+        rows = [b for b in rows if b["active"]]
+    return rows[offset:] if limit is None else rows[offset:offset + limit]
+
+
+def get_branch(db: Session, branch_id: int) -> Optional[Dict[str, Any]]:
+    entry = branch_meta.branches(db).get(branch_id)
+    return entry["branch"] if entry else None
+
+
+def directory(db: Session, *, active_only: bool = False) -> List[Dict[str, Any]]:
+    """Every branch with manager, headcounts and totals (two cached lookups)."""
+    totals = branch_meta.totals(db)
+    out = []
+    for branch_id, entry in branch_meta.branches(db).items():
+        if active_only and not entry["branch"]["active"]:
+            continue
+        out.append({**entry, **totals.get(branch_id, _EMPTY_TOTALS)})
+    return out
+
+
+def branch_details(db: Session, branch_id: int, *, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+    """Branch, manager, headcounts, totals and one page of members."""
+    entry = branch_meta.branches(db).get(branch_id)
+    if entry is None:
+        return None
+    rows = db.execute(members_statement(branch_id, offset=offset, limit=limit)).all()
+    stats = branch_meta.totals(db).get(branch_id, _EMPTY_TOTALS)
+    total_users = rows[0].total_count if rows else stats["headcount"]["total"]
+    return {
+        **entry,
+        **stats,
+        "users": [
+            {
+                "employee_code": r.employee_code,
+                "name": r.name,
+                "role": r.role_name or "Unknown",
+                "role_id": r.role_id,
+                "role_name": r.role_name,
+                "email": r.email,
+                "is_active": r.is_active,
+            }
+            for r in rows
+        ],
+        "total_users": total_users,
+        "skip": offset,
+        "limit": limit,
+    }
+
+
+def available_managers(db: Session) -> List[Dict[str, Any]]:
+    return [dict(r._mapping) for r in db.execute(available_managers_statement())]
+
+
+def ensure_branch_directory_indexes() -> None:
+    """create_all() doesn't add indexes to existing tables."""
+    names = {"ix_user_branch_role", "ix_lead_branch_live", "ix_payment_branch"}
+    with engine.begin() as conn:
+        for table in (UserDetails.__table__, Lead.__table__, Payment.__table__):
+            for idx in table.indexes:
+                if idx.name in names:
+                    conn.execute(CreateIndex(idx, if_not_exists=True))
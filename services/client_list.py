@@ -0,0 +1,291 @@
+# services/client_list.py
+"""
+Client list page in one statement.
+
+    page  = filtered live clients, projected lead columns + count(*) OVER ()
+            ORDER BY created_at DESC, id DESC OFFSET/LIMIT
+    paid  = JOIN LATERAL aggregate over the page's paid payments:
+            count, sum(paid_amount), json_agg(payment ORDER BY created_at DESC)
+    + LEFT JOIN assignee / branch for their display columns
+
+The window count rides along with the page, so a list request is one round
+trip (a second COUNT only when the page is past the end). The page comes off
+the partial ix_lead_clients_* indexes (is_client AND NOT is_delete) and
+each lateral probe off ix_payment_lead_created.
+
+    python -m services.client_list bench [clients]   # default 50,000, scratch schema
+"""
+
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import String, cast, desc, event, func, literal_column, select, text, true
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateIndex
+
+from db.connection import engine
+from db.models import BranchDetails, Lead, Payment, UserDetails
+from utils.serializers import RowSerializer, json_text
+
+logger = logging.getLogger(__name__)
+
+PAID_STATUSES = ("PAID", "SUCCESS", "SUCCESSFUL", "COMPLETED")
+
+CLIENT_LEAD = RowSerializer(
+    [
+        ("lead_id", Lead.id, None),
+        ("full_name", Lead.full_name, None),
+        ("email", Lead.email, None),
+        ("mobile", Lead.mobile, None),
+        ("city", Lead.city, None),
+        ("state", Lead.state, None),
+        ("occupation", Lead.occupation, None),
+        ("segment", Lead.segment, json_text),  # API keeps the JSON-text shape
+        ("lead_status", Lead.lead_status, None),
+        ("created_at", Lead.created_at, None),
+        ("assigned_to_user", Lead.assigned_to_user, None),
+        ("branch_id", Lead.branch_id, None),
+        ("is_client", Lead.is_client, None),
+        ("kyc", Lead.kyc, None),
+    ]
+)
+
+# Same keys as clients.ClientPaymentInfo, built in SQL (keys are literals:
+# json_build_object's arguments are untyped, asyncpg can't bind them)
+_PAYMENT_FIELDS = [
+    ("payment_id", Payment.id),
+    ("order_id", Payment.order_id),
+    ("service", func.coalesce(func.to_json(Payment.Service), text("'[]'::json"))),
+    ("paid_amount", Payment.paid_amount),
+    ("status", Payment.status),
+    ("mode", Payment.mode),
+    ("plan", func.coalesce(Payment.plan, text("'[]'::jsonb"))),
+    ("created_at", Payment.created_at),
+    ("duration_day", Payment.duration_day),
+    ("call", Payment.call),
+]
+_PAYMENT_JSON = func.json_build_object(*[x for k, v in _PAYMENT_FIELDS for x in (literal_column(f"'{k}'"), v)])
+
+
+def client_page_statement(stmt, *, offset: int, limit: int):
+    """stmt: select(Lead.id).where(<client filters>) as built by the routes."""
+    page = (
+        stmt.with_only_columns(
+            *[c.label(n) for n, c in zip(CLIENT_LEAD.names, CLIENT_LEAD.columns)],
+            func.count().over().label("total_count"),
+        )
+        .order_by(desc(Lead.created_at), desc(Lead.id))
+        .offset(offset)
+        .limit(limit)
+        .subquery("page")
+    )
+    paid = (
+        select(
+            func.count().label("total_payments"),
+            func.coalesce(func.sum(Payment.paid_amount), 0.0).label("total_amount_paid"),
+            func.json_agg(
+                aggregate_order_by(_PAYMENT_JSON, Payment.created_at.desc(), Payment.id.desc()), type_=JSON
+            ).label("payments"),
+        )
+        .where(Payment.lead_id == page.c.lead_id, func.upper(Payment.status).in_(PAID_STATUSES))
+        .lateral("paid")
+    )
+    return (
+        select(
+            *[page.c[n] for n in CLIENT_LEAD.names],
+            page.c.total_count,
+            paid.c.total_payments,
+            paid.c.total_amount_paid,
+            paid.c.payments,
+            UserDetails.name.label("emp_name"),
+            cast(UserDetails.role_id, String).label("emp_role_id"),
+            UserDetails.phone_number.label("emp_phone_number"),
+            UserDetails.email.label("emp_email"),
+            BranchDetails.name.label("branch_name"),
+        )
+        .select_from(page)
+        .join(paid, true())
+        .outerjoin(UserDetails, UserDetails.employee_code == page.c.assigned_to_user)
+        .outerjoin(BranchDetails, BranchDetails.id == page.c.branch_id)
+        .order_by(desc(page.c.created_at), desc(page.c.lead_id))
+    )
+
+
+async def count_clients(db: AsyncSession, stmt) -> int:
+    return (await db.execute(select(func.count()).select_from(stmt.subquery()))).scalar_one()
+
+
+def _client_row(r) -> Dict[str, Any]:
+    m = r._mapping
+    payments = m["payments"] or []
+    return {
+        "lead_id": m["lead_id"],
+        "full_name": m["full_name"],
+        "email": m["email"],
+        "mobile": m["mobile"],
+        "city": m["city"],
+        "state": m["state"],
+        "occupation": m["occupation"],
+        "segment": json_text(m["segment"]),
+        "lead_status": m["lead_status"],
+        "created_at": m["created_at"],
+        "total_payments": m["total_payments"],
+        "total_amount_paid": float(m["total_amount_paid"]),
+        "latest_payment": payments[0] if payments else None,
+        "all_payments": payments,
+        "assigned_employee": {
+            "employee_code": m["assigned_to_user"],
+            "name": m["emp_name"],
+            "role_id": m["emp_role_id"],
+            "phone_number": m["emp_phone_number"],
+            "email": m["emp_email"],
+        } if m["emp_name"] is not None else None,
+        "branch_name": m["branch_name"],
+        "is_active_client": m["total_payments"] > 0 or bool(m["is_client"]),
+        "kyc_status": bool(m["kyc"]),
+    }
+
+
+async def client_page(db: AsyncSession, stmt, *, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """(client rows, total count) for one page."""
+    rows = (await db.execute(client_page_statement(stmt, offset=offset, limit=limit))).all()
+    if rows:
+        return [_client_row(r) for r in rows], rows[0].total_count
+    # past the last page: no row to carry the window count
+    return [], (await count_clients(db, stmt) if offset else 0)
+
+
+def ensure_client_list_indexes() -> None:
+    """create_all() doesn't add indexes to existing tables."""
+    names = {"ix_lead_clients_created", "ix_lead_clients_assignee_created",
+             "ix_lead_clients_branch_created", "ix_payment_lead_created"}
+    with engine.begin() as conn:
+        for table in (Lead.__table__, Payment.__table__):
+            for idx in table.indexes:
+                if idx.name in names:
+                    conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+# -----------------------------
+# Benchmark (scratch schema in a rolled-back transaction)
+# -----------------------------
+_BENCH_SCHEMA = "bench_client_list"
+
+
+async def _batched_page(db: AsyncSession, stmt, *, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """The previous path (count + page + payments + assignees + branches), kept for the benchmark only."""
+    total = await count_clients(db, stmt)
+    rows = (
+        await db.execute(
+            stmt.with_only_columns(*CLIENT_LEAD.columns).order_by(desc(Lead.created_at)).offset(offset).limit(limit)
+        )
+    ).all()
+    leads = CLIENT_LEAD.many(rows)
+    if not leads:
+        return [], total
+    ids = [l["lead_id"] for l in leads]
+    payments: Dict[int, list] = {}
+    for r in await db.execute(
+        select(Payment.lead_id, Payment.id, Payment.paid_amount, Payment.status, Payment.created_at)
+        .where(Payment.lead_id.in_(ids), func.upper(Payment.status).in_(PAID_STATUSES))
+        .order_by(desc(Payment.created_at))
+    ):
+        payments.setdefault(r[0], []).append(r)
+    codes = {l["assigned_to_user"] for l in leads if l["assigned_to_user"]}
+    if codes:
+        await db.execute(select(UserDetails.employee_code, UserDetails.name).where(UserDetails.employee_code.in_(codes)))
+    branch_ids = {l["branch_id"] for l in leads if l["branch_id"]}
+    if branch_ids:
+        await db.execute(select(BranchDetails.id, BranchDetails.name).where(BranchDetails.id.in_(branch_ids)))
+    return leads, total
+
+
+async def _bench(n_clients: int, limit: int, runs: int) -> dict:
+    from db.async_connection import AsyncSessionLocal, async_engine
+
+    statements = [0]
+
+    def _count(*_args, **_kw):
+        statements[0] += 1
+
+    s = _BENCH_SCHEMA
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(text(f"CREATE SCHEMA {s}"))
+            for table in ("crm_lead", "crm_payment"):
+                await db.execute(
+                    text(f"CREATE TABLE {s}.{table} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING INDEXES)")
+                )
+            started = time.perf_counter()
+            await db.execute(text(
+                f"""
+                INSERT INTO {s}.crm_lead (id, full_name, mobile, is_old_lead, is_delete, is_client,
+                                          branch_id, assigned_to_user, created_at, updated_at)
+                SELECT g, 'Client ' || g, lpad(g::text, 10, '9'), FALSE, g % 50 = 0, g % 4 <> 0,
+                       NULL, 'EMP' || (g % 200),
+                       now() - (random() * interval '730 days'), now()
+                  FROM generate_series(1, :n) g
+                """
+            ), {"n": n_clients * 4 // 3})
+            await db.execute(text(
+                f"""
+                INSERT INTO {s}.crm_payment (id, lead_id, phone_number, paid_amount, status, mode,
+                                             is_send_invoice, created_at, updated_at)
+                SELECT p, 1 + p % :leads, '9999999999', 1000 + p % 5000,
+                       CASE WHEN p % 5 = 0 THEN 'FAILED' ELSE 'PAID' END, 'UPI', FALSE,
+                       now() - (random() * interval '730 days'), now()
+                  FROM generate_series(1, :payments) p
+                """
+            ), {"leads": n_clients * 4 // 3, "payments": n_clients * 3})
+            await db.execute(text(f"ANALYZE {s}.crm_lead; ANALYZE {s}.crm_payment"))
+            await db.execute(text(f"SET LOCAL search_path TO {s}, public"))
+            seed_s = time.perf_counter() - started
+
+            base = select(Lead.id).where(Lead.is_delete == False, Lead.is_client == True)
+            out: Dict[str, Any] = {"clients": n_clients, "limit": limit, "runs": runs, "seed_seconds": round(seed_s, 1)}
+            event.listen(async_engine.sync_engine, "before_cursor_execute", _count)
+            try:
+                for page_no in (1, 100):
+                    for name, fn in (("batched", _batched_page), ("single_query", client_page)):
+                        timings = []
+                        for _ in range(runs):
+                            statements[0] = 0
+                            t0 = time.perf_counter()
+                            await fn(db, base, offset=(page_no - 1) * limit, limit=limit)
+                            timings.append((time.perf_counter() - t0) * 1000)
+                        out[f"page_{page_no}.{name}"] = {
+                            "statements": statements[0],
+                            "median_ms": round(statistics.median(timings), 2),
+                        }
+            finally:
+                event.remove(async_engine.sync_engine, "before_cursor_execute", _count)
+            return out
+        finally:
+            await db.rollback()
+
+
+def bench(n_clients: int = 50_000, limit: int = 100, runs: int = 5) -> dict:
+    """
+    Seed n_clients live clients (~3 payments each, a fifth of them failed)
+    into a scratch schema cloned from crm_lead / crm_payment, then time page 1
+    and page 100 through the previous batched path and the single statement.
+    Everything runs in one transaction that is rolled back at the end.
+    """
+    return asyncio.run(_bench(n_clients, limit, runs))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "bench":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+        print(json.dumps(bench(n), indent=2, default=str))
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,472 @@
+# services/employee_directory.py
+"""
+Employee directory: indexed search, keyset pages, in-process typeahead.
+
+    search   = every term in lower(name || ' ' || email || ' ' || phone || ' ' || code)
+               LIKE '%term%'   -> ix_user_search_trgm (GIN, pg_trgm)
+    page     = projected user columns + role / department / branch names
+               (LEFT JOINs, no lazy loads or per-row role_name subquery)
+               ORDER BY name, employee_code; OFFSET pages or keyset cursors
+    count    = exact  count(*) OVER () on offset pages, a COUNT for cursor pages
+               estimate  the planner's row estimate (EXPLAIN), no scan
+               none
+
+DirectoryCache keeps every active employee (a few thousand rows) with a
+sorted prefix-token array. Typeahead is a bisect plus a short scan, and a
+substring pass runs only when prefixes don't fill the limit. The user write
+routes invalidate it. Other workers catch up within
+DIRECTORY_CACHE_TTL_SECONDS.
+
+    python -m services.employee_directory bench [users]   # default 5,000, scratch schema
+"""
+
+import base64
+import bisect
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, literal_column, select, text, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+
+from db.connection import SessionLocal, engine
+from db.models import BranchDetails, Department, ProfileRole, UserDetails
+from utils.serializers import RowSerializer
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = float(os.getenv("DIRECTORY_CACHE_TTL_SECONDS", "120"))
+TYPEAHEAD_LIMIT = 10
+
+COUNT_MODES = ("exact", "estimate", "none")
+
+_SP = literal_column("' '")
+# must match the ix_user_search_trgm expression in db/models.py
+SEARCH_TEXT = func.lower(
+    UserDetails.name + _SP + UserDetails.email + _SP + UserDetails.phone_number + _SP + UserDetails.employee_code
+)
+
+# Same keys as routes.auth.register.serialize_user (nested parts added in _nest)
+USER_ROW = RowSerializer(
+    [
+        ("employee_code", UserDetails.employee_code, None),
+        ("phone_number", UserDetails.phone_number, None),
+        ("email", UserDetails.email, None),
+        ("name", UserDetails.name, None),
+        ("role_id", UserDetails.role_id, str),
+        ("father_name", UserDetails.father_name, None),
+        ("is_active", UserDetails.is_active, None),
+        ("experience", UserDetails.experience, None),
+        ("date_of_joining", UserDetails.date_of_joining, None),
+        ("date_of_birth", UserDetails.date_of_birth, None),
+        ("pan", UserDetails.pan, None),
+        ("aadhaar", UserDetails.aadhaar, None),
+        ("address", UserDetails.address, None),
+        ("city", UserDetails.city, None),
+        ("state", UserDetails.state, None),
+        ("pincode", UserDetails.pincode, None),
+        ("comment", UserDetails.comment, None),
+        ("branch_id", UserDetails.branch_id, None),
+        ("permissions", UserDetails.permissions, None),
+        ("senior_profile_id", UserDetails.senior_profile_id, None),
+        ("vbc_extension_id", UserDetails.vbc_extension_id, None),
+        ("vbc_user_username", UserDetails.vbc_user_username, None),
+        ("vbc_user_password", UserDetails.vbc_user_password, None),
+        ("created_at", UserDetails.created_at, None),
+        ("updated_at", UserDetails.updated_at, None),
+        ("department_id", UserDetails.department_id, None),
+        ("target", UserDetails.target, None),
+        ("role_name", ProfileRole.name, None),
+        ("hierarchy_level", ProfileRole.hierarchy_level, None),
+        ("department_name", Department.name, None),
+        ("branch_name", BranchDetails.name, None),
+    ]
+)
+
+
+# -----------------------------
+# Statements
+# -----------------------------
+def search_terms(q: Optional[str]) -> List[str]:
+    return [t for t in (q or "").lower().split() if t]
+
+
+def _like(term: str) -> str:
+    escaped = term.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return f"%{escaped}%"
+
+
+def filter_statement(
+    stmt,
+    *,
+    search: Optional[str] = None,
+    active_only: bool = False,
+    branch_id: Optional[int] = None,
+    role_id: Optional[int] = None,
+    senior_profile_id: Optional[str] = None,
+):
+    for term in search_terms(search):
+        stmt = stmt.where(SEARCH_TEXT.like(_like(term), escape="!"))
+    if active_only:
+        stmt = stmt.where(UserDetails.is_active == True)
+    if branch_id is not None:
+        stmt = stmt.where(UserDetails.branch_id == branch_id)
+    if role_id is not None:
+        stmt = stmt.where(UserDetails.role_id == role_id)
+    if senior_profile_id is not None:
+        stmt = stmt.where(UserDetails.senior_profile_id == senior_profile_id)
+    return stmt
+
+
+def page_statement(*, after: Optional[Tuple[str, str]] = None, offset: int = 0, limit: int, window_count: bool, **filters):
+    columns = USER_ROW.with_columns(func.count().over().label("total_count")) if window_count else USER_ROW.columns
+    stmt = (
+        select(*columns)
+        .select_from(UserDetails)
+        .outerjoin(ProfileRole, ProfileRole.id == UserDetails.role_id)
+        .outerjoin(Department, Department.id == UserDetails.department_id)
+        .outerjoin(BranchDetails, BranchDetails.id == UserDetails.branch_id)
+    )
+    stmt = filter_statement(stmt, **filters)
+    if after is not None:
+        stmt = stmt.where(tuple_(UserDetails.name, UserDetails.employee_code) > tuple_(*after))
+    return stmt.order_by(UserDetails.name, UserDetails.employee_code).offset(offset).limit(limit)
+
+
+def encode_cursor(name: str, employee_code: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, employee_code]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """ValueError on anything that isn't one of ours."""
+    try:
+        name, code = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+    return str(name), str(code)
+
+
+def estimate_count(db: Session, stmt) -> int:
+    """Planner row estimate for stmt (no scan)."""
+    compiled = stmt.compile(dialect=db.get_bind().dialect)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def _nest(d: Dict[str, Any]) -> Dict[str, Any]:
+    role_name = d.pop("role_name")
+    hierarchy_level = d.pop("hierarchy_level")
+    department_name = d.pop("department_name")
+    branch_name = d.pop("branch_name")
+    d["profile_role"] = (
+        {"id": int(d["role_id"]), "name": role_name, "hierarchy_level": hierarchy_level}
+        if d["role_id"] is not None
+        else None
+    )
+    d["department"] = {"id": d["department_id"], "name": department_name} if d["department_id"] is not None else None
+    d["branch"] = {"id": d["branch_id"], "name": branch_name} if d["branch_id"] is not None else None
+    return d
+
+
+def list_users(
+    db: Session,
+    *,
+    offset: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    count: str = "exact",
+    **filters,
+) -> Dict[str, Any]:
+    """One page in serialize_user shape (+ branch); cursor pages ignore offset."""
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None:
+        offset = 0
+    window = count == "exact" and after is None
+    rows = db.execute(page_statement(after=after, offset=offset, limit=limit, window_count=window, **filters)).all()
+
+    total: Optional[int] = None
+    if window and rows:
+        total = rows[0].total_count
+    elif count == "exact":
+        base = filter_statement(select(func.count()).select_from(UserDetails), **filters)
+        total = db.execute(base).scalar_one()
+    elif count == "estimate":
+        total = estimate_count(db, filter_statement(select(UserDetails.employee_code), **filters))
+
+    n = len(USER_ROW.names)
+    data = [_nest(USER_ROW.one(r[:n])) for r in rows]
+    next_cursor = encode_cursor(data[-1]["name"], data[-1]["employee_code"]) if len(data) == limit else None
+    return {"data": data, "total": total, "next_cursor": next_cursor}
+
+
+# -----------------------------
+# Typeahead cache
+# -----------------------------
+_TYPEAHEAD_FIELDS = (
+    "employee_code", "name", "email", "phone_number", "role_id", "role_name",
+    "branch_id", "branch_name", "department_name",
+)
+
+
+def typeahead_statement():
+    return (
+        select(
+            UserDetails.employee_code,
+            UserDetails.name,
+            UserDetails.email,
+            UserDetails.phone_number,
+            UserDetails.role_id,
+            ProfileRole.name.label("role_name"),
+            UserDetails.branch_id,
+            BranchDetails.name.label("branch_name"),
+            Department.name.label("department_name"),
+        )
+        .outerjoin(ProfileRole, ProfileRole.id == UserDetails.role_id)
+        .outerjoin(Department, Department.id == UserDetails.department_id)
+        .outerjoin(BranchDetails, BranchDetails.id == UserDetails.branch_id)
+        .where(UserDetails.is_active == True)
+        .order_by(UserDetails.name, UserDetails.employee_code)
+    )
+
+
+def _tokens(name: str, email: str, phone: str, code: str) -> set:
+    name, email, code = (name or "").lower(), (email or "").lower(), (code or "").lower()
+    return {name, email, email.split("@", 1)[0], phone or "", code, *name.split()} - {""}
+
+
+class Directory:
+    """Active employees in name order + sorted (token, row) pairs for prefix lookups."""
+
+    __slots__ = ("rows", "haystacks", "tokens", "token_rows", "loaded_at")
+
+    def __init__(self, rows: Sequence[Any]):
+        self.rows: List[Tuple] = [tuple(r) for r in rows]
+        self.haystacks: List[str] = [f"{r[1]} {r[2]} {r[3]} {r[0]}".lower() for r in self.rows]
+        pairs = sorted((t, i) for i, r in enumerate(self.rows) for t in _tokens(r[1], r[2], r[3], r[0]))
+        self.tokens: List[str] = [t for t, _ in pairs]
+        self.token_rows: List[int] = [i for _, i in pairs]
+        self.loaded_at = time.monotonic()
+
+    def _prefix_rows(self, term: str) -> List[int]:
+        start = bisect.bisect_left(self.tokens, term)
+        end = bisect.bisect_left(self.tokens, term + "\uffff", lo=start)
+        return sorted(set(self.token_rows[start:end]))
+
+    def match(self, q: str, *, limit: int, branch_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        terms = search_terms(q)
+        if not terms:
+            return []
+        rest = terms[1:]
+
+        def keep(i: int) -> bool:
+            if branch_id is not None and self.rows[i][6] != branch_id:
+                return False
+            return all(t in self.haystacks[i] for t in rest)
+
+        hits: List[int] = []
+        seen = set()
+        for i in self._prefix_rows(terms[0]):
+            if keep(i):
+                hits.append(i)
+                seen.add(i)
+                if len(hits) == limit:
+                    break
+        if len(hits) < limit:
+            first = terms[0]
+            for i, hay in enumerate(self.haystacks):
+                if i not in seen and first in hay and keep(i):
+                    hits.append(i)
+                    if len(hits) == limit:
+                        break
+        return [dict(zip(_TYPEAHEAD_FIELDS, self.rows[i])) for i in hits]
+
+
+class DirectoryCache:
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._directory: Optional[Directory] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._directory = None
+
+    def directory(self, db: Session) -> Directory:
+        directory = self._directory
+        if directory is not None and time.monotonic() - directory.loaded_at < self.ttl_seconds:
+            return directory
+        generation = self._generation
+        directory = Directory(db.execute(typeahead_statement()).all())
+        with self._lock:
+            # a write landed while we were reading: use the rows, don't cache them
+            if generation == self._generation:
+                self._directory = directory
+        return directory
+
+    def stats(self) -> Dict[str, Any]:
+        d = self._directory
+        return {"employees": len(d.rows) if d else 0, "tokens": len(d.tokens) if d else 0}
+
+
+employees = DirectoryCache()
+
+
+def invalidate() -> None:
+    employees.invalidate()
+
+
+def typeahead(db: Session, q: str, *, limit: int = TYPEAHEAD_LIMIT, branch_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    return employees.directory(db).match(q, limit=limit, branch_id=branch_id)
+
+
+def ensure_directory_indexes() -> None:
+    """pg_trgm + the search / keyset indexes; create_all() doesn't add indexes to existing tables."""
+    names = {"ix_user_search_trgm", "ix_user_name_code"}
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for idx in UserDetails.__table__.indexes:
+            if idx.name in names:
+                conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+# -----------------------------
+# Benchmark (scratch schema in a rolled-back transaction)
+# -----------------------------
+_BENCH_SCHEMA = "bench_directory"
+
+
+def _legacy_search_sql(q: str) -> str:
+    like = f"'%{q}%'"
+    return (
+        "SELECT * FROM crm_user_details WHERE name ILIKE {0} OR email ILIKE {0} "
+        "OR phone_number ILIKE {0} OR employee_code ILIKE {0} OFFSET 0 LIMIT 100"
+    ).format(like)
+
+
+def _explain_ms(db: Session, sql: str, params: Optional[dict] = None) -> Dict[str, Any]:
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return {"execution_ms": plan[0].get("Execution Time"), "root_node": plan[0]["Plan"].get("Node Type")}
+
+
+def _timed_us(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1_000_000)
+    return round(statistics.median(timings), 1)
+
+
+def bench(n_users: int = 5000, runs: int = 200) -> Dict[str, Any]:
+    """
+    Seed n_users employees into a scratch copy of crm_user_details, then time
+    typeahead lookups against the cache (cold load + warm queries), and
+    search / deep-page / count statements against their legacy forms
+    (EXPLAIN ANALYZE). Rolled back at the end.
+    """
+    db = SessionLocal()
+    s = _BENCH_SCHEMA
+    try:
+        db.execute(text(f"CREATE SCHEMA {s}"))
+        db.execute(text(f"CREATE TABLE {s}.crm_user_details (LIKE public.crm_user_details INCLUDING DEFAULTS INCLUDING INDEXES)"))
+        db.execute(text(f"SET LOCAL search_path TO {s}, public"))
+        started = time.perf_counter()
+        db.execute(text(
+            """
+            INSERT INTO crm_user_details (employee_code, phone_number, email, name, password, role_id,
+                                          father_name, is_active, experience, date_of_joining, date_of_birth,
+                                          branch_id)
+            SELECT 'EMP' || lpad(g::text, 5, '0'), (9000000000 + g)::text,
+                   lower(f.first) || '.' || lower(l.last) || g || '@example.com',
+                   f.first || ' ' || l.last, 'x', 1, 'Father ' || g, g % 10 <> 0, 1.0,
+                   date '2020-01-01', date '1990-01-01', 1 + g % 12
+              FROM generate_series(1, :n) g
+             CROSS JOIN LATERAL (SELECT (ARRAY['Aarav','Vivaan','Aditya','Diya','Ananya','Isha','Rohan','Kabir',
+                                               'Meera','Priya','Rahul','Sneha','Arjun','Kavya','Neha','Vikram'])
+                                        [1 + (g * 7) % 16] AS first) f
+             CROSS JOIN LATERAL (SELECT (ARRAY['Sharma','Verma','Patel','Iyer','Nair','Gupta','Singh','Reddy',
+                                               'Das','Mehta','Joshi','Kapoor'])[1 + (g * 13) % 12] AS last) l
+            """
+        ), {"n": n_users})
+        db.execute(text("ANALYZE crm_user_details"))
+        seed_s = time.perf_counter() - started
+
+        cache = DirectoryCache()
+        t0 = time.perf_counter()
+        directory = cache.directory(db)
+        load_ms = (time.perf_counter() - t0) * 1000
+
+        out: Dict[str, Any] = {
+            "users": n_users,
+            "seed_seconds": round(seed_s, 1),
+            "typeahead_load_ms": round(load_ms, 1),
+            "typeahead_tokens": len(directory.tokens),
+            "typeahead_us": {
+                q: _timed_us(lambda q=q: directory.match(q, limit=TYPEAHEAD_LIMIT), runs)
+                for q in ("a", "pri", "priya sh", "9000001", "emp0421", "mehta", "xyz")
+            },
+            "typeahead_branch_us": _timed_us(lambda: directory.match("ro", limit=TYPEAHEAD_LIMIT, branch_id=3), runs),
+        }
+
+        sql_runs = max(3, runs // 40)
+        for q in ("priya", "mehta", "9000001"):
+            page = page_statement(limit=100, window_count=True, search=q)
+            compiled = page.compile(dialect=db.get_bind().dialect)
+            new = [_explain_ms(db, str(compiled), compiled.params) for _ in range(sql_runs)]
+            old = [_explain_ms(db, _legacy_search_sql(q)) for _ in range(sql_runs)]
+            out[f"search_{q}"] = {
+                "indexed_ms": statistics.median(r["execution_ms"] for r in new),
+                "indexed_root": new[-1]["root_node"],
+                "legacy_ilike_ms": statistics.median(r["execution_ms"] for r in old),
+            }
+
+        deep = n_users - 100
+        last = db.execute(
+            select(UserDetails.name, UserDetails.employee_code)
+            .order_by(UserDetails.name, UserDetails.employee_code).offset(deep - 1).limit(1)
+        ).one()
+        keyset = page_statement(after=tuple(last), limit=100, window_count=False).compile(dialect=db.get_bind().dialect)
+        offset = page_statement(offset=deep, limit=100, window_count=False).compile(dialect=db.get_bind().dialect)
+        out["deep_page"] = {
+            "keyset_ms": _explain_ms(db, str(keyset), keyset.params)["execution_ms"],
+            "offset_ms": _explain_ms(db, str(offset), offset.params)["execution_ms"],
+        }
+
+        count_stmt = filter_statement(select(func.count()).select_from(UserDetails), active_only=True)
+        t0 = time.perf_counter()
+        exact = db.execute(count_stmt).scalar_one()
+        exact_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        estimated = estimate_count(db, filter_statement(select(UserDetails.employee_code), active_only=True))
+        estimate_ms = (time.perf_counter() - t0) * 1000
+        out["count"] = {
+            "exact": exact, "exact_ms": round(exact_ms, 2),
+            "estimate": estimated, "estimate_ms": round(estimate_ms, 2),
+        }
+        return out
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "bench":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+        print(json.dumps(bench(n), indent=2, default=str))
+    else:
+        print(__doc__)
+        sys.exit(2)
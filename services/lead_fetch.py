@@ -0,0 +1,202 @@
+# services/lead_fetch.py
+"""
+Lead fetch limits: cached config resolution and the daily fetch quota.
+
+FetchConfigResolver keeps every crm_lead_fetch_config row (a handful) in a
+(role_id, branch_id) -> FetchConfig map, so resolving a user's limits costs
+no query. fetch_config.py invalidates it on every write; other workers pick
+up a change within FETCH_CONFIG_CACHE_TTL_SECONDS.
+
+consume_daily_fetch() takes one unit of a user's daily quota with a single
+INSERT ... ON CONFLICT DO UPDATE ... WHERE call_count < limit RETURNING.
+Concurrent fetches by the same user serialize on the history row, so the
+limit holds exactly. The increment is part of the caller's transaction: a
+fetch that rolls back (or returns without committing) gives the unit back.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from db.connection import engine
+from db.models import LeadFetchConfig
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = float(os.getenv("FETCH_CONFIG_CACHE_TTL_SECONDS", "60"))
+
+_SAME_BRANCH = object()
+
+
+@dataclass(frozen=True)
+class FetchConfig:
+    per_request_limit: int
+    daily_call_limit: int
+    last_fetch_limit: int
+    assignment_ttl_hours: int
+    old_lead_remove_days: Optional[int]
+    id: Optional[int] = None
+    role_id: Optional[str] = None
+    branch_id: Optional[int] = None
+
+
+DEFAULT_FETCH_CONFIG = FetchConfig(
+    per_request_limit=100,
+    daily_call_limit=50,
+    last_fetch_limit=10,
+    assignment_ttl_hours=24,
+    old_lead_remove_days=30,
+)
+
+
+def role_key(role_id: Any) -> Optional[str]:
+    """LeadFetchConfig.role_id is a string; users carry an int/Enum role_id."""
+    if role_id is None:
+        return None
+    return getattr(role_id, "value", str(role_id))
+
+
+class FetchConfigResolver:
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._configs: Optional[Dict[Tuple[Optional[str], Optional[int]], FetchConfig]] = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._configs = None
+
+    def _snapshot(self, db: Session) -> Dict[Tuple[Optional[str], Optional[int]], FetchConfig]:
+        configs = self._configs
+        if configs is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return configs
+
+        generation = self._generation
+        rows = db.execute(select(LeadFetchConfig)).scalars().all()
+        configs = {}
+        for r in rows:
+            key = (role_key(r.role_id), r.branch_id)
+            configs[key] = FetchConfig(
+                id=r.id,
+                role_id=key[0],
+                branch_id=r.branch_id,
+                per_request_limit=r.per_request_limit,
+                daily_call_limit=r.daily_call_limit,
+                last_fetch_limit=r.last_fetch_limit,
+                assignment_ttl_hours=r.assignment_ttl_hours,
+                old_lead_remove_days=r.old_lead_remove_days,
+            )
+        with self._lock:
+            # a write landed while we were reading: use the rows, don't cache them
+            if generation == self._generation:
+                self._configs = configs
+                self._loaded_at = time.monotonic()
+        return configs
+
+    def resolve(
+        self,
+        db: Session,
+        role_id: Any,
+        branch_id: Optional[int],
+        fallback_branch_id: Any = _SAME_BRANCH,
+        defaults: FetchConfig = DEFAULT_FETCH_CONFIG,
+    ) -> Tuple[FetchConfig, str]:
+        """
+        Priority: role+branch, role (global), branch (global), defaults.
+        fallback_branch_id replaces branch_id for the branch-global step
+        (the scheduler resolves by assignee role/branch, then the lead's branch).
+        """
+        configs = self._snapshot(db)
+        rk = role_key(role_id)
+        global_branch = branch_id if fallback_branch_id is _SAME_BRANCH else fallback_branch_id
+
+        if rk and branch_id is not None and (rk, branch_id) in configs:
+            return configs[(rk, branch_id)], "role_branch"
+        if rk and (rk, None) in configs:
+            return configs[(rk, None)], "role_global"
+        if global_branch is not None and (None, global_branch) in configs:
+            return configs[(None, global_branch)], "branch_global"
+        return defaults, "default"
+
+    def for_user(self, db: Session, user, defaults: FetchConfig = DEFAULT_FETCH_CONFIG) -> Tuple[FetchConfig, str]:
+        return self.resolve(db, user.role_id, user.branch_id, defaults=defaults)
+
+
+fetch_configs = FetchConfigResolver()
+
+
+# -----------------------------
+# Daily quota ledger
+# -----------------------------
+_CONSUME_SQL = text(
+    """
+    INSERT INTO crm_lead_fetch_history (user_id, date, call_count)
+    VALUES (:user_id, :day, 1)
+    ON CONFLICT (user_id, date) DO UPDATE
+        SET call_count = crm_lead_fetch_history.call_count + 1
+        WHERE crm_lead_fetch_history.call_count < :limit
+    RETURNING call_count
+    """
+)
+
+
+def consume_daily_fetch(db: Session, user_id: str, daily_limit: int, day: Optional[date] = None) -> Optional[int]:
+    """
+    Take one fetch from today's quota. Returns the new call count, or None
+    when the limit is already reached (nothing is written then).
+    """
+    if daily_limit is None or daily_limit <= 0:
+        return None
+    return db.execute(
+        _CONSUME_SQL,
+        {"user_id": user_id, "day": day or date.today(), "limit": daily_limit},
+    ).scalar()
+
+
+def ensure_fetch_history_unique() -> None:
+    """
+    The ledger upserts on (user_id, date). Older databases can hold several
+    rows per user/day (read-then-insert race): fold them into one, then add
+    the unique index create_all() won't add to an existing table.
+    """
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT to_regclass('uq_lead_fetch_history_user_date')")
+        ).scalar()
+        if exists:
+            return
+        merged = conn.execute(
+            text(
+                """
+                WITH totals AS (
+                    SELECT user_id, date, MIN(id) AS keep_id, SUM(call_count) AS total
+                    FROM crm_lead_fetch_history
+                    GROUP BY user_id, date
+                    HAVING COUNT(*) > 1
+                ), kept AS (
+                    UPDATE crm_lead_fetch_history h SET call_count = t.total
+                    FROM totals t WHERE h.id = t.keep_id
+                )
+                DELETE FROM crm_lead_fetch_history h
+                USING totals t
+                WHERE h.user_id = t.user_id AND h.date = t.date AND h.id <> t.keep_id
+                """
+            )
+        ).rowcount
+        conn.execute(
+            text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_lead_fetch_history_user_date "
+                "ON crm_lead_fetch_history (user_id, date)"
+            )
+        )
+        logger.info("crm_lead_fetch_history: unique (user_id, date) added, %d duplicate rows merged", merged)
@@ -0,0 +1,209 @@
+# services/lead_navigation.py
+"""
+Lead navigation: a per-user cursor over the assignment sequence.
+
+A user's sequence is their assignments fetched in the last NAV_WINDOW_HOURS,
+ordered by (fetched_at, id). One index-only range scan on
+ix_lead_assignment_user_fetched loads it, and it is kept in-process as
+compact parallel arrays (assignment ids, lead ids, fetch times, called
+flags) plus an id -> slot map. next / previous / position are slot
+arithmetic. The total and called counts are kept up to date as entries are
+marked called or age out.
+
+Expiry needs no write. Entries are in fetched_at order, so the ones past
+the window form a prefix. Reads trim that prefix and subtract it from the
+counts.
+
+A cached sequence is never mutated: trimming and flag changes build a new
+AssignmentSequence (sharing the id arrays) and swap it in under the lock,
+so a request keeps a consistent view while it reads outside the lock.
+
+Writes: db/models.py reports the assignment changes of each committed
+session to apply_changes(). A change to is_call alone swaps in a copy with
+the flag flipped. Anything else (fetch, transfer, complete) drops that
+user's sequence. Other workers catch up within NAV_CACHE_TTL_SECONDS. A slot whose
+lead is gone reloads the sequence.
+"""
+
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+
+from db.connection import engine
+from db.models import LeadAssignment
+
+WINDOW_HOURS = int(os.getenv("NAV_WINDOW_HOURS", "24"))
+CACHE_TTL_SECONDS = float(os.getenv("NAV_CACHE_TTL_SECONDS", "60"))
+MAX_USERS = int(os.getenv("NAV_CACHE_MAX_USERS", "5000"))
+
+
+def _cutoff() -> float:
+    return time.time() - WINDOW_HOURS * 3600
+
+
+class AssignmentSequence:
+    __slots__ = ("ids", "lead_ids", "fetched", "called", "slot", "start", "n_called", "loaded_at")
+
+    def __init__(self, rows: Iterable[Tuple[int, int, Optional[bool], datetime]]):
+        self.ids = array("q")
+        self.lead_ids = array("q")
+        self.fetched = array("d")
+        self.called = bytearray()
+        for assignment_id, lead_id, is_call, fetched_at in rows:
+            self.ids.append(assignment_id)
+            self.lead_ids.append(lead_id)
+            self.fetched.append(fetched_at.timestamp())
+            self.called.append(1 if is_call else 0)
+        self.slot: Dict[int, int] = {a: i for i, a in enumerate(self.ids)}
+        self.start = 0
+        self.n_called = sum(self.called)
+        self.loaded_at = time.monotonic()
+
+    def _derive(self, start: int, n_called: int, called: bytearray) -> "AssignmentSequence":
+        seq = AssignmentSequence.__new__(AssignmentSequence)
+        seq.ids, seq.lead_ids, seq.fetched, seq.slot = self.ids, self.lead_ids, self.fetched, self.slot
+        seq.start, seq.n_called, seq.called = start, n_called, called
+        seq.loaded_at = self.loaded_at
+        return seq
+
+    def trimmed(self, cutoff: float) -> "AssignmentSequence":
+        """Copy without the expired prefix (self if nothing expired)."""
+        start, n_called = self.start, self.n_called
+        while start < len(self.ids) and self.fetched[start] < cutoff:
+            n_called -= self.called[start]
+            start += 1
+        if start == self.start:
+            return self
+        return self._derive(start, n_called, self.called)
+
+    @property
+    def total(self) -> int:
+        return len(self.ids) - self.start
+
+    def index_of(self, assignment_id: int) -> Optional[int]:
+        """0-based position in the live window, None if not (or no longer) in it."""
+        slot = self.slot.get(assignment_id)
+        if slot is None or slot < self.start:
+            return None
+        return slot - self.start
+
+    def entry(self, index: int) -> Dict[str, Any]:
+        slot = self.start + index
+        return {
+            "assignment_id": self.ids[slot],
+            "lead_id": self.lead_ids[slot],
+            "is_call": bool(self.called[slot]),
+        }
+
+    def cursor(self, index: int) -> Dict[str, Any]:
+        return {
+            "position": index + 1,
+            "total_count": self.total,
+            "has_next": index + 1 < self.total,
+            "has_previous": index > 0,
+        }
+
+    def with_called(self, assignment_id: int, is_call: bool) -> Optional["AssignmentSequence"]:
+        """Copy with one called flag changed; None if the assignment isn't in it."""
+        slot = self.slot.get(assignment_id)
+        if slot is None:
+            return None
+        n_called = self.n_called
+        if slot >= self.start:
+            n_called += int(is_call) - self.called[slot]
+        called = bytearray(self.called)
+        called[slot] = 1 if is_call else 0
+        return self._derive(self.start, n_called, called)
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "uncalled_count": self.total - self.n_called,
+            "total_count": self.total,
+            "called_count": self.n_called,
+        }
+
+
+def sequence_statement(user_id: str):
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=WINDOW_HOURS)
+    return (
+        select(LeadAssignment.id, LeadAssignment.lead_id, LeadAssignment.is_call, LeadAssignment.fetched_at)
+        .where(LeadAssignment.user_id == user_id, LeadAssignment.fetched_at >= cutoff)
+        .order_by(LeadAssignment.fetched_at, LeadAssignment.id)
+    )
+
+
+class NavigationCache:
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS, max_users: int = MAX_USERS):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._sequences: "OrderedDict[str, AssignmentSequence]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._sequences.clear()
+            else:
+                self._sequences.pop(user_id, None)
+
+    def sequence(self, db: Session, user_id: str) -> AssignmentSequence:
+        with self._lock:
+            seq = self._sequences.get(user_id)
+            if seq is not None and time.monotonic() - seq.loaded_at < self.ttl_seconds:
+                seq = seq.trimmed(_cutoff())
+                self._sequences[user_id] = seq
+                self._sequences.move_to_end(user_id)
+                return seq
+            generation = self._generation
+
+        seq = AssignmentSequence(db.execute(sequence_statement(user_id)).all()).trimmed(_cutoff())
+        with self._lock:
+            # a write landed while we were reading: use the rows, don't cache them
+            if generation == self._generation:
+                self._sequences[user_id] = seq
+                self._sequences.move_to_end(user_id)
+                while len(self._sequences) > self.max_users:
+                    self._sequences.popitem(last=False)
+        return seq
+
+    def apply_changes(self, changes: Iterable[Tuple[str, str, Optional[int], Optional[bool]]]) -> None:
+        """("called", user, assignment_id, is_call) swaps in a copy; ("reset", user, None, None) drops."""
+        with self._lock:
+            self._generation += 1
+            for kind, user_id, assignment_id, is_call in changes:
+                seq = self._sequences.get(user_id)
+                if seq is None:
+                    continue
+                updated = seq.with_called(assignment_id, bool(is_call)) if kind == "called" else None
+                if updated is None:
+                    self._sequences.pop(user_id, None)
+                else:
+                    self._sequences[user_id] = updated
+
+    def stats(self) -> Dict[str, Any]:
+        return {"users": len(self._sequences), "max_users": self.max_users}
+
+
+navigation = NavigationCache()
+
+
+def apply_changes(changes) -> None:
+    navigation.apply_changes(changes)
+
+
+def ensure_navigation_index() -> None:
+    """create_all() doesn't add indexes to existing tables."""
+    with engine.begin() as conn:
+        for idx in LeadAssignment.__table__.indexes:
+            if idx.name == "ix_lead_assignment_user_fetched":
+                conn.execute(CreateIndex(idx, if_not_exists=True))
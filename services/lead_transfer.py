@@ -0,0 +1,644 @@
+# services/lead_transfer.py
+"""
+Bulk lead transfer and rebalancing, run as a chunked background job.
+
+POST /leads/transfer/bulk stores a crm_lead_transfer_jobs row. In the same
+transaction it enqueues a `lead_transfer` outbox event on the bulk lane.
+outbox_worker.py then moves the matching leads CHUNK_SIZE at a time. Each
+chunk is its own transaction:
+
+    SELECT ... FOR UPDATE                          next chunk in id order (id > last_lead_id)
+    UPDATE crm_lead ... FROM unnest(...)           one statement for the whole chunk
+    UPDATE crm_old_lead_queue ... FROM unnest(...) queue branch follows the lead
+    INSERT INTO crm_lead_story SELECT unnest(...)  one statement for the whole chunk
+    crm_lead_transfer_jobs                         cursor, counters, strategy state
+
+When no leads are left, the job enqueues one "notify" event per recipient,
+carrying the number of leads that recipient received.
+
+Filters are ANDed. At least one filter or lead_ids is required:
+    source_user                 Lead.effective_owner (ix_lead_owner_delete_created)
+    branch_id, lead_response_id
+    created_from / created_to   dates, inclusive
+    lead_ids                    explicit ids
+Leads created after the job (id > max_lead_id) are not touched.
+
+Strategies:
+    single        every lead goes to targets[0]
+    round_robin   targets take turns; the turn carries over across chunks and retries
+    least_loaded  each lead goes to the target with the fewest open leads
+                  (live, non-client, by effective_owner). Counted once at
+                  creation and kept up to date on the job.
+
+A lead already assigned to its target in that target's branch is skipped.
+As in the single transfer, the lead moves to the target's branch, and
+LeadAssignment rows are left alone, so the navigation cache does not need
+a reset. The ORM hooks never see these Core updates, so each chunk writes
+effective_owner and the queue's branch_id itself.
+
+If a chunk fails, only that chunk rolls back. The outbox retries the event
+and the job resumes from last_lead_id. Cancel takes effect at the next
+chunk boundary. Resume re-enqueues a FAILED or CANCELLED job.
+
+    python -m services.lead_transfer bench [leads]     # default 50,000, scratch schema
+"""
+
+import heapq
+import json
+import logging
+import os
+import sys
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from db.connection import SessionLocal
+from db.models import Lead, LeadTransferJob, UserDetails
+from services.outbox import enqueue
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("LEAD_TRANSFER_CHUNK", "1000"))
+# one outbox claim runs at most this long, then re-enqueues the rest
+SLICE_SECONDS = float(os.getenv("LEAD_TRANSFER_SLICE_SECONDS", "120"))
+MAX_LEAD_IDS = 100_000
+
+SINGLE = "single"
+ROUND_ROBIN = "round_robin"
+LEAST_LOADED = "least_loaded"
+STRATEGIES = (SINGLE, ROUND_ROBIN, LEAST_LOADED)
+
+STATUS_PENDING = "PENDING"
+STATUS_RUNNING = "RUNNING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+STATUS_CANCELLED = "CANCELLED"
+RUNNABLE = (STATUS_PENDING, STATUS_RUNNING, STATUS_FAILED)
+
+_FILTER_KEYS = ("source_user", "branch_id", "lead_response_id", "created_from", "created_to", "lead_ids")
+
+
+class TransferRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _role(user) -> str:
+    return (getattr(user, "role_name", "") or "").upper()
+
+
+# -----------------------------
+# Selection
+# -----------------------------
+def _filtered(stmt, filters: Dict[str, Any]):
+    stmt = stmt.where(Lead.is_delete.is_(False))
+    if filters.get("source_user"):
+        stmt = stmt.where(Lead.effective_owner == filters["source_user"])
+    if filters.get("branch_id") is not None:
+        stmt = stmt.where(Lead.branch_id == filters["branch_id"])
+    if filters.get("lead_response_id") is not None:
+        stmt = stmt.where(Lead.lead_response_id == filters["lead_response_id"])
+    if filters.get("created_from"):
+        stmt = stmt.where(Lead.created_at >= date.fromisoformat(filters["created_from"]))
+    if filters.get("created_to"):
+        stmt = stmt.where(Lead.created_at < date.fromisoformat(filters["created_to"]) + timedelta(days=1))
+    return stmt
+
+
+def _id_window(job: LeadTransferJob) -> Optional[List[int]]:
+    """Explicit ids: the next chunk_size of them after the cursor (the list is stored sorted)."""
+    ids = (job.filters or {}).get("lead_ids")
+    if not ids:
+        return None
+    start = bisect_right(ids, job.last_lead_id)
+    return ids[start:start + job.chunk_size]
+
+
+def chunk_statement(job: LeadTransferJob, window: Optional[List[int]] = None):
+    stmt = _filtered(
+        select(Lead.id, Lead.assigned_to_user, Lead.branch_id),
+        job.filters or {},
+    ).where(Lead.id > job.last_lead_id, Lead.id <= job.max_lead_id)
+    if window is not None:
+        stmt = stmt.where(Lead.id.in_(window))
+    return stmt.order_by(Lead.id).limit(job.chunk_size).with_for_update(of=Lead)
+
+
+def open_loads(db: Session, targets: Sequence[str]) -> Dict[str, int]:
+    rows = db.execute(
+        select(Lead.effective_owner, func.count())
+        .where(Lead.effective_owner.in_(list(targets)), Lead.is_delete.is_(False), Lead.is_client.is_(False))
+        .group_by(Lead.effective_owner)
+    ).all()
+    counts = dict(rows)
+    return {t: int(counts.get(t, 0)) for t in targets}
+
+
+# -----------------------------
+# Strategies
+# -----------------------------
+def plan(job: LeadTransferJob, rows: Sequence[Tuple[int, Optional[str], Optional[int]]]):
+    """
+    (moves, skipped) for one chunk. moves: (lead_id, previous_user,
+    previous_branch, target). Updates job.loads for least_loaded.
+    """
+    targets = list(job.targets)
+    branches = job.target_branches or {}
+    moves, skipped = [], 0
+
+    if job.strategy == LEAST_LOADED:
+        loads = dict(job.loads or {})
+        heap = [(loads.get(t, 0), i, t) for i, t in enumerate(targets)]
+        heapq.heapify(heap)
+        for lead_id, prev_user, prev_branch in rows:
+            load, i, target = heap[0]
+            if prev_user == target and prev_branch == branches.get(target):
+                skipped += 1
+                continue
+            moves.append((lead_id, prev_user, prev_branch, target))
+            heapq.heapreplace(heap, (load + 1, i, target))
+        job.loads = {t: load for load, _, t in heap}
+        return moves, skipped
+
+    turn = job.moved + job.skipped
+    for n, (lead_id, prev_user, prev_branch) in enumerate(rows):
+        target = targets[0] if job.strategy == SINGLE else targets[(turn + n) % len(targets)]
+        if prev_user == target and prev_branch == branches.get(target):
+            skipped += 1
+            continue
+        moves.append((lead_id, prev_user, prev_branch, target))
+    return moves, skipped
+
+
+# -----------------------------
+# Chunk
+# -----------------------------
+_MOVE_SQL = text(
+    """
+    UPDATE crm_lead l
+       SET assigned_to_user = v.owner,
+           effective_owner = v.owner,
+           branch_id = v.branch_id,
+           updated_at = now()
+      FROM unnest(CAST(:ids AS integer[]), CAST(:owners AS varchar[]), CAST(:branches AS integer[]))
+           AS v(id, owner, branch_id)
+     WHERE l.id = v.id
+    """
+)
+_QUEUE_SQL = text(
+    """
+    UPDATE crm_old_lead_queue q
+       SET branch_id = v.branch_id
+      FROM unnest(CAST(:ids AS integer[]), CAST(:branches AS integer[])) AS v(id, branch_id)
+     WHERE q.lead_id = v.id
+       AND q.branch_id IS DISTINCT FROM v.branch_id
+    """
+)
+_STORY_SQL = text(
+    """
+    INSERT INTO crm_lead_story (lead_id, user_id, msg)
+    SELECT v.id, :user_id, v.msg
+      FROM unnest(CAST(:ids AS integer[]), CAST(:msgs AS text[])) AS v(id, msg)
+    """
+)
+
+
+def move_chunk(db: Session, job: LeadTransferJob) -> int:
+    """Move the next chunk inside the caller's transaction; returns rows examined (0 = finished)."""
+    window = _id_window(job)
+    if window is not None and not window:
+        return 0
+    rows = db.execute(chunk_statement(job, window)).all()
+    if not rows and window is None:
+        return 0
+
+    moves, skipped = plan(job, rows)
+    if moves:
+        branches = job.target_branches or {}
+        ids = [m[0] for m in moves]
+        owners = [m[3] for m in moves]
+        new_branches = [branches.get(t) for t in owners]
+        db.execute(_MOVE_SQL, {"ids": ids, "owners": owners, "branches": new_branches})
+        db.execute(_QUEUE_SQL, {"ids": ids, "branches": new_branches})
+        db.execute(_STORY_SQL, {
+            "ids": ids,
+            "user_id": job.created_by,
+            "msgs": [
+                f"Lead transferred from {prev_user or 'UNASSIGNED'} (branch {prev_branch}) "
+                f"to {target} (branch {branches.get(target)}) by {job.created_by} (bulk transfer #{job.id})"
+                for _lead_id, prev_user, prev_branch, target in moves
+            ],
+        })
+        recipients = dict(job.recipients or {})
+        for t in owners:
+            recipients[t] = recipients.get(t, 0) + 1
+        job.recipients = recipients
+
+    job.moved += len(moves)
+    job.skipped += skipped
+    job.chunks += 1
+    # explicit ids: the window is consumed even where the filters dropped rows
+    job.last_lead_id = window[-1] if window is not None else rows[-1][0]
+    return len(rows) or 1
+
+
+def _finish(db: Session, job: LeadTransferJob, actor_name: str) -> None:
+    job.status = STATUS_DONE
+    job.finished_at = utcnow()
+    for code, count in sorted((job.recipients or {}).items()):
+        enqueue(
+            db,
+            "notify",
+            {
+                "user_id": code,
+                "title": "Leads Transferred",
+                "message": f"{count} lead{'s' if count != 1 else ''} have been transferred to you by {actor_name}.",
+                "lead_id": None,
+            },
+            idempotency_key=f"lead_transfer:{job.id}:{code}",
+        )
+
+
+def run_chunk(job_id: int) -> bool:
+    """One chunk in its own transaction. False when the job is finished, cancelled or gone."""
+    db = SessionLocal()
+    try:
+        job = db.get(LeadTransferJob, job_id, with_for_update=True)
+        if job is None or job.status not in RUNNABLE:
+            return False
+        if job.status != STATUS_RUNNING:
+            job.status = STATUS_RUNNING
+            job.error = None
+            job.started_at = job.started_at or utcnow()
+        if move_chunk(db, job) == 0:
+            actor = db.get(UserDetails, job.created_by)
+            _finish(db, job, getattr(actor, "name", None) or job.created_by)
+            db.commit()
+            return False
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _record_failure(job_id: int, error: str) -> None:
+    db = SessionLocal()
+    try:
+        job = db.get(LeadTransferJob, job_id)
+        if job is not None and job.status in (STATUS_PENDING, STATUS_RUNNING):
+            job.status = STATUS_FAILED
+            job.error = error[:2000]
+            db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("lead transfer %s: could not record failure", job_id)
+    finally:
+        db.close()
+
+
+def run(job_id: int, slice_seconds: float = SLICE_SECONDS) -> bool:
+    """
+    Chunks until done or the slice runs out (then the rest is re-enqueued).
+    A failure marks the job FAILED and re-raises; the outbox retry resumes it.
+    """
+    deadline = time.monotonic() + slice_seconds
+    try:
+        while run_chunk(job_id):
+            if time.monotonic() >= deadline:
+                _continue_later(job_id)
+                return False
+        return True
+    except Exception as e:
+        logger.exception("lead transfer %s failed", job_id)
+        _record_failure(job_id, str(e))
+        raise
+
+
+def _enqueue_run(db: Session, job: LeadTransferJob, key: Optional[str] = None) -> None:
+    enqueue(db, "lead_transfer", {"job_id": job.id}, idempotency_key=key and f"lead_transfer:{job.id}:{key}")
+
+
+def _continue_later(job_id: int) -> None:
+    db = SessionLocal()
+    try:
+        job = db.get(LeadTransferJob, job_id)
+        if job is not None and job.status == STATUS_RUNNING:
+            # chunks done so far keep each continuation's key unique
+            _enqueue_run(db, job, key=f"continue:{job.chunks}")
+            db.commit()
+    finally:
+        db.close()
+
+
+# -----------------------------
+# Job API (routes/leads/lead_transfer.py)
+# -----------------------------
+def _clean_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for key in _FILTER_KEYS:
+        value = filters.get(key)
+        if value is None or value == "" or value == []:
+            continue
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()[:10]
+        out[key] = value
+    if "lead_ids" in out:
+        out["lead_ids"] = sorted({int(i) for i in out["lead_ids"]})
+        if len(out["lead_ids"]) > MAX_LEAD_IDS:
+            raise TransferRejected(400, f"At most {MAX_LEAD_IDS} lead_ids per job")
+    if out.get("created_from") and out.get("created_to") and out["created_from"] > out["created_to"]:
+        raise TransferRejected(400, "created_from is after created_to")
+    return out
+
+
+def create_job(
+    db: Session,
+    current_user: UserDetails,
+    *,
+    filters: Dict[str, Any],
+    targets: Sequence[str],
+    strategy: str,
+    chunk_size: Optional[int] = None,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Validate, count and store a job (plus its outbox event); the caller commits."""
+    role = _role(current_user)
+    if role not in ("SUPERADMIN", "BRANCH_MANAGER"):
+        raise TransferRejected(403, "You don't have permission to transfer leads")
+    if strategy not in STRATEGIES:
+        raise TransferRejected(400, f"strategy must be one of {', '.join(STRATEGIES)}")
+
+    targets = list(dict.fromkeys(t.strip() for t in targets if t and t.strip()))
+    if not targets:
+        raise TransferRejected(400, "At least one target employee is required")
+    if strategy == SINGLE and len(targets) != 1:
+        raise TransferRejected(400, "strategy 'single' takes exactly one target")
+
+    filters = _clean_filters(filters)
+    if role == "BRANCH_MANAGER":
+        if current_user.branch_id is None:
+            raise TransferRejected(403, "Branch manager has no branch assigned")
+        if filters.get("branch_id") not in (None, current_user.branch_id):
+            raise TransferRejected(403, "You can only transfer leads from your branch")
+        filters["branch_id"] = current_user.branch_id
+    if not filters:
+        raise TransferRejected(400, "Give at least one filter or lead_ids")
+    if filters.get("source_user") in targets:
+        raise TransferRejected(400, "The source user can't also be a target")
+
+    employees = dict(
+        db.execute(
+            select(UserDetails.employee_code, UserDetails.branch_id)
+            .where(UserDetails.employee_code.in_(targets), UserDetails.is_active.is_(True))
+        ).all()
+    )
+    missing = [t for t in targets if t not in employees]
+    if missing:
+        raise TransferRejected(404, f"Target employees not found or inactive: {', '.join(missing)}")
+    if role == "BRANCH_MANAGER" and any(employees[t] != current_user.branch_id for t in targets):
+        raise TransferRejected(403, "You can only transfer leads to employees in your branch")
+
+    max_lead_id = db.execute(select(func.max(Lead.id))).scalar() or 0
+    count = _filtered(select(func.count()).select_from(Lead), filters).where(Lead.id <= max_lead_id)
+    if filters.get("lead_ids"):
+        count = count.where(Lead.id.in_(filters["lead_ids"]))
+    total = db.execute(count).scalar() or 0
+    loads = open_loads(db, targets) if strategy == LEAST_LOADED else {}
+
+    if dry_run:
+        return {"dry_run": True, "total": total, "targets": targets, "strategy": strategy, "loads": loads, "filters": filters}
+
+    job = LeadTransferJob(
+        status=STATUS_PENDING,
+        created_by=current_user.employee_code,
+        filters=filters,
+        strategy=strategy,
+        targets=targets,
+        target_branches={t: employees[t] for t in targets},
+        loads=loads,
+        recipients={},
+        chunk_size=max(1, min(chunk_size or CHUNK_SIZE, 10_000)),
+        max_lead_id=max_lead_id,
+        last_lead_id=0,
+        total=total,
+        moved=0,
+        skipped=0,
+        chunks=0,
+    )
+    db.add(job)
+    db.flush()
+    _enqueue_run(db, job, key="start")
+    return job_status(job)
+
+
+def job_status(job: LeadTransferJob) -> Dict[str, Any]:
+    done = job.moved + job.skipped
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or utcnow()) - job.started_at).total_seconds()
+    return {
+        "id": job.id,
+        "status": job.status,
+        "strategy": job.strategy,
+        "targets": list(job.targets or []),
+        "filters": {k: v for k, v in (job.filters or {}).items() if k != "lead_ids"},
+        "lead_ids": len((job.filters or {}).get("lead_ids") or []),
+        "total": job.total,
+        "moved": job.moved,
+        "skipped": job.skipped,
+        "chunks": job.chunks,
+        "percent": round(100.0 * done / job.total, 1) if job.total else (100.0 if job.status == STATUS_DONE else 0.0),
+        "leads_per_second": round(job.moved / elapsed, 1) if elapsed else None,
+        "last_lead_id": job.last_lead_id,
+        "recipients": job.recipients or {},
+        "loads": job.loads or {},
+        "error": job.error,
+        "created_by": job.created_by,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _visible(job: Optional[LeadTransferJob], current_user: UserDetails) -> LeadTransferJob:
+    if job is None or (_role(current_user) != "SUPERADMIN" and job.created_by != current_user.employee_code):
+        raise TransferRejected(404, "Transfer job not found")
+    return job
+
+
+def get_job(db: Session, job_id: int, current_user: UserDetails) -> Dict[str, Any]:
+    return job_status(_visible(db.get(LeadTransferJob, job_id), current_user))
+
+
+def list_jobs(db: Session, current_user: UserDetails, limit: int = 20) -> List[Dict[str, Any]]:
+    stmt = select(LeadTransferJob).order_by(LeadTransferJob.id.desc()).limit(limit)
+    if _role(current_user) != "SUPERADMIN":
+        stmt = stmt.where(LeadTransferJob.created_by == current_user.employee_code)
+    return [job_status(j) for j in db.scalars(stmt)]
+
+
+def cancel_job(db: Session, job_id: int, current_user: UserDetails) -> Dict[str, Any]:
+    job = _visible(db.get(LeadTransferJob, job_id, with_for_update=True), current_user)
+    if job.status in (STATUS_DONE, STATUS_CANCELLED):
+        raise TransferRejected(409, f"Job is already {job.status}")
+    job.status = STATUS_CANCELLED
+    job.finished_at = utcnow()
+    return job_status(job)
+
+
+def resume_job(db: Session, job_id: int, current_user: UserDetails) -> Dict[str, Any]:
+    job = _visible(db.get(LeadTransferJob, job_id, with_for_update=True), current_user)
+    if job.status not in (STATUS_FAILED, STATUS_CANCELLED):
+        raise TransferRejected(409, f"Only FAILED or CANCELLED jobs can be resumed (job is {job.status})")
+    job.status = STATUS_PENDING
+    job.error = None
+    job.finished_at = None
+    _enqueue_run(db, job)
+    return job_status(job)
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+_BENCH_SCHEMA = "lead_transfer_bench"
+
+
+def bench(n_leads: int = 50_000, targets: int = 10, legacy_sample: int = 500) -> dict:
+    """
+    Move n_leads off one agent to `targets` agents (least_loaded) in a scratch
+    schema: chunked engine vs the per-lead path (lookup lead, lookup
+    employee, update, story insert; sampled and extrapolated). Per-call
+    commits, HTTP and notification overhead are left out of both sides, so
+    the legacy figure is a lower bound. Rolled back at the end.
+    """
+    db = SessionLocal()
+    s = _BENCH_SCHEMA
+    try:
+        db.execute(text(f"CREATE SCHEMA {s}"))
+        for table in ("crm_lead", "crm_old_lead_queue", "crm_lead_story"):
+            db.execute(text(f"CREATE TABLE {s}.{table} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING INDEXES)"))
+        db.execute(text(f"CREATE SEQUENCE {s}.story_id"))
+        db.execute(text(f"ALTER TABLE {s}.crm_lead_story ALTER COLUMN id SET DEFAULT nextval('{s}.story_id')"))
+
+        started = time.perf_counter()
+        db.execute(text(
+            f"""
+            INSERT INTO {s}.crm_lead (id, full_name, mobile, is_old_lead, is_delete, is_client,
+                                      assigned_to_user, effective_owner, branch_id, created_at, updated_at)
+            SELECT g, 'Lead ' || g, lpad(g::text, 10, '9'), g % 3 = 0, FALSE, FALSE,
+                   CASE WHEN g <= :n THEN 'BENCH_SRC' ELSE 'BENCH_T' || (g % :t) END,
+                   CASE WHEN g <= :n THEN 'BENCH_SRC' ELSE 'BENCH_T' || (g % :t) END,
+                   1, now() - (random() * interval '365 days'), now()
+              FROM generate_series(1, :n + :n / 2) g
+            """
+        ), {"n": n_leads, "t": targets})
+        db.execute(text(
+            f"""
+            INSERT INTO {s}.crm_old_lead_queue (lead_id, branch_id, priority, attempts, is_ready, ready_at)
+            SELECT id, branch_id, 0, 0, TRUE, now() FROM {s}.crm_lead WHERE is_old_lead
+            """
+        ))
+        db.execute(text(f"SET LOCAL search_path TO {s}, public"))
+        db.execute(text(f"ANALYZE {s}.crm_lead; ANALYZE {s}.crm_old_lead_queue"))
+        seed_s = time.perf_counter() - started
+
+        codes = [f"BENCH_T{i}" for i in range(targets)]
+        out = {"leads": n_leads, "targets": targets, "chunk_size": CHUNK_SIZE, "seed_seconds": round(seed_s, 1)}
+
+        # per-lead path, sampled
+        db.execute(text("SAVEPOINT legacy"))
+        sample = db.execute(
+            text("SELECT id FROM crm_lead WHERE effective_owner = 'BENCH_SRC' ORDER BY id LIMIT :k"), {"k": legacy_sample}
+        ).scalars().all()
+        started = time.perf_counter()
+        for i, lead_id in enumerate(sample):
+            target = codes[i % targets]
+            db.execute(text("SELECT * FROM crm_lead WHERE id = :id AND NOT is_delete"), {"id": lead_id}).first()
+            db.execute(text("SELECT * FROM crm_user_details WHERE employee_code = :c"), {"c": target}).first()
+            db.execute(
+                text("UPDATE crm_lead SET assigned_to_user = :c, effective_owner = :c, branch_id = 1 WHERE id = :id"),
+                {"c": target, "id": lead_id},
+            )
+            db.execute(
+                text("INSERT INTO crm_lead_story (lead_id, user_id, msg) VALUES (:id, :u, 'transfer')"),
+                {"id": lead_id, "u": "BENCH_ADMIN"},
+            )
+        legacy_s = time.perf_counter() - started
+        db.execute(text("ROLLBACK TO SAVEPOINT legacy"))
+        per_lead_ms = 1000 * legacy_s / max(len(sample), 1)
+        out["per_lead"] = {
+            "sample": len(sample),
+            "ms_per_lead": round(per_lead_ms, 3),
+            "statements": 4 * n_leads,
+            "extrapolated_seconds": round(per_lead_ms * n_leads / 1000, 1),
+            "notifications": n_leads,
+        }
+
+        # chunked engine on a transient job (no commits; same basis as above)
+        job = LeadTransferJob(
+            id=0,
+            created_by="BENCH_ADMIN",
+            filters={"source_user": "BENCH_SRC"},
+            strategy=LEAST_LOADED,
+            targets=codes,
+            target_branches={c: 1 for c in codes},
+            loads=open_loads(db, codes),
+            recipients={},
+            chunk_size=CHUNK_SIZE,
+            max_lead_id=db.execute(select(func.max(Lead.id))).scalar() or 0,
+            last_lead_id=0,
+            moved=0,
+            skipped=0,
+            chunks=0,
+        )
+        chunk_ms: List[float] = []
+        started = time.perf_counter()
+        while True:
+            t0 = time.perf_counter()
+            if move_chunk(db, job) == 0:
+                break
+            chunk_ms.append(1000 * (time.perf_counter() - t0))
+        engine_s = time.perf_counter() - started
+        chunk_ms.sort()
+        out["chunked"] = {
+            "moved": job.moved,
+            "skipped": job.skipped,
+            "chunks": job.chunks,
+            "statements": 4 * job.chunks,
+            "seconds": round(engine_s, 2),
+            "leads_per_second": round(job.moved / engine_s, 1) if engine_s else None,
+            "median_chunk_ms": round(chunk_ms[len(chunk_ms) // 2], 2) if chunk_ms else None,
+            "p95_chunk_ms": round(chunk_ms[int(len(chunk_ms) * 0.95)], 2) if chunk_ms else None,
+            "notifications": len(job.recipients),
+            "final_loads": job.loads,
+        }
+        if engine_s:
+            out["speedup"] = round(out["per_lead"]["extrapolated_seconds"] / engine_s, 1)
+        return out
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "bench":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+        print(json.dumps(bench(n), indent=2, default=str))
+    else:
+        print(__doc__)
+        sys.exit(2)
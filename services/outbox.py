@@ -0,0 +1,380 @@
+# services/outbox.py
+"""
+Transactional outbox for request side-effects.
+
+Request handlers call `enqueue(db, kind, payload)` inside the same
+transaction as their business write; nothing leaves the process until that
+transaction commits. `OutboxWorker` then drains `crm_outbox_events` with
+`FOR UPDATE SKIP LOCKED`, so several workers (web process + standalone
+`outbox_worker.py`) can share the table safely.
+
+Lanes:
+  - realtime : websocket notifications (drained inside the web process,
+               because the sockets live there)
+  - default  : emails and other light network calls
+  - bulk     : PDF render / sign / SMTP (invoices)
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db.connection import SessionLocal
+from db.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+LANE_REALTIME = "realtime"
+LANE_DEFAULT = "default"
+LANE_BULK = "bulk"
+LANES = (LANE_REALTIME, LANE_DEFAULT, LANE_BULK)
+
+STATUS_PENDING = "PENDING"
+STATUS_PROCESSING = "PROCESSING"
+STATUS_DONE = "DONE"
+STATUS_DEAD = "DEAD"
+
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 15 * 60
+VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("OUTBOX_VISIBILITY_TIMEOUT", "600"))
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# kind -> (handler, default lane, default priority)
+_HANDLERS: Dict[str, tuple] = {}
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+def register_handler(kind: str, *, lane: str = LANE_DEFAULT, priority: int = 100):
+    """Decorator: register an async handler for an outbox `kind`."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown outbox lane: {lane}")
+
+    def deco(fn: Handler) -> Handler:
+        _HANDLERS[kind] = (fn, lane, priority)
+        return fn
+
+    return deco
+
+
+def _handler_defaults(kind: str) -> tuple:
+    # Handlers live in services/outbox_handlers.py; import lazily so callers
+    # that only enqueue don't pull in mail / PDF stacks.
+    if kind not in _HANDLERS:
+        import services.outbox_handlers  # noqa: F401
+    if kind not in _HANDLERS:
+        raise ValueError(f"No outbox handler registered for kind '{kind}'")
+    return _HANDLERS[kind]
+
+
+# -----------------------------
+# Producer API
+# -----------------------------
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Dict[str, Any],
+    *,
+    idempotency_key: Optional[str] = None,
+    lane: Optional[str] = None,
+    priority: Optional[int] = None,
+    max_attempts: int = 8,
+    delay_seconds: int = 0,
+) -> None:
+    """
+    Add an outbox row to the caller's transaction (no commit here).
+    A repeated `idempotency_key` is silently ignored.
+    """
+    _, default_lane, default_priority = _handler_defaults(kind)
+    values = {
+        "kind": kind,
+        "lane": lane or default_lane,
+        "priority": default_priority if priority is None else priority,
+        "payload": payload,
+        "idempotency_key": idempotency_key,
+        "status": STATUS_PENDING,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "available_at": utcnow() + timedelta(seconds=delay_seconds),
+    }
+    stmt = pg_insert(OutboxEvent).values(**values)
+    if idempotency_key:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[OutboxEvent.idempotency_key])
+    db.execute(stmt)
+
+
+# -----------------------------
+# Consumer side (sync DB helpers, run via asyncio.to_thread)
+# -----------------------------
+def _claim_batch(lane: str, limit: int, worker_id: str) -> List[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        now = utcnow()
+        rows = db.execute(
+            select(OutboxEvent.id, OutboxEvent.kind, OutboxEvent.payload, OutboxEvent.attempts, OutboxEvent.max_attempts)
+            .where(
+                OutboxEvent.lane == lane,
+                OutboxEvent.status == STATUS_PENDING,
+                OutboxEvent.available_at <= now,
+            )
+            .order_by(OutboxEvent.priority, OutboxEvent.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            db.rollback()
+            return []
+
+        ids = [r.id for r in rows]
+        db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_(ids))
+            .values(
+                status=STATUS_PROCESSING,
+                locked_at=now,
+                locked_by=worker_id,
+                attempts=OutboxEvent.attempts + 1,
+            )
+        )
+        db.commit()
+        return [
+            {
+                "id": r.id,
+                "kind": r.kind,
+                "payload": r.payload or {},
+                "attempts": (r.attempts or 0) + 1,
+                "max_attempts": r.max_attempts,
+            }
+            for r in rows
+        ]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _owned(event_id: int, worker_id: str):
+    # Only the worker still holding the claim may settle a row; after a
+    # visibility-timeout requeue it belongs to whoever claimed it next.
+    return (
+        OutboxEvent.id == event_id,
+        OutboxEvent.status == STATUS_PROCESSING,
+        OutboxEvent.locked_by == worker_id,
+    )
+
+
+def _mark_done(event_id: int, worker_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        res = db.execute(
+            update(OutboxEvent)
+            .where(*_owned(event_id, worker_id))
+            .values(status=STATUS_DONE, processed_at=utcnow(), locked_at=None, last_error=None)
+        )
+        db.commit()
+        return bool(res.rowcount)
+    finally:
+        db.close()
+
+
+def _mark_failed(event_id: int, worker_id: str, attempts: int, max_attempts: int, error: str) -> Optional[str]:
+    """New status, or None if the claim was lost (row requeued meanwhile)."""
+    dead = attempts >= max_attempts
+    delay = min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_MAX_SECONDS)
+    values = {
+        "status": STATUS_DEAD if dead else STATUS_PENDING,
+        "last_error": (error or "")[:4000],
+        "locked_at": None,
+        "locked_by": None,
+    }
+    if dead:
+        values["processed_at"] = utcnow()
+    else:
+        values["available_at"] = utcnow() + timedelta(seconds=delay)
+
+    db = SessionLocal()
+    try:
+        res = db.execute(update(OutboxEvent).where(*_owned(event_id, worker_id)).values(**values))
+        db.commit()
+        if not res.rowcount:
+            return None
+    finally:
+        db.close()
+    return values["status"]
+
+
+def requeue_stale(visibility_timeout: int = VISIBILITY_TIMEOUT_SECONDS) -> int:
+    """Return PROCESSING rows whose worker died back to PENDING."""
+    db = SessionLocal()
+    try:
+        cutoff = utcnow() - timedelta(seconds=visibility_timeout)
+        res = db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.status == STATUS_PROCESSING, OutboxEvent.locked_at < cutoff)
+            .values(status=STATUS_PENDING, locked_at=None, locked_by=None, available_at=utcnow())
+        )
+        db.commit()
+        return res.rowcount or 0
+    finally:
+        db.close()
+
+
+def retry_dead(db: Session, event_ids: Optional[Iterable[int]] = None) -> int:
+    """Move dead-lettered rows back to PENDING (all, or the given ids)."""
+    stmt = update(OutboxEvent).where(OutboxEvent.status == STATUS_DEAD)
+    if event_ids is not None:
+        stmt = stmt.where(OutboxEvent.id.in_(list(event_ids)))
+    res = db.execute(
+        stmt.values(status=STATUS_PENDING, attempts=0, available_at=utcnow(), processed_at=None)
+    )
+    db.commit()
+    return res.rowcount or 0
+
+
+def get_outbox_stats(db: Session) -> Dict[str, Dict[str, int]]:
+    """{lane: {status: count}} for monitoring."""
+    rows = db.execute(
+        select(OutboxEvent.lane, OutboxEvent.status, func.count(OutboxEvent.id))
+        .group_by(OutboxEvent.lane, OutboxEvent.status)
+    ).all()
+    out: Dict[str, Dict[str, int]] = {}
+    for lane, st, cnt in rows:
+        out.setdefault(lane, {})[st] = int(cnt)
+    return out
+
+
+# -----------------------------
+# Worker
+# -----------------------------
+class OutboxWorker:
+    """
+    Async drain loop: one poller per lane, bounded concurrency per lane.
+
+    A lane claims at most `concurrency` events at a time, so every claimed
+    event starts right away and none ages against the visibility timeout
+    while waiting for a slot.
+    """
+
+    def __init__(
+        self,
+        lanes: Iterable[str],
+        *,
+        concurrency: int = 4,
+        batch_size: int = 20,
+        poll_interval: float = 1.0,
+        worker_id: Optional[str] = None,
+    ):
+        self.lanes = [ln for ln in lanes if ln]
+        for ln in self.lanes:
+            if ln not in LANES:
+                raise ValueError(f"Unknown outbox lane: {ln}")
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    async def _run_event(self, ev: Dict[str, Any]) -> None:
+        kind = ev["kind"]
+        try:
+            handler = _handler_defaults(kind)[0]
+            await handler(ev["payload"])
+        except Exception as e:
+            try:
+                status = await asyncio.to_thread(
+                    _mark_failed, ev["id"], self.worker_id, ev["attempts"], ev["max_attempts"], repr(e)
+                )
+            except Exception as mark_err:
+                # the row stays PROCESSING; requeue_stale hands it out again
+                logger.error("[outbox] %s #%s failed (%s) and could not be marked: %s",
+                             kind, ev["id"], e, mark_err)
+                return
+            if status is None:
+                logger.warning("[outbox] %s #%s failed after its claim was lost: %s", kind, ev["id"], e)
+            elif status == STATUS_DEAD:
+                logger.error("[outbox] %s #%s dead-lettered after %s attempts: %s",
+                             kind, ev["id"], ev["attempts"], e)
+            else:
+                logger.warning("[outbox] %s #%s failed (attempt %s): %s",
+                               kind, ev["id"], ev["attempts"], e)
+            return
+        try:
+            if not await asyncio.to_thread(_mark_done, ev["id"], self.worker_id):
+                logger.warning("[outbox] %s #%s finished after its claim was lost", kind, ev["id"])
+        except Exception as e:
+            logger.error("[outbox] %s #%s done but could not be marked: %s", kind, ev["id"], e)
+
+    async def _lane_loop(self, lane: str) -> None:
+        limit = max(1, min(self.batch_size, self.concurrency))
+        while not self._stopping.is_set():
+            try:
+                batch = await asyncio.to_thread(_claim_batch, lane, limit, self.worker_id)
+            except Exception as e:
+                logger.error("[outbox] claim failed on lane %s: %s", lane, e)
+                batch = []
+
+            if batch:
+                results = await asyncio.gather(*(self._run_event(ev) for ev in batch), return_exceptions=True)
+                for ev, res in zip(batch, results):
+                    if isinstance(res, Exception):
+                        logger.error("[outbox] %s #%s crashed the runner: %s", ev["kind"], ev["id"], res)
+                continue
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reaper_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                n = await asyncio.to_thread(requeue_stale)
+                if n:
+                    logger.warning("[outbox] requeued %d stale event(s)", n)
+            except Exception as e:
+                logger.error("[outbox] stale requeue failed: %s", e)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=60)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Start lane pollers on the running event loop."""
+        if self._tasks:
+            return
+        self._stopping.clear()
+        for lane in self.lanes:
+            self._tasks.append(asyncio.create_task(self._lane_loop(lane)))
+        self._tasks.append(asyncio.create_task(self._reaper_loop()))
+        logger.info("[outbox] worker %s started on lanes %s", self.worker_id, self.lanes)
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("[outbox] worker %s stopped", self.worker_id)
+
+    async def run_forever(self) -> None:
+        self.start()
+        await asyncio.gather(*self._tasks)
+
+
+def lanes_from_env(var: str, default: str) -> List[str]:
+    raw = os.getenv(var, default) or ""
+    return [x.strip() for x in raw.split(",") if x.strip()]
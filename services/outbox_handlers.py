@@ -0,0 +1,84 @@
+# services/outbox_handlers.py
+"""
+Handlers for services/outbox.py. Each handler must be safe to run more than
+once for the same payload (the outbox is at-least-once).
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+import httpx
+
+from db.connection import SessionLocal
+from db.models import Payment
+from services.outbox import register_handler, LANE_REALTIME, LANE_DEFAULT, LANE_BULK
+
+logger = logging.getLogger(__name__)
+
+
+@register_handler("notify", lane=LANE_REALTIME, priority=10)
+async def handle_notify(payload: Dict[str, Any]) -> None:
+    from routes.notification.notification_service import notification_service
+
+    await notification_service.notify(
+        user_id=payload["user_id"],
+        title=payload.get("title") or "",
+        message=payload.get("message") or "",
+        lead_id=payload.get("lead_id"),
+    )
+
+
+@register_handler("agreement_email", lane=LANE_DEFAULT, priority=50)
+async def handle_agreement_email(payload: Dict[str, Any]) -> None:
+    from routes.mail_service.kyc_agreement_mail import send_agreement
+
+    async with httpx.AsyncClient(timeout=20.0) as client:
+        resp = await client.get(payload["signed_url"])
+    resp.raise_for_status()
+
+    result = await send_agreement(payload.get("email"), payload.get("name"), resp.content)
+    # send_agreement reports failure as a JSONResponse instead of raising
+    if not isinstance(result, dict):
+        raise RuntimeError(f"Agreement mail failed for {payload.get('email')}")
+
+
+@register_handler("invoice", lane=LANE_BULK, priority=100)
+async def handle_invoice(payload: Dict[str, Any]) -> None:
+    from routes.payments.Invoice import generate_invoices_from_payments
+
+    payloads: List[Dict[str, Any]] = payload.get("payments") or []
+    order_ids = [p.get("order_id") for p in payloads if p.get("order_id")]
+    if not order_ids:
+        return
+
+    # Skip orders that a previous (partially failed) attempt already invoiced
+    db = SessionLocal()
+    try:
+        done = {
+            oid for (oid,) in db.query(Payment.order_id)
+            .filter(Payment.order_id.in_(order_ids), Payment.is_send_invoice.is_(True))
+            .all()
+        }
+    finally:
+        db.close()
+
+    pending = [p for p in payloads if p.get("order_id") not in done]
+    if pending:
+        await generate_invoices_from_payments(pending)
+
+
+@register_handler("vbc_sync", lane=LANE_DEFAULT, priority=90)
+async def handle_vbc_sync(payload: Dict[str, Any]) -> None:
+    from services.vbc_sync import run_sync_once
+
+    # incremental from the stored cursors, so a repeat is cheap
+    await run_sync_once()
+
+
+@register_handler("lead_transfer", lane=LANE_BULK, priority=80)
+async def handle_lead_transfer(payload: Dict[str, Any]) -> None:
+    from services.lead_transfer import run
+
+    # chunks commit one by one; a retry resumes from the job's cursor
+    await asyncio.to_thread(run, int(payload["job_id"]))
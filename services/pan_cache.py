@@ -0,0 +1,336 @@
+# services/pan_cache.py
+"""
+Layered cache for PAN verification results.
+
+  memory LRU (TTL)  ->  crm_pan_verifications  ->  Zoop API
+
+- Concurrent misses for the same PAN share one upstream call (single-flight).
+- Full results live in the table forever, like before. Partial results
+  (individual PAN without father name) and negative results (upstream
+  invalid / not-found PAN) are cached too, with a shorter TTL, so they're not re-fetched on every check.
+- Cache hits don't write: APICount increments are buffered and flushed in
+  one UPDATE per interval by PanCounterFlusher.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, update
+
+from db.connection import SessionLocal
+from db.models import PanVerification
+
+logger = logging.getLogger(__name__)
+
+MEMORY_MAX_ENTRIES = int(os.getenv("PAN_CACHE_MAX_ENTRIES", "5000"))
+MEMORY_TTL_SECONDS = int(os.getenv("PAN_CACHE_TTL_SECONDS", "3600"))
+PARTIAL_TTL_SECONDS = int(os.getenv("PAN_PARTIAL_TTL_SECONDS", str(24 * 3600)))
+NEGATIVE_TTL_SECONDS = int(os.getenv("PAN_NEGATIVE_TTL_SECONDS", str(6 * 3600)))
+COUNTER_FLUSH_SECONDS = float(os.getenv("PAN_COUNTER_FLUSH_SECONDS", "10"))
+
+KIND_FULL = "full"
+KIND_PARTIAL = "partial"
+KIND_NEGATIVE = "negative"
+
+# Zoop answers a malformed PAN with 400/422 and an unknown one with 404.
+NEGATIVE_STATUS_CODES = frozenset({400, 404, 422})
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class PanResult:
+    kind: str
+    data: Dict[str, Any]           # parsed API response (or {"status_code", "detail"} if negative)
+    api_count: int
+    expires_at: Optional[datetime] = None  # None = never (full results)
+
+    def raise_if_negative(self) -> None:
+        if self.kind == KIND_NEGATIVE:
+            raise HTTPException(status_code=self.data.get("status_code", 400), detail=self.data.get("detail"))
+
+
+def classify(api_data: Dict[str, Any], pan_type: Optional[str]) -> str:
+    if pan_type != "company":
+        result_obj = api_data.get("result") or {}
+        if not result_obj.get("user_father_name"):
+            return KIND_PARTIAL
+    return KIND_FULL
+
+
+def _is_negative_status(status_code: int) -> bool:
+    # Only "no / bad PAN" is an answer about the PAN itself. 401/403 (our
+    # credentials / quota), 429 and 5xx are transient and must not be cached.
+    return status_code in NEGATIVE_STATUS_CODES
+
+
+# -----------------------------
+# DB helpers (sync; run via asyncio.to_thread)
+# -----------------------------
+def _db_load(pan: str) -> Optional[PanResult]:
+    db = SessionLocal()
+    try:
+        entry = db.get(PanVerification, pan)
+        if not entry or not entry.response:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= utcnow():
+            return None
+        try:
+            data = json.loads(entry.response)
+        except json.JSONDecodeError:
+            return None
+        if not data:
+            return None
+        return PanResult(
+            kind=entry.result_kind or KIND_FULL,
+            data=data,
+            api_count=entry.APICount or 0,
+            expires_at=entry.expires_at,
+        )
+    finally:
+        db.close()
+
+
+def _db_save(pan: str, result: PanResult) -> int:
+    """Upsert the latest upstream result; one API call = APICount + 1."""
+    db = SessionLocal()
+    try:
+        entry = db.get(PanVerification, pan, with_for_update=True)
+        if entry:
+            entry.response = json.dumps(result.data)
+            entry.APICount = (entry.APICount or 0) + 1
+        else:
+            entry = PanVerification(PANnumber=pan, response=json.dumps(result.data), APICount=1)
+            db.add(entry)
+        entry.result_kind = result.kind
+        entry.expires_at = result.expires_at
+        db.commit()
+        return entry.APICount
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _db_add_counts(counts: Dict[str, int]) -> None:
+    db = SessionLocal()
+    try:
+        stmt = (
+            update(PanVerification)
+            .where(PanVerification.PANnumber == bindparam("pan"))
+            .values(APICount=PanVerification.APICount + bindparam("n"))
+        )
+        db.connection().execute(stmt, [{"pan": p, "n": n} for p, n in counts.items()])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+class PanCache:
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES, ttl_seconds: int = MEMORY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lru: "OrderedDict[Tuple[str, str], Tuple[float, PanResult]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._pending_counts: Counter = Counter()
+        self.hits = self.db_hits = self.misses = self.coalesced = 0
+
+    # --- memory layer ---
+    def _mem_get(self, key: Tuple[str, str]) -> Optional[PanResult]:
+        item = self._lru.get(key)
+        if item is None:
+            return None
+        mono_expiry, result = item
+        if mono_expiry <= time.monotonic() or (result.expires_at and result.expires_at <= utcnow()):
+            self._lru.pop(key, None)
+            return None
+        self._lru.move_to_end(key)
+        return result
+
+    def _mem_put(self, key: Tuple[str, str], result: PanResult) -> None:
+        ttl = self.ttl_seconds
+        if result.expires_at is not None:
+            ttl = min(ttl, max(0.0, (result.expires_at - utcnow()).total_seconds()))
+        self._lru[key] = (time.monotonic() + ttl, result)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def invalidate(self, pan: str) -> None:
+        for key in [k for k in self._lru if k[0] == pan]:
+            self._lru.pop(key, None)
+
+    # --- counters ---
+    def count_hit(self, pan: str) -> int:
+        """Buffer one APICount increment; returns the pending delta for display."""
+        self._pending_counts[pan] += 1
+        return self._pending_counts[pan]
+
+    def drain_counts(self) -> Dict[str, int]:
+        counts, self._pending_counts = dict(self._pending_counts), Counter()
+        return counts
+
+    def restore_counts(self, counts: Dict[str, int]) -> None:
+        self._pending_counts.update(counts)
+
+    def apply_flushed(self, counts: Dict[str, int]) -> None:
+        """Fold flushed increments into the memory copies so displayed counts stay right."""
+        for (pan, _), (_, result) in self._lru.items():
+            if pan in counts:
+                result.api_count += counts[pan]
+
+    # --- lookup ---
+    async def get_or_fetch(
+        self,
+        pan: str,
+        pan_type: Optional[str],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[PanResult, bool]:
+        """
+        Returns (result, cached). Negative results are returned, not raised;
+        call result.raise_if_negative().
+        """
+        # The table is keyed by PAN only, so company/individual share one row
+        # (as before); memory keys include the type so a micro partial never
+        # answers a "pro" lookup.
+        key = (pan, "company" if pan_type == "company" else "micro")
+
+        result = self._mem_get(key)
+        if result is not None:
+            self.hits += 1
+            return result, True
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            out = await self._load_or_fetch(key, pan, pan_type, fetch)
+            fut.set_result(out)
+            return out
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_or_fetch(self, key, pan, pan_type, fetch) -> Tuple[PanResult, bool]:
+        stored = await asyncio.to_thread(_db_load, pan)
+        if stored is not None and not (stored.kind == KIND_PARTIAL and pan_type == "company"):
+            self.db_hits += 1
+            self._mem_put(key, stored)
+            return stored, True
+
+        self.misses += 1
+        try:
+            api_data = await fetch()
+        except HTTPException as e:
+            if not _is_negative_status(e.status_code):
+                raise
+            result = PanResult(
+                kind=KIND_NEGATIVE,
+                data={"status_code": e.status_code, "detail": e.detail},
+                api_count=0,
+                expires_at=utcnow() + timedelta(seconds=NEGATIVE_TTL_SECONDS),
+            )
+        else:
+            kind = classify(api_data, pan_type)
+            result = PanResult(
+                kind=kind,
+                data=api_data,
+                api_count=0,
+                expires_at=None if kind == KIND_FULL else utcnow() + timedelta(seconds=PARTIAL_TTL_SECONDS),
+            )
+
+        try:
+            result.api_count = await asyncio.to_thread(_db_save, pan, result)
+        except Exception as e:
+            # still answer the caller; the next miss will try to persist again
+            logger.error("PAN cache save failed for %s: %s", pan, e)
+            return result, False
+
+        self._mem_put(key, result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "pending_counts": sum(self._pending_counts.values()),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+class PanCounterFlusher:
+    """Periodically writes buffered APICount increments in one statement."""
+
+    def __init__(self, cache: "PanCache", interval: float = COUNTER_FLUSH_SECONDS):
+        self.cache = cache
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    async def flush(self) -> int:
+        counts = self.cache.drain_counts()
+        if not counts:
+            return 0
+        try:
+            await asyncio.to_thread(_db_add_counts, counts)
+        except Exception as e:
+            logger.error("PAN counter flush failed: %s", e)
+            self.cache.restore_counts(counts)
+            return 0
+        self.cache.apply_flushed(counts)
+        return len(counts)
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+pan_cache = PanCache()
+pan_counter_flusher = PanCounterFlusher(pan_cache)
@@ -0,0 +1,573 @@
+# services/payment_events.py
+"""
+Cashfree webhook ingestion pipeline.
+
+  webhook  ->  archive_raw()            (non-blocking, daily rotating file)
+           ->  ingest_event()           (one INSERT .. ON CONFLICT DO NOTHING)
+  applier  ->  apply_queued_events()    (batch: few IN-queries, one commit)
+
+Duplicates are dropped by the unique `event_id`; stale / out-of-order
+statuses are dropped by `should_apply()`.
+
+Replay an archived day (backfill):
+    python -m services.payment_events replay 2026-10-17 [--requeue]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import date, datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db.connection import SessionLocal
+from db.models import Lead, LeadAssignment, LeadStory, Payment, PaymentWebhookEvent
+from services.outbox import enqueue
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE = os.getenv("WEBHOOK_LOG_PATH", "payment_webhook.log")
+ARCHIVE_BACKUP_DAYS = int(os.getenv("WEBHOOK_LOG_BACKUP_DAYS", "90"))
+
+EV_QUEUED = "QUEUED"
+EV_APPLIED = "APPLIED"
+EV_STALE = "STALE"
+EV_ORPHAN = "ORPHAN"
+EV_ERROR = "ERROR"
+
+# Higher rank = further along. PAID is terminal.
+STATUS_RANK = {
+    "NOT_ATTEMPTED": 0,
+    "ACTIVE": 0,
+    "PENDING": 0,
+    "FLAGGED": 1,
+    "USER_DROPPED": 2,
+    "CANCELLED": 2,
+    "VOID": 2,
+    "FAILED": 2,
+    "PAID": 3,
+}
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# -----------------------------
+# Formatting helpers
+# -----------------------------
+def _fmt_inr(val: Optional[float]) -> str:
+    try:
+        return f"₹{float(val or 0):,.2f}"
+    except Exception:
+        return "₹0.00"
+
+
+def _lead_name(lead: Optional[Lead], payment: Payment) -> str:
+    """
+    Lead model generally has 'full_name' (not 'name').
+    Fall back to payment.name if needed.
+    """
+    if lead:
+        return getattr(lead, "full_name", None) or getattr(lead, "name", None) or (payment.name or "")
+    return payment.name or ""
+
+
+def _lead_email(lead: Optional[Lead], payment: Payment) -> str:
+    if lead:
+        return getattr(lead, "email", None) or (getattr(payment, "email", None) or "")
+    return getattr(payment, "email", None) or ""
+
+
+# -----------------------------
+# Raw archive (async, buffered)
+# -----------------------------
+_archive_logger: Optional[logging.Logger] = None
+_archive_listener: Optional[QueueListener] = None
+
+
+def _get_archive_logger() -> logging.Logger:
+    global _archive_logger, _archive_listener
+    if _archive_logger is None:
+        file_handler = TimedRotatingFileHandler(
+            LOG_FILE, when="midnight", utc=True, backupCount=ARCHIVE_BACKUP_DAYS, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        q: "queue.SimpleQueue" = queue.SimpleQueue()
+        _archive_listener = QueueListener(q, file_handler)
+        _archive_listener.start()
+
+        lg = logging.getLogger("payment_webhook.raw")
+        lg.setLevel(logging.INFO)
+        lg.propagate = False
+        lg.addHandler(QueueHandler(q))
+        _archive_logger = lg
+    return _archive_logger
+
+
+def archive_raw(raw: str) -> None:
+    """Queue the raw body for the archive file; never blocks on disk."""
+    try:
+        line = raw.replace("\r", " ").replace("\n", " ")
+        _get_archive_logger().info("%s RAW: %s", utcnow().isoformat(), line)
+    except Exception as e:
+        logger.warning("Could not archive webhook body: %s", e)
+
+
+def stop_archive() -> None:
+    if _archive_listener is not None:
+        _archive_listener.stop()
+
+
+# -----------------------------
+# Parsing + state machine
+# -----------------------------
+def normalize_status(status_cf: Optional[str]) -> str:
+    s = (status_cf or "").upper()
+    return "PAID" if s == "SUCCESS" else s
+
+
+def _parse_ts(val: Any) -> Optional[datetime]:
+    if not val:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(val).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def parse_event(payload: Dict[str, Any], raw: str) -> Dict[str, Any]:
+    """
+    Extract the dedup key and ordering fields. Raises ValueError on payloads
+    without order_id / payment_status.
+    """
+    data = payload.get("data") or {}
+    order = data.get("order") or {}
+    payment_d = data.get("payment") or {}
+
+    order_id = order.get("order_id")
+    status_cf = payment_d.get("payment_status")
+    if not order_id or not status_cf:
+        raise ValueError("Missing order_id or payment_status")
+
+    event_time = _parse_ts(payload.get("event_time")) or _parse_ts(payment_d.get("payment_time"))
+    cf_payment_id = payment_d.get("cf_payment_id")
+    if cf_payment_id:
+        event_id = f"cf:{cf_payment_id}:{str(status_cf).upper()}"
+    else:
+        event_id = "sha:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    return {
+        "event_id": event_id,
+        "order_id": order_id,
+        "payment_status": str(status_cf).upper(),
+        "event_time": event_time,
+        "payload": payload,
+    }
+
+
+def should_apply(
+    old_status: Optional[str],
+    old_at: Optional[datetime],
+    new_status: str,
+    new_at: Optional[datetime],
+) -> bool:
+    """Status-transition guard: ignore duplicates, regressions and stale events."""
+    old = (old_status or "").upper()
+    if old == new_status:
+        return False
+    if old == "PAID":
+        return False
+    if new_status == "PAID":
+        return True
+    if old_at and new_at:
+        return new_at > old_at
+    return STATUS_RANK.get(new_status, 0) >= STATUS_RANK.get(old, 0)
+
+
+# -----------------------------
+# Ingest
+# -----------------------------
+def ingest_event(db: Session, event: Dict[str, Any]) -> bool:
+    """Insert one event; returns False when it is a duplicate."""
+    res = db.execute(
+        pg_insert(PaymentWebhookEvent)
+        .values(status=EV_QUEUED, **event)
+        .on_conflict_do_nothing(index_elements=[PaymentWebhookEvent.event_id])
+        .returning(PaymentWebhookEvent.id)
+    )
+    inserted = res.first() is not None
+    db.commit()
+    return inserted
+
+
+def ingest_events_bulk(db: Session, events: List[Dict[str, Any]], chunk: int = 1000) -> int:
+    """Multi-row insert for replays; returns number of new events."""
+    new = 0
+    for i in range(0, len(events), chunk):
+        part = [dict(status=EV_QUEUED, **e) for e in events[i:i + chunk]]
+        res = db.execute(
+            pg_insert(PaymentWebhookEvent)
+            .values(part)
+            .on_conflict_do_nothing(index_elements=[PaymentWebhookEvent.event_id])
+            .returning(PaymentWebhookEvent.id)
+        )
+        new += len(res.all())
+        db.commit()
+    return new
+
+
+# -----------------------------
+# Batch apply
+# -----------------------------
+def _load_context(db: Session, order_ids: Iterable[str]) -> Tuple[dict, dict, dict]:
+    # Row-locked in id order: a concurrent applier holding events for the
+    # same order waits here and then sees the committed status.
+    payments = {
+        p.order_id: p
+        for p in db.query(Payment)
+        .filter(Payment.order_id.in_(list(order_ids)))
+        .order_by(Payment.id)
+        .with_for_update()
+        .all()
+    }
+
+    lead_ids = {p.lead_id for p in payments.values() if p.lead_id}
+    leads_by_id = {l.id: l for l in db.query(Lead).filter(Lead.id.in_(lead_ids)).all()} if lead_ids else {}
+
+    # Phone fallback for payments without a resolvable lead_id (lowest id wins)
+    phones = {
+        p.phone_number for p in payments.values()
+        if p.phone_number and (not p.lead_id or p.lead_id not in leads_by_id)
+    }
+    leads_by_phone: Dict[str, Lead] = {}
+    if phones:
+        for l in db.query(Lead).filter(Lead.mobile.in_(phones)).order_by(Lead.id).all():
+            leads_by_phone.setdefault(l.mobile, l)
+
+    lead_for_order: Dict[str, Optional[Lead]] = {}
+    for oid, p in payments.items():
+        lead = leads_by_id.get(p.lead_id) if p.lead_id else None
+        if lead is None and p.phone_number:
+            lead = leads_by_phone.get(p.phone_number)
+        lead_for_order[oid] = lead
+
+    all_lead_ids = {l.id for l in lead_for_order.values() if l}
+    assignments = {
+        a.lead_id: a
+        for a in db.query(LeadAssignment).filter(LeadAssignment.lead_id.in_(all_lead_ids)).all()
+    } if all_lead_ids else {}
+
+    return payments, lead_for_order, assignments
+
+
+def _apply_transition(
+    db: Session,
+    payment: Payment,
+    lead: Optional[Lead],
+    assignments: Dict[int, LeadAssignment],
+    new_status: str,
+    event_time: Optional[datetime],
+) -> bool:
+    """Apply one accepted status; returns False if nothing changed."""
+    order_id = payment.order_id
+    old_status = (payment.status or "").upper()
+    status_changed = old_status != new_status
+    conversion_happened = False
+    actor_user_id = payment.user_id or "SYSTEM"
+
+    if lead and new_status == "PAID":
+        if not lead.is_client:
+            lead.is_client = True
+            conversion_happened = True
+        assignment = assignments.pop(lead.id, None)
+        if assignment:
+            actor_user_id = assignment.user_id or actor_user_id
+            db.delete(assignment)
+
+    if not status_changed and not conversion_happened:
+        return False
+
+    if status_changed:
+        payment.status = new_status
+    if event_time:
+        payment.status_event_at = event_time
+
+    lead_name = _lead_name(lead, payment)
+    lead_email = _lead_email(lead, payment)
+
+    if lead and new_status == "PAID":
+        db.add(LeadStory(
+            lead_id=lead.id,
+            user_id=actor_user_id,
+            msg=f"Lead converted to client via payment {order_id}. Amount: {_fmt_inr(payment.paid_amount)}",
+        ))
+
+    notify_msg = (
+        "<div style='font-family:Arial,sans-serif; line-height:1.5;'>"
+        f"<p><strong>Lead:</strong> {lead_name} ({payment.phone_number or ''})</p>"
+        f"<p><strong>Status:</strong> {new_status}" + (f" <em>(prev: {old_status})</em>" if old_status else "") + "</p>"
+        f"<p><strong>Amount:</strong> {_fmt_inr(payment.paid_amount)}</p>"
+        f"<p><strong>Mode:</strong> {payment.mode or 'N/A'}</p>"
+        "</div>"
+    )
+    story_msg = (
+        f"Payment status updated for order {order_id}: "
+        f"{old_status or 'N/A'} → {new_status}. "
+        f"Amount: {_fmt_inr(payment.paid_amount)}, Mode: {payment.mode or 'N/A'}"
+    )
+    if lead:
+        db.add(LeadStory(lead_id=lead.id, user_id=actor_user_id, msg=story_msg))
+
+    enqueue(
+        db, "notify",
+        {"user_id": actor_user_id, "title": "Payment Update", "message": notify_msg,
+         "lead_id": lead.id if lead else None},
+        idempotency_key=f"payment:{order_id}:{new_status}:notify",
+    )
+
+    if lead and getattr(lead, "kyc", False) and new_status == "PAID":
+        invoice_payload = {
+            "order_id": payment.order_id,
+            "paid_amount": float(payment.paid_amount) if payment.paid_amount is not None else 0.0,
+            "plan": payment.plan,
+            "call": payment.call or 0,
+            "created_at": payment.created_at.isoformat() if isinstance(payment.created_at, datetime) else None,
+            "phone_number": payment.phone_number,
+            "email": lead_email,
+            "name": lead_name,
+            "mode": payment.mode,
+            "employee_code": payment.user_id,
+        }
+        enqueue(db, "invoice", {"payments": [invoice_payload]}, idempotency_key=f"invoice:{order_id}")
+
+    return True
+
+
+def apply_queued_events(limit: int = 500) -> Dict[str, int]:
+    """
+    Claim up to `limit` queued events (SKIP LOCKED) and apply them in one
+    transaction, each event in its own savepoint: an event that raises is
+    marked ERROR and the rest of the batch still commits. Returns
+    per-outcome counts.
+    """
+    db = SessionLocal()
+    counts = {EV_APPLIED: 0, EV_STALE: 0, EV_ORPHAN: 0, EV_ERROR: 0}
+    try:
+        events = (
+            db.query(PaymentWebhookEvent)
+            .filter(PaymentWebhookEvent.status == EV_QUEUED)
+            .order_by(PaymentWebhookEvent.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not events:
+            db.rollback()
+            return counts
+
+        # Apply in gateway time order; arrival order is only a tiebreak
+        events.sort(key=lambda e: (e.event_time or e.received_at or utcnow(), e.id))
+        payments, lead_for_order, assignments = _load_context(db, {e.order_id for e in events})
+
+        now = utcnow()
+        for ev in events:
+            ev.applied_at = now
+            payment = payments.get(ev.order_id)
+            if payment is None:
+                ev.status = EV_ORPHAN
+                ev.error = "Payment record not found"
+                counts[EV_ORPHAN] += 1
+                continue
+
+            lead = lead_for_order.get(ev.order_id)
+            new_status = normalize_status(ev.payment_status)
+            lead_id = lead.id if lead is not None else None
+            held = assignments.get(lead_id)
+            try:
+                with db.begin_nested():
+                    accepted = should_apply(payment.status, payment.status_event_at, new_status, ev.event_time)
+                    # A repeated PAID still converts a lead that is not a client yet
+                    if not accepted and new_status == "PAID" and lead is not None and not lead.is_client:
+                        accepted = True
+                    applied = accepted and _apply_transition(
+                        db, payment, lead, assignments, new_status, ev.event_time
+                    )
+            except Exception as e:
+                logger.exception("payment event %s (order %s) failed", ev.event_id, ev.order_id)
+                ev.status = EV_ERROR
+                ev.error = str(e)[:2000]
+                # the savepoint rollback undid any delete; keep the row for later events
+                if held is not None:
+                    assignments[lead_id] = held
+                counts[EV_ERROR] += 1
+                continue
+
+            if applied:
+                ev.status = EV_APPLIED
+                counts[EV_APPLIED] += 1
+            else:
+                ev.status = EV_STALE
+                counts[EV_STALE] += 1
+
+        db.commit()
+        return counts
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def requeue_orphans(db: Session, order_ids: Optional[Iterable[str]] = None) -> int:
+    """Retry ORPHAN events (e.g. the payment row was created late)."""
+    stmt = update(PaymentWebhookEvent).where(PaymentWebhookEvent.status == EV_ORPHAN)
+    if order_ids is not None:
+        stmt = stmt.where(PaymentWebhookEvent.order_id.in_(list(order_ids)))
+    res = db.execute(stmt.values(status=EV_QUEUED, error=None))
+    db.commit()
+    return res.rowcount or 0
+
+
+# -----------------------------
+# Background applier
+# -----------------------------
+class WebhookApplier:
+    """Drains queued events; `wake()` lets the webhook skip the poll delay."""
+
+    def __init__(self, batch_size: int = 500, poll_interval: float = 2.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            try:
+                counts = await asyncio.to_thread(apply_queued_events, self.batch_size)
+                if sum(counts.values()) >= self.batch_size:
+                    continue  # backlog: keep draining
+            except Exception as e:
+                logger.error("[webhook-applier] batch failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        stop_archive()
+
+
+webhook_applier = WebhookApplier()
+
+
+# -----------------------------
+# Replay tool
+# -----------------------------
+def _archive_files_for(day: date) -> List[str]:
+    # TimedRotatingFileHandler names rotated files "<LOG_FILE>.YYYY-MM-DD";
+    # the live file holds today's (and pre-rotation) lines.
+    out = [f"{LOG_FILE}.{day.isoformat()}"]
+    out.append(LOG_FILE)
+    return [p for p in out if os.path.exists(p)]
+
+
+def read_archived_events(day: date) -> List[Dict[str, Any]]:
+    prefix = day.isoformat()
+    events: List[Dict[str, Any]] = []
+    skipped = 0
+    for path in _archive_files_for(day):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if not line.startswith(prefix):
+                    continue
+                _, sep, raw = line.rstrip("\n").partition(" RAW: ")
+                if not sep:
+                    skipped += 1
+                    continue
+                try:
+                    events.append(parse_event(json.loads(raw), raw))
+                except (json.JSONDecodeError, ValueError):
+                    skipped += 1
+    if skipped:
+        logger.warning("[replay] skipped %d unparsable line(s)", skipped)
+    return events
+
+
+def replay_day(day: date, requeue: bool = False, batch_size: int = 2000) -> Dict[str, int]:
+    started = utcnow()
+    events = read_archived_events(day)
+
+    db = SessionLocal()
+    try:
+        new = ingest_events_bulk(db, events)
+        requeued = 0
+        if requeue and events:
+            ids = list({e["event_id"] for e in events})
+            for i in range(0, len(ids), 1000):
+                res = db.execute(
+                    update(PaymentWebhookEvent)
+                    .where(PaymentWebhookEvent.event_id.in_(ids[i:i + 1000]))
+                    .values(status=EV_QUEUED, error=None)
+                )
+                requeued += res.rowcount or 0
+            db.commit()
+    finally:
+        db.close()
+
+    totals = {"read": len(events), "new": new, "requeued": requeued, EV_APPLIED: 0, EV_STALE: 0, EV_ORPHAN: 0, EV_ERROR: 0}
+    while True:
+        counts = apply_queued_events(batch_size)
+        for k, v in counts.items():
+            totals[k] += v
+        if sum(counts.values()) == 0:
+            break
+
+    secs = max((utcnow() - started).total_seconds(), 1e-6)
+    totals["events_per_sec"] = int(len(events) / secs)
+    return totals
+
+
+def _main(argv: List[str]) -> int:
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Cashfree webhook archive tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("replay", help="re-ingest and apply an archived day")
+    rp.add_argument("day", help="YYYY-MM-DD (UTC)")
+    rp.add_argument("--requeue", action="store_true", help="re-apply events already seen")
+    rp.add_argument("--batch", type=int, default=2000)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "replay":
+        result = replay_day(date.fromisoformat(args.day), requeue=args.requeue, batch_size=args.batch)
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,162 @@
+# services/permissions.py
+"""
+Permission engine: the PermissionDetails enum compiled to bit positions.
+
+Each permission gets bit i, where i is its position in the enum, fixed at
+import. A user's effective set is stored on the row as
+crm_user_details.effective_permissions: the user's own list, or the role's
+default_permissions when the user has none (the same rule login uses).
+Hooks in db/models.py maintain the column whenever permissions, role_id or
+a role's defaults change, and bump permission_version each time.
+
+Guards compile that set to an int mask once per (user, permission_version)
+and keep it in an in-process LRU. A check is then `mask & bit`. A version
+bump from any worker is visible on the next request, because the auth
+dependency loads the user row anyway. No cross-worker message is needed.
+
+The stored column holds names, not bits. Permissions are inserted into the
+middle of the enum, so positions move between releases. "Who has X" is
+`effective_permissions @> ARRAY[X]` on the GIN index
+ix_user_effective_permissions.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import ARRAY, String, cast, select, text
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+
+from db.connection import engine
+from db.models import PermissionDetails, ProfileRole, UserDetails
+
+PERMISSIONS: Tuple[str, ...] = tuple(p.value for p in PermissionDetails)
+BITS: Dict[str, int] = {name: 1 << i for i, name in enumerate(PERMISSIONS)}
+VALID: FrozenSet[str] = frozenset(PERMISSIONS)
+ALL_MASK = (1 << len(PERMISSIONS)) - 1
+
+MAX_USERS = 10000
+
+
+def bit_of(permission) -> Optional[int]:
+    """Bit for a PermissionDetails member or its value; None if unknown."""
+    value = permission.value if isinstance(permission, PermissionDetails) else str(permission).strip()
+    return BITS.get(value)
+
+
+def invalid(names: Iterable[str]) -> List[str]:
+    return [n for n in names if n not in VALID]
+
+
+def mask_of(names: Iterable[str]) -> int:
+    """Unknown names (dropped from the enum) are ignored."""
+    mask = 0
+    for n in names or ():
+        mask |= BITS.get(n, 0)
+    return mask
+
+
+def names_of(mask: int) -> List[str]:
+    return [name for name in PERMISSIONS if mask & BITS[name]]
+
+
+class MaskCache:
+    """employee_code -> (permission_version, mask); a stale version recompiles."""
+
+    def __init__(self, max_users: int = MAX_USERS):
+        self.max_users = max_users
+        self._masks: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.compiles = 0
+
+    def mask(self, user: UserDetails) -> int:
+        key, version = user.employee_code, user.permission_version or 0
+        with self._lock:
+            entry = self._masks.get(key)
+            if entry is not None and entry[0] == version:
+                self._masks.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        mask = mask_of(user.effective_permissions)
+        with self._lock:
+            self.compiles += 1
+            self._masks[key] = (version, mask)
+            self._masks.move_to_end(key)
+            while len(self._masks) > self.max_users:
+                self._masks.popitem(last=False)
+        return mask
+
+    def invalidate(self, employee_code: Optional[str] = None) -> None:
+        with self._lock:
+            if employee_code is None:
+                self._masks.clear()
+            else:
+                self._masks.pop(employee_code, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"users": len(self._masks), "hits": self.hits, "compiles": self.compiles}
+
+
+masks = MaskCache()
+
+
+def has_permission(user: UserDetails, permission) -> bool:
+    bit = bit_of(permission)
+    return bit is not None and bool(masks.mask(user) & bit)
+
+
+def holders_statement(permission: str, *, branch_id: Optional[int] = None, active_only: bool = True):
+    stmt = (
+        select(
+            UserDetails.employee_code,
+            UserDetails.name,
+            UserDetails.email,
+            UserDetails.role_id,
+            ProfileRole.name.label("role_name"),
+            UserDetails.branch_id,
+            UserDetails.is_active,
+        )
+        .outerjoin(ProfileRole, ProfileRole.id == UserDetails.role_id)
+        .where(UserDetails.effective_permissions.op("@>")(cast(array([permission]), ARRAY(String))))
+        .order_by(UserDetails.name, UserDetails.employee_code)
+    )
+    if branch_id is not None:
+        stmt = stmt.where(UserDetails.branch_id == branch_id)
+    if active_only:
+        stmt = stmt.where(UserDetails.is_active == True)
+    return stmt
+
+
+def holders(db: Session, permission: str, **filters) -> List[Dict]:
+    return [dict(r._mapping) for r in db.execute(holders_statement(permission, **filters))]
+
+
+def ensure_permission_columns() -> None:
+    """Add + backfill effective_permissions / permission_version on older databases."""
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "ALTER TABLE crm_user_details "
+                "ADD COLUMN IF NOT EXISTS effective_permissions VARCHAR[] NOT NULL DEFAULT '{}', "
+                "ADD COLUMN IF NOT EXISTS permission_version INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+        conn.execute(
+            text(
+                """
+                UPDATE crm_user_details u
+                   SET effective_permissions = CASE WHEN cardinality(u.permissions) > 0 THEN u.permissions
+                                                    ELSE coalesce(r.default_permissions, '{}') END,
+                       permission_version = u.permission_version + 1
+                  FROM crm_profile_roles r
+                 WHERE r.id = u.role_id
+                   AND u.permission_version = 0
+                """
+            )
+        )
+        for idx in UserDetails.__table__.indexes:
+            if idx.name == "ix_user_effective_permissions":
+                conn.execute(CreateIndex(idx, if_not_exists=True))
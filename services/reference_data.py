@@ -0,0 +1,399 @@
+# services/reference_data.py
+"""
+Reference data: whole-table snapshots of the small lookup tables, held in
+process and invalidated by version.
+
+    services, lead_sources, lead_responses, departments, profile_roles, sms_templates
+
+crm_reference_versions holds one monotonically increasing version per
+table. An ORM hook in db/models.py bumps it in the same transaction as any
+insert, update or delete of a registered model, so each write endpoint bumps
+it without doing anything. The hook also sends pg_notify(CHANNEL, name),
+which is delivered on commit, and marks the writing worker's snapshot stale
+on commit.
+
+Freshness on the other workers:
+    push  REFDATA_LISTEN=1: ReferenceListener LISTENs and marks names
+          stale as notifications arrive (polling pauses while it's connected)
+    poll  otherwise one `SELECT name, version` at most every
+          REFDATA_CHECK_SECONDS per worker, from whichever request gets there first
+
+Listing endpoints send a weak ETag built from the table versions and their
+query. A matching If-None-Match gets a 304 without touching the rows.
+
+    python -m services.reference_data check    # every snapshot row through its response model
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import select as _select
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from db.connection import engine
+from db.models import Department, LeadResponse, LeadSource, ProfileRole, ReferenceVersion, Service, SMSTemplate
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = float(os.getenv("REFDATA_CHECK_SECONDS", "2"))
+LISTEN = os.getenv("REFDATA_LISTEN", "0") == "1"
+CHANNEL = "crm_reference_data"
+
+TABLES = {
+    "services": Service,
+    "lead_sources": LeadSource,
+    "lead_responses": LeadResponse,
+    "departments": Department,
+    "profile_roles": ProfileRole,
+    "sms_templates": SMSTemplate,
+}
+NAME_BY_MODEL = {model: name for name, model in TABLES.items()}
+
+# model @property values the endpoints serialize; computed into the rows on load
+COMPUTED = {
+    "services": ("discounted_price",),
+}
+
+# response models each snapshot is served through (`python -m services.reference_data check`)
+RESPONSE_MODELS = {
+    "services": "db.Schema.service:ServiceOut",
+    "lead_sources": "routes.leads.lead_sources:LeadSourceOut",
+    "lead_responses": "routes.leads.lead_responses:LeadResponseOut",
+    "departments": "routes.profile_role.ProfileRole:DepartmentOut",
+    "profile_roles": "routes.profile_role.ProfileRole:ProfileRoleOut",
+    "sms_templates": "routes.Send_client_message.sms_templates:SMSTemplateOut",
+}
+
+
+class Snapshot:
+    __slots__ = ("name", "version", "rows", "by_id", "loaded_at")
+
+    def __init__(self, name: str, version: int, rows: List[Dict[str, Any]]):
+        self.name = name
+        self.version = version
+        self.rows = rows
+        self.by_id = {r["id"]: r for r in rows}
+        self.loaded_at = time.monotonic()
+
+
+def _versions(conn) -> Dict[str, int]:
+    return dict(conn.execute(select(ReferenceVersion.name, ReferenceVersion.version)).all())
+
+
+class ReferenceCache:
+    def __init__(self, check_seconds: float = CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self.pushed = False  # a listener is connected: skip polling
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._stale: set = set()
+        self._generation = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.metrics: Counter = Counter()
+
+    # -- freshness --
+    def _check_due(self) -> bool:
+        return not self.pushed and time.monotonic() - self._checked_at >= self.check_seconds
+
+    def check_versions(self) -> None:
+        with engine.connect() as conn:
+            current = _versions(conn)
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self.metrics["version_checks"] += 1
+            for name, snap in self._snapshots.items():
+                if current.get(name, 0) != snap.version:
+                    self._stale.add(name)
+                    self._generation += 1
+
+    def mark_stale(self, names: Iterable[str]) -> None:
+        with self._lock:
+            for name in names:
+                if name in TABLES:
+                    self._stale.add(name)
+                    self._generation += 1
+                    self.metrics["invalidations"] += 1
+
+    def mark_all_stale(self) -> None:
+        self.mark_stale(list(self._snapshots))
+
+    # -- reads --
+    def _fresh(self, name: str) -> Optional[Snapshot]:
+        snap = self._snapshots.get(name)
+        if snap is None or name in self._stale:
+            return None
+        return snap
+
+    def _load(self, name: str) -> Snapshot:
+        model = TABLES[name]
+        generation = self._generation
+        with engine.connect() as conn:
+            # version first: rows committed after it only cost one more reload
+            version = conn.execute(
+                select(ReferenceVersion.version).where(ReferenceVersion.name == name)
+            ).scalar() or 0
+            table = model.__table__
+            rows = [dict(r._mapping) for r in conn.execute(select(table).order_by(*table.primary_key.columns))]
+        computed = COMPUTED.get(name, ())
+        if computed:
+            for row in rows:
+                obj = model(**row)
+                row.update({attr: getattr(obj, attr) for attr in computed})
+        snap = Snapshot(name, version, rows)
+        with self._lock:
+            self.metrics["misses"] += 1
+            current = self._snapshots.get(name)
+            if current is None or current.version <= version:
+                self._snapshots[name] = snap
+                # an invalidation landed while we were reading: serve it, reload next time
+                if generation == self._generation:
+                    self._stale.discard(name)
+        return snap
+
+    def get(self, name: str) -> Snapshot:
+        if self._check_due():
+            try:
+                self.check_versions()
+            except Exception as e:
+                logger.warning("reference version check failed: %s", e)
+        snap = self._fresh(name)
+        if snap is not None:
+            self.metrics["hits"] += 1
+            return snap
+        return self._load(name)
+
+    async def aget(self, name: str) -> Snapshot:
+        """For async routes: DB work (check / reload) runs in a thread, hits don't."""
+        if not self._check_due():
+            snap = self._fresh(name)
+            if snap is not None:
+                self.metrics["hits"] += 1
+                return snap
+        return await asyncio.to_thread(self.get, name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "metrics": dict(self.metrics),
+            "push": self.pushed,
+            "check_seconds": self.check_seconds,
+            "tables": {
+                name: {
+                    "version": s.version,
+                    "rows": len(s.rows),
+                    "stale": name in self._stale,
+                    "age_seconds": round(time.monotonic() - s.loaded_at, 1),
+                }
+                for name, s in self._snapshots.items()
+            },
+        }
+
+
+reference = ReferenceCache()
+
+
+def get(name: str) -> Snapshot:
+    return reference.get(name)
+
+
+async def aget(name: str) -> Snapshot:
+    return await reference.aget(name)
+
+
+# -----------------------------
+# Version bumps (called from the db.models flush hook)
+# -----------------------------
+_BUMP_SQL = text(
+    """
+    INSERT INTO crm_reference_versions (name, version, updated_at)
+    SELECT n, 1, now() FROM unnest(CAST(:names AS varchar[])) AS n
+    ON CONFLICT (name) DO UPDATE
+       SET version = crm_reference_versions.version + 1, updated_at = now()
+    """
+)
+_NOTIFY_SQL = text(f"SELECT pg_notify('{CHANNEL}', n) FROM unnest(CAST(:names AS varchar[])) AS n")
+
+
+def bump_statements(names: List[str]):
+    params = {"names": sorted(names)}
+    return [(_BUMP_SQL, params), (_NOTIFY_SQL, params)]
+
+
+# -----------------------------
+# HTTP conditional requests
+# -----------------------------
+def etag(*parts: Any) -> str:
+    return 'W/"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:20] + '"'
+
+
+def query_etag(request: Request, *parts: Any) -> str:
+    """ETag over the given parts + the request's query string."""
+    return etag(*parts, tuple(sorted(request.query_params.multi_items())))
+
+
+def not_modified(request: Request, response: Response, tag: str) -> Optional[Response]:
+    """Sets ETag on the response; returns a 304 to send instead when the client already has it."""
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "private, no-cache"
+    sent = request.headers.get("if-none-match")
+    if sent and (sent.strip() == "*" or tag in [t.strip() for t in sent.split(",")]):
+        reference.metrics["not_modified"] += 1
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "private, no-cache"})
+    return None
+
+
+def page(rows: List[Dict[str, Any]], skip: int, limit: Optional[int]) -> List[Dict[str, Any]]:
+    return rows[skip:] if limit is None else rows[skip:skip + limit]
+
+
+def contains(value: Optional[str], needle: str) -> bool:
+    """ILIKE '%needle%' (needle already lowercased)."""
+    return value is not None and needle in value.lower()
+
+
+def ordered(rows: List[Dict[str, Any]], order_by: Optional[str]) -> List[Dict[str, Any]]:
+    """"field" / "-field" ordering over snapshot rows; unknown fields keep table order; NULLs last."""
+    if not order_by:
+        return rows
+    field = order_by.lstrip("-")
+    if not rows or field not in rows[0]:
+        return rows
+    present = [r for r in rows if r[field] is not None]
+    missing = [r for r in rows if r[field] is None]
+    return sorted(present, key=lambda r: r[field], reverse=order_by.startswith("-")) + missing
+
+
+def attach(db: Session, model, row: Dict[str, Any]):
+    """Session-bound instance from a snapshot row, without a SELECT."""
+    obj = model(**row)
+    make_transient_to_detached(obj)
+    return db.merge(obj, load=False)
+
+
+# -----------------------------
+# LISTEN / NOTIFY push
+# -----------------------------
+class ReferenceListener:
+    """LISTENs on CHANNEL from a dedicated connection and marks notified tables stale."""
+
+    def __init__(self, cache: ReferenceCache, timeout: float = 5.0, retry_seconds: float = 5.0):
+        self.cache = cache
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self._conn = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    def _connect(self) -> None:
+        import psycopg2
+
+        args = engine.url.translate_connect_args(username="user", database="dbname")
+        conn = psycopg2.connect(**args)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        self._conn = conn
+
+    def _wait(self) -> List[str]:
+        conn = self._conn
+        if _select.select([conn], [], [], self.timeout) == ([], [], []):
+            return []
+        conn.poll()
+        names = [n.payload for n in conn.notifies]
+        conn.notifies.clear()
+        return names
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._conn is None:
+                    await asyncio.to_thread(self._connect)
+                    # whatever was sent while we weren't listening is lost
+                    self.cache.mark_all_stale()
+                    self.cache.pushed = True
+                names = await asyncio.to_thread(self._wait)
+                if names:
+                    self.cache.metrics["notifications"] += len(names)
+                    self.cache.mark_stale(set(names))
+            except Exception as e:
+                logger.warning("reference listener: %s; polling until reconnected", e)
+                self.cache.pushed = False
+                self._close()
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.retry_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.cache.pushed = False
+        self._close()
+
+
+reference_listener = ReferenceListener(reference)
+
+
+# -----------------------------
+# Check
+# -----------------------------
+def response_model(name: str):
+    import importlib
+
+    module, attr = RESPONSE_MODELS[name].split(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def validate_rows(name: str, rows: List[Dict[str, Any]]) -> List[str]:
+    """Errors from running snapshot rows through the endpoint's response model."""
+    schema = response_model(name)
+    errors = []
+    for row in rows:
+        try:
+            schema.model_validate(row)
+        except Exception as e:
+            errors.append(f"{name} id={row.get('id')}: {e}")
+    return errors
+
+
+def check() -> Dict[str, Any]:
+    out = {}
+    for name in TABLES:
+        snap = reference.get(name)
+        out[name] = {"version": snap.version, "rows": len(snap.rows), "errors": validate_rows(name, snap.rows)}
+    return out
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    if (sys.argv[1] if len(sys.argv) > 1 else "") == "check":
+        report = check()
+        print(json.dumps(report, indent=2, default=str))
+        sys.exit(1 if any(r["errors"] for r in report.values()) else 0)
+    print(__doc__)
+    sys.exit(2)
@@ -6,7 +6,7 @@ from typing import Iterable, List, Optional, Union, Dict, Set, Tuple
 
 import httpx
 from fastapi import HTTPException
-from sqlalchemy import func, cast, String, or_, case
+from sqlalchemy import func, cast, String, and_, case
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -22,6 +22,7 @@ from db.models import (
     SMSTemplate,
     EmailLog,  # <-- added
 )
+from services import reference_data
 from services.mail import send_mail_by_client
 from config import (
     AIRTEL_IQ_SMS_URL,
@@ -105,7 +106,10 @@ def _get_used_history_counts(payment_ids: List[int], db: Session) -> Dict[int, i
         )
         .join(
             ServiceDispatchPlatformStatus,
-            ServiceDispatchPlatformStatus.history_id == ServiceDispatchHistory.id,
+            and_(
+                ServiceDispatchPlatformStatus.history_id == ServiceDispatchHistory.id,
+                ServiceDispatchPlatformStatus.history_created_at == ServiceDispatchHistory.created_at,
+            ),
         )
         .filter(
             func.lower(ServiceDispatchPlatformStatus.status) == "sent",
@@ -323,31 +327,25 @@ def resolve_sms_template(db: Session, template_identifier: Union[int, str]) -> O
     """
     Resolve an SMSTemplate by internal id OR by DLT template id.
     Handles string/numeric storage and stray whitespace.
+    Served from the reference-data snapshot; the result is attached to `db`.
     """
     norm = str(template_identifier).strip()
+    snap = reference_data.get("sms_templates")
 
     # try internal PK id
     try:
-        as_int = int(norm)
-        tmpl = db.query(SMSTemplate).filter(SMSTemplate.id == as_int).first()
-        if tmpl:
-            return tmpl
+        row = snap.by_id.get(int(norm))
+        if row:
+            return reference_data.attach(db, SMSTemplate, row)
     except ValueError:
         pass
 
-    # try DLT id (cast to text, trim, also remove spaces)
-    dlt_text = cast(SMSTemplate.dlt_template_id, String)
-    tmpl = (
-        db.query(SMSTemplate)
-        .filter(
-            or_(
-                func.trim(dlt_text) == norm,
-                func.replace(func.trim(dlt_text), " ", "") == norm,
-            )
-        )
-        .first()
-    )
-    return tmpl
+    # try DLT id (trim, also remove spaces)
+    for row in snap.rows:
+        dlt = str(row["dlt_template_id"]).strip()
+        if dlt == norm or dlt.replace(" ", "") == norm:
+            return reference_data.attach(db, SMSTemplate, row)
+    return None
 
 
 # =========================
@@ -494,7 +492,10 @@ def debug_print_sms_usage(db: Session, only_with_activity: bool = True) -> List[
         )
         .join(
             ServiceDispatchPlatformStatus,
-            ServiceDispatchPlatformStatus.history_id == ServiceDispatchHistory.id,
+            and_(
+                ServiceDispatchPlatformStatus.history_id == ServiceDispatchHistory.id,
+                ServiceDispatchPlatformStatus.history_created_at == ServiceDispatchHistory.created_at,
+            ),
         )
         .filter(
             func.lower(ServiceDispatchPlatformStatus.status) == "sent",
@@ -606,7 +607,10 @@ def _build_used_by_lead_map(db: Session) -> Dict[int, int]:
         )
         .join(
             ServiceDispatchPlatformStatus,
-            ServiceDispatchPlatformStatus.history_id == ServiceDispatchHistory.id,
+            and_(
+                ServiceDispatchPlatformStatus.history_id == ServiceDispatchHistory.id,
+                ServiceDispatchPlatformStatus.history_created_at == ServiceDispatchHistory.created_at,
+            ),
         )
         .filter(
             func.lower(ServiceDispatchPlatformStatus.status) == "sent",
@@ -947,10 +951,10 @@ async def distribution_rational(
                     scheduled_for=datetime.now(timezone.utc),
                 )
                 db.add(hist)
-                db.flush()  # hist.id
+                db.flush()  # hist.id / hist.created_at
 
                 plat = ServiceDispatchPlatformStatus(
-                    history_id=hist.id,
+                    dispatch_history=hist,
                     platform="SMS",
                     platform_identifier=identifier,
                     status=status_str,
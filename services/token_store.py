@@ -0,0 +1,522 @@
+# services/token_store.py
+"""
+Refresh-token store.
+
+Rows hold sha256(token) in the unique token_hash column, never the token
+itself, so every lookup is one index probe on a fixed 64-char key. Each
+login starts a session family (one per device). /refresh rotates inside
+the family:
+
+    UPDATE ... SET rotated_at = now()
+     WHERE token_hash = :digest AND rotated_at IS NULL
+       AND revoked_at IS NULL AND expires_at > now()
+    RETURNING family_id
+    + INSERT the successor row (same family_id)
+
+A token that was already rotated or revoked and is presented again is a
+reuse: the whole family is revoked and that device has to log in again.
+Two refreshes racing with the same token (two tabs) are not a reuse: on
+the worker that rotated it, the `recent` LRU answers the duplicate with the
+same new pair for REFRESH_REUSE_GRACE_SECONDS. On another worker the
+duplicate gets a 401 within that window without revoking the family. The
+LRU also remembers digests known dead, so replays are rejected without a
+query.
+
+purge() deletes expired rows, revoked rows after a day and rotated rows
+after TOKEN_ROTATED_RETENTION_DAYS (reuse of a token older than that is
+just "unknown"), in batches, one pass per index.
+
+    python -m services.token_store purge
+    python -m services.token_store bench [tokens]   # default 1,000,000, scratch schema
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from jose import jwt
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateIndex
+
+from db.connection import engine
+from db.models import TokenDetails
+
+logger = logging.getLogger(__name__)
+
+REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+LRU_SIZE = int(os.getenv("TOKEN_LRU_SIZE", "4096"))
+ROTATED_RETENTION_DAYS = int(os.getenv("TOKEN_ROTATED_RETENTION_DAYS", "30"))
+REVOKED_RETENTION_HOURS = 24
+PURGE_BATCH = int(os.getenv("TOKEN_PURGE_BATCH", "5000"))
+PURGE_INTERVAL_SECONDS = int(os.getenv("TOKEN_PURGE_INTERVAL_SECONDS", "3600"))
+_DEAD_TTL_SECONDS = 3600
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _expires_at(token: str) -> datetime:
+    # our own freshly minted JWT: the claim is trusted here
+    return datetime.fromtimestamp(jwt.get_unverified_claims(token)["exp"], tz=timezone.utc)
+
+
+# -----------------------------
+# Recently validated digests
+# -----------------------------
+@dataclass(frozen=True)
+class Rotation:
+    user_id: str
+    family_id: str
+    refresh_token: str
+
+
+_DEAD = object()
+
+
+class RecentDigests:
+    """digest -> (deadline, Rotation | _DEAD), least recently used evicted first."""
+
+    def __init__(self, size: int = LRU_SIZE):
+        self.size = size
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str):
+        with self._lock:
+            item = self._items.get(digest)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[digest]
+                self.misses += 1
+                return None
+            self._items.move_to_end(digest)
+            self.hits += 1
+            return item[1]
+
+    def put(self, digest: str, value, ttl: float) -> None:
+        with self._lock:
+            self._items[digest] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(digest)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._items), "max_size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+recent = RecentDigests()
+
+
+# -----------------------------
+# Statements
+# -----------------------------
+def issue_statement(user_id: str, refresh_token: str, *, family_id: Optional[str] = None, device: Optional[str] = None):
+    """New session row; no family_id starts a new family (a login)."""
+    return insert(TokenDetails).values(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        token_hash=token_digest(refresh_token),
+        family_id=family_id or str(uuid.uuid4()),
+        device=(device or "")[:255] or None,
+        expires_at=_expires_at(refresh_token),
+    )
+
+
+def revoke_family_statement(family_id: str):
+    return (
+        update(TokenDetails)
+        .where(TokenDetails.family_id == family_id, TokenDetails.revoked_at.is_(None))
+        .values(revoked_at=func.now())
+    )
+
+
+def revoke_token_statement(refresh_token: str):
+    """Logout: revoke the family the token belongs to."""
+    family = select(TokenDetails.family_id).where(TokenDetails.token_hash == token_digest(refresh_token))
+    return (
+        update(TokenDetails)
+        .where(TokenDetails.family_id == family.scalar_subquery(), TokenDetails.revoked_at.is_(None))
+        .values(revoked_at=func.now())
+    )
+
+
+def forget(refresh_token: str) -> None:
+    recent.put(token_digest(refresh_token), _DEAD, _DEAD_TTL_SECONDS)
+
+
+# -----------------------------
+# Rotation
+# -----------------------------
+class RefreshRejected(Exception):
+    """reason: unknown | expired | concurrent | revoked | reused"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+async def _reject(db: AsyncSession, digest: str, user_id: str) -> None:
+    row = (
+        await db.execute(
+            select(
+                TokenDetails.user_id,
+                TokenDetails.family_id,
+                TokenDetails.rotated_at,
+                TokenDetails.revoked_at,
+                (TokenDetails.rotated_at > func.now() - timedelta(seconds=REUSE_GRACE_SECONDS)).label("in_grace"),
+            ).where(TokenDetails.token_hash == digest)
+        )
+    ).first()
+    if row is None or row.user_id != user_id:
+        raise RefreshRejected("unknown")
+    if row.revoked_at is not None:
+        recent.put(digest, _DEAD, _DEAD_TTL_SECONDS)
+        raise RefreshRejected("revoked")
+    if row.rotated_at is None:
+        recent.put(digest, _DEAD, _DEAD_TTL_SECONDS)
+        raise RefreshRejected("expired")
+    if row.in_grace:
+        raise RefreshRejected("concurrent")
+    await db.execute(revoke_family_statement(row.family_id))
+    recent.put(digest, _DEAD, _DEAD_TTL_SECONDS)
+    logger.warning("Refresh token reuse for %s: family %s revoked", user_id, row.family_id)
+    raise RefreshRejected("reused")
+
+
+async def rotate(
+    db: AsyncSession,
+    refresh_token: str,
+    *,
+    user_id: str,
+    mint: Callable[[str], str],
+    device: Optional[str] = None,
+) -> Rotation:
+    """
+    Swap a refresh token for its successor in the same family. The caller
+    commits, also on RefreshRejected (a reuse has revoked the family).
+    """
+    digest = token_digest(refresh_token)
+    hit = recent.get(digest)
+    if hit is _DEAD:
+        raise RefreshRejected("revoked")
+    if hit is not None:
+        if hit.user_id != user_id:
+            raise RefreshRejected("unknown")
+        return hit
+
+    claimed = (
+        await db.execute(
+            update(TokenDetails)
+            .where(
+                TokenDetails.token_hash == digest,
+                TokenDetails.user_id == user_id,
+                TokenDetails.rotated_at.is_(None),
+                TokenDetails.revoked_at.is_(None),
+                TokenDetails.expires_at > func.now(),
+            )
+            .values(rotated_at=func.now())
+            .returning(TokenDetails.family_id)
+        )
+    ).first()
+    if claimed is None:
+        await _reject(db, digest, user_id)
+
+    new_token = mint(user_id)
+    await db.execute(issue_statement(user_id, new_token, family_id=claimed.family_id, device=device))
+    rotation = Rotation(user_id=user_id, family_id=claimed.family_id, refresh_token=new_token)
+    recent.put(digest, rotation, REUSE_GRACE_SECONDS)
+    return rotation
+
+
+# -----------------------------
+# Purge
+# -----------------------------
+# one index per pass: ix_token_details_expires / _revoked / _rotated
+_PURGE_PASSES = [
+    ("expired", "expires_at < now()"),
+    ("revoked", "revoked_at < now() - make_interval(hours => :revoked_hours)"),
+    ("rotated", "rotated_at < now() - make_interval(days => :rotated_days)"),
+]
+
+
+def _purge_statement(predicate: str):
+    return text(
+        f"""
+        WITH doomed AS (
+            SELECT id FROM crm_token_details
+             WHERE {predicate}
+             LIMIT :batch
+             FOR UPDATE SKIP LOCKED
+        )
+        DELETE FROM crm_token_details t USING doomed WHERE t.id = doomed.id
+        """
+    )
+
+
+def _purge_params(batch: int) -> Dict[str, int]:
+    return {"batch": batch, "revoked_hours": REVOKED_RETENTION_HOURS, "rotated_days": ROTATED_RETENTION_DAYS}
+
+
+def purge(batch: int = PURGE_BATCH) -> Dict[str, int]:
+    """Delete dead rows in `batch`-sized transactions; rows deleted per pass."""
+    out: Dict[str, int] = {}
+    for name, predicate in _PURGE_PASSES:
+        stmt, deleted = _purge_statement(predicate), 0
+        while True:
+            with engine.begin() as conn:
+                n = conn.execute(stmt, _purge_params(batch)).rowcount
+            deleted += n
+            if n < batch:
+                break
+        out[name] = deleted
+    return out
+
+
+class TokenPurgeLoop:
+    def __init__(self, interval: int = PURGE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                result = await asyncio.to_thread(purge)
+                if any(result.values()):
+                    logger.info("[token-purge] %s", result)
+            except Exception as e:
+                logger.error("[token-purge] purge failed: %s", e)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+token_purge_loop = TokenPurgeLoop()
+
+
+# -----------------------------
+# Schema
+# -----------------------------
+def ensure_token_store() -> None:
+    """
+    Older databases: add the store columns, digest the plaintext tokens (one
+    family per row, expiry from created_at), then swap the one-row-per-user
+    index for the store's indexes.
+    """
+    from routes.auth.JWTSecurity import REFRESH_TOKEN_EXPIRE_DAYS
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                ALTER TABLE crm_token_details
+                    ADD COLUMN IF NOT EXISTS token_hash VARCHAR(64),
+                    ADD COLUMN IF NOT EXISTS family_id VARCHAR(36),
+                    ADD COLUMN IF NOT EXISTS device VARCHAR(255),
+                    ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ,
+                    ADD COLUMN IF NOT EXISTS rotated_at TIMESTAMPTZ,
+                    ADD COLUMN IF NOT EXISTS revoked_at TIMESTAMPTZ,
+                    ALTER COLUMN refresh_token DROP NOT NULL
+                """
+            )
+        )
+        conn.execute(
+            text(
+                """
+                UPDATE crm_token_details
+                   SET token_hash = encode(sha256(convert_to(refresh_token, 'UTF8')), 'hex'),
+                       family_id = id,
+                       expires_at = created_at + make_interval(days => :days),
+                       refresh_token = NULL
+                 WHERE token_hash IS NULL
+                """
+            ),
+            {"days": REFRESH_TOKEN_EXPIRE_DAYS},
+        )
+        conn.execute(
+            text(
+                """
+                ALTER TABLE crm_token_details
+                    ALTER COLUMN token_hash SET NOT NULL,
+                    ALTER COLUMN family_id SET NOT NULL,
+                    ALTER COLUMN expires_at SET NOT NULL
+                """
+            )
+        )
+        conn.execute(text("DROP INDEX IF EXISTS uq_token_details_user"))
+        for idx in TokenDetails.__table__.indexes:
+            conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+# -----------------------------
+# Benchmark (scratch schema in a rolled-back transaction)
+# -----------------------------
+_BENCH_SCHEMA = "bench_token_store"
+
+
+def _ms(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50_ms": round(statistics.median(values), 3),
+        "p99_ms": round(values[max(0, int(len(values) * 0.99) - 1)], 3),
+    }
+
+
+async def _bench(n_tokens: int, runs: int) -> Dict[str, Any]:
+    from db.async_connection import AsyncSessionLocal
+    from routes.auth.JWTSecurity import create_refresh_token
+
+    s = _BENCH_SCHEMA
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(text(f"CREATE SCHEMA {s}"))
+            await db.execute(
+                text(f"CREATE TABLE {s}.crm_token_details (LIKE public.crm_token_details INCLUDING DEFAULTS INCLUDING INDEXES)")
+            )
+            started = time.perf_counter()
+            # ~5 rows per family, 10% expired, 2% revoked, the rest mostly rotated
+            await db.execute(text(
+                f"""
+                INSERT INTO {s}.crm_token_details (id, user_id, token_hash, family_id, expires_at,
+                                                   rotated_at, revoked_at, created_at)
+                SELECT md5('id' || g), 'EMP' || (g % 2000), encode(sha256(('bench' || g)::bytea), 'hex'),
+                       md5('family' || (g / 5)),
+                       now() + CASE WHEN g % 10 = 0 THEN -interval '1 day' ELSE interval '300 days' END,
+                       CASE WHEN g % 5 <> 4 THEN now() - (random() * interval '90 days') END,
+                       CASE WHEN g % 50 = 0 THEN now() - interval '2 days' END,
+                       now() - (random() * interval '90 days')
+                  FROM generate_series(1, :n) g
+                """
+            ), {"n": n_tokens})
+            await db.execute(text(f"ANALYZE {s}.crm_token_details"))
+            await db.execute(text(f"SET LOCAL search_path TO {s}, public"))
+            seed_s = time.perf_counter() - started
+
+            users = [f"EMP{i % 2000}" for i in range(runs)]
+            live = [create_refresh_token(u) for u in users]
+            for u, t in zip(users, live):
+                await db.execute(issue_statement(u, t, device="bench"))
+            recent.clear()
+
+            out: Dict[str, Any] = {"tokens": n_tokens, "runs": runs, "seed_seconds": round(seed_s, 1)}
+
+            # legacy lookup: the full token string in the old column, user_id unindexed
+            timings = []
+            for u in users[:50]:
+                t0 = time.perf_counter()
+                await db.execute(text("SELECT id FROM crm_token_details WHERE user_id || '' = :u LIMIT 1"), {"u": u})
+                timings.append((time.perf_counter() - t0) * 1000)
+            out["legacy_user_scan"] = _ms(timings)
+
+            rotated: List[Rotation] = []
+            timings = []
+            for u, t in zip(users, live):
+                t0 = time.perf_counter()
+                rotated.append(await rotate(db, t, user_id=u, mint=create_refresh_token))
+                timings.append((time.perf_counter() - t0) * 1000)
+            out["rotate"] = _ms(timings)
+
+            timings = []
+            for u, t in zip(users, live):
+                t0 = time.perf_counter()
+                await rotate(db, t, user_id=u, mint=create_refresh_token)
+                timings.append((time.perf_counter() - t0) * 1000)
+            out["duplicate_in_grace_lru"] = _ms(timings)
+
+            await db.execute(text(
+                "UPDATE crm_token_details SET rotated_at = rotated_at - interval '1 hour' WHERE device = 'bench'"
+            ))
+            recent.clear()
+            timings, reasons = [], {}
+            for u, t in zip(users, live):
+                t0 = time.perf_counter()
+                try:
+                    await rotate(db, t, user_id=u, mint=create_refresh_token)
+                except RefreshRejected as e:
+                    reasons[e.reason] = reasons.get(e.reason, 0) + 1
+                timings.append((time.perf_counter() - t0) * 1000)
+            out["reuse_detected"] = {**_ms(timings), "reasons": reasons}
+
+            # successors of the reused tokens: revoked with their family, then dead in the LRU
+            for key in ("revoked_family", "revoked_family_lru"):
+                timings = []
+                for r in rotated:
+                    t0 = time.perf_counter()
+                    try:
+                        await rotate(db, r.refresh_token, user_id=r.user_id, mint=create_refresh_token)
+                    except RefreshRejected:
+                        pass
+                    timings.append((time.perf_counter() - t0) * 1000)
+                out[key] = _ms(timings)
+            out["lru"] = recent.stats()
+
+            started = time.perf_counter()
+            purged: Dict[str, int] = {}
+            for name, predicate in _PURGE_PASSES:
+                stmt, deleted = _purge_statement(predicate), 0
+                while True:
+                    n = (await db.execute(stmt, _purge_params(PURGE_BATCH))).rowcount
+                    deleted += n
+                    if n < PURGE_BATCH:
+                        break
+                purged[name] = deleted
+            out["purge"] = {**purged, "seconds": round(time.perf_counter() - started, 2)}
+            return out
+        finally:
+            recent.clear()
+            await db.rollback()
+
+
+def bench(n_tokens: int = 1_000_000, runs: int = 500) -> Dict[str, Any]:
+    """
+    Seed n_tokens rows into a scratch copy of crm_token_details, then time
+    `runs` rotations (DB path), the same refreshes again inside the grace
+    window (LRU), replays after it (reuse detection + family revoke), the
+    revoked successors (DB, then LRU) and a full purge. A legacy unindexed user_id scan is timed for comparison.
+    Everything runs in one transaction that is rolled back at the end.
+    """
+    return asyncio.run(_bench(n_tokens, runs))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "purge":
+        print(json.dumps(purge(), indent=2))
+    elif cmd == "bench":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+        print(json.dumps(bench(n), indent=2))
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,500 @@
+# services/vbc_sync.py
+"""
+Incremental VBC call-log / company-recording sync into local tables
+(crm_vbc_call_logs, crm_vbc_call_recordings), plus an on-disk LRU cache
+for recording audio.
+
+The sync walks forward from a per-stream time cursor in bounded windows,
+pages each window, upserts by upstream id and matches rows to leads by
+normalized phone. Matched recordings also get a LeadRecording row so they
+show up in the lead's recordings list.
+
+Runs in outbox_worker.py (VBC_SYNC_ENABLED=1) or on demand via
+POST /vbc/index/sync. A Postgres advisory lock keeps it single-runner.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import VBC_ACCOUNT_ID, API_CLIENT_ID, API_CLIENT_SECRET
+from db.connection import SessionLocal, engine
+from db.models import (
+    Lead,
+    LeadRecording,
+    UserDetails,
+    VBCCallLog,
+    VBCCallRecording,
+    VBCSyncCursor,
+)
+from routes.VBC_Calling.vbc_client import AsyncVBCClient, VBCEnv, vbc_manager
+from utils.contact_keys import normalize_mobile, mobile_variants
+
+logger = logging.getLogger(__name__)
+
+SYNC_EMPLOYEE_CODE = os.getenv("VBC_SYNC_EMPLOYEE_CODE")  # user whose VBC creds can read company data
+SYNC_INTERVAL_SECONDS = int(os.getenv("VBC_SYNC_INTERVAL_SECONDS", "300"))
+BACKFILL_DAYS = int(os.getenv("VBC_SYNC_BACKFILL_DAYS", "7"))
+OVERLAP_SECONDS = 10 * 60          # re-read a little behind the cursor for late rows
+WINDOW = timedelta(days=1)         # max span requested per page walk
+PAGE_SIZE = 200
+ADVISORY_LOCK_KEY = 7_221_004      # arbitrary, constant across processes
+
+STREAM_CALL_LOGS = "call_logs"
+STREAM_RECORDINGS = "company_recordings"
+
+AUDIO_CACHE_DIR = os.getenv("VBC_AUDIO_CACHE_DIR", os.path.join(os.getcwd(), "vbc_audio_cache"))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("VBC_AUDIO_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# -----------------------------
+# Payload helpers
+# -----------------------------
+def _pick(d: Dict[str, Any], *keys: str) -> Any:
+    for k in keys:
+        v = d.get(k)
+        if v not in (None, ""):
+            return v
+    return None
+
+
+def _extract_items(resp: Any) -> List[Dict[str, Any]]:
+    """VBC list endpoints wrap items differently; find the list."""
+    if isinstance(resp, list):
+        return resp
+    if not isinstance(resp, dict):
+        return []
+    emb = resp.get("_embedded")
+    if isinstance(emb, dict):
+        for v in emb.values():
+            if isinstance(v, list):
+                return v
+    for k in ("items", "data", "records", "recordings", "call_logs", "results"):
+        if isinstance(resp.get(k), list):
+            return resp[k]
+    return []
+
+
+def _parse_dt(val: Any) -> Optional[datetime]:
+    if val in (None, ""):
+        return None
+    if isinstance(val, (int, float)):
+        ts = val / 1000 if val > 10_000_000_000 else val
+        return datetime.fromtimestamp(ts, tz=timezone.utc)
+    s = str(val).replace("Z", "+00:00").replace(" ", "T", 1)
+    try:
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _as_int(val: Any) -> Optional[int]:
+    try:
+        return int(float(val))
+    except (TypeError, ValueError):
+        return None
+
+
+def _customer_number(direction: Optional[str], from_no: Optional[str], to_no: Optional[str]) -> Optional[str]:
+    d = (direction or "").upper()
+    if d.startswith("IN"):
+        return normalize_mobile(from_no)
+    return normalize_mobile(to_no) or normalize_mobile(from_no)
+
+
+def _recording_row(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    rec_id = _pick(item, "id", "recording_id")
+    if rec_id is None:
+        return None
+    direction = _pick(item, "call_direction", "direction")
+    caller_id = _pick(item, "caller_id", "from")
+    dnis = _pick(item, "dnis", "to")
+    return {
+        "recording_id": str(rec_id),
+        "call_id": str(_pick(item, "call_id") or "") or None,
+        "direction": direction,
+        "caller_id": caller_id,
+        "dnis": dnis,
+        "cnam": _pick(item, "cnam"),
+        "norm_phone": _customer_number(direction, caller_id, dnis),
+        "extension": str(_pick(item, "extension") or "") or None,
+        "start_time": _parse_dt(_pick(item, "start", "start_time")),
+        "duration": _as_int(_pick(item, "duration")),
+        "raw": item,
+    }
+
+
+def _call_log_row(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    vbc_id = _pick(item, "id", "call_id", "uuid")
+    if vbc_id is None:
+        return None
+    direction = _pick(item, "direction", "call_direction")
+    from_no = _pick(item, "from", "caller_id", "from_number")
+    to_no = _pick(item, "to", "dnis", "to_number", "dialed_number")
+    if isinstance(from_no, dict):
+        from_no = _pick(from_no, "number", "destination")
+    if isinstance(to_no, dict):
+        to_no = _pick(to_no, "number", "destination")
+    return {
+        "vbc_id": str(vbc_id),
+        "direction": direction,
+        "from_number": from_no,
+        "to_number": to_no,
+        "norm_phone": _customer_number(direction, from_no, to_no),
+        "extension": str(_pick(item, "extension") or "") or None,
+        "start_time": _parse_dt(_pick(item, "start", "start_time")),
+        "duration": _as_int(_pick(item, "duration", "length")),
+        "result": _pick(item, "result", "status", "disposition"),
+        "raw": item,
+    }
+
+
+# -----------------------------
+# DB side (sync; called via asyncio.to_thread)
+# -----------------------------
+def _load_cursor(name: str) -> Optional[datetime]:
+    db = SessionLocal()
+    try:
+        cur = db.get(VBCSyncCursor, name)
+        return cur.synced_until if cur else None
+    finally:
+        db.close()
+
+
+def _save_cursor(name: str, until: Optional[datetime], rows: int, error: Optional[str] = None) -> None:
+    db = SessionLocal()
+    try:
+        cur = db.get(VBCSyncCursor, name)
+        if cur is None:
+            cur = VBCSyncCursor(name=name, rows_synced=0)
+            db.add(cur)
+        if until is not None:
+            cur.synced_until = until
+        cur.last_run_at = utcnow()
+        cur.last_error = error
+        cur.rows_synced = (cur.rows_synced or 0) + rows
+        db.commit()
+    finally:
+        db.close()
+
+
+def _resolve_links(db, rows: List[Dict[str, Any]]) -> None:
+    """Fill employee_code (by extension) and lead_id (by normalized phone)."""
+    exts = {r["extension"] for r in rows if r.get("extension")}
+    ext_map: Dict[str, str] = {}
+    if exts:
+        for code, ext in (
+            db.query(UserDetails.employee_code, UserDetails.vbc_extension_id)
+            .filter(UserDetails.vbc_extension_id.in_(exts))
+            .all()
+        ):
+            ext_map[str(ext)] = code
+
+    phones = {r["norm_phone"] for r in rows if r.get("norm_phone")}
+    lead_map: Dict[str, int] = {}
+    if phones:
+        spellings = [v for p in phones for v in mobile_variants(p)]
+        for lead_id, mobile in (
+            db.query(Lead.id, Lead.mobile)
+            .filter(Lead.mobile.in_(spellings), Lead.is_delete.isnot(True))
+            .order_by(Lead.id)
+            .all()
+        ):
+            lead_map.setdefault(normalize_mobile(mobile), lead_id)
+
+    for r in rows:
+        r["employee_code"] = ext_map.get(r.get("extension") or "")
+        r["lead_id"] = lead_map.get(r.get("norm_phone") or "")
+
+
+def _upsert(model, key: str, rows: List[Dict[str, Any]]) -> int:
+    if not rows:
+        return 0
+    db = SessionLocal()
+    try:
+        _resolve_links(db, rows)
+        stmt = pg_insert(model).values(rows)
+        update_cols = {c: stmt.excluded[c] for c in rows[0].keys() if c != key}
+        update_cols["synced_at"] = text("now()")
+        db.execute(stmt.on_conflict_do_update(index_elements=[key], set_=update_cols))
+
+        if model is VBCCallRecording:
+            _link_lead_recordings(db, [r["recording_id"] for r in rows if r.get("lead_id")])
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _link_lead_recordings(db, recording_ids: List[str]) -> None:
+    """Create LeadRecording rows for newly matched recordings (once)."""
+    if not recording_ids:
+        return
+    pending = (
+        db.query(VBCCallRecording)
+        .filter(
+            VBCCallRecording.recording_id.in_(recording_ids),
+            VBCCallRecording.lead_id.isnot(None),
+            VBCCallRecording.lead_recording_id.is_(None),
+        )
+        .all()
+    )
+    for rec in pending:
+        lr = LeadRecording(
+            lead_id=rec.lead_id,
+            employee_code=rec.employee_code,
+            recording_url=f"/api/v1/vbc/cr/audio/{rec.recording_id}",
+        )
+        db.add(lr)
+        db.flush()
+        rec.lead_recording_id = lr.id
+
+
+def _try_lock(conn) -> bool:
+    return bool(conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY}).scalar())
+
+
+def _sync_client_env() -> Tuple[str, VBCEnv, Optional[str]]:
+    if not SYNC_EMPLOYEE_CODE:
+        raise RuntimeError("VBC_SYNC_EMPLOYEE_CODE is not set")
+    db = SessionLocal()
+    try:
+        user = db.get(UserDetails, SYNC_EMPLOYEE_CODE)
+        if not user or not user.vbc_user_username or not user.vbc_user_password:
+            raise RuntimeError(f"Missing VBC creds in DB for {SYNC_EMPLOYEE_CODE}")
+        env = VBCEnv(
+            account_id=VBC_ACCOUNT_ID,
+            vbc_user_username=user.vbc_user_username,
+            vbc_user_password=user.vbc_user_password,
+            client_id=API_CLIENT_ID,
+            client_secret=API_CLIENT_SECRET,
+        )
+        return user.employee_code, env, user.vbc_extension_id
+    finally:
+        db.close()
+
+
+# -----------------------------
+# Sync engine
+# -----------------------------
+def _iso_z(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _report_ts(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+async def _pages(fetch, start: datetime, end: datetime) -> AsyncIterator[List[Dict[str, Any]]]:
+    page = 1
+    while True:
+        items = _extract_items(await fetch(start, end, page))
+        if items:
+            yield items
+        if len(items) < PAGE_SIZE:
+            return
+        page += 1
+
+
+async def _sync_stream(client: AsyncVBCClient, name: str) -> int:
+    if name == STREAM_RECORDINGS:
+        model, key, to_row = VBCCallRecording, "recording_id", _recording_row
+
+        async def fetch(s, e, page):
+            return await client.cr_company_list(
+                start_gte=_iso_z(s), start_lte=_iso_z(e), page_size=PAGE_SIZE, page=page, order="start:ASC"
+            )
+    else:
+        model, key, to_row = VBCCallLog, "vbc_id", _call_log_row
+
+        async def fetch(s, e, page):
+            return await client.reports_call_logs(
+                start_gte=_report_ts(s), start_lte=_report_ts(e), page_size=PAGE_SIZE, page=page
+            )
+
+    cursor = await asyncio.to_thread(_load_cursor, name)
+    now = utcnow()
+    start = (cursor - timedelta(seconds=OVERLAP_SECONDS)) if cursor else now - timedelta(days=BACKFILL_DAYS)
+
+    total = 0
+    while start < now:
+        end = min(start + WINDOW, now)
+        window_rows = 0
+        async for items in _pages(fetch, start, end):
+            rows = [r for r in (to_row(i) for i in items) if r]
+            # de-dupe within the page so ON CONFLICT sees each key once
+            rows = list({r[key]: r for r in rows}.values())
+            window_rows += await asyncio.to_thread(_upsert, model, key, rows)
+        total += window_rows
+        # advance the cursor per window so a failure resumes where it stopped
+        await asyncio.to_thread(_save_cursor, name, end, window_rows)
+        start = end
+    return total
+
+
+async def run_sync_once() -> Dict[str, Any]:
+    """One incremental pass over both streams (no-op if another runner holds the lock)."""
+    conn = await asyncio.to_thread(engine.connect)
+    try:
+        if not await asyncio.to_thread(_try_lock, conn):
+            return {"skipped": "another sync is running"}
+        try:
+            code, env, ext = await asyncio.to_thread(_sync_client_env)
+            client = await vbc_manager.for_user(code, env, extension=ext)
+            result: Dict[str, Any] = {}
+            for name in (STREAM_RECORDINGS, STREAM_CALL_LOGS):
+                started = time.monotonic()
+                try:
+                    result[name] = {"rows": await _sync_stream(client, name)}
+                except Exception as e:
+                    logger.error("[vbc-sync] %s failed: %s", name, e)
+                    await asyncio.to_thread(_save_cursor, name, None, 0, repr(e))
+                    result[name] = {"error": str(e)}
+                result[name]["ms"] = int((time.monotonic() - started) * 1000)
+            return result
+        finally:
+            await asyncio.to_thread(
+                conn.execute, text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY}
+            )
+    finally:
+        await asyncio.to_thread(conn.close)
+
+
+def sync_status() -> List[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        return [
+            {
+                "name": c.name,
+                "synced_until": c.synced_until.isoformat() if c.synced_until else None,
+                "last_run_at": c.last_run_at.isoformat() if c.last_run_at else None,
+                "last_error": c.last_error,
+                "rows_synced": c.rows_synced,
+            }
+            for c in db.query(VBCSyncCursor).all()
+        ]
+    finally:
+        db.close()
+
+
+class VBCSyncLoop:
+    def __init__(self, interval: int = SYNC_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                result = await run_sync_once()
+                logger.info("[vbc-sync] %s", result)
+            except Exception as e:
+                logger.error("[vbc-sync] pass failed: %s", e)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# -----------------------------
+# Audio cache (disk, LRU by mtime, size-capped)
+# -----------------------------
+class AudioCache:
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def path_for(self, recording_id: str) -> str:
+        safe = "".join(ch for ch in recording_id if ch.isalnum() or ch in "-_")
+        return os.path.join(self.directory, f"{safe}.bin")
+
+    def hit(self, recording_id: str) -> Optional[str]:
+        p = self.path_for(recording_id)
+        if os.path.exists(p):
+            try:
+                os.utime(p, None)  # LRU touch
+            except OSError:
+                pass
+            return p
+        return None
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            p = os.path.join(self.directory, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, p in sorted(entries):
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                pass
+            if total <= self.max_bytes:
+                break
+
+    async def stream_and_cache(self, recording_id: str, source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Pass chunks through to the client while writing them to a temp file;
+        the file is only published (renamed) when the download completes.
+        """
+        final = self.path_for(recording_id)
+        tmp = f"{final}.{uuid.uuid4().hex}.part"
+        f = await asyncio.to_thread(open, tmp, "wb")
+        ok = False
+        try:
+            async for chunk in source:
+                await asyncio.to_thread(f.write, chunk)
+                yield chunk
+            ok = True
+        finally:
+            await asyncio.to_thread(f.close)
+            if ok:
+                await asyncio.to_thread(os.replace, tmp, final)
+                await asyncio.to_thread(self._evict)
+            else:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+
+audio_cache = AudioCache()
+vbc_sync_loop = VBCSyncLoop()
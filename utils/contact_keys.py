@@ -0,0 +1,70 @@
+# utils/contact_keys.py
+"""
+Normalized contact keys shared by matching / dedup code.
+
+    email  -> stripped, lowercased
+    mobile -> digits only, 91 / 0 prefix stripped
+    pan    -> stripped, uppercased
+"""
+import re
+from typing import Any, Dict, List, Mapping, Optional
+
+_NON_DIGIT = re.compile(r"\D+")
+
+KIND_EMAIL = "email"
+KIND_MOBILE = "mobile"
+KIND_PAN = "pan"
+
+# model attribute -> key kind
+LEAD_KEY_FIELDS = {"email": KIND_EMAIL, "mobile": KIND_MOBILE, "alternate_mobile": KIND_MOBILE, "pan": KIND_PAN}
+USER_KEY_FIELDS = {"email": KIND_EMAIL, "phone_number": KIND_MOBILE, "pan": KIND_PAN}
+
+
+def normalize_mobile(num: Optional[str]) -> Optional[str]:
+    """
+    Digits only, country code / trunk prefix stripped:
+      '+91 98765-43210' -> '9876543210', '09876543210' -> '9876543210'
+    Returns None when nothing usable is left.
+    """
+    digits = _NON_DIGIT.sub("", num or "")
+    if len(digits) == 12 and digits.startswith("91"):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith("0"):
+        digits = digits[1:]
+    return digits or None
+
+
+def mobile_variants(norm: str) -> List[str]:
+    """Stored spellings a normalized 10-digit mobile may appear as."""
+    return [norm, f"91{norm}", f"+91{norm}", f"0{norm}"]
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    email = (email or "").strip().lower()
+    return email or None
+
+
+def normalize_pan(pan: Optional[str]) -> Optional[str]:
+    pan = (pan or "").strip().upper()
+    return pan or None
+
+
+_NORMALIZERS = {KIND_EMAIL: normalize_email, KIND_MOBILE: normalize_mobile, KIND_PAN: normalize_pan}
+
+
+def contact_key(kind: str, raw: Any) -> Optional[str]:
+    return _NORMALIZERS[kind](None if raw is None else str(raw))
+
+
+def key_rows(values: Mapping[str, Any], fields: Mapping[str, str], **owner: Any) -> List[Dict[str, Any]]:
+    """
+    crm_contact_keys rows for one lead/user. `fields` is LEAD_KEY_FIELDS or
+    USER_KEY_FIELDS (restricted to what changed); `owner` is lead_id=... or
+    employee_code=....
+    """
+    rows = []
+    for field, kind in fields.items():
+        value = contact_key(kind, values.get(field))
+        if value:
+            rows.append({"kind": kind, "value": value, "field": field, **owner})
+    return rows
@@ -0,0 +1,119 @@
+# utils/loadtest.py
+"""
+Closed-loop HTTP load test: N concurrent clients hammer each path for a
+fixed time; prints throughput and latency percentiles per path so the
+sync and async DB stacks can be compared side by side.
+
+    LOADTEST_PROBES=1 uvicorn main:app ...
+    python -m utils.loadtest --base-url http://localhost:8000 --concurrency 500 --duration 30
+    python -m utils.loadtest --token <jwt> /api/v1/clients/ /api/v1/leads/
+    python -m utils.loadtest --concurrency 200 --form username=<phone> --form password=<pw> /api/v1/auth/login
+
+--form switches to form-encoded POSTs with the given fields.
+
+With no paths, runs the three /debug/db-probe/* endpoints (same query via
+async route + sync session, def route in the threadpool, AsyncSession).
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/api/v1/debug/db-probe/blocking",
+    "/api/v1/debug/db-probe/threadpool",
+    "/api/v1/debug/db-probe/async",
+]
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def run_path(
+    client: httpx.AsyncClient, path: str, *, concurrency: int, duration: float, warmup: float,
+    form: Optional[Dict[str, str]] = None,
+) -> Dict[str, object]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    measuring = False
+    deadline = time.perf_counter() + warmup + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                r = await (client.post(path, data=form) if form else client.get(path))
+                key = None if r.status_code < 400 else str(r.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            if not measuring:
+                continue
+            if key is None:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[key] = errors.get(key, 0) + 1
+
+    tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await asyncio.sleep(warmup)
+    measuring = True
+    measured_from = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - measured_from
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 1)
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(_percentile(latencies, 50)),
+        "p95_ms": ms(_percentile(latencies, 95)),
+        "p99_ms": ms(_percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+async def main(
+    base_url: str, paths: List[str], *, concurrency: int, duration: float, warmup: float, token: Optional[str],
+    form: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, object]]:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60.0) as client:
+        for path in paths:
+            results.append(
+                await run_path(client, path, concurrency=concurrency, duration=duration, warmup=warmup, form=form)
+            )
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="*", default=DEFAULT_PATHS)
+    ap.add_argument("--base-url", default="http://localhost:8000")
+    ap.add_argument("--concurrency", type=int, default=500)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--token", default=None)
+    ap.add_argument("--form", action="append", default=[], metavar="KEY=VALUE")
+    args = ap.parse_args()
+
+    out = asyncio.run(main(
+        args.base_url, args.paths,
+        concurrency=args.concurrency, duration=args.duration, warmup=args.warmup, token=args.token,
+        form=dict(f.split("=", 1) for f in args.form) or None,
+    ))
+    print(f"{'path':45} {'rps':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for r in out:
+        print(f"{r['path']:45} {r['rps']:>9} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {sum(r['errors'].values()):>7}")
+    print(json.dumps(out, indent=2))
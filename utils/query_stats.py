@@ -0,0 +1,271 @@
+# utils/query_stats.py
+"""
+Per-request SQL statement accounting.
+
+Engine events count every statement executed while a request is in flight
+(sync routes run in the threadpool with a copy of the request context, so
+the counters follow them). For each request we keep:
+
+  - statement count and total DB time
+  - fingerprints (SQL with parameters/IN-lists collapsed) seen more than
+    once -> the usual N+1 signature
+
+QueryStatsMiddleware adds X-DB-Queries / X-DB-Time-Ms / X-DB-Repeated
+headers, logs one structured line per request with at least
+QUERY_STATS_LOG_MIN_QUERIES statements (or over budget) and folds the numbers into
+a per-route report (GET /api/v1/debug/query-stats).
+
+Budgets: declare one on a route with
+    dependencies=[Depends(query_budget(20))]
+(or QUERY_STATS_DEFAULT_BUDGET for all routes). Over-budget requests log a
+warning; with QUERY_STATS_STRICT=1 (test runs) the middleware raises
+QueryBudgetExceeded so the test client call fails.
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("db.query_stats")
+
+ENABLED = os.getenv("QUERY_STATS_ENABLED", "1") == "1"
+STRICT = os.getenv("QUERY_STATS_STRICT", "0") == "1"
+DEFAULT_BUDGET = int(os.getenv("QUERY_STATS_DEFAULT_BUDGET", "0")) or None
+LOG_MIN_QUERIES = int(os.getenv("QUERY_STATS_LOG_MIN_QUERIES", "10"))
+TOP_FINGERPRINTS = 5
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# -----------------------------
+# Fingerprints
+# -----------------------------
+_IN_LIST = re.compile(r"\(\s*(?:%\([^)]*\)s|\?|\$\d+)(?:\s*,\s*(?:%\([^)]*\)s|\?|\$\d+))*\s*\)")
+_PARAM = re.compile(r"%\([^)]*\)s|\$\d+")
+_NUMBER = re.compile(r"\b\d+\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    s = _STRING.sub("?", statement)
+    s = _IN_LIST.sub("(?)", s)
+    s = _PARAM.sub("?", s)
+    s = _NUMBER.sub("N", s)
+    return _SPACE.sub(" ", s).strip()
+
+
+def fingerprint(statement: str) -> str:
+    return hashlib.sha1(normalize_sql(statement).encode()).hexdigest()[:12]
+
+
+# -----------------------------
+# Per-request stats
+# -----------------------------
+class RequestStats:
+    __slots__ = ("count", "db_seconds", "fingerprints", "samples", "budget", "_lock")
+
+    def __init__(self, budget: Optional[int] = DEFAULT_BUDGET):
+        self.count = 0
+        self.db_seconds = 0.0
+        self.fingerprints: Counter = Counter()
+        self.samples: Dict[str, str] = {}
+        self.budget = budget
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float) -> None:
+        fp = fingerprint(statement)
+        with self._lock:
+            self.count += 1
+            self.db_seconds += seconds
+            self.fingerprints[fp] += 1
+            if fp not in self.samples:
+                self.samples[fp] = normalize_sql(statement)[:300]
+
+    def repeated(self) -> List[Dict[str, Any]]:
+        return [
+            {"fingerprint": fp, "count": n, "sql": self.samples[fp]}
+            for fp, n in self.fingerprints.most_common(TOP_FINGERPRINTS)
+            if n > 1
+        ]
+
+    @property
+    def max_repeat(self) -> int:
+        return max(self.fingerprints.values(), default=0)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def query_budget(max_statements: int):
+    """Route dependency: fail/warn when the request runs more statements."""
+    def _set_budget() -> None:
+        stats = _current.get()
+        if stats is not None:
+            stats.budget = max_statements
+    return _set_budget
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_stats_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    starts = conn.info.get("query_stats_start")
+    if not starts:
+        return
+    stats.record(statement, time.perf_counter() - starts.pop())
+
+
+# -----------------------------
+# Per-route aggregate
+# -----------------------------
+class RouteReport:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, route: str, stats: RequestStats) -> None:
+        with self._lock:
+            r = self._routes.get(route)
+            if r is None:
+                r = self._routes[route] = {
+                    "requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0, "max_db_ms": 0.0,
+                    "over_budget": 0, "budget": None, "repeated": Counter(), "samples": {},
+                }
+            db_ms = stats.db_seconds * 1000
+            r["requests"] += 1
+            r["queries"] += stats.count
+            r["max_queries"] = max(r["max_queries"], stats.count)
+            r["db_ms"] += db_ms
+            r["max_db_ms"] = max(r["max_db_ms"], db_ms)
+            r["budget"] = stats.budget
+            if stats.over_budget:
+                r["over_budget"] += 1
+            for fp, n in stats.fingerprints.items():
+                if n > 1:
+                    r["repeated"][fp] += n
+                    r["samples"].setdefault(fp, stats.samples[fp])
+
+    def snapshot(self, sort: str = "queries") -> List[Dict[str, Any]]:
+        with self._lock:
+            out = []
+            for route, r in self._routes.items():
+                n = r["requests"]
+                out.append({
+                    "route": route,
+                    "requests": n,
+                    "avg_queries": round(r["queries"] / n, 2),
+                    "max_queries": r["max_queries"],
+                    "avg_db_ms": round(r["db_ms"] / n, 2),
+                    "max_db_ms": round(r["max_db_ms"], 2),
+                    "budget": r["budget"],
+                    "over_budget": r["over_budget"],
+                    "repeated": [
+                        {"fingerprint": fp, "count": c, "sql": r["samples"][fp]}
+                        for fp, c in r["repeated"].most_common(TOP_FINGERPRINTS)
+                    ],
+                })
+        key = {"queries": "avg_queries", "db_ms": "avg_db_ms", "requests": "requests"}.get(sort, "avg_queries")
+        out.sort(key=lambda x: x[key], reverse=True)
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+route_report = RouteReport()
+
+
+# -----------------------------
+# Middleware
+# -----------------------------
+def _route_name(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}"
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware (keeps streaming responses streaming)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_headers(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.count).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.db_seconds * 1000:.1f}".encode()))
+                headers.append((b"x-db-repeated", str(stats.max_repeat).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            self._finish(scope, stats, status_code, time.perf_counter() - started)
+
+    def _finish(self, scope, stats: RequestStats, status_code: int, seconds: float) -> None:
+        if stats.count == 0:
+            return
+        route = _route_name(scope)
+        route_report.add(route, stats)
+
+        if stats.count >= LOG_MIN_QUERIES or stats.over_budget:
+            record = {
+                "route": route,
+                "status": status_code,
+                "queries": stats.count,
+                "db_ms": round(stats.db_seconds * 1000, 1),
+                "total_ms": round(seconds * 1000, 1),
+                "budget": stats.budget,
+                "repeated": stats.repeated(),
+            }
+            level = logging.WARNING if stats.over_budget else logging.INFO
+            logger.log(level, "query_stats %s", json.dumps(record))
+
+        if stats.over_budget and STRICT:
+            raise QueryBudgetExceeded(
+                f"{route} ran {stats.count} statements (budget {stats.budget}); "
+                f"top repeats: {stats.repeated()}"
+            )
@@ -0,0 +1,252 @@
+# utils/serializers.py
+"""
+Fast row -> dict serialization for list endpoints.
+
+List routes select only the output columns (query.with_entities(*s.columns))
+and turn the row tuples into dicts with RowSerializer; converters are
+resolved once per serializer, not per row. The dicts go straight to
+ORJSONResponse, skipping a second pydantic validation pass.
+
+    python -m utils.serializers bench [rows]
+"""
+
+import decimal
+import json
+import uuid
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+
+from db.models import Lead, Payment
+
+
+def _orjson_default(obj: Any) -> Any:
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(_ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+
+# -----------------------------
+# Converters
+# -----------------------------
+def segment_list(v: Any) -> Optional[List[Any]]:
+    """Lead.segment is JSONB now; tolerate legacy JSON-text values."""
+    if v is None or isinstance(v, list):
+        return v
+    if isinstance(v, str):
+        try:
+            parsed = json.loads(v)
+        except json.JSONDecodeError:
+            return [v] if v.strip() else None
+        return parsed if isinstance(parsed, list) else [parsed]
+    return [v]
+
+
+def service_text(v: Any) -> Any:
+    """Payment.Service ARRAY -> 'A, B' (same rules as PaymentOut.normalize_service)."""
+    if isinstance(v, list):
+        if all(isinstance(c, str) and len(c) == 1 for c in v):
+            return "".join(v)
+        return ", ".join(str(item) for item in v)
+    return v
+
+
+def json_text(v: Any) -> Optional[str]:
+    """JSON value -> its JSON text (for response fields that stayed strings)."""
+    return None if v is None else json.dumps(v)
+
+
+def upper_or_none(v: Any) -> Any:
+    return v.upper() if isinstance(v, str) else v
+
+
+def invoice_text(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    return str(v)
+
+
+# -----------------------------
+# Row serializer
+# -----------------------------
+Field = Tuple[str, Any, Optional[Callable[[Any], Any]]]  # (output key, column, converter)
+
+
+class RowSerializer:
+    def __init__(self, fields: Sequence[Field], *, required: Iterable[str] = ()):
+        self.names: Tuple[str, ...] = tuple(f[0] for f in fields)
+        self.columns: List[Any] = [f[1] for f in fields]
+        self._converters = [(i, f[0], f[2]) for i, f in enumerate(fields) if f[2] is not None]
+        self._required = [self.names.index(n) for n in required]
+
+    def one(self, row: Sequence[Any]) -> Optional[Dict[str, Any]]:
+        for i in self._required:
+            if row[i] is None:
+                return None
+        d = dict(zip(self.names, row))
+        for i, name, fn in self._converters:
+            d[name] = fn(row[i])
+        return d
+
+    def many(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        one = self.one
+        out = []
+        for row in rows:
+            d = one(row)
+            if d is not None:
+                out.append(d)
+        return out
+
+    def with_columns(self, *extra: Any) -> List[Any]:
+        return self.columns + list(extra)
+
+
+# Same keys as routes.leads.leads.LeadOut (and globel_search.LeadOut)
+LEAD_OUT = RowSerializer(
+    [
+        ("id", Lead.id, None),
+        ("full_name", Lead.full_name, None),
+        ("director_name", Lead.director_name, None),
+        ("father_name", Lead.father_name, None),
+        ("gender", Lead.gender, None),
+        ("marital_status", Lead.marital_status, None),
+        ("email", Lead.email, None),
+        ("mobile", Lead.mobile, None),
+        ("alternate_mobile", Lead.alternate_mobile, None),
+        ("aadhaar", Lead.aadhaar, None),
+        ("pan", Lead.pan, None),
+        ("gstin", Lead.gstin, None),
+        ("state", Lead.state, None),
+        ("city", Lead.city, None),
+        ("district", Lead.district, None),
+        ("address", Lead.address, None),
+        ("pincode", Lead.pincode, None),
+        ("country", Lead.country, None),
+        ("dob", Lead.dob, None),
+        ("occupation", Lead.occupation, None),
+        ("segment", Lead.segment, segment_list),
+        ("experience", Lead.experience, None),
+        ("investment", Lead.investment, None),
+        ("ft_service_type", Lead.ft_service_type, None),
+        ("lead_response_id", Lead.lead_response_id, None),
+        ("lead_source_id", Lead.lead_source_id, None),
+        ("branch_id", Lead.branch_id, None),
+        ("created_by", Lead.created_by, None),
+        ("created_by_name", Lead.created_by_name, None),
+        ("aadhar_front_pic", Lead.aadhar_front_pic, None),
+        ("aadhar_back_pic", Lead.aadhar_back_pic, None),
+        ("pan_pic", Lead.pan_pic, None),
+        ("kyc", Lead.kyc, None),
+        ("kyc_id", Lead.kyc_id, None),
+        ("is_old_lead", Lead.is_old_lead, None),
+        ("call_back_date", Lead.call_back_date, None),
+        ("lead_status", Lead.lead_status, None),
+        ("ft_to_date", Lead.ft_to_date, None),
+        ("ft_from_date", Lead.ft_from_date, None),
+        ("is_client", Lead.is_client, None),
+        ("assigned_to_user", Lead.assigned_to_user, None),
+        ("response_changed_at", Lead.response_changed_at, None),
+        ("assigned_for_conversion", Lead.assigned_for_conversion, None),
+        ("conversion_deadline", Lead.conversion_deadline, None),
+        ("created_at", Lead.created_at, None),
+    ]
+)
+
+
+# Same keys/rules as db.Schema.payment.PaymentOut minus the raised_by_* extras;
+# rows PaymentOut would reject (missing required values) are dropped.
+PAYMENT_OUT = RowSerializer(
+    [
+        ("id", Payment.id, None),
+        ("name", Payment.name, None),
+        ("email", Payment.email, None),
+        ("phone_number", Payment.phone_number, None),
+        ("order_id", Payment.order_id, None),
+        ("Service", Payment.Service, service_text),
+        ("paid_amount", Payment.paid_amount, None),
+        ("call", Payment.call, None),
+        ("duration_day", Payment.duration_day, None),
+        ("plan", Payment.plan, None),
+        ("status", Payment.status, upper_or_none),
+        ("mode", Payment.mode, None),
+        ("is_send_invoice", Payment.is_send_invoice, None),
+        ("description", Payment.description, None),
+        ("transaction_id", Payment.transaction_id, None),
+        ("user_id", Payment.user_id, None),
+        ("branch_id", Payment.branch_id, None),
+        ("lead_id", Payment.lead_id, None),
+        ("created_at", Payment.created_at, None),
+        ("updated_at", Payment.updated_at, None),
+        ("invoice", Payment.invoice, invoice_text),
+    ],
+    required=("phone_number", "order_id", "Service", "paid_amount", "call", "plan",
+              "status", "mode", "is_send_invoice", "created_at", "updated_at"),
+)
+
+
+# -----------------------------
+# Microbenchmark
+# -----------------------------
+def _bench(n: int = 500, repeat: int = 20) -> Dict[str, Any]:
+    import time
+    from routes.leads.leads import LeadOut, LeadsListResponse, safe_convert_lead_to_dict
+
+    now = datetime.now()
+    values = {
+        "id": 1, "full_name": "Ravi Kumar", "father_name": "Suresh Kumar", "gender": "MALE",
+        "email": "ravi.kumar@example.com", "mobile": "9876543210", "pan": "ABCDE1234F",
+        "state": "Madhya Pradesh", "city": "Indore", "address": "12, MG Road", "pincode": "452001",
+        "country": "India", "dob": date(1990, 1, 1), "occupation": "Business",
+        "segment": ["Equity", "F&O"], "lead_response_id": 3, "lead_source_id": 2, "branch_id": 1,
+        "created_by": "EMP001", "kyc": False, "is_old_lead": False, "is_client": False,
+        "assigned_to_user": "EMP002", "created_at": now, "response_changed_at": now,
+    }
+    legacy_values = dict(values, segment=json.dumps(values["segment"]))
+
+    leads = [Lead(**dict(legacy_values, id=i)) for i in range(n)]
+    rows = [tuple(dict(values, id=i).get(k) for k in LEAD_OUT.names) for i in range(n)]
+
+    def old_path() -> bytes:
+        out = [LeadOut(**safe_convert_lead_to_dict(l)) for l in leads]
+        return LeadsListResponse(leads=out, filters=None).model_dump_json().encode()
+
+    def new_path() -> bytes:
+        return ORJSONResponse({"leads": LEAD_OUT.many(rows), "filters": None}).body
+
+    result: Dict[str, Any] = {"rows_per_call": n, "repeat": repeat}
+    for name, fn in (("orm+LeadOut+pydantic_json", old_path), ("projected+RowSerializer+orjson", new_path)):
+        fn()  # warm up
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        elapsed = time.perf_counter() - started
+        result[name] = {"rows_per_sec": int(n * repeat / elapsed), "ms_per_call": round(elapsed / repeat * 1000, 3)}
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        rows = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        print(json.dumps(_bench(rows), indent=2))
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,104 @@
+# utils/startup_profile.py
+"""
+Boot timing report: per-import and per-step wall time plus RSS.
+
+main.py wraps its top-level imports in startup_profile.imports() and each
+lifespan step in startup_profile.step(name); the report is logged once the
+app is up. STARTUP_PROFILE=0 turns it off; STARTUP_PROFILE_TOP limits how
+many imports are listed (slowest first).
+"""
+
+import builtins
+import logging
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("startup")
+
+ENABLED = os.getenv("STARTUP_PROFILE", "1") == "1"
+TOP_IMPORTS = int(os.getenv("STARTUP_PROFILE_TOP", "15"))
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+
+
+def rss_mb() -> float:
+    """Current RSS (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_KB / 1024
+    except (OSError, IndexError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rss_at_start = rss_mb()
+        self.import_times: List[Tuple[str, float, float]] = []  # (module, ms, rss delta MB)
+        self.steps: List[Tuple[str, float, float]] = []         # (step, ms, rss after MB)
+        self._imports_ms = 0.0
+
+    @contextmanager
+    def imports(self):
+        """Time each import statement made directly inside the block (inclusive)."""
+        if not ENABLED:
+            yield
+            return
+        real_import = builtins.__import__
+        depth = 0
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            nonlocal depth
+            if depth or (name in sys.modules and not fromlist):
+                return real_import(name, globals, locals, fromlist, level)
+            depth += 1
+            rss_before, t0 = rss_mb(), time.perf_counter()
+            try:
+                return real_import(name, globals, locals, fromlist, level)
+            finally:
+                depth -= 1
+                label = f"{name}[{', '.join(fromlist)}]" if fromlist else name
+                self.import_times.append((label, (time.perf_counter() - t0) * 1000, rss_mb() - rss_before))
+
+        t0 = time.perf_counter()
+        builtins.__import__ = timed_import
+        try:
+            yield
+        finally:
+            builtins.__import__ = real_import
+            self._imports_ms += (time.perf_counter() - t0) * 1000
+
+    @contextmanager
+    def step(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, (time.perf_counter() - t0) * 1000, rss_mb()))
+
+    def report(self, top: Optional[int] = TOP_IMPORTS) -> str:
+        total_ms = (time.perf_counter() - self.started) * 1000
+        lines = [
+            f"startup: {total_ms:.0f} ms total, imports {self._imports_ms:.0f} ms, "
+            f"RSS {self.rss_at_start:.1f} -> {rss_mb():.1f} MB"
+        ]
+        slow = sorted(self.import_times, key=lambda r: r[1], reverse=True)[:top]
+        if slow:
+            lines.append("  imports (slowest first):")
+            lines += [f"    {ms:8.1f} ms  {rss:+7.1f} MB  {name}" for name, ms, rss in slow]
+        if self.steps:
+            lines.append("  steps:")
+            lines += [f"    {ms:8.1f} ms  RSS {rss:7.1f} MB  {name}" for name, ms, rss in self.steps]
+        return "\n".join(lines)
+
+    def log(self) -> None:
+        if ENABLED:
+            logger.info(self.report())
+
+
+startup_profile = StartupProfile()
@@ -5,8 +5,8 @@ Comprehensive validation utilities for email, mobile, and PAN across UserDetails
 
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from db.models import UserDetails, Lead
+from db.contact_keys import ContactConflict, find_conflicts
+from utils.contact_keys import KIND_EMAIL, KIND_MOBILE, KIND_PAN, contact_key
 import re
 from typing import Optional, Dict, Any
 
@@ -20,201 +20,106 @@ class ValidationError(Exception):
 
 
 class UniquenessValidator:
-    """Handles uniqueness validation across UserDetails and Lead tables"""
-    
+    """
+    Handles uniqueness validation across UserDetails and Lead tables.
+
+    Lookups go through the normalized crm_contact_keys index (db.contact_keys):
+    all fields are checked in one query.
+    """
+
+    _LABELS = {KIND_EMAIL: "Email", KIND_MOBILE: "Mobile number", KIND_PAN: "PAN"}
+
     def __init__(self, db: Session):
         self.db = db
-    
+
+    @staticmethod
+    def _conflict_info(conflict: ContactConflict) -> Dict[str, Any]:
+        label = UniquenessValidator._LABELS[conflict.kind]
+        if conflict.is_user:
+            return {
+                "exists_in": "UserDetails",
+                "table": "crm_user_details",
+                "employee_code": conflict.employee_code,
+                "name": conflict.name,
+                "message": f"{label} already registered with employee {conflict.employee_code} ({conflict.name})"
+            }
+        info = {
+            "exists_in": "Lead",
+            "table": "crm_lead",
+            "lead_id": conflict.lead_id,
+            "name": conflict.name,
+            "message": f"{label} already exists in lead #{conflict.lead_id} ({conflict.name or 'No Name'})"
+        }
+        if conflict.kind == KIND_MOBILE:
+            mobile_type = "alternate" if conflict.field == "alternate_mobile" else "primary"
+            info["mobile_type"] = mobile_type
+            info["message"] += f" as {mobile_type} mobile"
+        return info
+
+    def find_all_conflicts(
+        self, data: Dict[str, Any], exclude_user_id: str = None, exclude_lead_id: int = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Check email, mobile/phone_number and PAN in one round trip.
+
+        Returns:
+            {kind: conflict info} for every kind that is already taken
+            (a user match wins over a lead match, like the per-field checks)
+        """
+        mobile_field = 'phone_number' if 'phone_number' in data else 'mobile'
+        keys = [
+            (KIND_EMAIL, contact_key(KIND_EMAIL, data.get('email'))),
+            (KIND_MOBILE, contact_key(KIND_MOBILE, data.get(mobile_field))),
+            (KIND_PAN, contact_key(KIND_PAN, data.get('pan'))),
+        ]
+        conflicts: Dict[str, Dict[str, Any]] = {}
+        for c in find_conflicts(self.db, keys, exclude_user_id=exclude_user_id, exclude_lead_id=exclude_lead_id):
+            conflicts.setdefault(c.kind, self._conflict_info(c))
+        return conflicts
+
     def check_email_uniqueness(self, email: str, exclude_user_id: str = None, exclude_lead_id: int = None) -> Dict[str, Any]:
         """
         Check if email is unique across UserDetails and Lead tables
-        
-        Args:
-            email: Email to check
-            exclude_user_id: Employee code to exclude from UserDetails check (for updates)
-            exclude_lead_id: Lead ID to exclude from Lead check (for updates)
-            
+
         Returns:
             Dict with conflict information if found, None if unique
         """
-        if not email or not email.strip():
-            return None
-            
-        email = email.strip().lower()
-        
-        # Check UserDetails table
-        user_query = self.db.query(UserDetails).filter(UserDetails.email.ilike(email))
-        if exclude_user_id:
-            user_query = user_query.filter(UserDetails.employee_code != exclude_user_id)
-        
-        existing_user = user_query.first()
-        if existing_user:
-            return {
-                "exists_in": "UserDetails",
-                "table": "crm_user_details", 
-                "employee_code": existing_user.employee_code,
-                "name": existing_user.name,
-                "message": f"Email already registered with employee {existing_user.employee_code} ({existing_user.name})"
-            }
-        
-        # Check Lead table
-        lead_query = self.db.query(Lead).filter(Lead.email.ilike(email))
-        if exclude_lead_id:
-            lead_query = lead_query.filter(Lead.id != exclude_lead_id)
-            
-        existing_lead = lead_query.first()
-        if existing_lead:
-            return {
-                "exists_in": "Lead",
-                "table": "crm_lead",
-                "lead_id": existing_lead.id,
-                "name": existing_lead.full_name,
-                "message": f"Email already exists in lead #{existing_lead.id} ({existing_lead.full_name or 'No Name'})"
-            }
-        
-        return None
-    
+        return self.find_all_conflicts({'email': email}, exclude_user_id, exclude_lead_id).get(KIND_EMAIL)
+
     def check_mobile_uniqueness(self, mobile: str, exclude_user_id: str = None, exclude_lead_id: int = None) -> Dict[str, Any]:
         """
-        Check if mobile is unique across UserDetails and Lead tables
-        
-        Args:
-            mobile: Mobile number to check
-            exclude_user_id: Employee code to exclude from UserDetails check (for updates)
-            exclude_lead_id: Lead ID to exclude from Lead check (for updates)
-            
+        Check if mobile is unique across UserDetails and Lead tables (lead
+        mobile and alternate_mobile)
+
         Returns:
             Dict with conflict information if found, None if unique
         """
-        if not mobile or not mobile.strip():
-            return None
-            
-        mobile = mobile.strip()
-        
-        # Check UserDetails table
-        user_query = self.db.query(UserDetails).filter(UserDetails.phone_number == mobile)
-        if exclude_user_id:
-            user_query = user_query.filter(UserDetails.employee_code != exclude_user_id)
-        
-        existing_user = user_query.first()
-        if existing_user:
-            return {
-                "exists_in": "UserDetails",
-                "table": "crm_user_details",
-                "employee_code": existing_user.employee_code,
-                "name": existing_user.name,
-                "message": f"Mobile number already registered with employee {existing_user.employee_code} ({existing_user.name})"
-            }
-        
-        # Check Lead table (both mobile and alternate_mobile)
-        lead_query = self.db.query(Lead).filter(
-            or_(Lead.mobile == mobile, Lead.alternate_mobile == mobile)
-        )
-        if exclude_lead_id:
-            lead_query = lead_query.filter(Lead.id != exclude_lead_id)
-            
-        existing_lead = lead_query.first()
-        if existing_lead:
-            mobile_type = "primary" if existing_lead.mobile == mobile else "alternate"
-            return {
-                "exists_in": "Lead",
-                "table": "crm_lead",
-                "lead_id": existing_lead.id,
-                "name": existing_lead.full_name,
-                "mobile_type": mobile_type,
-                "message": f"Mobile number already exists in lead #{existing_lead.id} ({existing_lead.full_name or 'No Name'}) as {mobile_type} mobile"
-            }
-        
-        return None
-    
+        return self.find_all_conflicts({'mobile': mobile}, exclude_user_id, exclude_lead_id).get(KIND_MOBILE)
+
     def check_pan_uniqueness(self, pan: str, exclude_user_id: str = None, exclude_lead_id: int = None) -> Dict[str, Any]:
         """
         Check if PAN is unique across UserDetails and Lead tables
-        
-        Args:
-            pan: PAN number to check
-            exclude_user_id: Employee code to exclude from UserDetails check (for updates)
-            exclude_lead_id: Lead ID to exclude from Lead check (for updates)
-            
+
         Returns:
             Dict with conflict information if found, None if unique
         """
-        if not pan or not pan.strip():
-            return None
-            
-        pan = pan.strip().upper()
-        
-        # Check UserDetails table
-        user_query = self.db.query(UserDetails).filter(UserDetails.pan == pan)
-        if exclude_user_id:
-            user_query = user_query.filter(UserDetails.employee_code != exclude_user_id)
-        
-        existing_user = user_query.first()
-        if existing_user:
-            return {
-                "exists_in": "UserDetails",
-                "table": "crm_user_details",
-                "employee_code": existing_user.employee_code,
-                "name": existing_user.name,
-                "message": f"PAN already registered with employee {existing_user.employee_code} ({existing_user.name})"
-            }
-        
-        # Check Lead table
-        lead_query = self.db.query(Lead).filter(Lead.pan == pan)
-        if exclude_lead_id:
-            lead_query = lead_query.filter(Lead.id != exclude_lead_id)
-            
-        existing_lead = lead_query.first()
-        if existing_lead:
-            return {
-                "exists_in": "Lead", 
-                "table": "crm_lead",
-                "lead_id": existing_lead.id,
-                "name": existing_lead.full_name,
-                "message": f"PAN already exists in lead #{existing_lead.id} ({existing_lead.full_name or 'No Name'})"
-            }
-        
-        return None
-    
+        return self.find_all_conflicts({'pan': pan}, exclude_user_id, exclude_lead_id).get(KIND_PAN)
+
     def validate_all_unique_fields(self, data: Dict[str, Any], exclude_user_id: str = None, exclude_lead_id: int = None) -> None:
         """
         Validate all unique fields (email, mobile, pan) at once
-        
+
         Args:
             data: Dictionary containing fields to validate
             exclude_user_id: Employee code to exclude from UserDetails check (for updates)
             exclude_lead_id: Lead ID to exclude from Lead check (for updates)
-            
+
         Raises:
             HTTPException: If any duplicate is found
         """
-        errors = []
-        
-        # Check email
-        if 'email' in data and data['email']:
-            email_conflict = self.check_email_uniqueness(
-                data['email'], exclude_user_id, exclude_lead_id
-            )
-            if email_conflict:
-                errors.append(email_conflict['message'])
-        
-        # Check mobile/phone_number
-        mobile_field = 'phone_number' if 'phone_number' in data else 'mobile'
-        if mobile_field in data and data[mobile_field]:
-            mobile_conflict = self.check_mobile_uniqueness(
-                data[mobile_field], exclude_user_id, exclude_lead_id
-            )
-            if mobile_conflict:
-                errors.append(mobile_conflict['message'])
-        
-        # Check PAN
-        if 'pan' in data and data['pan']:
-            pan_conflict = self.check_pan_uniqueness(
-                data['pan'], exclude_user_id, exclude_lead_id
-            )
-            if pan_conflict:
-                errors.append(pan_conflict['message'])
-        
+        conflicts = self.find_all_conflicts(data, exclude_user_id, exclude_lead_id)
+        errors = [conflicts[k]['message'] for k in (KIND_EMAIL, KIND_MOBILE, KIND_PAN) if k in conflicts]
+
         if errors:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,